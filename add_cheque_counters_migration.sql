@@ -0,0 +1,18 @@
+-- Migration: Stored expense counters on cheques and status counters on cheque books
+-- Run this on your database, then backfill the counters with: python cheque_counters.py
+
+-- Non-rejected expense count per cheque (cheques.total_expenses already holds the amount)
+ALTER TABLE cheques ADD COLUMN expenses_count INT NOT NULL DEFAULT 0;
+
+-- Cheque counts per book by status
+ALTER TABLE cheque_books
+    ADD COLUMN cheques_count INT NOT NULL DEFAULT 0,
+    ADD COLUMN created_cheques INT NOT NULL DEFAULT 0,
+    ADD COLUMN assigned_cheques INT NOT NULL DEFAULT 0,
+    ADD COLUMN active_cheques INT NOT NULL DEFAULT 0,
+    ADD COLUMN overspent_cheques INT NOT NULL DEFAULT 0,
+    ADD COLUMN settled_cheques INT NOT NULL DEFAULT 0,
+    ADD COLUMN cancelled_cheques INT NOT NULL DEFAULT 0;
+
+-- Book counters are recomputed per book after every cheque status change
+CREATE INDEX idx_cheques_book_status ON cheques(cheque_book_id, status);
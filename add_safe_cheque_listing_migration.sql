@@ -0,0 +1,21 @@
+-- Migration: Index for safe cheque listings and the cheque_attachments table
+-- Run this on your database, then record existing settlement files with: python cheque_attachments.py
+
+-- /safes/{safe_id}/cheques filters on safe / settled and pages on settlement_date
+CREATE INDEX idx_cheques_safe_settled ON cheques(safe_id, is_assigned_to_safe, is_settled, settlement_date);
+
+-- Settlement attachments (also created by the application on startup)
+CREATE TABLE IF NOT EXISTS cheque_attachments (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    cheque_id INT NOT NULL,
+    filename VARCHAR(255) NOT NULL,
+    original_filename VARCHAR(255) NOT NULL,
+    file_path VARCHAR(500) NOT NULL,
+    file_size INT NOT NULL,
+    mime_type VARCHAR(100) NULL,
+    uploaded_by INT NULL,
+    uploaded_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    INDEX ix_cheque_attachments_cheque_id (cheque_id),
+    CONSTRAINT fk_cheque_attachments_cheque FOREIGN KEY (cheque_id) REFERENCES cheques(id) ON DELETE CASCADE,
+    CONSTRAINT fk_cheque_attachments_user FOREIGN KEY (uploaded_by) REFERENCES users(id) ON DELETE SET NULL
+);
@@ -1,5 +1,8 @@
 import os
 import json
+import hashlib
+import threading
+from collections import OrderedDict
 from io import BytesIO
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
@@ -9,9 +12,8 @@ from fastapi import APIRouter, HTTPException, UploadFile, File
 from fastapi.responses import Response
 from pydantic import BaseModel, validator
 from typing import Dict, Tuple, Optional, Union, List, Any
-import arabic_reshaper
-from bidi.algorithm import get_display
-from num2words import num2words
+from document_cache import document_cache, PO_CHEQUE_PDF
+from arabic_text import shape, shape_many, to_arabic_digits, amount_in_words, cache_info as text_cache_info
 import shutil
 import fitz  # PyMuPDF
 from pathlib import Path
@@ -161,6 +163,115 @@ class ChequePrintPayload(BaseModel):
         return v
 
 
+# Fields whose text is the same on every cheque; they are rendered once into
+# the cached template layer instead of on every print
+STATIC_FIELDS = ("note_1", "note_2", "note_3", "note_4", "payee_notice", "recipient", "receipt_date")
+
+# Number of pre-rendered template layers kept in memory
+TEMPLATE_LAYER_CACHE_SIZE = 16
+
+
+class TemplateLayerCache:
+    """
+    LRU of pre-rendered cheque template pages.
+
+    The template file is read and checksummed once per modification (keyed by
+    mtime and size). Each layer is the template's first page with the static
+    labels already stamped, stored as PDF bytes and keyed by (template
+    checksum, field positions version, font size, static label text, debug
+    mode), so printing a cheque only opens a copy and stamps its own values.
+    """
+
+    def __init__(self, max_entries: int = TEMPLATE_LAYER_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._layers: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._template: Optional[Tuple[Tuple[str, int, int], str, bytes]] = None
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def template_bytes(self, template_path: str) -> Tuple[str, bytes]:
+        """(sha256 checksum, contents) of the template, re-read only when the file changes"""
+        stat = os.stat(template_path)
+        signature = (template_path, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if self._template is None or self._template[0] != signature:
+                with open(template_path, "rb") as f:
+                    contents = f.read()
+                self._template = (signature, hashlib.sha256(contents).hexdigest(), contents)
+            return self._template[1], self._template[2]
+
+    def static_layer(self, generator: "ArabicChequeGenerator", template_path: str, static_values: Dict[str, str],
+                     pdf_field_positions: Dict[str, Tuple[float, float]], debug_mode: bool, font_size: int) -> bytes:
+        checksum, contents = self.template_bytes(template_path)
+        positions_version = hashlib.sha1(
+            json.dumps(sorted((key, list(pos)) for key, pos in pdf_field_positions.items())).encode("utf-8")
+        ).hexdigest()
+        key = (checksum, positions_version, font_size, tuple(sorted(static_values.items())), debug_mode)
+
+        with self._lock:
+            layer = self._layers.get(key)
+            if layer is not None:
+                self._layers.move_to_end(key)
+                self.hits += 1
+                return layer
+            self.misses += 1
+
+        doc = fitz.open("pdf", contents)
+        if len(doc) > 1:
+            doc.select([0])
+        page = doc[0]
+        generator.stamp_fields(page, static_values, pdf_field_positions, debug_mode, font_size)
+        if debug_mode:
+            # Add debug header
+            header_rect = fitz.Rect(200, 50, 400, 100)
+            page.insert_textbox(
+                header_rect,
+                "DEBUG MODE - PDF COORDINATES",
+                fontsize=20,
+                align=fitz.TEXT_ALIGN_CENTER,
+                color=(1, 0, 0)
+            )
+        layer = doc.tobytes(garbage=1)
+        doc.close()
+
+        with self._lock:
+            self._layers[key] = layer
+            self._layers.move_to_end(key)
+            while len(self._layers) > self.max_entries:
+                self._layers.popitem(last=False)
+        return layer
+
+    def invalidate(self):
+        """Drop every cached layer (e.g. after a new template upload)"""
+        with self._lock:
+            self._layers.clear()
+            self._template = None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._layers), "hits": self.hits, "misses": self.misses}
+
+
+# Shared instance used by all print paths in this process
+template_layer_cache = TemplateLayerCache()
+
+
+_template_font = None
+
+
+def template_font() -> Optional["fitz.Font"]:
+    """Amiri as a PyMuPDF font, parsed once per process (None if unavailable)"""
+    global _template_font
+    if _template_font is None:
+        try:
+            _template_font = fitz.Font(fontfile="fonts/Amiri-Bold.ttf")
+        except Exception as e:
+            print(f"Warning: Could not load Amiri font for templates: {e}")
+            _template_font = False
+    return _template_font or None
+
+
 class ArabicChequeGenerator:
     # Default positions in browser coordinate space (top-left origin)
     DEFAULT_BROWSER_POSITIONS = {
@@ -189,15 +300,14 @@ class ArabicChequeGenerator:
             print(f"Warning: Using fallback font {self.arabic_font} because Arabic fonts are not registered")
 
     def reshape_arabic(self, text):
-        reshaped = arabic_reshaper.reshape(text)
-        return get_display(reshaped)
+        return shape(text)
     
     def process_arabic_text(self, text):
         """Process Arabic text for proper display"""
         return self.reshape_arabic(str(text))
 
     def to_arabic_digits(self, text: str) -> str:
-        return text.translate(str.maketrans("0123456789", "٠١٢٣٤٥٦٧٨٩"))
+        return to_arabic_digits(text)
     
     def convert_date_to_arabic(self, date) -> str:
         """Convert date to Arabic digits while keeping the same format"""
@@ -238,10 +348,17 @@ class ArabicChequeGenerator:
         Returns:
             PDF bytes
         """
-        from helpers.pdf.draw_company_table import draw_company_table
-        
         buffer = BytesIO()
         c = canvas.Canvas(buffer, pagesize=A4)
+        self.draw_overlay_page(c, cheque_data, pdf_field_positions, field_visibility, debug_mode, font_size)
+        c.save()
+        buffer.seek(0)
+        return buffer.read()
+
+    def draw_overlay_page(self, c: canvas.Canvas, cheque_data: Dict, pdf_field_positions: Dict[str, Tuple[int, int]],
+                          field_visibility: Dict[str, bool], debug_mode: bool = False, font_size: int = 16):
+        """Draw one cheque onto the current page of `c` (does not end the page)"""
+        from helpers.pdf.draw_company_table import draw_company_table
         
         # Only add white background if not in debug mode
         if not debug_mode:
@@ -274,20 +391,8 @@ class ArabicChequeGenerator:
             if not field_visibility.get(field_key, True):
                 continue
             
-            value = cheque_data.get(field_key, "")
-            
-            # Convert numbers to Arabic digits for amount and date fields
-            if "amount" in field_key or field_key == "cheque_number":
-                value = self.to_arabic_digits(str(value))
-            elif "date" in field_key:
-                value = self.convert_date_to_arabic(value)
-            
-            # Add Egyptian pounds suffix to amount_words
-            if field_key == "amount_words" and value:
-                value = f"{value} جنيه مصري فقط لا غير"
-            
-            # Reshape Arabic text for proper display
-            value = self.reshape_arabic(str(value))
+            # Arabic digits, amount suffix and reshaping for proper display
+            value = self.format_field_value(field_key, cheque_data.get(field_key, ""))
             
             # Save current state
             c.saveState()
@@ -323,15 +428,84 @@ class ArabicChequeGenerator:
             c.drawCentredString(300, 800, "DEBUG MODE - PDF COORDINATES")
             c.restoreState()
 
-        c.save()
-        buffer.seek(0)
-        return buffer.read()
+    def format_field_value(self, field_key: str, value) -> str:
+        """Digits, dates and amount suffix for one field, reshaped for display"""
+        return self.reshape_arabic(self.field_text(field_key, value))
+
+    def field_text(self, field_key: str, value) -> str:
+        """Digits, dates and amount suffix for one field, before reshaping"""
+        # Convert numbers to Arabic digits
+        if "amount" in field_key or field_key == "cheque_number":
+            value = self.to_arabic_digits(str(value))
+        elif "date" in field_key:
+            value = self.convert_date_to_arabic(value)
+        
+        # Add Egyptian pounds suffix to amount_words
+        if field_key == "amount_words" and value:
+            value = f"{value} جنيه مصري فقط لا غير"
+        
+        return str(value)
+
+    def stamp_fields(self, page, field_values: Dict[str, str], pdf_field_positions: Dict[str, Tuple[int, int]],
+                     debug_mode: bool = False, font_size: int = 16):
+        """Insert already-formatted field values onto a PyMuPDF page"""
+        # One parsed Amiri font shared by every document (insert_textbox with
+        # fontfile re-measures all of its glyphs for each new document)
+        font = template_font()
+        writer = fitz.TextWriter(page.rect) if font is not None else None
+        
+        for field_key, value in field_values.items():
+            pdf_x, pdf_y = pdf_field_positions[field_key]
+            
+            # Create text box using PDF coordinates (no additional transformation needed)
+            text_rect = fitz.Rect(pdf_x - 500, pdf_y - 30, pdf_x + 100, pdf_y + 10)
+            
+            stamped = False
+            if writer is not None:
+                try:
+                    writer.fill_textbox(
+                        text_rect,
+                        value,
+                        font=font,
+                        fontsize=font_size,
+                        align=fitz.TEXT_ALIGN_RIGHT
+                    )
+                    stamped = True
+                except Exception as e:
+                    print(f"Warning: Amiri font failed for {field_key}, using built-in font: {e}")
+            if not stamped:
+                # No Amiri font (or it failed): built-in font
+                page.insert_textbox(
+                    text_rect,
+                    value,
+                    fontsize=font_size,
+                    align=fitz.TEXT_ALIGN_RIGHT,
+                    color=(0, 0, 0)
+                )
+            
+            if debug_mode:
+                # Add debug circle
+                page.draw_circle(fitz.Point(pdf_x, pdf_y), 5, color=(1, 0, 0), fill=(1, 0, 0))
+                # Add debug label
+                label_rect = fitz.Rect(pdf_x + 5, pdf_y - 10, pdf_x + 150, pdf_y + 10)
+                page.insert_textbox(
+                    label_rect,
+                    f"{field_key} PDF({int(pdf_x)},{int(pdf_y)})",
+                    fontsize=8,
+                    color=(1, 0, 0)
+                )
+        
+        if writer is not None:
+            writer.write_text(page, color=(0, 0, 0))
 
     def create_overlay_with_template(self, cheque_data: Dict, pdf_field_positions: Dict[str, Tuple[int, int]],
                                     field_visibility: Dict[str, bool], debug_mode: bool = False, font_size: int = 16) -> bytes:
-        """Create PDF with text overlaid directly on template using PyMuPDF"""
-        from helpers.pdf.draw_company_table import draw_company_table
-        
+        """
+        Create PDF with text overlaid directly on template using PyMuPDF.
+
+        The template plus the static labels (STATIC_FIELDS) come pre-rendered
+        from template_layer_cache; only the per-cheque fields are stamped here.
+        """
         template_path = "uploads/cheque_template.pdf"
         
         if not os.path.exists(template_path):
@@ -354,8 +528,8 @@ class ArabicChequeGenerator:
                 # Create buffers
                 overlay_buffer = BytesIO(overlay_pdf)
                 
-                # Open PDFs
-                template_pdf = PdfReader(template_path)
+                # Open PDFs (template bytes are held in memory by the cache)
+                template_pdf = PdfReader(BytesIO(template_layer_cache.template_bytes(template_path)[1]))
                 overlay_pdf_reader = PdfReader(overlay_buffer)
                 
                 # Create output
@@ -377,82 +551,28 @@ class ArabicChequeGenerator:
                 return overlay_pdf
         
         try:
-            # Open the template PDF
-            doc = fitz.open(template_path)
+            visible_fields = [key for key in pdf_field_positions if field_visibility.get(key, True)]
+            # Reshape every field of the cheque in one batch
+            shaped = shape_many(self.field_text(key, cheque_data.get(key, "")) for key in visible_fields)
+            static_values = {}
+            variable_values = {}
+            for field_key, value in zip(visible_fields, shaped):
+                if field_key in STATIC_FIELDS:
+                    static_values[field_key] = value
+                else:
+                    variable_values[field_key] = value
+
+            # Template page with the static layer, copied from the cache
+            doc = fitz.open("pdf", template_layer_cache.static_layer(
+                self, template_path, static_values, pdf_field_positions, debug_mode, font_size
+            ))
             page = doc[0]
             
-            # Get the Amiri font path
-            font_path = "fonts/Amiri-Bold.ttf"
-            
-            # Add overlay text using PDF coordinates
-            for field_key, (pdf_x, pdf_y) in pdf_field_positions.items():
-                if not field_visibility.get(field_key, True):
-                    continue
-                    
-                value = cheque_data.get(field_key, "")
-                
-                # Convert numbers to Arabic digits
-                if "amount" in field_key or field_key == "cheque_number":
-                    value = self.to_arabic_digits(str(value))
-                elif "date" in field_key:
-                    value = self.convert_date_to_arabic(value)
-                
-                # Add Egyptian pounds suffix to amount_words
-                if field_key == "amount_words" and value:
-                    value = f"{value} جنيه مصري فقط لا غير"
-                
-                # Reshape Arabic text
-                value = self.reshape_arabic(str(value))
-                
-                # Create text box using PDF coordinates (no additional transformation needed)
-                text_rect = fitz.Rect(pdf_x - 500, pdf_y - 30, pdf_x + 100, pdf_y + 10)
-                
-                try:
-                    # Try to insert with custom font
-                    rc = page.insert_textbox(
-                        text_rect,
-                        value,
-                        fontname="helv",
-                        fontfile=font_path,
-                        fontsize=font_size,
-                        align=fitz.TEXT_ALIGN_RIGHT,
-                        color=(0, 0, 0)
-                    )
-                except:
-                    # Fallback to built-in font
-                    rc = page.insert_textbox(
-                        text_rect,
-                        value,
-                        fontsize=font_size,
-                        align=fitz.TEXT_ALIGN_RIGHT,
-                        color=(0, 0, 0)
-                    )
-                
-                if debug_mode:
-                    # Add debug circle
-                    page.draw_circle(fitz.Point(pdf_x, pdf_y), 5, color=(1, 0, 0), fill=(1, 0, 0))
-                    # Add debug label
-                    label_rect = fitz.Rect(pdf_x + 5, pdf_y - 10, pdf_x + 150, pdf_y + 10)
-                    page.insert_textbox(
-                        label_rect,
-                        f"{field_key} PDF({int(pdf_x)},{int(pdf_y)})",
-                        fontsize=8,
-                        color=(1, 0, 0)
-                    )
-            
-            if debug_mode:
-                # Add debug header
-                header_rect = fitz.Rect(200, 50, 400, 100)
-                page.insert_textbox(
-                    header_rect,
-                    "DEBUG MODE - PDF COORDINATES",
-                    fontsize=20,
-                    align=fitz.TEXT_ALIGN_CENTER,
-                    color=(1, 0, 0)
-                )
+            self.stamp_fields(page, variable_values, pdf_field_positions, debug_mode, font_size)
             
-            # Get PDF bytes
-            pdf_bytes = doc.tobytes()
+            # Get PDF bytes, embedding only the glyphs this cheque uses
+            doc.subset_fonts()
+            pdf_bytes = doc.tobytes(garbage=3, deflate=True)
             doc.close()
             
             return pdf_bytes
@@ -468,7 +588,7 @@ def print_arabic_cheque(id: int, payload: ChequePrintPayload):
     cheque_data = {
         "cheque_number": "123456",
         "amount_number": "25000",
-        "amount_words": num2words(25000, lang='ar'),
+        "amount_words": amount_in_words(25000),
         "beneficiary_name": "شركة التجربة",
         "issue_date": "2025-06-17",
         "due_date": "2025-07-17",
@@ -504,6 +624,7 @@ def print_arabic_cheque(id: int, payload: ChequePrintPayload):
     os.makedirs("storage", exist_ok=True)
     with open("storage/cheque_settings.json", "w") as f:
         json.dump({"font_size": payload.font_size}, f)
+    document_cache.invalidate(PO_CHEQUE_PDF)
     
     return Response(
         content=overlay, 
@@ -549,6 +670,7 @@ def save_field_positions(data: Dict[str, Any]):
     # Save browser coordinates in normalized object format
     with open("storage/cheque_field_positions.json", "w") as f:
         json.dump(normalized_data, f)
+    document_cache.invalidate(PO_CHEQUE_PDF)
     return {"message": "Saved successfully"}
 
 
@@ -564,6 +686,7 @@ def reset_field_positions():
     # Save in normalized object format
     with open("storage/cheque_field_positions.json", "w") as f:
         json.dump(default_positions, f, indent=2)
+    document_cache.invalidate(PO_CHEQUE_PDF)
     
     return {"message": "Field positions reset to defaults", "positions": default_positions}
 
@@ -597,6 +720,7 @@ async def upload_cheque_template(file: UploadFile = File(...)):
     
     with open(template_path, "wb") as buffer:
         buffer.write(contents)
+    template_layer_cache.invalidate()
     
     return {"success": True, "message": "Template uploaded successfully", "path": template_path}
 
@@ -608,6 +732,8 @@ def get_system_status():
         "fonts_registered": FONTS_REGISTERED,
         "font_error": FONT_REGISTRATION_ERROR,
         "pypdf2_available": PYPDF2_AVAILABLE,
+        "template_layer_cache": template_layer_cache.stats(),
+        "text_shaping_cache": text_cache_info(),
         "coordinate_system": "browser",  # Indicate we expect browser coordinates
         "directories": {
             "uploads": os.path.exists("uploads") and os.access("uploads", os.W_OK),
@@ -736,7 +862,7 @@ def preview_cheque_with_template(id: int, payload: ChequePrintPayload):
     cheque_data = {
         "cheque_number": "123456",
         "amount_number": "25000",
-        "amount_words": num2words(25000, lang='ar'),
+        "amount_words": amount_in_words(25000),
         "beneficiary_name": "شركة التجربة",
         "issue_date": "2025-06-17",
         "due_date": "2025-07-17",
@@ -803,6 +929,7 @@ def save_cheque_settings(payload: ChequeSettingsPayload):
     os.makedirs("storage", exist_ok=True)
     with open("storage/cheque_settings.json", "w") as f:
         json.dump({"font_size": payload.font_size}, f)
+    document_cache.invalidate(PO_CHEQUE_PDF)
     return {"message": "Settings saved"}
 
 
@@ -810,21 +937,27 @@ def save_cheque_settings(payload: ChequeSettingsPayload):
 # Legacy compatibility wrapper
 # ---------------------------------------------------------------------------
 
-def generate_arabic_cheque(cheque_data: Dict) -> bytes:
-    """
-    Legacy wrapper for backward compatibility.
-    
-    Expects cheque_data to contain browser coordinate positions if available,
-    otherwise uses default positions.
-    """
+def cheque_layout_version() -> str:
+    """Hash of everything besides the cheque data that a printed cheque depends on"""
+    digest = hashlib.sha1(str(os.stat(__file__).st_mtime_ns).encode())
+    for path in ("storage/cheque_field_positions.json", "storage/cheque_settings.json"):
+        try:
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        except OSError:
+            digest.update(b"-")
+    return digest.hexdigest()
 
-    generator = ArabicChequeGenerator()
 
-    # Get debug mode early to use in logs
-    debug_mode = cheque_data.get("debug_mode", False)
+def load_print_layout(debug_mode: bool = False) -> Tuple[Dict[str, Dict[str, float]], Dict[str, Tuple[float, float]], int]:
+    """
+    Read the saved field positions and font size once.
 
+    Returns (browser_positions, pdf_field_positions, font_size); missing or
+    invalid settings fall back to the defaults.
+    """
     # Try to load saved positions from storage (browser coordinates)
-    browser_positions: Dict[str, Dict[str, float]] = generator.DEFAULT_BROWSER_POSITIONS.copy()
+    browser_positions: Dict[str, Dict[str, float]] = ArabicChequeGenerator.DEFAULT_BROWSER_POSITIONS.copy()
     
     try:
         if os.path.exists("storage/cheque_field_positions.json"):
@@ -851,6 +984,18 @@ def generate_arabic_cheque(cheque_data: Dict) -> bytes:
     # Convert browser coordinates to PDF coordinates
     pdf_field_positions = convert_browser_positions_to_pdf(browser_positions)
 
+    # try load last used font size
+    try:
+        with open("storage/cheque_settings.json") as f:
+            font_size = json.load(f).get("font_size", 16)
+    except Exception:
+        font_size = 16
+
+    return browser_positions, pdf_field_positions, font_size
+
+
+def _prepare_cheque_fields(cheque_data: Dict, browser_positions: Dict[str, Dict[str, float]]) -> Dict[str, bool]:
+    """Fill in amount_words and return the field visibility for one cheque"""
     # Get field visibility from cheque_data if provided, otherwise all visible
     field_visibility: Dict[str, bool] = cheque_data.get("field_visibility", {})
     if not field_visibility:
@@ -865,26 +1010,37 @@ def generate_arabic_cheque(cheque_data: Dict) -> bytes:
         field_visibility["note_3"] = True
         field_visibility["expense.id"] = False
 
-    # Get font size from cheque_data if provided
-    if "font_size" in cheque_data:
-        font_size = cheque_data["font_size"]
-    else:
-        # try load last used font size
-        try:
-            with open("storage/cheque_settings.json") as f:
-                font_size = json.load(f).get("font_size", 16)
-        except Exception:
-            font_size = 16
-
     # Add amount_words if not present but amount_number is
     if "amount_words" not in cheque_data and "amount_number" in cheque_data:
         try:
             amount = float(cheque_data["amount_number"])
             # Generate amount in words without suffix - it will be added during rendering
-            cheque_data["amount_words"] = num2words(amount, lang='ar')
+            cheque_data["amount_words"] = amount_in_words(amount)
         except:
             pass
 
+    return field_visibility
+
+
+def generate_arabic_cheque(cheque_data: Dict) -> bytes:
+    """
+    Legacy wrapper for backward compatibility.
+    
+    Expects cheque_data to contain browser coordinate positions if available,
+    otherwise uses default positions.
+    """
+
+    generator = ArabicChequeGenerator()
+
+    # Get debug mode early to use in logs
+    debug_mode = cheque_data.get("debug_mode", False)
+
+    browser_positions, pdf_field_positions, saved_font_size = load_print_layout(debug_mode)
+    field_visibility = _prepare_cheque_fields(cheque_data, browser_positions)
+
+    # Get font size from cheque_data if provided
+    font_size = cheque_data.get("font_size", saved_font_size)
+
     # Log the data being passed to help debug
     if debug_mode:
         print(f"Cheque data keys: {list(cheque_data.keys())}")
@@ -895,5 +1051,32 @@ def generate_arabic_cheque(cheque_data: Dict) -> bytes:
         pdf_field_positions=pdf_field_positions,
         field_visibility=field_visibility,
         debug_mode=debug_mode,
-                  font_size=font_size
-      )
+        font_size=font_size
+    )
+
+
+def generate_arabic_cheques_batch(cheques: List[Dict]) -> bytes:
+    """
+    Render several cheques as the pages of one PDF.
+
+    Positions and settings are read once and every page is drawn on the same
+    canvas, so the Arabic font is embedded a single time for the whole batch.
+    """
+    generator = ArabicChequeGenerator()
+    browser_positions, pdf_field_positions, saved_font_size = load_print_layout()
+
+    buffer = BytesIO()
+    c = canvas.Canvas(buffer, pagesize=A4)
+    for cheque_data in cheques:
+        field_visibility = _prepare_cheque_fields(cheque_data, browser_positions)
+        generator.draw_overlay_page(
+            c,
+            cheque_data=cheque_data,
+            pdf_field_positions=pdf_field_positions,
+            field_visibility=field_visibility,
+            font_size=cheque_data.get("font_size", saved_font_size)
+        )
+        c.showPage()
+    c.save()
+    buffer.seek(0)
+    return buffer.read()
@@ -0,0 +1,401 @@
+"""
+Balance Ledger
+Append-only history of safe and bank account balances. Every write that
+moves a `current_balance` (expenses, cheque assignment / cancellation,
+settlements, early settlements, manual adjustments, admin resets) also
+posts a signed entry to balance_ledger in the same transaction; entries are
+never updated or deleted, so current_balance is always the sum of an
+account's entries.
+
+balance_checkpoints materializes the running balance per account at a point
+in time (write_checkpoints, run periodically). "Balance at X" is then the
+latest checkpoint before X plus the entries between it and X, and a
+statement is that opening balance plus one range scan of
+(account_type, account_id, posted_at), instead of summing full history.
+
+posted_at is the database clock at posting time. A checkpoint only covers
+entries older than CHECKPOINT_LAG, so a transaction still open when it is
+written cannot commit an entry into an already-checkpointed period.
+"""
+
+import asyncio
+import logging
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text, bindparam
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# account_type -> (table, opening balance column)
+ACCOUNTS = {
+    "safe": ("safes", "initial_balance"),
+    "bank": ("bank_accounts", "opening_balance"),
+}
+
+# Entries younger than this are left out of new checkpoints
+CHECKPOINT_LAG = timedelta(minutes=10)
+
+# One checkpoint run at a time per process
+_checkpoint_lock = asyncio.Lock()
+
+_POST = text("""
+    INSERT INTO balance_ledger (account_type, account_id, amount, entry_type, reference_type,
+                                reference_id, description, created_by, posted_at)
+    VALUES (:account_type, :account_id, :amount, :entry_type, :reference_type,
+            :reference_id, :description, :created_by, CURRENT_TIMESTAMP)
+""")
+
+
+def _table(account_type: str) -> Tuple[str, str]:
+    if account_type not in ACCOUNTS:
+        raise ValueError(f"Unknown ledger account type: {account_type}")
+    return ACCOUNTS[account_type]
+
+
+# ---------- posting (caller commits) ----------
+
+def post_entry(db: Session, account_type: str, account_id: int, amount: float, entry_type: str,
+               reference_type: Optional[str] = None, reference_id: Optional[int] = None,
+               description: Optional[str] = None, created_by: Optional[int] = None):
+    """Record a change of `amount` (credit > 0, debit < 0) next to the balance UPDATE that applies it"""
+    _table(account_type)
+    if not amount:
+        return
+    db.execute(_POST, {
+        "account_type": account_type,
+        "account_id": account_id,
+        "amount": amount,
+        "entry_type": entry_type,
+        "reference_type": reference_type,
+        "reference_id": reference_id,
+        "description": description[:500] if description else description,
+        "created_by": created_by
+    })
+
+
+def post_balance_set(db: Session, account_type: str, account_id: int, new_balance: float,
+                     entry_type: str = "adjustment", description: Optional[str] = None,
+                     created_by: Optional[int] = None):
+    """
+    Record an overwrite of current_balance as the difference it makes.
+    Call BEFORE the UPDATE that sets the new balance.
+    """
+    table, _ = _table(account_type)
+    db.execute(text(f"""
+        INSERT INTO balance_ledger (account_type, account_id, amount, entry_type, description,
+                                    created_by, posted_at)
+        SELECT :account_type, id, :new_balance - COALESCE(current_balance, 0), :entry_type,
+               :description, :created_by, CURRENT_TIMESTAMP
+        FROM {table}
+        WHERE id = :account_id AND COALESCE(current_balance, 0) <> :new_balance
+    """), {
+        "account_type": account_type,
+        "account_id": account_id,
+        "new_balance": new_balance,
+        "entry_type": entry_type,
+        "description": description,
+        "created_by": created_by
+    })
+
+
+def post_safe_resets(db: Session, safe_ids: Optional[Iterable[int]] = None,
+                     description: str = "Admin reset to initial balance", created_by: Optional[int] = None):
+    """
+    Record admin resets of safes (given ids, or every active safe) to their
+    initial balance. Call BEFORE the UPDATE that resets them.
+    """
+    if safe_ids is None:
+        condition, params = "is_active = 1", {}
+    else:
+        safe_ids = list(safe_ids)
+        if not safe_ids:
+            return
+        condition, params = "id IN :safe_ids", {"safe_ids": safe_ids}
+    statement = text(f"""
+        INSERT INTO balance_ledger (account_type, account_id, amount, entry_type, description,
+                                    created_by, posted_at)
+        SELECT 'safe', id, COALESCE(initial_balance, 0) - COALESCE(current_balance, 0), 'reset',
+               :description, :created_by, CURRENT_TIMESTAMP
+        FROM safes
+        WHERE {condition} AND COALESCE(initial_balance, 0) <> COALESCE(current_balance, 0)
+    """)
+    if safe_ids is not None:
+        statement = statement.bindparams(bindparam("safe_ids", expanding=True))
+    db.execute(statement, {**params, "description": description, "created_by": created_by})
+
+
+def open_accounts(db: Session) -> int:
+    """
+    Backfill: an 'opening' entry of the current balance for every account
+    with no ledger entries yet (accounts from before the ledger). Caller commits.
+    """
+    opened = 0
+    for account_type, (table, _) in ACCOUNTS.items():
+        opened += db.execute(text(f"""
+            INSERT INTO balance_ledger (account_type, account_id, amount, entry_type, description, posted_at)
+            SELECT :account_type, a.id, COALESCE(a.current_balance, 0), 'opening',
+                   'Balance when the ledger was opened', CURRENT_TIMESTAMP
+            FROM {table} a
+            WHERE NOT EXISTS (
+                SELECT 1 FROM balance_ledger l
+                WHERE l.account_type = :account_type AND l.account_id = a.id
+            )
+        """), {"account_type": account_type}).rowcount
+    return opened
+
+
+# ---------- queries ----------
+
+def _latest_checkpoint(db: Session, account_type: str, account_id: int,
+                       at: Optional[datetime] = None) -> Tuple[Optional[datetime], float]:
+    """(as_of, balance) of the newest checkpoint at or before `at` (None, 0.0 when there is none)"""
+    row = db.execute(text(f"""
+        SELECT as_of, balance FROM balance_checkpoints
+        WHERE account_type = :account_type AND account_id = :account_id
+        {"AND as_of <= :at" if at is not None else ""}
+        ORDER BY as_of DESC
+        LIMIT 1
+    """), {"account_type": account_type, "account_id": account_id, "at": at}).fetchone()
+    return (row[0], float(row[1])) if row else (None, 0.0)
+
+
+def _sum_between(db: Session, account_type: str, account_id: int,
+                 start: Optional[datetime], end: Optional[datetime]) -> Tuple[float, int, Optional[datetime]]:
+    """SUM, COUNT and MAX(posted_at) of entries with start <= posted_at < end (None = unbounded)"""
+    conditions = ["account_type = :account_type", "account_id = :account_id"]
+    if start is not None:
+        conditions.append("posted_at >= :start")
+    if end is not None:
+        conditions.append("posted_at < :end")
+    row = db.execute(text(f"""
+        SELECT COALESCE(SUM(amount), 0), COUNT(*), MAX(posted_at)
+        FROM balance_ledger
+        WHERE {" AND ".join(conditions)}
+    """), {"account_type": account_type, "account_id": account_id, "start": start, "end": end}).fetchone()
+    return float(row[0]), int(row[1]), row[2]
+
+
+def balance_at(db: Session, account_type: str, account_id: int, at: Optional[datetime] = None) -> float:
+    """Balance from every entry posted before `at` (None: all entries, i.e. the current balance)"""
+    _table(account_type)
+    as_of, balance = _latest_checkpoint(db, account_type, account_id, at)
+    delta, _, _ = _sum_between(db, account_type, account_id, as_of, at)
+    return round(balance + delta, 2)
+
+
+def statement(db: Session, account_type: str, account_id: int,
+              start: datetime, end: datetime) -> Dict[str, Any]:
+    """Entries posted in [start, end) with their running balance, plus opening / closing balances"""
+    opening = balance_at(db, account_type, account_id, start)
+    rows = db.execute(text("""
+        SELECT id, posted_at, amount, entry_type, reference_type, reference_id, description, created_by
+        FROM balance_ledger
+        WHERE account_type = :account_type AND account_id = :account_id
+          AND posted_at >= :start AND posted_at < :end
+        ORDER BY posted_at, id
+    """), {"account_type": account_type, "account_id": account_id, "start": start, "end": end})
+
+    running = opening
+    entries = []
+    credits = debits = 0.0
+    for row in rows:
+        amount = float(row[2])
+        running = round(running + amount, 2)
+        if amount > 0:
+            credits += amount
+        else:
+            debits -= amount
+        entries.append({
+            "id": row[0],
+            "posted_at": row[1].isoformat() if row[1] else None,
+            "amount": amount,
+            "balance": running,
+            "entry_type": row[3],
+            "reference_type": row[4],
+            "reference_id": row[5],
+            "description": row[6],
+            "created_by": row[7]
+        })
+
+    return {
+        "account_type": account_type,
+        "account_id": account_id,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "opening_balance": opening,
+        "total_credits": round(credits, 2),
+        "total_debits": round(debits, 2),
+        "closing_balance": running,
+        "entries": entries
+    }
+
+
+def statement_for_dates(db: Session, account_type: str, account_id: int,
+                        start_date: date, end_date: date) -> Dict[str, Any]:
+    """statement() for whole days, end_date inclusive"""
+    return statement(db, account_type, account_id,
+                     datetime.combine(start_date, time.min),
+                     datetime.combine(end_date + timedelta(days=1), time.min))
+
+
+# ---------- checkpoints and reconciliation ----------
+
+def _account_ids(db: Session) -> List[Tuple[str, int]]:
+    accounts = []
+    for account_type, (table, _) in ACCOUNTS.items():
+        accounts.extend((account_type, row[0]) for row in db.execute(text(f"SELECT id FROM {table} ORDER BY id")))
+    return accounts
+
+
+def _database_now(db: Session) -> datetime:
+    now = db.execute(text("SELECT CURRENT_TIMESTAMP")).scalar()
+    return datetime.fromisoformat(now) if isinstance(now, str) else now
+
+
+def write_checkpoints(db: Session, lag: timedelta = CHECKPOINT_LAG) -> int:
+    """
+    Checkpoint every account with entries since its last checkpoint, as of
+    (database now - lag). Returns the number written. Caller commits.
+    """
+    as_of = (_database_now(db) - lag).replace(microsecond=0)
+    written = 0
+    for account_type, account_id in _account_ids(db):
+        previous_as_of, balance = _latest_checkpoint(db, account_type, account_id)
+        if previous_as_of is not None and previous_as_of >= as_of:
+            continue
+        delta, count, _ = _sum_between(db, account_type, account_id, previous_as_of, as_of)
+        if not count:
+            continue
+        db.execute(text("""
+            INSERT INTO balance_checkpoints (account_type, account_id, as_of, balance, entries_count, created_at)
+            VALUES (:account_type, :account_id, :as_of, :balance, :entries_count, CURRENT_TIMESTAMP)
+        """), {
+            "account_type": account_type,
+            "account_id": account_id,
+            "as_of": as_of,
+            "balance": round(balance + delta, 2),
+            "entries_count": count
+        })
+        written += 1
+    return written
+
+
+def ledger_mismatches(db: Session) -> List[Dict[str, Any]]:
+    """Accounts whose current_balance differs from the sum of their ledger entries"""
+    mismatches = []
+    for account_type, (table, _) in ACCOUNTS.items():
+        for account_id, current in db.execute(text(f"SELECT id, COALESCE(current_balance, 0) FROM {table} ORDER BY id")):
+            ledger = balance_at(db, account_type, account_id)
+            if abs(ledger - float(current)) >= 0.005:
+                mismatches.append({
+                    "account_type": account_type,
+                    "account_id": account_id,
+                    "current_balance": float(current),
+                    "ledger_balance": ledger,
+                    "difference": round(float(current) - ledger, 2)
+                })
+    return mismatches
+
+
+async def run_periodic_checkpoints(interval_seconds: float):
+    """Background task: open new accounts and checkpoint balances every interval until cancelled"""
+    from database import SessionLocal
+
+    while True:
+        async with _checkpoint_lock:
+            db = SessionLocal()
+            try:
+                opened = await asyncio.to_thread(open_accounts, db)
+                written = await asyncio.to_thread(write_checkpoints, db)
+                db.commit()
+                if opened or written:
+                    logger.info(f"Balance ledger: {opened} account(s) opened, {written} checkpoint(s) written")
+            except Exception as e:
+                db.rollback()
+                logger.error(f"❌ Balance checkpoint run failed: {str(e)}")
+            finally:
+                db.close()
+        await asyncio.sleep(interval_seconds)
+
+
+if __name__ == "__main__":
+    # Maintenance: python balance_ledger.py            (open accounts, checkpoint, reconcile)
+    # Benchmark:   python balance_ledger.py --benchmark 200000
+    import argparse
+    import random
+    import time as timer
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--benchmark", type=int, metavar="ENTRIES",
+                        help="time balance-at lookups over a scratch SQLite ledger instead")
+    args = parser.parse_args()
+
+    if not args.benchmark:
+        from database import SessionLocal
+
+        db = SessionLocal()
+        try:
+            opened = open_accounts(db)
+            written = write_checkpoints(db)
+            db.commit()
+            print(f"✅ {opened} account(s) opened, {written} checkpoint(s) written")
+            mismatches = ledger_mismatches(db)
+            for mismatch in mismatches:
+                print(f"❌ {mismatch['account_type']} {mismatch['account_id']}: current "
+                      f"{mismatch['current_balance']:.2f}, ledger {mismatch['ledger_balance']:.2f}")
+            if not mismatches:
+                print("✅ Every current balance matches its ledger")
+        except Exception as e:
+            db.rollback()
+            print(f"❌ Error: {str(e)}")
+        finally:
+            db.close()
+    else:
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+
+        import models
+
+        engine = create_engine("sqlite://")
+        models.LedgerEntry.__table__.create(engine)
+        models.BalanceCheckpoint.__table__.create(engine)
+        db = sessionmaker(bind=engine)()
+
+        # Two years of postings spread over 20 safes, checkpointed daily
+        start = datetime(2024, 1, 1)
+        step = timedelta(days=730) / args.benchmark
+        db.execute(text("""
+            INSERT INTO balance_ledger (account_type, account_id, amount, entry_type, posted_at)
+            VALUES ('safe', :account_id, :amount, 'expense', :posted_at)
+        """), [
+            {"account_id": index % 20 + 1, "amount": round(random.uniform(-500, 600), 2), "posted_at": start + step * index}
+            for index in range(args.benchmark)
+        ])
+        for day in range(1, 731):
+            as_of = start + timedelta(days=day)
+            for account_id in range(1, 21):
+                previous, balance = _latest_checkpoint(db, "safe", account_id)
+                delta, count, _ = _sum_between(db, "safe", account_id, previous, as_of)
+                db.execute(text("""
+                    INSERT INTO balance_checkpoints (account_type, account_id, as_of, balance, entries_count)
+                    VALUES ('safe', :account_id, :as_of, :balance, :count)
+                """), {"account_id": account_id, "as_of": as_of, "balance": balance + delta, "count": count})
+        db.commit()
+
+        lookups = [(random.randint(1, 20), start + timedelta(days=random.uniform(1, 730))) for _ in range(200)]
+
+        began = timer.perf_counter()
+        full = [
+            round(_sum_between(db, "safe", account_id, None, at)[0], 2) for account_id, at in lookups
+        ]
+        full_ms = (timer.perf_counter() - began) * 1000 / len(lookups)
+
+        began = timer.perf_counter()
+        checkpointed = [balance_at(db, "safe", account_id, at) for account_id, at in lookups]
+        checkpoint_ms = (timer.perf_counter() - began) * 1000 / len(lookups)
+
+        mark = "✅" if all(abs(a - b) < 0.01 for a, b in zip(full, checkpointed)) else "❌"
+        print(f"{mark} {args.benchmark} entries: full-history sum {full_ms:.2f} ms/lookup, "
+              f"checkpoint + range {checkpoint_ms:.2f} ms/lookup")
@@ -0,0 +1,141 @@
+"""
+Batch Production Explosion
+Turns a production plan ({cake_id: quantity}) into the raw-material bill of
+materials with one sparse matrix-vector product over precomputed, flattened
+cake recipes
+"""
+
+import threading
+from typing import Dict, List, Any, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from recipe_graph import RecipeGraph, CAKE, SUB_RECIPE, MID_PREP
+from recipe_cost_cache import recipe_cost_cache
+
+
+class BatchExplosionMatrix:
+    """
+    Flattened cake recipes stored as a CSR matrix: one row per cake, one
+    column per raw item, values are item quantity per cake. Built once per
+    recipe-cost-cache version and reused for every plan.
+    """
+
+    def __init__(self, graph: RecipeGraph):
+        self.item_ids = np.array(sorted(graph.items), dtype=np.int64)
+        column_of = {item_id: column for column, item_id in enumerate(self.item_ids.tolist())}
+
+        self.row_of: Dict[int, int] = {}
+        indptr = [0]
+        indices: List[int] = []
+        data: List[float] = []
+
+        for node in graph.nodes_of(CAKE):
+            self.row_of[node[1]] = len(indptr) - 1
+            for item_id, quantity in graph.flat_bom(node).items():
+                indices.append(column_of[item_id])
+                data.append(quantity)
+            indptr.append(len(indices))
+
+        self.indptr = np.array(indptr, dtype=np.int64)
+        self.indices = np.array(indices, dtype=np.int64)
+        self.data = np.array(data, dtype=np.float64)
+        self.prices = np.array(
+            [graph.items[item_id]["price_per_unit"] for item_id in self.item_ids.tolist()],
+            dtype=np.float64
+        )
+
+    def explode(self, plan: Dict[int, float]) -> Tuple[np.ndarray, List[int]]:
+        """
+        Return (quantity per item column, cake ids not found) for the plan.
+        Equivalent to M^T . q where q is the sparse plan vector.
+        """
+        missing = [cake_id for cake_id in plan if cake_id not in self.row_of]
+        known = [(self.row_of[cake_id], qty) for cake_id, qty in plan.items() if cake_id in self.row_of]
+        if not known:
+            return np.zeros(len(self.item_ids)), missing
+
+        rows = np.array([row for row, _ in known], dtype=np.int64)
+        quantities = np.array([qty for _, qty in known], dtype=np.float64)
+
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+
+        # Positions of every non-zero in the selected rows, without a Python loop
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        positions = offsets + np.arange(lengths.sum())
+
+        weights = self.data[positions] * np.repeat(quantities, lengths)
+        totals = np.bincount(self.indices[positions], weights=weights, minlength=len(self.item_ids))
+        return totals, missing
+
+
+_matrix = None
+_matrix_version = None
+_matrix_lock = threading.Lock()
+
+
+def get_explosion_matrix(db: Session) -> Tuple[RecipeGraph, BatchExplosionMatrix]:
+    """Return the current graph and its explosion matrix, rebuilding on change"""
+    global _matrix, _matrix_version
+
+    graph = recipe_cost_cache.get_graph(db)
+    with _matrix_lock:
+        if _matrix is None or _matrix_version != recipe_cost_cache.version:
+            _matrix = BatchExplosionMatrix(graph)
+            _matrix_version = recipe_cost_cache.version
+        return graph, _matrix
+
+
+def explode_batch(db: Session, plan: Dict[int, float]) -> Dict[str, Any]:
+    """Full bill of materials, costs and intermediate usage for a production plan"""
+    graph, matrix = get_explosion_matrix(db)
+    totals, missing = matrix.explode(plan)
+
+    used = np.nonzero(totals)[0]
+    costs = totals * matrix.prices
+
+    ingredients = []
+    for column in used.tolist():
+        item = graph.items[int(matrix.item_ids[column])]
+        ingredients.append({
+            "item_id": item["id"],
+            "name": item["name"],
+            "unit": item["unit"],
+            "quantity": round(float(totals[column]), 5),
+            "price_per_unit": item["price_per_unit"],
+            "cost": round(float(costs[column]), 2)
+        })
+    ingredients.sort(key=lambda row: row["name"])
+
+    # Direct sub-recipe / mid-prep usage, matching the old batch calculator summary
+    intermediates: Dict[Tuple[str, int], float] = {}
+    for cake_id, qty in plan.items():
+        for edge in graph.edges.get((CAKE, cake_id), []):
+            if edge.child[0] in (SUB_RECIPE, MID_PREP):
+                intermediates[edge.child] = intermediates.get(edge.child, 0.0) + edge.quantity * qty
+
+    def usage(kind: str) -> List[Dict[str, Any]]:
+        rows = []
+        for node, quantity in intermediates.items():
+            if node[0] != kind:
+                continue
+            unit_cost = graph.cost(*node)
+            rows.append({
+                "id": node[1],
+                "name": graph.names[node],
+                "quantity": round(quantity, 5),
+                "unit_cost": round(unit_cost, 2),
+                "total_cost": round(quantity * unit_cost, 2)
+            })
+        return sorted(rows, key=lambda row: row["name"])
+
+    return {
+        "ingredients": ingredients,
+        "sub_recipes": usage(SUB_RECIPE),
+        "mid_preps": usage(MID_PREP),
+        "total_cost": round(float(costs.sum()), 2),
+        "cake_count": len(plan) - len(missing),
+        "missing_cakes": missing
+    }
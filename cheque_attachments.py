@@ -0,0 +1,131 @@
+"""
+Cheque Attachments
+Settlement files are streamed into the upload store (upload_storage) and
+recorded in cheque_attachments under the name settlement_<cheque_id>_<uuid>
+<ext>, which is what download URLs use; file_path points at the stored
+blob. Listings look attachments up with one indexed query per page instead
+of globbing an upload directory for every cheque. Files saved before the
+store existed live in uploads/early_settlement_files under their name.
+"""
+
+import mimetypes
+import os
+import uuid
+from typing import Any, Dict, Iterable, List, Optional
+
+from fastapi import UploadFile
+from sqlalchemy import text, bindparam
+from sqlalchemy.orm import Session
+
+from upload_storage import store_upload_or_400
+
+ATTACHMENT_DIR = "uploads/early_settlement_files"
+
+
+async def store_settlement_files(cheque_id: int, files: List[UploadFile], max_bytes: int) -> List[Dict[str, Any]]:
+    """Stream settlement files into the upload store, named for record_cheque_attachments"""
+    uploaded_files = []
+    for file in files:
+        stored = await store_upload_or_400(file, max_bytes)
+        stored["saved_filename"] = f"settlement_{cheque_id}_{uuid.uuid4()}{os.path.splitext(stored['file_path'])[1]}"
+        uploaded_files.append(stored)
+    return uploaded_files
+
+
+def attachment_file(db: Session, cheque_id: int, filename: str) -> Optional[Dict[str, Any]]:
+    """Stored path / type / upload name of one attachment, or None"""
+    row = db.execute(text("""
+        SELECT file_path, mime_type, original_filename
+        FROM cheque_attachments
+        WHERE cheque_id = :cheque_id AND filename = :filename
+        LIMIT 1
+    """), {"cheque_id": cheque_id, "filename": filename}).fetchone()
+    if not row:
+        return None
+    return {"file_path": row[0], "mime_type": row[1], "original_filename": row[2]}
+
+
+def record_cheque_attachments(db: Session, cheque_id: int, uploaded_files: List[Dict[str, Any]],
+                              uploaded_by: Optional[int] = None):
+    """Insert the metadata of files just saved for a cheque (caller commits)"""
+    if not uploaded_files:
+        return
+    db.execute(text("""
+        INSERT INTO cheque_attachments
+            (cheque_id, filename, original_filename, file_path, file_size, mime_type, uploaded_by, uploaded_at)
+        VALUES
+            (:cheque_id, :filename, :original_filename, :file_path, :file_size, :mime_type, :uploaded_by, CURRENT_TIMESTAMP)
+    """), [
+        {
+            "cheque_id": cheque_id,
+            "filename": uploaded["saved_filename"],
+            "original_filename": uploaded["original_filename"] or uploaded["saved_filename"],
+            "file_path": uploaded["file_path"],
+            "file_size": uploaded["file_size"],
+            "mime_type": uploaded.get("mime_type"),
+            "uploaded_by": uploaded_by
+        }
+        for uploaded in uploaded_files
+    ])
+
+
+def attachments_by_cheque(db: Session, cheque_ids: Iterable[int]) -> Dict[int, List[Dict[str, Any]]]:
+    """cheque_id -> attachments, for a page of cheques in one query"""
+    cheque_ids = list(cheque_ids)
+    attachments: Dict[int, List[Dict[str, Any]]] = {}
+    if not cheque_ids:
+        return attachments
+    rows = db.execute(text("""
+        SELECT cheque_id, filename, original_filename, file_size, file_path
+        FROM cheque_attachments
+        WHERE cheque_id IN :cheque_ids
+        ORDER BY cheque_id, id
+    """).bindparams(bindparam("cheque_ids", expanding=True)), {"cheque_ids": cheque_ids})
+    for row in rows:
+        attachments.setdefault(row[0], []).append({
+            "filename": row[1],
+            "original_filename": row[2],
+            "file_size": row[3],
+            "file_path": row[4]
+        })
+    return attachments
+
+
+def backfill_from_disk(db: Session, directory: str = ATTACHMENT_DIR) -> int:
+    """Record settlement files saved before the table existed; returns rows added"""
+    if not os.path.isdir(directory):
+        return 0
+    known = {row[0] for row in db.execute(text("SELECT filename FROM cheque_attachments"))}
+    cheque_ids = {row[0] for row in db.execute(text("SELECT id FROM cheques"))}
+    added = 0
+    for entry in os.scandir(directory):
+        parts = entry.name.split("_", 2)
+        if not entry.is_file() or entry.name in known or len(parts) < 3 or parts[0] != "settlement":
+            continue
+        if not parts[1].isdigit() or int(parts[1]) not in cheque_ids:
+            continue
+        record_cheque_attachments(db, int(parts[1]), [{
+            "saved_filename": entry.name,
+            "original_filename": entry.name,  # the upload name was not kept on disk
+            "file_path": os.path.join(directory, entry.name),
+            "file_size": entry.stat().st_size,
+            "mime_type": mimetypes.guess_type(entry.name)[0]
+        }])
+        added += 1
+    return added
+
+
+if __name__ == "__main__":
+    # One-off after creating the table: python cheque_attachments.py
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        added = backfill_from_disk(db)
+        db.commit()
+        print(f"✅ Recorded {added} existing settlement attachment(s)")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Error recording settlement attachments: {str(e)}")
+    finally:
+        db.close()
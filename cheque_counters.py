@@ -0,0 +1,178 @@
+"""
+Cheque Spend Counters
+Stored per-cheque expense totals and per-book status counts, kept in step
+with every write in the same transaction, so listings read a cheque's spend
+and a book's summary from one row instead of summing expenses / scanning
+cheques.
+
+- cheques.total_expenses / expenses_count: non-rejected expenses on the
+  cheque, moved by deltas (record_expense, expense_status_changed,
+  move_expense). Open cheques (assigned / active / overspent) also get
+  their status and overspent_amount from the new total, as in
+  Cheque.update_status().
+- cheque_books.<status>_cheques / cheques_count: moved by one when an
+  expense changes its cheque's status (record_expense; only that cheque
+  and its book row are locked), and recomputed from the book's cheques
+  (one indexed GROUP BY, at most 1,000 rows) after the other cheque status
+  changes, via refresh_book_counters().
+
+rebuild_counters() recomputes everything from scratch (backfill / repair).
+"""
+
+from typing import Iterable, Optional
+
+from sqlalchemy import text, bindparam
+from sqlalchemy.orm import Session
+
+# Statuses an expense may still move between assigned / active / overspent
+OPEN_STATUSES = ("assigned", "active", "overspent")
+
+# Statuses with a cheque_books.<status>_cheques column
+BOOK_STATUSES = ("created", "assigned", "active", "overspent", "settled", "cancelled")
+
+# Only the status and overspent_amount expressions may read total_expenses:
+# they are assigned first, so they see the old total on MySQL too
+_APPLY_EXPENSE_DELTA = text(f"""
+    UPDATE cheques
+    SET overspent_amount = CASE
+            WHEN status IN {OPEN_STATUSES} THEN GREATEST(COALESCE(total_expenses, 0) + :amount - amount, 0)
+            ELSE overspent_amount
+        END,
+        status = CASE
+            WHEN status NOT IN {OPEN_STATUSES} THEN status
+            WHEN COALESCE(total_expenses, 0) + :amount > amount THEN 'overspent'
+            WHEN COALESCE(total_expenses, 0) + :amount > 0 THEN 'active'
+            ELSE 'assigned'
+        END,
+        expenses_count = COALESCE(expenses_count, 0) + :count,
+        total_expenses = COALESCE(total_expenses, 0) + :amount
+    WHERE id = :cheque_id
+""")
+
+# {books}: an expanding bind parameter or a parenthesized subquery
+_REFRESH_BOOKS = """
+    UPDATE cheque_books b
+    JOIN (
+        SELECT c.cheque_book_id,
+               COUNT(*) AS cheques_count,
+               SUM(CASE WHEN c.status = 'created' THEN 1 ELSE 0 END) AS created_cheques,
+               SUM(CASE WHEN c.status = 'assigned' THEN 1 ELSE 0 END) AS assigned_cheques,
+               SUM(CASE WHEN c.status = 'active' THEN 1 ELSE 0 END) AS active_cheques,
+               SUM(CASE WHEN c.status = 'overspent' THEN 1 ELSE 0 END) AS overspent_cheques,
+               SUM(CASE WHEN c.status = 'settled' THEN 1 ELSE 0 END) AS settled_cheques,
+               SUM(CASE WHEN c.status = 'cancelled' THEN 1 ELSE 0 END) AS cancelled_cheques
+        FROM cheques c
+        WHERE c.cheque_book_id IN {books}
+        GROUP BY c.cheque_book_id
+    ) counts ON counts.cheque_book_id = b.id
+    SET b.cheques_count = counts.cheques_count,
+        b.created_cheques = counts.created_cheques,
+        b.assigned_cheques = counts.assigned_cheques,
+        b.active_cheques = counts.active_cheques,
+        b.overspent_cheques = counts.overspent_cheques,
+        b.settled_cheques = counts.settled_cheques,
+        b.cancelled_cheques = counts.cancelled_cheques
+"""
+
+_ZERO_EMPTY_BOOKS = """
+    UPDATE cheque_books
+    SET cheques_count = 0, created_cheques = 0, assigned_cheques = 0, active_cheques = 0,
+        overspent_cheques = 0, settled_cheques = 0, cancelled_cheques = 0
+    WHERE id NOT IN (SELECT DISTINCT cheque_book_id FROM cheques WHERE cheque_book_id IS NOT NULL)
+"""
+
+
+def refresh_book_counters(db: Session, cheque_ids: Optional[Iterable[int]] = None,
+                          book_ids: Optional[Iterable[int]] = None):
+    """Recompute the status counters of the books holding these cheques (or these books)"""
+    cheque_ids = [cheque_id for cheque_id in (cheque_ids or []) if cheque_id is not None]
+    book_ids = [book_id for book_id in (book_ids or []) if book_id is not None]
+    if cheque_ids:
+        book_ids += [
+            row[0] for row in db.execute(
+                text("SELECT DISTINCT cheque_book_id FROM cheques WHERE id IN :ids AND cheque_book_id IS NOT NULL")
+                .bindparams(bindparam("ids", expanding=True)),
+                {"ids": cheque_ids}
+            )
+        ]
+    if not book_ids:
+        return
+    db.execute(
+        text(_REFRESH_BOOKS.format(books=":book_ids")).bindparams(bindparam("book_ids", expanding=True)),
+        {"book_ids": sorted(set(book_ids))}
+    )
+
+
+def record_expense(db: Session, cheque_id: int, amount: float, count: int = 1):
+    """A counted (non-rejected) expense was added to a cheque; negative values remove one"""
+    # Lock just this cheque; other cheques of the book stay free for other postings
+    before = db.execute(
+        text("SELECT status, cheque_book_id FROM cheques WHERE id = :cheque_id FOR UPDATE"),
+        {"cheque_id": cheque_id}
+    ).fetchone()
+    if not before:
+        return
+    db.execute(_APPLY_EXPENSE_DELTA, {"cheque_id": cheque_id, "amount": amount, "count": count})
+    old_status, book_id = before
+    if book_id is None or old_status not in OPEN_STATUSES:
+        return
+    new_status = db.execute(text("SELECT status FROM cheques WHERE id = :cheque_id"),
+                            {"cheque_id": cheque_id}).scalar()
+    if new_status != old_status and new_status in BOOK_STATUSES:
+        db.execute(text(f"""
+            UPDATE cheque_books
+            SET {old_status}_cheques = COALESCE({old_status}_cheques, 0) - 1,
+                {new_status}_cheques = COALESCE({new_status}_cheques, 0) + 1
+            WHERE id = :book_id
+        """), {"book_id": book_id})
+
+
+def expense_status_changed(db: Session, cheque_id: int, amount: float, old_status: str, new_status: str):
+    """Approving/rejecting an expense: only crossing 'rejected' changes the counters"""
+    was_counted = old_status != "rejected"
+    is_counted = new_status != "rejected"
+    if was_counted and not is_counted:
+        record_expense(db, cheque_id, -amount, -1)
+    elif is_counted and not was_counted:
+        record_expense(db, cheque_id, amount, 1)
+
+
+def move_expense(db: Session, amount: float, from_cheque_id: int, to_cheque_id: int, status: str = "pending"):
+    """An expense was moved to another cheque"""
+    if status == "rejected" or from_cheque_id == to_cheque_id:
+        return
+    record_expense(db, from_cheque_id, -amount, -1)
+    record_expense(db, to_cheque_id, amount, 1)
+
+
+def rebuild_counters(db: Session):
+    """Recompute every cheque and book counter from the expenses and cheques tables"""
+    db.execute(text("""
+        UPDATE cheques c
+        LEFT JOIN (
+            SELECT cheque_id, COUNT(*) AS expenses_count, SUM(amount) AS total_expenses
+            FROM expenses
+            WHERE status != 'rejected'
+            GROUP BY cheque_id
+        ) e ON e.cheque_id = c.id
+        SET c.expenses_count = COALESCE(e.expenses_count, 0),
+            c.total_expenses = COALESCE(e.total_expenses, 0)
+    """))
+    db.execute(text(_REFRESH_BOOKS.format(books="(SELECT id FROM cheque_books)")))
+    db.execute(text(_ZERO_EMPTY_BOOKS))
+
+
+if __name__ == "__main__":
+    # Backfill after adding the columns, or repair: python cheque_counters.py
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        rebuild_counters(db)
+        db.commit()
+        print("✅ Cheque and cheque book counters rebuilt")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Error rebuilding cheque counters: {str(e)}")
+    finally:
+        db.close()
@@ -38,6 +38,14 @@ class Settings(BaseSettings):
     default_currency: str = "EGP"
     supported_currencies: str = "EGP,USD,EUR,GBP"
     
+    # PDF render pool (0 = derive from CPU count)
+    pdf_render_workers: int = 0
+    pdf_render_queue_limit: int = 0
+    pdf_render_timeout_seconds: float = 30.0
+    
+    # Safe / bank balance ledger checkpoints (0 = off)
+    ledger_checkpoint_minutes: int = 60
+    
     # Encryption key for sensitive data (derived from SECRET_KEY)
     @property
     def encryption_key(self) -> bytes:
@@ -56,6 +64,9 @@ class Settings(BaseSettings):
     foodics_token_expiry_hours: int = 24
     max_failed_sync_attempts: int = 3
     sync_rate_limit_per_hour: int = 10
+    foodics_order_sync_minutes: int = 15  # background order ingestion interval (0 = off)
+    foodics_api_url: str = "https://api.foodics.dev/v5"
+    foodics_page_concurrency: int = 4  # listing pages fetched at the same time
     
     @property
     def cors_origins(self) -> list:
@@ -0,0 +1,195 @@
+"""
+Generated Document Cache
+Content-addressed, size-bounded disk cache for rendered documents (PO
+PDF/HTML, PO cheques, expense summaries). A document's key is the SHA-256 of
+everything it is rendered from - type, entity data, language and a
+template/settings version - so a changed PO can never be served from a stale
+entry, and the same key is the ETag browsers revalidate with (304).
+"""
+
+import asyncio
+import hashlib
+import inspect
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+
+from fastapi import Request
+from fastapi.responses import Response
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path("storage/document_cache")
+
+# Total bytes kept on disk; least recently used documents are evicted first
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+# Document types
+PO_PDF = "po_pdf"
+PO_HTML = "po_html"
+PO_CHEQUE_PDF = "po_cheque_pdf"
+EXPENSE_SUMMARY_HTML = "expense_summary_html"
+
+Renderer = Callable[[], Union[bytes, str, Awaitable[Union[bytes, str]]]]
+
+
+def renderer_version(module) -> str:
+    """Version of a generator module (its source mtime), so deploys invalidate"""
+    try:
+        return str(os.stat(inspect.getfile(module)).st_mtime_ns)
+    except (TypeError, OSError):
+        return "0"
+
+
+def document_key(doc_type: str, data: Any, language: str = "", version: str = "") -> str:
+    payload = json.dumps(
+        {"type": doc_type, "data": data, "language": language, "version": version},
+        sort_keys=True, default=str, ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DocumentCache:
+    """
+    Files are stored as `<type>-<entity>-<key>` under CACHE_DIR so entries of
+    one entity can be dropped by prefix. The in-memory LRU (path -> size) is
+    rebuilt from the directory, oldest modification first, on first use.
+    """
+
+    def __init__(self, directory: Path = CACHE_DIR, max_bytes: int = MAX_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self._loaded = False
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        files = [entry for entry in os.scandir(self.directory) if entry.is_file() and not entry.name.endswith(".tmp")]
+        files.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in files:
+            size = entry.stat().st_size
+            self._entries[entry.name] = size
+            self._total += size
+        self._loaded = True
+        self._evict()
+
+    def _evict(self):
+        while self._total > self.max_bytes and self._entries:
+            name, size = self._entries.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(self.directory / name)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _file_name(doc_type: str, entity_id: Any, key: str) -> str:
+        return f"{doc_type}-{entity_id}-{key}"
+
+    def get(self, doc_type: str, entity_id: Any, key: str) -> Optional[bytes]:
+        name = self._file_name(doc_type, entity_id, key)
+        with self._lock:
+            self._ensure_loaded()
+            if name not in self._entries:
+                return None
+            try:
+                content = (self.directory / name).read_bytes()
+            except OSError:
+                self._total -= self._entries.pop(name)
+                return None
+            self._entries.move_to_end(name)
+        try:
+            os.utime(self.directory / name)  # keeps LRU order across restarts
+        except OSError:
+            pass
+        return content
+
+    def put(self, doc_type: str, entity_id: Any, key: str, content: bytes):
+        name = self._file_name(doc_type, entity_id, key)
+        with self._lock:
+            self._ensure_loaded()
+            temp_path = self.directory / f"{name}.{threading.get_ident()}.tmp"
+            temp_path.write_bytes(content)
+            os.replace(temp_path, self.directory / name)
+            self._total -= self._entries.pop(name, 0)
+            self._entries[name] = len(content)
+            self._total += len(content)
+            self._evict()
+
+    def invalidate(self, doc_type: Optional[str] = None, entity_id: Any = None):
+        """Drop the documents of one entity, of one type, or everything"""
+        prefix = ""
+        if doc_type is not None:
+            prefix = f"{doc_type}-" if entity_id is None else f"{doc_type}-{entity_id}-"
+        with self._lock:
+            self._ensure_loaded()
+            for name in [name for name in self._entries if name.startswith(prefix)]:
+                self._total -= self._entries.pop(name)
+                try:
+                    os.remove(self.directory / name)
+                except OSError:
+                    pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified
+            }
+
+    async def respond(self, request: Optional[Request], doc_type: str, entity_id: Any, key: str,
+                      render: Renderer, media_type: str, headers: Optional[Dict[str, str]] = None) -> Response:
+        """
+        Serve a document by key: 304 when the browser already has it, the
+        cached file when present, otherwise render (sync or async), store
+        and serve.
+        """
+        etag = f'"{key}"'
+        response_headers = {"ETag": etag, "Cache-Control": "private, no-cache", **(headers or {})}
+
+        if request is not None:
+            if_none_match = request.headers.get("if-none-match", "")
+            if etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+                with self._lock:
+                    self.not_modified += 1
+                return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+        content = await asyncio.to_thread(self.get, doc_type, entity_id, key)
+        if content is not None:
+            with self._lock:
+                self.hits += 1
+            response_headers["X-Document-Cache"] = "hit"
+            return Response(content=content, media_type=media_type, headers=response_headers)
+
+        with self._lock:
+            self.misses += 1
+        content = render()
+        if inspect.isawaitable(content):
+            content = await content
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        try:
+            await asyncio.to_thread(self.put, doc_type, entity_id, key, content)
+        except OSError as e:
+            logger.warning(f"Could not cache {doc_type} document: {e}")
+        response_headers["X-Document-Cache"] = "miss"
+        return Response(content=content, media_type=media_type, headers=response_headers)
+
+
+# Shared instance used by all endpoints in this process
+document_cache = DocumentCache()
@@ -0,0 +1,286 @@
+"""
+Streaming Exports
+Shared CSV / XLSX export helpers: rows come from an unbuffered (server-side)
+cursor in batches and are encoded by generators straight into a
+StreamingResponse, so memory stays flat and the first bytes go out before
+the query has finished
+"""
+
+import csv
+import io
+import math
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+
+from fastapi.responses import StreamingResponse
+from sqlalchemy import text
+
+from database import engine
+
+# Rows fetched from the cursor per round trip
+EXPORT_BATCH_SIZE = 2000
+
+# Rows encoded before handing a chunk to the response
+CHUNK_ROWS = 500
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def iter_query_rows(sql: str, params: Optional[Dict[str, Any]] = None,
+                    batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[Sequence[Any]]:
+    """
+    Yield the rows of a raw SQL query from an unbuffered cursor on its own
+    pooled connection (the request session is closed before a streamed body
+    is sent). mysql-connector buffers the whole result set unless asked not
+    to, and SQLAlchemy's stream_results is a no-op for that driver, so the
+    DBAPI cursor is used directly.
+    """
+    compiled = text(sql).bindparams(**(params or {})).compile(dialect=engine.dialect)
+    if compiled.positional:
+        args: Any = tuple(compiled.params[name] for name in compiled.positiontup)
+    else:
+        args = compiled.params
+
+    connection = engine.raw_connection()
+    finished = False
+    try:
+        try:
+            cursor = connection.cursor(buffered=False)
+        except TypeError:
+            cursor = connection.cursor()  # driver without the buffered flag
+        cursor.execute(compiled.string, args)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+        cursor.close()
+        finished = True
+    finally:
+        if finished:
+            connection.close()
+        else:
+            # Client went away mid-stream: unread rows would block the
+            # connection, so drop it instead of returning it to the pool
+            connection.invalidate()
+            connection.close()
+
+
+def _content_disposition(filename: str) -> str:
+    """Attachment header that survives non-ASCII (e.g. Arabic) file names"""
+    fallback = filename.encode("ascii", "ignore").decode() or "export"
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"
+
+
+def _chunks(rows: Iterable[Sequence[Any]], size: int = CHUNK_ROWS) -> Iterator[List[Sequence[Any]]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ==========================================
+# CSV
+# ==========================================
+
+def iter_csv(header: Sequence[str], rows: Iterable[Sequence[Any]]) -> Iterator[bytes]:
+    """Encode rows as UTF-8 CSV (with BOM so Excel shows Arabic correctly)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(header)
+    yield ("\ufeff" + buffer.getvalue()).encode("utf-8")
+
+    for batch in _chunks(rows):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(batch)
+        yield buffer.getvalue().encode("utf-8")
+
+
+def csv_response(filename: str, header: Sequence[str], rows: Iterable[Sequence[Any]]) -> StreamingResponse:
+    return StreamingResponse(
+        iter_csv(header, rows),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": _content_disposition(filename)}
+    )
+
+
+# ==========================================
+# XLSX
+# ==========================================
+
+_XML_ILLEGAL = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>'
+)
+
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+
+_SHEET_TAIL = '</sheetData></worksheet>'
+
+
+class _ChunkSink:
+    """Write-only, non-seekable file object; the generator drains what the zip writer produced"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _column_letter(index: int) -> str:
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def _sheet_name(name: str) -> str:
+    cleaned = re.sub(r"[\[\]:*?/\\]", " ", name).strip()[:31]
+    return escape(cleaned or "Sheet1", {'"': "&quot;"})
+
+
+def _finite(value: Any) -> bool:
+    if isinstance(value, float):
+        return math.isfinite(value)
+    if isinstance(value, Decimal):
+        return value.is_finite()
+    return True
+
+
+def _xlsx_row(row_number: int, values: Sequence[Any], columns: List[str], style: str = "") -> str:
+    cells = []
+    for column, value in zip(columns, values):
+        ref = f"{column}{row_number}"
+        if value is None or not _finite(value):
+            continue  # SpreadsheetML has no NaN / infinity; leave the cell empty
+        if isinstance(value, bool):
+            cells.append(f'<c r="{ref}"{style} t="b"><v>{int(value)}</v></c>')
+        elif isinstance(value, (int, float, Decimal)):
+            cells.append(f'<c r="{ref}"{style}><v>{value}</v></c>')
+        else:
+            if isinstance(value, (datetime, date)):
+                value = value.isoformat()
+            cleaned = escape(_XML_ILLEGAL.sub("", str(value)))
+            cells.append(f'<c r="{ref}"{style} t="inlineStr"><is><t xml:space="preserve">{cleaned}</t></is></c>')
+    return f'<row r="{row_number}">{"".join(cells)}</row>'
+
+
+def iter_xlsx(header: Sequence[str], rows: Iterable[Sequence[Any]], sheet_name: str = "Sheet1") -> Iterator[bytes]:
+    """
+    Encode rows as a single-sheet .xlsx without holding the workbook in
+    memory: the sheet is written with inline strings into a zip entry whose
+    compressed output is yielded as it is produced
+    """
+    columns = [_column_letter(index) for index in range(len(header))]
+    sink = _ChunkSink()
+
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        archive.writestr("_rels/.rels", _ROOT_RELS)
+        archive.writestr("xl/workbook.xml", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{_sheet_name(sheet_name)}" sheetId="1" r:id="rId1"/></sheets></workbook>'
+        ))
+        archive.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        archive.writestr("xl/styles.xml", _STYLES)
+
+        with archive.open("xl/worksheets/sheet1.xml", mode="w", force_zip64=True) as sheet:
+            sheet.write((_SHEET_HEAD + _xlsx_row(1, header, columns, ' s="1"')).encode("utf-8"))
+            yield sink.drain()
+
+            row_number = 1
+            for batch in _chunks(rows):
+                parts = []
+                for values in batch:
+                    row_number += 1
+                    parts.append(_xlsx_row(row_number, values, columns))
+                sheet.write("".join(parts).encode("utf-8"))
+                data = sink.drain()
+                if data:
+                    yield data
+
+            sheet.write(_SHEET_TAIL.encode("utf-8"))
+
+    yield sink.drain()
+
+
+def xlsx_response(filename: str, header: Sequence[str], rows: Iterable[Sequence[Any]],
+                  sheet_name: str = "Sheet1") -> StreamingResponse:
+    return StreamingResponse(
+        iter_xlsx(header, rows, sheet_name),
+        media_type=XLSX_MEDIA_TYPE,
+        headers={"Content-Disposition": _content_disposition(filename)}
+    )
+
+
+def export_response(export_format: str, filename: str, header: Sequence[str],
+                    rows: Iterable[Sequence[Any]], sheet_name: str = "Sheet1") -> StreamingResponse:
+    """Pick the CSV or XLSX encoder from a `format` query value; `filename` has no extension"""
+    if export_format == "xlsx":
+        return xlsx_response(f"{filename}.xlsx", header, rows, sheet_name)
+    return csv_response(f"{filename}.csv", header, rows)
@@ -0,0 +1,245 @@
+"""
+Foodics HTTP Client
+One long-lived httpx.AsyncClient for every Foodics API call: pooled
+keep-alive connections (HTTP/2 when the h2 package is installed), so calls
+reuse an open TLS connection instead of handshaking each time. Requests are
+retried on 429 / 5xx / connection errors with jittered exponential backoff,
+honouring Retry-After, and paginated listings fetch the remaining pages
+concurrently once page 1 reports last_page.
+"""
+
+import asyncio
+import logging
+import random
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from config import settings
+
+try:
+    import h2  # noqa: F401 - enables httpx's HTTP/2 support
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Connection pool (one host; HTTP/2 multiplexes requests over one connection)
+MAX_CONNECTIONS = 10
+KEEPALIVE_EXPIRY_SECONDS = 60.0
+DEFAULT_TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+
+# Retries after the first attempt, and the backoff window (seconds)
+MAX_RETRIES = 4
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 30.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Pages of one listing fetched at the same time (FOODICS_PAGE_CONCURRENCY overrides)
+PAGE_CONCURRENCY = settings.foodics_page_concurrency
+
+
+class FoodicsAPIError(Exception):
+    """A Foodics call answered with a non-200 status (after retries)"""
+
+    def __init__(self, response: httpx.Response):
+        self.response = response
+        self.status_code = response.status_code
+        super().__init__(f"HTTP {response.status_code}")
+
+
+class FoodicsClient:
+    """
+    Shared async client for the Foodics API.
+
+    `await foodics_client.get("/orders", headers=..., params=...)` returns the
+    final httpx.Response (callers still check the status), retrying 429 /
+    5xx answers and transport errors up to `max_retries` times.
+    `get_all_pages()` returns the `data` of every page of a listing. The
+    client is created on first use or by start(), and closed by aclose()
+    at application shutdown. Pass `transport` to run against a mock server.
+    """
+
+    def __init__(self, base_url: str = settings.foodics_api_url, max_retries: int = MAX_RETRIES,
+                 page_concurrency: int = PAGE_CONCURRENCY, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.page_concurrency = page_concurrency
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._requests = 0
+        self._retries = 0
+        self._failed = 0
+
+    # ---------- lifecycle ----------
+
+    def start(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                http2=HTTP2_AVAILABLE,
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_CONNECTIONS,
+                    keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS
+                ),
+                timeout=DEFAULT_TIMEOUT,
+                transport=self.transport
+            )
+            logger.info(f"Foodics HTTP client started ({'HTTP/2' if HTTP2_AVAILABLE else 'HTTP/1.1'}, "
+                        f"{MAX_CONNECTIONS} connection(s))")
+        return self._client
+
+    async def aclose(self):
+        client, self._client = self._client, None
+        if client is not None:
+            await client.aclose()
+
+    # ---------- requests ----------
+
+    @staticmethod
+    def _backoff(attempt: int, response: Optional[httpx.Response] = None) -> float:
+        """Retry-After when the server sends one, otherwise full-jitter exponential backoff"""
+        if response is not None and response.headers.get("retry-after"):
+            try:
+                return min(max(float(response.headers["retry-after"]), 0.0), BACKOFF_MAX_SECONDS)
+            except ValueError:
+                pass  # HTTP-date form; fall back to backoff
+        return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+    async def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        client = self.start()
+        for attempt in range(self.max_retries + 1):
+            self._requests += 1
+            try:
+                response = await client.request(method, path, **kwargs)
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    self._failed += 1
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"Foodics {method} {path} failed ({e.__class__.__name__}), retrying in {delay:.2f}s")
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                if attempt == self.max_retries:
+                    self._failed += 1
+                    return response
+                delay = self._backoff(attempt, response)
+                logger.warning(f"Foodics {method} {path} answered {response.status_code}, retrying in {delay:.2f}s")
+            self._retries += 1
+            await asyncio.sleep(delay)
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", path, **kwargs)
+
+    async def get_all_pages(self, path: str, headers: Dict[str, str],
+                            params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        `data` of every page of a listing, in page order. Page 1 is fetched
+        first for meta.last_page; the rest run concurrently, at most
+        `page_concurrency` at a time. Raises FoodicsAPIError on a non-200 page.
+        """
+        params = dict(params or {})
+        response = await self.get(path, headers=headers, params={**params, "page": 1})
+        if response.status_code != 200:
+            raise FoodicsAPIError(response)
+        body = response.json()
+        items = list(body.get("data", []))
+        last_page = int(body.get("meta", {}).get("last_page") or 1)
+        if last_page <= 1:
+            return items
+
+        semaphore = asyncio.Semaphore(self.page_concurrency)
+
+        async def fetch_page(page: int) -> List[Dict[str, Any]]:
+            async with semaphore:
+                page_response = await self.get(path, headers=headers, params={**params, "page": page})
+            if page_response.status_code != 200:
+                raise FoodicsAPIError(page_response)
+            return page_response.json().get("data", [])
+
+        for page_items in await asyncio.gather(*(fetch_page(page) for page in range(2, last_page + 1))):
+            items.extend(page_items)
+        return items
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "base_url": self.base_url,
+            "http2": HTTP2_AVAILABLE,
+            "started": self._client is not None,
+            "requests": self._requests,
+            "retries": self._retries,
+            "failed": self._failed
+        }
+
+
+# Shared instance used by FoodicsService in this process
+foodics_client = FoodicsClient()
+
+
+if __name__ == "__main__":
+    # Paging benchmark against a local mock Foodics server: python foodics_client.py
+    import json
+    import threading
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlparse
+
+    TOTAL_PAGES = 40
+    LATENCY_SECONDS = 0.05
+    hits = {"count": 0}
+
+    class MockFoodics(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+
+        def do_GET(self):
+            hits["count"] += 1
+            time.sleep(LATENCY_SECONDS)
+            if hits["count"] % 9 == 0:  # rate limit every 9th request
+                body, status, extra = b'{"message": "Too Many Attempts."}', 429, {"Retry-After": "0.1"}
+            else:
+                page = int(parse_qs(urlparse(self.path).query).get("page", ["1"])[0])
+                body = json.dumps({
+                    "data": [{"id": f"item-{page}-{index}"} for index in range(100)],
+                    "meta": {"current_page": page, "last_page": TOTAL_PAGES}
+                }).encode()
+                status, extra = 200, {}
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in extra.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockFoodics)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v5"
+
+    async def run(page_concurrency: int):
+        client = FoodicsClient(base_url=base_url, page_concurrency=page_concurrency)
+        started = time.perf_counter()
+        items = await client.get_all_pages("/inventory_items", headers={"Accept": "application/json"})
+        elapsed = time.perf_counter() - started
+        await client.aclose()
+        stats = client.stats()
+        print(f"page_concurrency={page_concurrency}: {len(items)} items from {TOTAL_PAGES} pages "
+              f"in {elapsed:.2f}s ({stats['requests']} requests, {stats['retries']} retried)")
+
+    async def per_call_clients():
+        # What every method did before: a new client (and connection) per listing page
+        started = time.perf_counter()
+        for page in range(1, TOTAL_PAGES + 1):
+            async with httpx.AsyncClient(base_url=base_url) as client:
+                await client.get("/inventory_items", params={"page": page})
+        print(f"new client per page, sequential: {time.perf_counter() - started:.2f}s")
+
+    asyncio.run(per_call_clients())
+    for concurrency in (1, PAGE_CONCURRENCY, 8):
+        asyncio.run(run(concurrency))
+    server.shutdown()
@@ -1,5 +1,5 @@
 import logging
-import httpx
+from foodics_client import foodics_client, FoodicsAPIError
 from typing import Dict, List, Optional, Any
 from sqlalchemy.orm import Session
 from sqlalchemy import text
@@ -8,6 +8,17 @@ from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Official include parameters for accounting orders (from documentation)
+ORDER_INCLUDES = [
+    "charges", "payments", "discount", "products", "products.taxes",
+    "charges.taxes", "products.product", "products.options", "combos.products",
+    "charges.charge", "products.discount", "combos.discount",
+    "combos.products.options.taxes", "combos.products.taxes", "products.options.taxes"
+]
+
+# The orders API returns at most 50 orders per page
+ORDERS_PER_PAGE = 50
+
 class FoodicsService:
     """
     Official Foodics Accounting/ERP Integration Service
@@ -15,8 +26,10 @@ class FoodicsService:
     """
     
     def __init__(self):
-        # Official Foodics API base URL from documentation
-        self.base_url = "https://api.foodics.dev/v5"
+        # Official Foodics API base URL from documentation (FOODICS_API_URL);
+        # every call goes through the shared pooled client
+        self.base_url = foodics_client.base_url
+        self.client = foodics_client
         self.default_headers = {
             "Accept": "application/json",
             "Content-Type": "application/json"
@@ -50,38 +63,36 @@ class FoodicsService:
         try:
             headers = self._get_headers(token)
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                url = f"{self.base_url}/whoami"
-                logger.info(f"🏢 DEBUG: Making whoami request to: {url}")
+            logger.info(f"🏢 DEBUG: Making whoami request to: {self.base_url}/whoami")
+            
+            response = await self.client.get("/whoami", headers=headers)
+            logger.info(f"🏢 DEBUG: Whoami response status: {response.status_code}")
+            
+            if response.status_code == 200:
+                data = response.json()
+                business_info = data.get("data", {})
                 
-                response = await client.get(url, headers=headers)
-                logger.info(f"🏢 DEBUG: Whoami response status: {response.status_code}")
+                logger.info(f"🏢 DEBUG: Business name: {business_info.get('business', {}).get('name', 'Unknown')}")
+                logger.info(f"🏢 DEBUG: Business reference: {business_info.get('business', {}).get('reference', 'Unknown')}")
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    business_info = data.get("data", {})
-                    
-                    logger.info(f"🏢 DEBUG: Business name: {business_info.get('business', {}).get('name', 'Unknown')}")
-                    logger.info(f"🏢 DEBUG: Business reference: {business_info.get('business', {}).get('reference', 'Unknown')}")
-                    
-                    return {
-                        "success": True,
-                        "business_info": business_info,
-                        "business_name": business_info.get('business', {}).get('name'),
-                        "business_reference": business_info.get('business', {}).get('reference'),
-                        "user_info": {
-                            "name": business_info.get('name'),
-                            "email": business_info.get('email')
-                        }
-                    }
-                else:
-                    logger.error(f"🏢 DEBUG: Whoami failed: {response.status_code} - {response.text}")
-                    return {
-                        "success": False,
-                        "error": f"HTTP {response.status_code}",
-                        "details": response.text
+                return {
+                    "success": True,
+                    "business_info": business_info,
+                    "business_name": business_info.get('business', {}).get('name'),
+                    "business_reference": business_info.get('business', {}).get('reference'),
+                    "user_info": {
+                        "name": business_info.get('name'),
+                        "email": business_info.get('email')
                     }
-                    
+                }
+            else:
+                logger.error(f"🏢 DEBUG: Whoami failed: {response.status_code} - {response.text}")
+                return {
+                    "success": False,
+                    "error": f"HTTP {response.status_code}",
+                    "details": response.text
+                }
+                
         except Exception as e:
             logger.error(f"🏢 DEBUG: Whoami exception: {str(e)}")
             return {
@@ -97,29 +108,27 @@ class FoodicsService:
         try:
             headers = self._get_headers(token)
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                url = f"{self.base_url}/settings"
-                response = await client.get(url, headers=headers)
+            response = await self.client.get("/settings", headers=headers)
+            
+            if response.status_code == 200:
+                data = response.json()
+                settings_data = data.get("data", {})
+                
+                return {
+                    "success": True,
+                    "settings": settings_data,
+                    "business_currency": settings_data.get("business_currency"),
+                    "business_timezone": settings_data.get("business_timezone"),
+                    "tax_settings": settings_data.get("tax_settings", {}),
+                    "rounding_settings": settings_data.get("rounding_settings", {})
+                }
+            else:
+                return {
+                    "success": False,
+                    "error": f"HTTP {response.status_code}",
+                    "details": response.text
+                }
                 
-                if response.status_code == 200:
-                    data = response.json()
-                    settings_data = data.get("data", {})
-                    
-                    return {
-                        "success": True,
-                        "settings": settings_data,
-                        "business_currency": settings_data.get("business_currency"),
-                        "business_timezone": settings_data.get("business_timezone"),
-                        "tax_settings": settings_data.get("tax_settings", {}),
-                        "rounding_settings": settings_data.get("rounding_settings", {})
-                    }
-                else:
-                    return {
-                        "success": False,
-                        "error": f"HTTP {response.status_code}",
-                        "details": response.text
-                    }
-                    
         except Exception as e:
             logger.error(f"⚙️ DEBUG: Settings exception: {str(e)}")
             return {
@@ -153,34 +162,17 @@ class FoodicsService:
         logger.info("🏢 DEBUG: Fetching branches (official ERP integration)")
         try:
             headers = self._get_headers(token)
-            all_branches = []
-            page = 1
-            
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                while True:
-                    url = f"{self.base_url}/branches"
-                    params = {"page": page}
-                    logger.info(f"🏢 DEBUG: Fetching branches page {page}")
-                    
-                    response = await client.get(url, headers=headers, params=params)
-                    
-                    if response.status_code != 200:
-                        logger.error(f"🏢 DEBUG: Branches API error: {response.status_code}")
-                        return {
-                            "success": False,
-                            "error": f"HTTP {response.status_code}",
-                            "details": response.text
-                        }
-                    
-                    data = response.json()
-                    page_branches = data.get("data", [])
-                    all_branches.extend(page_branches)
-                    
-                    # Check pagination
-                    meta = data.get("meta", {})
-                    if meta.get("current_page", 1) >= meta.get("last_page", 1):
-                        break
-                    page += 1
+            
+            # Page 1 first, then the remaining pages concurrently
+            try:
+                all_branches = await self.client.get_all_pages("/branches", headers)
+            except FoodicsAPIError as e:
+                logger.error(f"🏢 DEBUG: Branches API error: {e.status_code}")
+                return {
+                    "success": False,
+                    "error": f"HTTP {e.status_code}",
+                    "details": e.response.text
+                }
             
             logger.info(f"🏢 DEBUG: Retrieved {len(all_branches)} branches total")
             
@@ -229,20 +221,12 @@ class FoodicsService:
         try:
             headers = self._get_headers(token)
             
-            # Official include parameters from documentation
-            includes = [
-                "charges", "payments", "discount", "products", "products.taxes",
-                "charges.taxes", "products.product", "products.options", "combos.products",
-                "charges.charge", "products.discount", "combos.discount",
-                "combos.products.options.taxes", "combos.products.taxes", "products.options.taxes"
-            ]
-            
             params = {
                 "filter[status]": "4,5",  # Status 4: completed, Status 5: returned
-                "include": ",".join(includes),
+                "include": ",".join(ORDER_INCLUDES),
                 "sort": "reference",
                 "filter[reference_after]": reference_after,
-                "per_page": 50  # API returns 50 orders per page
+                "per_page": ORDERS_PER_PAGE
             }
             
             # Add date filters if provided
@@ -251,82 +235,61 @@ class FoodicsService:
             if end_date:
                 params["filter[created_at][lte]"] = end_date.isoformat()
             
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                url = f"{self.base_url}/orders"
-                logger.info(f"💰 DEBUG: Making orders request to: {url}")
-                logger.info(f"💰 DEBUG: Request params: {params}")
-                
-                response = await client.get(url, headers=headers, params=params)
-                logger.info(f"💰 DEBUG: Orders response status: {response.status_code}")
-                
-                if response.status_code != 200:
-                    logger.error(f"💰 DEBUG: Orders API error: {response.status_code} - {response.text}")
-                    return {
-                        "success": False,
-                        "error": f"API error: {response.status_code}",
-                        "details": response.text
-                    }
-                
-                data = response.json()
-                orders = data.get('data', [])
-                meta = data.get('meta', {})
-                
-                logger.info(f"💰 DEBUG: Retrieved {len(orders)} orders")
-                
-                # Process orders for accounting purposes
-                processed_orders = []
-                total_sales = 0
-                total_returns = 0
-                
-                for order in orders:
-                    order_status = order.get('status')
-                    order_total = float(order.get('total_price', 0))
-                    
-                    # Calculate net sales (completed - returned)
-                    if order_status == 4:  # Completed
-                        total_sales += order_total
-                    elif order_status == 5:  # Returned
-                        total_returns += order_total
-                    
-                    # Extract key accounting information
-                    processed_order = {
-                        "id": order.get("id"),
-                        "reference": order.get("reference"),
-                        "status": order_status,
-                        "status_name": "completed" if order_status == 4 else "returned" if order_status == 5 else "other",
-                        "total_price": order_total,
-                        "subtotal_price": float(order.get("subtotal_price", 0)),
-                        "discount_amount": float(order.get("discount_amount", 0)),
-                        "rounding_amount": float(order.get("rounding_amount", 0)),
-                        "created_at": order.get("created_at"),
-                        "business_date": order.get("business_date"),
-                        
-                        # Extract charges, taxes, payments info
-                        "charges": self._extract_charges_info(order.get("charges", [])),
-                        "taxes": self._extract_taxes_info(order),
-                        "payments": self._extract_payments_info(order.get("payments", [])),
-                        "products": self._extract_products_info(order.get("products", [])),
-                        "combos": self._extract_combos_info(order.get("combos", []))
-                    }
-                    processed_orders.append(processed_order)
-                
+            logger.info(f"💰 DEBUG: Making orders request to: {self.base_url}/orders")
+            logger.info(f"💰 DEBUG: Request params: {params}")
+            
+            response = await self.client.get("/orders", headers=headers, params=params, timeout=60.0)
+            logger.info(f"💰 DEBUG: Orders response status: {response.status_code}")
+            
+            if response.status_code != 200:
+                logger.error(f"💰 DEBUG: Orders API error: {response.status_code} - {response.text}")
                 return {
-                    "success": True,
-                    "orders": processed_orders,
-                    "summary": {
-                        "total_orders": len(orders),
-                        "total_sales": total_sales,
-                        "total_returns": total_returns,
-                        "net_sales": total_sales - total_returns
-                    },
-                    "pagination": {
-                        "current_page": meta.get("current_page", 1),
-                        "last_page": meta.get("last_page", 1),
-                        "per_page": meta.get("per_page", 50),
-                        "total": meta.get("total", 0)
-                    }
+                    "success": False,
+                    "error": f"API error: {response.status_code}",
+                    "details": response.text
                 }
+            
+            data = response.json()
+            orders = data.get('data', [])
+            meta = data.get('meta', {})
+            
+            logger.info(f"💰 DEBUG: Retrieved {len(orders)} orders")
+            
+            # Process orders for accounting purposes
+            processed_orders = []
+            total_sales = 0
+            total_returns = 0
+            
+            for order in orders:
+                order_status = order.get('status')
+                order_total = float(order.get('total_price', 0))
+                
+                # Calculate net sales (completed - returned)
+                if order_status == 4:  # Completed
+                    total_sales += order_total
+                elif order_status == 5:  # Returned
+                    total_returns += order_total
                 
+                # Extract key accounting information
+                processed_orders.append(self.normalize_order(order))
+            
+            return {
+                "success": True,
+                "orders": processed_orders,
+                "summary": {
+                    "total_orders": len(orders),
+                    "total_sales": total_sales,
+                    "total_returns": total_returns,
+                    "net_sales": total_sales - total_returns
+                },
+                "pagination": {
+                    "current_page": meta.get("current_page", 1),
+                    "last_page": meta.get("last_page", 1),
+                    "per_page": meta.get("per_page", 50),
+                    "total": meta.get("total", 0)
+                }
+            }
+            
         except Exception as e:
             logger.error(f"💰 DEBUG: Exception getting orders: {str(e)}")
             return {
@@ -334,6 +297,59 @@ class FoodicsService:
                 "error": str(e)
             }
     
+    async def fetch_orders_after(self, token: str, reference_after: int = 0, branch_id: str = None) -> Dict[str, Any]:
+        """
+        One page of orders (every status) with a reference above
+        `reference_after`, sorted by reference, as raw API objects. Paging is
+        done by moving `reference_after` to the last reference returned.
+        Open orders are included so the caller can tell where its cursor
+        must stop until they are closed.
+        """
+        params = {
+            "include": ",".join(ORDER_INCLUDES),
+            "sort": "reference",
+            "filter[reference_after]": reference_after,
+            "per_page": ORDERS_PER_PAGE
+        }
+        if branch_id:
+            params["filter[branch_id]"] = branch_id
+        
+        response = await self.client.get("/orders", headers=self._get_headers(token), params=params, timeout=60.0)
+        
+        if response.status_code != 200:
+            logger.error(f"Orders API error: {response.status_code} - {response.text}")
+            return {
+                "success": False,
+                "error": f"API error: {response.status_code}",
+                "details": response.text
+            }
+        
+        data = response.json()
+        return {"success": True, "orders": data.get("data", []), "meta": data.get("meta", {})}
+    
+    def normalize_order(self, order: Dict) -> Dict[str, Any]:
+        """Accounting view of a raw order (amounts as floats, lines extracted)"""
+        order_status = order.get("status")
+        return {
+            "id": order.get("id"),
+            "reference": order.get("reference"),
+            "status": order_status,
+            "status_name": "completed" if order_status == 4 else "returned" if order_status == 5 else "other",
+            "total_price": float(order.get("total_price", 0)),
+            "subtotal_price": float(order.get("subtotal_price", 0)),
+            "discount_amount": float(order.get("discount_amount", 0)),
+            "rounding_amount": float(order.get("rounding_amount", 0)),
+            "created_at": order.get("created_at"),
+            "business_date": order.get("business_date"),
+            
+            # Extract charges, taxes, payments info
+            "charges": self._extract_charges_info(order.get("charges", [])),
+            "taxes": self._extract_taxes_info(order),
+            "payments": self._extract_payments_info(order.get("payments", [])),
+            "products": self._extract_products_info(order.get("products", [])),
+            "combos": self._extract_combos_info(order.get("combos", []))
+        }
+    
     def _extract_charges_info(self, charges: List[Dict]) -> List[Dict]:
         """Extract charge information for accounting"""
         charge_info = []
@@ -436,32 +452,16 @@ class FoodicsService:
         logger.info("📦 DEBUG: Fetching inventory items")
         try:
             headers = self._get_headers(token)
-            all_items = []
-            page = 1
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                while True:
-                    url = f"{self.base_url}/inventory_items"
-                    params = {"page": page, "per_page": 100}
-                    
-                    response = await client.get(url, headers=headers, params=params)
-                    
-                    if response.status_code != 200:
-                        return {
-                            "success": False,
-                            "error": f"HTTP {response.status_code}",
-                            "details": response.text
-                        }
-                    
-                    data = response.json()
-                    page_items = data.get("data", [])
-                    all_items.extend(page_items)
-                    
-                    # Check pagination
-                    meta = data.get("meta", {})
-                    if meta.get("current_page", 1) >= meta.get("last_page", 1):
-                        break
-                    page += 1
+            # Page 1 first, then the remaining pages concurrently
+            try:
+                all_items = await self.client.get_all_pages("/inventory_items", headers, {"per_page": 100})
+            except FoodicsAPIError as e:
+                return {
+                    "success": False,
+                    "error": f"HTTP {e.status_code}",
+                    "details": e.response.text
+                }
             
             return {
                 "success": True,
@@ -484,24 +484,22 @@ class FoodicsService:
         try:
             headers = self._get_headers(token)
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                url = f"{self.base_url}/suppliers"
-                response = await client.get(url, headers=headers)
-                
-                if response.status_code != 200:
-                    return {
-                        "success": False,
-                        "error": f"HTTP {response.status_code}",
-                        "details": response.text
-                    }
-                
-                data = response.json()
+            # All pages (only the first one used to be read)
+            try:
+                suppliers = await self.client.get_all_pages("/suppliers", headers)
+            except FoodicsAPIError as e:
                 return {
-                    "success": True,
-                    "suppliers": data.get("data", []),
-                    "total": len(data.get("data", []))
+                    "success": False,
+                    "error": f"HTTP {e.status_code}",
+                    "details": e.response.text
                 }
-                
+            
+            return {
+                "success": True,
+                "suppliers": suppliers,
+                "total": len(suppliers)
+            }
+            
         except Exception as e:
             logger.error(f"🏭 DEBUG: Exception getting suppliers: {str(e)}")
             return {
@@ -0,0 +1,441 @@
+"""
+Foodics Order Sync
+Incremental ingestion of completed / returned Foodics orders into local
+tables (foodics_orders and its products, payments and taxes). Each branch is
+paged by reference with filter[reference_after], starting from the cursor
+stored in foodics_sync_cursors; every page is upserted in bulk and the
+cursor moved in the same transaction, so an interrupted sync resumes where
+it stopped. The cursor never passes an order that is still open: it stays
+just below the lowest open reference, so that order is picked up once it
+is completed (orders above it are re-read and upserted again meanwhile).
+Sales endpoints read the local copy (local_branch_sales) instead of calling
+Foodics on every request. Database work runs in a worker thread.
+"""
+
+import asyncio
+import logging
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text, bindparam
+from sqlalchemy.orm import Session
+
+from foodics_service import foodics_service, SecureFoodicsService, ORDERS_PER_PAGE
+
+logger = logging.getLogger(__name__)
+
+# Pages fetched per branch in one run; the next run continues from the cursor
+MAX_PAGES_PER_RUN = 200
+
+# Foodics order statuses: completed / returned orders are stored; open ones
+# (pending, active, draft) hold the cursor below their reference
+STORED_STATUSES = (4, 5)
+OPEN_STATUSES = (1, 2, 8)
+
+# An order still open after this long is considered abandoned and no longer holds the cursor
+OPEN_ORDER_HOLD = timedelta(days=2)
+
+# One sync at a time per process (scheduled run or manual trigger)
+_sync_lock = asyncio.Lock()
+
+_ORDER_COLUMNS = (
+    "foodics_id", "branch_id", "reference", "status", "total_price", "subtotal_price",
+    "discount_amount", "rounding_amount", "tax_amount", "business_date", "ordered_at"
+)
+
+
+def _parse_datetime(value) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _parse_date(value) -> Optional[date]:
+    parsed = _parse_datetime(value)
+    return parsed.date() if parsed else None
+
+
+def _reference(order: Dict[str, Any]) -> int:
+    try:
+        return int(order.get("reference") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def sync_branch_ids(db: Session) -> List[str]:
+    """Foodics branches to ingest: auto-synced shops plus the configured default branch"""
+    branch_ids = [
+        row[0] for row in db.execute(text("""
+            SELECT foodics_branch_id FROM warehouses
+            WHERE is_shop = TRUE AND auto_sync = TRUE AND foodics_branch_id IS NOT NULL
+            ORDER BY id
+        """))
+    ]
+    default_branch = db.execute(text("""
+        SELECT config_value FROM api_configurations WHERE config_key = 'foodics_default_branch_id'
+    """)).fetchone()
+    if default_branch and default_branch[0]:
+        branch_ids.append(default_branch[0])
+    return list(dict.fromkeys(branch_ids))
+
+
+def shop_branch_id(db: Session, shop_id: int) -> Optional[str]:
+    row = db.execute(text("SELECT foodics_branch_id FROM warehouses WHERE id = :id"), {"id": shop_id}).fetchone()
+    return row[0] if row else None
+
+
+def get_cursor(db: Session, branch_id: str) -> int:
+    row = db.execute(text("""
+        SELECT last_reference FROM foodics_sync_cursors WHERE branch_id = :branch_id
+    """), {"branch_id": branch_id}).fetchone()
+    return int(row[0]) if row else 0
+
+
+def _save_cursor(db: Session, branch_id: str, last_reference: int, orders_synced: int = 0,
+                 error: Optional[str] = None):
+    db.execute(text("""
+        INSERT INTO foodics_sync_cursors (branch_id, last_reference, orders_synced, last_synced_at, last_error)
+        VALUES (:branch_id, :last_reference, :orders_synced, NOW(), :error)
+        ON DUPLICATE KEY UPDATE
+            last_reference = VALUES(last_reference),
+            orders_synced = orders_synced + VALUES(orders_synced),
+            last_synced_at = VALUES(last_synced_at),
+            last_error = VALUES(last_error)
+    """), {"branch_id": branch_id, "last_reference": last_reference, "orders_synced": orders_synced, "error": error})
+
+
+def upsert_orders(db: Session, branch_id: str, orders: List[Dict[str, Any]]):
+    """
+    Store a page of normalized orders (FoodicsService.normalize_order): one
+    multi-row upsert for the orders, then their lines are replaced with one
+    executemany per line table (caller commits)
+    """
+    if not orders:
+        return
+    values = []
+    params: Dict[str, Any] = {"branch_id": branch_id}
+    products, payments, taxes = [], [], []
+    for index, order in enumerate(orders):
+        order_taxes = order["taxes"] + [
+            {"source": "charge", "product_name": charge["name"], "tax_name": tax["name"],
+             "rate": tax["rate"], "amount": tax["amount"]}
+            for charge in order["charges"] for tax in charge["taxes"]
+        ]
+        row = {
+            "foodics_id": order["id"],
+            "reference": _reference(order),
+            "status": order["status"],
+            "total_price": order["total_price"],
+            "subtotal_price": order["subtotal_price"],
+            "discount_amount": order["discount_amount"],
+            "rounding_amount": order["rounding_amount"],
+            "tax_amount": round(sum(tax["amount"] for tax in order_taxes), 2),
+            "business_date": _parse_date(order["business_date"]),
+            "ordered_at": _parse_datetime(order["created_at"])
+        }
+        values.append("(" + ", ".join(
+            ":branch_id" if column == "branch_id" else f":{column}_{index}" for column in _ORDER_COLUMNS
+        ) + ")")
+        params.update({f"{column}_{index}": value for column, value in row.items()})
+
+        lines = [(product, None) for product in order["products"]]
+        lines += [(product, combo["name"]) for combo in order["combos"] for product in combo["products"]]
+        products += [
+            {
+                "order_id": order["id"],
+                "product_name": product["name"] or "",
+                "sku": product["sku"] or None,
+                "combo_name": combo_name,
+                "quantity": product["quantity"],
+                "unit_price": product["price"],
+                "total_price": product["total_price"],
+                "discount_amount": product["discount_amount"],
+                "is_non_revenue": bool(product["is_non_revenue"])
+            }
+            for product, combo_name in lines
+        ]
+        payments += [
+            {
+                "order_id": order["id"],
+                "payment_method": payment["payment_method"] or "Unknown",
+                "amount": payment["amount"],
+                "tendered": payment["tendered"],
+                "tips": payment["tips"],
+                "business_date": _parse_date(payment["business_date"])
+            }
+            for payment in order["payments"]
+        ]
+        taxes += [
+            {
+                "order_id": order["id"],
+                "source": tax["source"],
+                "product_name": tax["product_name"] or None,
+                "tax_name": tax["tax_name"] or "",
+                "rate": tax["rate"] or 0,
+                "amount": tax["amount"]
+            }
+            for tax in order_taxes
+        ]
+
+    db.execute(text(f"""
+        INSERT INTO foodics_orders ({", ".join(_ORDER_COLUMNS)})
+        VALUES {", ".join(values)}
+        ON DUPLICATE KEY UPDATE
+            {", ".join(f"{column} = VALUES({column})" for column in _ORDER_COLUMNS if column != "foodics_id")}
+    """), params)
+
+    order_ids = [order["id"] for order in orders]
+    for table in ("foodics_order_products", "foodics_order_payments", "foodics_order_taxes"):
+        db.execute(
+            text(f"DELETE FROM {table} WHERE order_id IN :order_ids").bindparams(bindparam("order_ids", expanding=True)),
+            {"order_ids": order_ids}
+        )
+    if products:
+        db.execute(text("""
+            INSERT INTO foodics_order_products
+                (order_id, product_name, sku, combo_name, quantity, unit_price, total_price, discount_amount, is_non_revenue)
+            VALUES
+                (:order_id, :product_name, :sku, :combo_name, :quantity, :unit_price, :total_price, :discount_amount, :is_non_revenue)
+        """), products)
+    if payments:
+        db.execute(text("""
+            INSERT INTO foodics_order_payments (order_id, payment_method, amount, tendered, tips, business_date)
+            VALUES (:order_id, :payment_method, :amount, :tendered, :tips, :business_date)
+        """), payments)
+    if taxes:
+        db.execute(text("""
+            INSERT INTO foodics_order_taxes (order_id, source, product_name, tax_name, rate, amount)
+            VALUES (:order_id, :source, :product_name, :tax_name, :rate, :amount)
+        """), taxes)
+
+
+def _holds_cursor(order: Dict[str, Any], now: datetime) -> bool:
+    """An open order the cursor must not pass yet"""
+    if order.get("status") not in OPEN_STATUSES:
+        return False
+    created_at = _parse_datetime(order.get("created_at"))
+    return created_at is None or now - created_at < OPEN_ORDER_HOLD
+
+
+def _store_page(db: Session, branch_id: str, raw_orders: List[Dict[str, Any]], cursor: int) -> int:
+    """Upsert the page's completed / returned orders and move the cursor, in one transaction"""
+    stored = [
+        foodics_service.normalize_order(order) for order in raw_orders
+        if order.get("status") in STORED_STATUSES
+    ]
+    upsert_orders(db, branch_id, stored)
+    _save_cursor(db, branch_id, cursor, len(stored))
+    db.commit()
+    return len(stored)
+
+
+def _record_error(db: Session, branch_id: str, cursor: int, error: Optional[str]):
+    db.rollback()
+    _save_cursor(db, branch_id, cursor, error=error)
+    db.commit()
+
+
+async def sync_branch(db: Session, token: str, branch_id: str, max_pages: int = MAX_PAGES_PER_RUN) -> Dict[str, Any]:
+    """Ingest the branch's orders after its cursor, one committed page at a time"""
+    cursor = await asyncio.to_thread(get_cursor, db, branch_id)
+    reference_after = cursor  # paging position within this run
+    oldest_open: Optional[int] = None
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    synced = 0
+    pages = 0
+    try:
+        while pages < max_pages:
+            page = await foodics_service.fetch_orders_after(token, reference_after, branch_id)
+            if not page.get("success"):
+                await asyncio.to_thread(_record_error, db, branch_id, cursor, page.get("error"))
+                return {"branch_id": branch_id, "success": False, "error": page.get("error"),
+                        "orders_synced": synced, "last_reference": cursor}
+
+            raw_orders = page["orders"]
+            if not raw_orders:
+                break
+            reference_after = max(reference_after, max(_reference(order) for order in raw_orders))
+            open_references = [_reference(order) for order in raw_orders if _holds_cursor(order, now)]
+            if open_references:
+                oldest_open = min(open_references + ([oldest_open] if oldest_open is not None else []))
+            cursor = max(cursor, oldest_open - 1 if oldest_open is not None else reference_after)
+            synced += await asyncio.to_thread(_store_page, db, branch_id, raw_orders, cursor)
+
+            pages += 1
+            if len(raw_orders) < ORDERS_PER_PAGE:
+                break
+    except Exception as e:
+        logger.error(f"❌ Foodics order sync failed for branch {branch_id}: {str(e)}")
+        await asyncio.to_thread(_record_error, db, branch_id, cursor, str(e))
+        return {"branch_id": branch_id, "success": False, "error": str(e),
+                "orders_synced": synced, "last_reference": cursor}
+
+    return {"branch_id": branch_id, "success": True, "orders_synced": synced,
+            "last_reference": cursor, "oldest_open_reference": oldest_open, "complete": pages < max_pages}
+
+
+async def sync_all_branches(db: Session) -> Dict[str, Any]:
+    """Run sync_branch for every branch in sync_branch_ids()"""
+    async with _sync_lock:
+        token = await SecureFoodicsService(db).get_active_token()
+        if not token:
+            return {"success": False, "error": "No active API token found", "branches": []}
+
+        branch_ids = await asyncio.to_thread(sync_branch_ids, db)
+        results = [await sync_branch(db, token, branch_id) for branch_id in branch_ids]
+
+        logger.info(f"✅ Foodics order sync: {sum(result['orders_synced'] for result in results)} order(s) "
+                    f"from {len(results)} branch(es)")
+        return {"success": all(result["success"] for result in results), "branches": results}
+
+
+async def run_periodic_sync(interval_seconds: float):
+    """Background task: sync every interval until cancelled"""
+    from database import SessionLocal
+
+    while True:
+        db = SessionLocal()
+        try:
+            await sync_all_branches(db)
+        except Exception as e:
+            logger.error(f"❌ Scheduled Foodics order sync failed: {str(e)}")
+        finally:
+            db.close()
+        await asyncio.sleep(interval_seconds)
+
+
+def sync_status(db: Session) -> List[Dict[str, Any]]:
+    rows = db.execute(text("""
+        SELECT branch_id, last_reference, orders_synced, last_synced_at, last_error
+        FROM foodics_sync_cursors
+        ORDER BY branch_id
+    """))
+    return [
+        {
+            "branch_id": row[0],
+            "last_reference": row[1],
+            "orders_synced": row[2],
+            "last_synced_at": row[3].isoformat() if row[3] else None,
+            "last_error": row[4]
+        }
+        for row in rows
+    ]
+
+
+def _naive_utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def local_branch_sales(db: Session, branch_id: str, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
+    """Sales summary of a branch from the synced orders (ordered_at within the period)"""
+    params = {"branch_id": branch_id, "start_date": _naive_utc(start_date), "end_date": _naive_utc(end_date)}
+    period = "o.branch_id = :branch_id AND o.ordered_at BETWEEN :start_date AND :end_date"
+
+    summary = db.execute(text(f"""
+        SELECT COUNT(*),
+               COALESCE(SUM(CASE WHEN o.status = 4 THEN o.total_price ELSE 0 END), 0),
+               COALESCE(SUM(CASE WHEN o.status = 5 THEN o.total_price ELSE 0 END), 0),
+               COALESCE(SUM(o.tax_amount), 0),
+               COALESCE(SUM(o.discount_amount), 0)
+        FROM foodics_orders o
+        WHERE {period}
+    """), params).fetchone()
+
+    daily = db.execute(text(f"""
+        SELECT o.business_date,
+               COUNT(*),
+               COALESCE(SUM(CASE WHEN o.status = 4 THEN o.total_price ELSE 0 END), 0),
+               COALESCE(SUM(CASE WHEN o.status = 5 THEN o.total_price ELSE 0 END), 0)
+        FROM foodics_orders o
+        WHERE {period}
+        GROUP BY o.business_date
+        ORDER BY o.business_date
+    """), params).fetchall()
+
+    payments = db.execute(text(f"""
+        SELECT p.payment_method, COUNT(*), COALESCE(SUM(p.amount), 0)
+        FROM foodics_order_payments p
+        JOIN foodics_orders o ON o.foodics_id = p.order_id
+        WHERE {period} AND o.status = 4
+        GROUP BY p.payment_method
+        ORDER BY SUM(p.amount) DESC
+    """), params).fetchall()
+
+    products = db.execute(text(f"""
+        SELECT p.product_name, p.sku, COALESCE(SUM(p.quantity), 0), COALESCE(SUM(p.total_price), 0)
+        FROM foodics_order_products p
+        JOIN foodics_orders o ON o.foodics_id = p.order_id
+        WHERE {period} AND o.status = 4
+        GROUP BY p.product_name, p.sku
+        ORDER BY SUM(p.total_price) DESC
+        LIMIT 20
+    """), params).fetchall()
+
+    cursor = db.execute(text("""
+        SELECT last_reference, last_synced_at FROM foodics_sync_cursors WHERE branch_id = :branch_id
+    """), {"branch_id": branch_id}).fetchone()
+
+    total_sales = float(summary[1])
+    total_returns = float(summary[2])
+    return {
+        "success": True,
+        "source": "local",
+        "branch_id": branch_id,
+        "period": {"start_date": start_date.isoformat(), "end_date": end_date.isoformat()},
+        "last_synced_at": cursor[1].isoformat() if cursor and cursor[1] else None,
+        "last_reference": cursor[0] if cursor else None,
+        "summary": {
+            "total_orders": summary[0],
+            "total_sales": total_sales,
+            "total_returns": total_returns,
+            "net_sales": total_sales - total_returns,
+            "total_tax": float(summary[3]),
+            "total_discount": float(summary[4])
+        },
+        "sales_data": [
+            {
+                "business_date": str(row[0]) if row[0] else None,
+                "orders": row[1],
+                "sales": float(row[2]),
+                "returns": float(row[3]),
+                "net_sales": float(row[2]) - float(row[3])
+            }
+            for row in daily
+        ],
+        "payments": [
+            {"payment_method": row[0], "count": row[1], "amount": float(row[2])}
+            for row in payments
+        ],
+        "top_products": [
+            {"name": row[0], "sku": row[1], "quantity": float(row[2]), "total_price": float(row[3])}
+            for row in products
+        ]
+    }
+
+
+if __name__ == "__main__":
+    # Run one sync now (e.g. from cron or after configuring a branch): python foodics_sync.py
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        result = asyncio.run(sync_all_branches(db))
+        for branch in result["branches"]:
+            mark = "✅" if branch["success"] else "❌"
+            print(f"{mark} {branch['branch_id']}: {branch['orders_synced']} order(s), "
+                  f"last reference {branch['last_reference']}{' - ' + branch['error'] if branch.get('error') else ''}")
+        if not result["branches"]:
+            print(f"❌ {result.get('error') or 'No Foodics branches to sync'}")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Error syncing Foodics orders: {str(e)}")
+    finally:
+        db.close()
@@ -0,0 +1,175 @@
+"""
+Image Previews
+Thumbnails and medium previews of uploaded images (settlement attachments,
+supplier invoices), so cheque lists download a few KB per image instead of
+multi-MB phone photos. Derivatives are generated once per source file, right
+after upload, in a separate worker process pool (Pillow decoding and
+resizing are CPU-bound), kept under uploads/previews and served with
+long-lived cache headers. A missing derivative is generated on first
+request; non-image files (PDFs) are always served as they are.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import FileResponse
+from PIL import Image, ImageOps, features
+
+from pdf_render_pool import RenderPool
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_DIR = Path("uploads/previews")
+
+# size= value -> longest side in pixels
+PREVIEW_SIZES = {"thumb": 256, "medium": 1280}
+ORIGINAL_SIZES = ("full", "original")
+
+# WebP when Pillow was built with it, JPEG otherwise
+if features.check("webp"):
+    PREVIEW_FORMAT, PREVIEW_EXTENSION, PREVIEW_MEDIA_TYPE = "WEBP", ".webp", "image/webp"
+    SAVE_OPTIONS = {"quality": 80, "method": 4}
+else:
+    PREVIEW_FORMAT, PREVIEW_EXTENSION, PREVIEW_MEDIA_TYPE = "JPEG", ".jpg", "image/jpeg"
+    SAVE_OPTIONS = {"quality": 80, "optimize": True}
+
+IMAGE_TYPES = {"image/jpeg", "image/jpg", "image/png", "image/gif", "image/webp"}
+
+# Attachments never change under their URL (new uploads get new names)
+CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+# The original served in place of a failed preview: the preview URL must not
+# keep it once generation works again
+FALLBACK_CACHE_CONTROL = "private, no-cache"
+
+PREVIEW_RENDERERS = {"image_previews": ("image_previews", "generate_previews")}
+
+# Separate from the PDF workers so uploads never queue behind cheque printing
+preview_pool = RenderPool(max_workers=1, max_pending=32, timeout=60.0, initializer=None, name="Image preview",
+                          renderers=PREVIEW_RENDERERS)
+
+# Source key -> generation in progress, so concurrent requests share one job
+_in_flight: Dict[str, asyncio.Future] = {}
+_background: set = set()
+
+
+def generate_previews(source_path: str, targets: Dict[str, str]) -> Dict[str, int]:
+    """Worker job: write each {size: target path} derivative of an image; returns bytes written"""
+    written = {}
+    with Image.open(source_path) as image:
+        largest = max(PREVIEW_SIZES[size] for size in targets)
+        image.draft("RGB", (largest, largest))  # JPEG: decode at reduced scale
+        image = ImageOps.exif_transpose(image)  # phone photos store rotation in EXIF
+        has_alpha = image.mode in ("RGBA", "LA", "P") and PREVIEW_FORMAT == "WEBP"
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+        # Largest first, each smaller size resized from the previous one
+        for size in sorted(targets, key=lambda name: PREVIEW_SIZES[name], reverse=True):
+            image.thumbnail((PREVIEW_SIZES[size], PREVIEW_SIZES[size]), Image.LANCZOS)
+            target = Path(targets[size])
+            target.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+            image.save(temp_path, PREVIEW_FORMAT, **SAVE_OPTIONS)
+            os.replace(temp_path, target)
+            written[size] = target.stat().st_size
+    return written
+
+
+def _source_key(file_path: str) -> str:
+    stat = os.stat(file_path)
+    return hashlib.sha256(f"{os.path.abspath(file_path)}:{stat.st_mtime_ns}:{stat.st_size}".encode()).hexdigest()
+
+
+def preview_path(key: str, size: str) -> Path:
+    return PREVIEW_DIR / key[:2] / f"{key}_{size}{PREVIEW_EXTENSION}"
+
+
+async def ensure_previews(file_path: str) -> Dict[str, Path]:
+    """Paths of every derivative of an image, generating missing ones in the pool"""
+    key = await asyncio.to_thread(_source_key, file_path)
+    targets = {size: preview_path(key, size) for size in PREVIEW_SIZES}
+    missing = {size: str(path) for size, path in targets.items() if not path.exists()}
+    if missing:
+        job = _in_flight.get(key)
+        if job is None:
+            job = asyncio.ensure_future(preview_pool.render("image_previews", file_path, missing))
+            _in_flight[key] = job
+            job.add_done_callback(lambda _: _in_flight.pop(key, None))
+        await asyncio.shield(job)
+    return targets
+
+
+async def _generate_quietly(file_path: str):
+    try:
+        await ensure_previews(file_path)
+    except Exception as e:
+        logger.warning(f"Could not generate previews of {file_path}: {e}")
+
+
+def schedule_previews(uploaded_files: Iterable[Dict[str, Any]]):
+    """After an upload: generate previews of its images in the background"""
+    for uploaded in uploaded_files:
+        if uploaded.get("mime_type") in IMAGE_TYPES:
+            task = asyncio.create_task(_generate_quietly(uploaded["file_path"]))
+            _background.add(task)
+            task.add_done_callback(_background.discard)
+
+
+async def preview_response(file_path: str, size: Optional[str], media_type: str, filename: str,
+                           disposition: str = "inline") -> FileResponse:
+    """
+    FileResponse for ?size=thumb|medium|full: the derivative of an image
+    (falling back to the original, not cached as immutable, if it cannot be
+    generated), otherwise the original file
+    """
+    if size and size not in PREVIEW_SIZES and size not in ORIGINAL_SIZES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid size. Use one of: {', '.join([*PREVIEW_SIZES, *ORIGINAL_SIZES])}"
+        )
+    headers = {"Cache-Control": CACHE_CONTROL}
+
+    if size in PREVIEW_SIZES and media_type in IMAGE_TYPES:
+        try:
+            targets = await ensure_previews(file_path)
+            return FileResponse(
+                path=targets[size],
+                media_type=PREVIEW_MEDIA_TYPE,
+                headers=headers,
+                content_disposition_type=disposition,
+                filename=f"{os.path.splitext(filename)[0]}_{size}{PREVIEW_EXTENSION}"
+            )
+        except Exception as e:
+            logger.warning(f"Serving original of {file_path}, preview failed: {e}")
+            headers = {"Cache-Control": FALLBACK_CACHE_CONTROL}
+
+    return FileResponse(
+        path=file_path,
+        media_type=media_type,
+        headers=headers,
+        content_disposition_type=disposition,
+        filename=filename
+    )
+
+
+if __name__ == "__main__":
+    # Preview sizes and timings for a phone-sized photo: python image_previews.py
+    import tempfile
+    import time
+
+    directory = Path(tempfile.mkdtemp())
+    PREVIEW_DIR = directory / "previews"
+    source = directory / "receipt.jpg"
+    photo = Image.effect_noise((4032, 3024), 64).convert("RGB")
+    photo.save(source, "JPEG", quality=92)
+    print(f"original: {source.stat().st_size / 1024:.0f} KB")
+
+    started = time.perf_counter()
+    written = generate_previews(str(source), {size: str(preview_path("bench", size)) for size in PREVIEW_SIZES})
+    print(f"generated in {(time.perf_counter() - started) * 1000:.0f} ms: " +
+          ", ".join(f"{size} {length / 1024:.0f} KB" for size, length in written.items()))
@@ -0,0 +1,269 @@
+"""
+Inventory Valuation Snapshot
+Keeps inventory_valuation_snapshot (quantity, moving-average unit cost and
+value per warehouse/item) up to date, so inventory reports read one indexed
+table instead of crossing every warehouse with every item and re-averaging
+six months of purchase order lines on each request
+"""
+
+import logging
+from typing import Dict, List, Optional, Any, Tuple
+
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Purchase history used to seed the unit cost of pairs with no receipts yet
+SEED_COST_MONTHS = 6
+
+STOCK_STATUS_SQL = """
+    CASE
+        WHEN s.quantity <= 0 THEN 'Out of Stock'
+        WHEN s.quantity <= COALESCE(i.minimum_stock, 0) THEN 'Low Stock'
+        ELSE 'In Stock'
+    END
+"""
+
+
+def refresh_valuation_snapshot(db: Session, warehouse_id: Optional[int] = None) -> int:
+    """
+    Re-sync snapshot quantities from warehouse_stock (nightly or on demand).
+    Existing moving-average costs are kept; new pairs are seeded from the
+    quantity-weighted purchase price of the last SEED_COST_MONTHS months,
+    falling back to items.price_per_unit. Does not commit. Returns rows synced.
+    """
+    stock_filter = ""
+    params: Dict[str, Any] = {"months": SEED_COST_MONTHS}
+    if warehouse_id is not None:
+        stock_filter = "WHERE ws.warehouse_id = :warehouse_id"
+        params["warehouse_id"] = warehouse_id
+
+    result = db.execute(text(f"""
+        INSERT INTO inventory_valuation_snapshot (warehouse_id, item_id, quantity, avg_cost, total_value)
+        SELECT ws.warehouse_id, ws.ingredient_id, COALESCE(ws.quantity, 0),
+               COALESCE(pc.avg_cost, i.price_per_unit, 0),
+               COALESCE(ws.quantity, 0) * COALESCE(pc.avg_cost, i.price_per_unit, 0)
+        FROM warehouse_stock ws
+        JOIN items i ON i.id = ws.ingredient_id
+        LEFT JOIN (
+            SELECT poi.item_id,
+                   SUM(poi.unit_price * COALESCE(poi.quantity_received, poi.quantity_ordered))
+                       / NULLIF(SUM(COALESCE(poi.quantity_received, poi.quantity_ordered)), 0) AS avg_cost
+            FROM purchase_order_items poi
+            JOIN purchase_orders po ON poi.purchase_order_id = po.id
+            WHERE po.order_date >= DATE_SUB(NOW(), INTERVAL :months MONTH)
+            GROUP BY poi.item_id
+        ) pc ON pc.item_id = ws.ingredient_id
+        {stock_filter}
+        ON DUPLICATE KEY UPDATE
+            avg_cost = IF(avg_cost > 0, avg_cost, VALUES(avg_cost)),
+            quantity = VALUES(quantity),
+            total_value = quantity * avg_cost
+    """), params)
+
+    # Pairs whose warehouse_stock row is gone
+    orphan_filter = "AND s.warehouse_id = :warehouse_id" if warehouse_id is not None else ""
+    db.execute(text(f"""
+        DELETE s FROM inventory_valuation_snapshot s
+        LEFT JOIN warehouse_stock ws ON ws.warehouse_id = s.warehouse_id AND ws.ingredient_id = s.item_id
+        WHERE ws.ingredient_id IS NULL {orphan_filter}
+    """), {"warehouse_id": warehouse_id})
+
+    logger.info(f"Refreshed inventory valuation snapshot ({result.rowcount} row change(s))")
+    return result.rowcount
+
+
+def record_receipt(db: Session, warehouse_id: int, lines: List[Tuple[int, float, float]]):
+    """
+    Fold received purchase lines [(item_id, quantity, unit_price), ...] into
+    the moving-average cost:  new_avg = (q * avg + dq * price) / (q + dq).
+    Call in the same transaction as the warehouse_stock update.
+    """
+    rows = [
+        {"warehouse_id": warehouse_id, "item_id": item_id, "quantity": float(quantity), "unit_price": float(unit_price or 0)}
+        for item_id, quantity, unit_price in lines
+        if quantity and float(quantity) > 0
+    ]
+    if not rows:
+        return
+
+    # MySQL applies ON DUPLICATE KEY assignments left to right, so avg_cost
+    # still sees the old quantity and total_value sees both new values
+    db.execute(text("""
+        INSERT INTO inventory_valuation_snapshot (warehouse_id, item_id, quantity, avg_cost, total_value)
+        VALUES (:warehouse_id, :item_id, :quantity, :unit_price, :quantity * :unit_price)
+        ON DUPLICATE KEY UPDATE
+            avg_cost = IF(quantity + VALUES(quantity) > 0 AND quantity > 0,
+                          (quantity * avg_cost + VALUES(quantity) * VALUES(avg_cost)) / (quantity + VALUES(quantity)),
+                          VALUES(avg_cost)),
+            quantity = quantity + VALUES(quantity),
+            total_value = quantity * avg_cost
+    """), rows)
+
+
+def record_stock_changes(db: Session, warehouse_id: int, deltas: Dict[int, float]):
+    """
+    Apply signed quantity changes that carry no purchase price (production,
+    transfers, adjustments). Unit cost is unchanged; new pairs are seeded
+    from items.price_per_unit. Call in the same transaction as the stock update.
+    """
+    rows = [
+        {"warehouse_id": warehouse_id, "item_id": item_id, "quantity": round(float(change), 3)}
+        for item_id, change in deltas.items()
+        if change
+    ]
+    if not rows:
+        return
+
+    db.execute(text("""
+        INSERT INTO inventory_valuation_snapshot (warehouse_id, item_id, quantity, avg_cost, total_value)
+        SELECT :warehouse_id, i.id, :quantity, COALESCE(i.price_per_unit, 0), :quantity * COALESCE(i.price_per_unit, 0)
+        FROM items i
+        WHERE i.id = :item_id
+        ON DUPLICATE KEY UPDATE
+            quantity = quantity + VALUES(quantity),
+            total_value = quantity * avg_cost
+    """), rows)
+
+
+def seed_valuation_snapshot(db: Session) -> int:
+    """
+    Run refresh_valuation_snapshot when any warehouse_stock pair has no
+    snapshot row yet (table freshly created, or stock written before the
+    snapshot existed). Called at startup, before any request is served.
+    Does not commit. Returns rows synced (0 when nothing was missing).
+    """
+    missing = db.execute(text("""
+        SELECT 1
+        FROM warehouse_stock ws
+        LEFT JOIN inventory_valuation_snapshot s
+            ON s.warehouse_id = ws.warehouse_id AND s.item_id = ws.ingredient_id
+        WHERE s.item_id IS NULL
+        LIMIT 1
+    """)).fetchone()
+    if not missing:
+        return 0
+    return refresh_valuation_snapshot(db)
+
+
+def _snapshot_filters(warehouse_id: Optional[int], category_id: Optional[int],
+                      low_stock_only: bool) -> Tuple[str, Dict[str, Any]]:
+    where_clauses = []
+    params: Dict[str, Any] = {}
+
+    if warehouse_id:
+        where_clauses.append("s.warehouse_id = :warehouse_id")
+        params["warehouse_id"] = warehouse_id
+
+    if category_id:
+        where_clauses.append("i.category_id = :category_id")
+        params["category_id"] = category_id
+
+    if low_stock_only:
+        where_clauses.append("s.quantity <= COALESCE(i.minimum_stock, 0)")
+
+    where_clause = ""
+    if where_clauses:
+        where_clause = "WHERE " + " AND ".join(where_clauses)
+    return where_clause, params
+
+
+def get_valuation_summary(db: Session, warehouse_id: Optional[int] = None, category_id: Optional[int] = None,
+                          low_stock_only: bool = False) -> Dict[str, Any]:
+    """Totals over every matching snapshot row (not just the current page)"""
+    where_clause, params = _snapshot_filters(warehouse_id, category_id, low_stock_only)
+
+    row = db.execute(text(f"""
+        SELECT COUNT(*),
+               COALESCE(SUM(s.total_value), 0),
+               COALESCE(SUM(s.quantity > 0 AND s.quantity <= COALESCE(i.minimum_stock, 0)), 0),
+               COALESCE(SUM(s.quantity <= 0), 0),
+               COALESCE(SUM(s.quantity > COALESCE(i.minimum_stock, 0) AND s.quantity > 0), 0)
+        FROM inventory_valuation_snapshot s
+        JOIN items i ON i.id = s.item_id
+        {where_clause}
+    """), params).fetchone()
+
+    return {
+        "total_items": int(row[0]),
+        "total_inventory_value": float(row[1]),
+        "low_stock_items": int(row[2]),
+        "out_of_stock_items": int(row[3]),
+        "in_stock_items": int(row[4])
+    }
+
+
+def valuation_rows_query(warehouse_id: Optional[int] = None, category_id: Optional[int] = None,
+                         low_stock_only: bool = False) -> Tuple[str, Dict[str, Any]]:
+    """SQL and params for snapshot rows joined with their names, ordered warehouse > category > item"""
+    where_clause, params = _snapshot_filters(warehouse_id, category_id, low_stock_only)
+
+    sql = f"""
+        SELECT
+            s.warehouse_id,
+            w.name,
+            s.item_id,
+            i.name,
+            i.unit,
+            ic.name,
+            s.quantity,
+            COALESCE(i.minimum_stock, 0),
+            {STOCK_STATUS_SQL},
+            s.avg_cost,
+            s.total_value
+        FROM inventory_valuation_snapshot s
+        JOIN warehouses w ON w.id = s.warehouse_id
+        JOIN items i ON i.id = s.item_id
+        LEFT JOIN inventory_categories ic ON i.category_id = ic.id
+        {where_clause}
+        ORDER BY w.name, ic.name, i.name
+    """
+    return sql, params
+
+
+def get_valuation_rows(db: Session, warehouse_id: Optional[int] = None, category_id: Optional[int] = None,
+                       low_stock_only: bool = False, limit: Optional[int] = None,
+                       offset: int = 0) -> List[Dict[str, Any]]:
+    """One page (or all) of snapshot rows as report dictionaries"""
+    sql, params = valuation_rows_query(warehouse_id, category_id, low_stock_only)
+
+    if limit is not None:
+        sql += " LIMIT :limit OFFSET :offset"
+        params["limit"] = limit
+        params["offset"] = offset
+
+    result = db.execute(text(sql), params).fetchall()
+
+    return [
+        {
+            "warehouse_id": row[0],
+            "warehouse_name": row[1],
+            "item_id": row[2],
+            "item_name": row[3],
+            "unit": row[4],
+            "category_name": row[5] or "Uncategorized",
+            "current_stock": float(row[6]),
+            "min_stock_level": float(row[7]),
+            "stock_status": row[8],
+            "average_cost": float(row[9]),
+            "total_value": float(row[10])
+        }
+        for row in result
+    ]
+
+
+if __name__ == "__main__":
+    # Nightly refresh, e.g. cron: 0 3 * * * python inventory_valuation.py
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        rows = refresh_valuation_snapshot(db)
+        db.commit()
+        print(f"✅ Inventory valuation snapshot refreshed ({rows} row change(s))")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Error refreshing inventory valuation snapshot: {str(e)}")
+    finally:
+        db.close()
@@ -1,23 +1,38 @@
 from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Form, Query, Body
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.responses import FileResponse, Response, JSONResponse
+from fastapi.responses import Response, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import and_, or_, func, text
+from sqlalchemy import and_, or_, func, text, bindparam
 from typing import List, Optional, Dict, Any
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from decimal import Decimal
 import schemas
 import models
-from database import engine, get_db
+from database import engine, get_db, SessionLocal
 from auth import (
     authenticate_user, create_access_token, get_current_active_user,
     get_password_hash
 )
 from config import settings
+from recipe_cost_cache import recipe_cost_cache
+from inventory_valuation import (
+    get_valuation_summary, get_valuation_rows, refresh_valuation_snapshot,
+    seed_valuation_snapshot, valuation_rows_query
+)
+from export_stream import iter_query_rows, export_response
+from search_index import search_index, hydrate_hits, SEARCH_TYPE_ALIASES, ITEMS
+from autocomplete import autocomplete_index, ITEM, CAKE
+from pdf_render_pool import render_pool, render_pdf
+from cheque_counters import refresh_book_counters
+from balance_ledger import post_entry, open_accounts, run_periodic_checkpoints
+from cheque_attachments import record_cheque_attachments, store_settlement_files, attachment_file
+from upload_storage import store_upload_or_400, record_stored_files
+from image_previews import preview_pool, preview_response, schedule_previews
+from document_cache import document_cache
 import os
-import uuid
+import asyncio
 import shutil
 import json
 import logging
@@ -31,6 +46,8 @@ logger = logging.getLogger(__name__)
 # Import Foodics service
 try:
     from foodics_service import FoodicsService, SecureFoodicsService
+    import foodics_sync
+    from foodics_client import foodics_client
     foodics_available = True
     logger.info("Foodics service loaded successfully")
 except ImportError as e:
@@ -41,7 +58,7 @@ except Exception as e:
     logger.warning(f"Foodics service error: {e}")
 
 # Import all routers
-from routers import auth_routes, safe_routes, category_routes, simple_routes, expense_routes, item_routes, kitchen_routes, admin_routes
+from routers import auth_routes, safe_routes, category_routes, simple_routes, expense_routes, item_routes, kitchen_routes, batch_routes, autocomplete_routes, admin_routes
 
 # Create upload directories
 UPLOAD_DIR = "uploads/expense_files"
@@ -132,6 +149,8 @@ app.include_router(simple_routes.router)  # For direct simple endpoints
 app.include_router(expense_routes.router)
 app.include_router(item_routes.router)
 app.include_router(kitchen_routes.router)  # Kitchen production endpoints
+app.include_router(batch_routes.router)  # Batch production explosion
+app.include_router(autocomplete_routes.router)  # Type-ahead name suggestions
 app.include_router(admin_routes.router)  # Super admin endpoints
 
 # Include new bank and cheque book routes
@@ -152,6 +171,89 @@ app.include_router(warehouse_api_router)
 from arabic_cheque_generator import router as arabic_cheque_router
 app.include_router(arabic_cheque_router)
 
+# PDF render workers live for the lifetime of the server
+@app.on_event("startup")
+async def start_render_pool():
+    render_pool.start()
+
+@app.on_event("shutdown")
+async def stop_render_pool():
+    render_pool.shutdown()
+    preview_pool.shutdown()
+
+# Foodics orders are ingested in the background; sales endpoints read the local copy
+foodics_sync_task = None
+
+@app.on_event("startup")
+async def start_foodics_order_sync():
+    global foodics_sync_task
+    if foodics_available:
+        foodics_client.start()
+    if foodics_available and settings.foodics_order_sync_minutes > 0:
+        foodics_sync_task = asyncio.create_task(
+            foodics_sync.run_periodic_sync(settings.foodics_order_sync_minutes * 60)
+        )
+
+@app.on_event("shutdown")
+async def stop_foodics_order_sync():
+    if foodics_sync_task is not None:
+        foodics_sync_task.cancel()
+    if foodics_available:
+        await foodics_client.aclose()
+
+# Balance ledger: accounts from before the ledger get their opening entry
+# before any request posts to them; checkpoints are written in the background
+ledger_checkpoint_task = None
+
+@app.on_event("startup")
+async def start_balance_ledger():
+    global ledger_checkpoint_task
+    db = SessionLocal()
+    try:
+        opened = open_accounts(db)
+        db.commit()
+        if opened:
+            logger.info(f"Balance ledger opened for {opened} account(s)")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Could not open the balance ledger: {e}")
+    finally:
+        db.close()
+    if settings.ledger_checkpoint_minutes > 0:
+        ledger_checkpoint_task = asyncio.create_task(
+            run_periodic_checkpoints(settings.ledger_checkpoint_minutes * 60)
+        )
+
+# Inventory valuation: stock pairs from before the snapshot table get their
+# row before any report reads it or any stock change adds to it
+@app.on_event("startup")
+async def seed_inventory_valuation():
+    db = SessionLocal()
+    try:
+        seeded = seed_valuation_snapshot(db)
+        db.commit()
+        if seeded:
+            logger.info(f"Inventory valuation snapshot seeded ({seeded} row change(s))")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Could not seed the inventory valuation snapshot: {e}")
+    finally:
+        db.close()
+
+@app.on_event("shutdown")
+async def stop_balance_ledger():
+    if ledger_checkpoint_task is not None:
+        ledger_checkpoint_task.cancel()
+
+@app.get("/api/render-pool/status")
+async def get_render_pool_status():
+    """Queue depth and counters of the PDF render / image preview workers and the document cache"""
+    return {"success": True, "data": {
+        **render_pool.stats(),
+        "document_cache": document_cache.stats(),
+        "image_previews": preview_pool.stats()
+    }}
+
 # Legacy endpoints for backward compatibility
 @app.post("/token", response_model=schemas.Token)
 async def login_legacy(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
@@ -215,9 +317,19 @@ async def test():
 
 # Items management endpoints for IngredientManagement component
 @app.get("/items-for-ingredients")
-async def get_items_for_ingredients(db: Session = Depends(get_db)):
-    """Get items for ingredient management"""
+async def get_items_for_ingredients(
+    q: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    """Get items for ingredient management (name-prefix suggestions when q is given)"""
     try:
+        if q:
+            return {"success": True, "data": [
+                {field: item[field] for field in ("id", "name", "unit", "price_per_unit", "category_id", "category_name")}
+                for item in autocomplete_index.complete(db, q, [ITEM], limit)
+            ]}
+        
         result = db.execute(text("""
             SELECT i.id, i.name, i.unit, i.price_per_unit, i.category_id,
                    ic.name as category_name
@@ -263,8 +375,12 @@ async def create_item_for_ingredients(item_data: dict, db: Session = Depends(get
             "price_per_unit": price_per_unit,
             "category_id": category_id
         })
+        item_id = db.execute(text("SELECT LAST_INSERT_ID()")).fetchone()[0]
         
         db.commit()
+        recipe_cost_cache.item_changed(item_id, name, unit, price_per_unit)
+        search_index.refresh(db, ITEMS, item_id)
+        autocomplete_index.refresh(db, ITEM, item_id)
         return {"success": True, "message": "Item created successfully"}
     except HTTPException:
         raise
@@ -298,6 +414,9 @@ async def update_item_for_ingredients(item_id: int, item_data: dict, db: Session
         })
         
         db.commit()
+        recipe_cost_cache.item_changed(item_id, name, unit, price_per_unit)
+        search_index.refresh(db, ITEMS, item_id)
+        autocomplete_index.refresh(db, ITEM, item_id)
         return {"success": True, "message": "Item updated successfully"}
     except HTTPException:
         raise
@@ -312,6 +431,9 @@ async def delete_item_for_ingredients(item_id: int, db: Session = Depends(get_db
         # Delete the item
         db.execute(text("DELETE FROM items WHERE id = :id"), {"id": item_id})
         db.commit()
+        recipe_cost_cache.item_removed(item_id)
+        search_index.remove(ITEMS, item_id)
+        autocomplete_index.remove(ITEM, item_id)
         return {"success": True, "message": "Item deleted successfully"}
     except Exception as e:
         db.rollback()
@@ -344,6 +466,7 @@ async def update_cheque(
             db.execute(text("UPDATE cheques SET status = :status WHERE id = :id"), 
                       {"status": status, "id": cheque_id})
         
+        refresh_book_counters(db, cheque_ids=[cheque_id])
         db.commit()
         
         return {"success": True, "message": "Cheque updated successfully"}
@@ -399,6 +522,8 @@ async def assign_cheques_to_safe(
             
             assigned_count += 1
             total_amount_assigned += float(cheque[3]) if cheque[3] else 0.0
+            post_entry(db, "safe", safe_id, float(cheque[3] or 0), "cheque_assigned", "cheque", cheque_id,
+                       f"Cheque {cheque[1]} assigned")
         
         # Update safe balance with total amount of assigned cheques
         if assigned_count > 0:
@@ -408,6 +533,7 @@ async def assign_cheques_to_safe(
                 WHERE id = :safe_id
             """), {"amount": total_amount_assigned, "safe_id": safe_id})
         
+        refresh_book_counters(db, cheque_ids=cheque_ids)
         db.commit()
         
         return {
@@ -442,10 +568,7 @@ async def cancel_cheque_main(
         cheque = db.execute(text("""
             SELECT c.id, c.cheque_number, c.status, c.is_settled, 
                    c.safe_id, c.amount,
-                   COALESCE(
-                       (SELECT SUM(e.amount) FROM expenses e WHERE e.cheque_id = c.id AND e.status != 'rejected'),
-                       0
-                   ) as total_expenses
+                   COALESCE(c.total_expenses, 0) as total_expenses
             FROM cheques c
             WHERE c.id = :cheque_id
         """), {"cheque_id": cheque_id}).fetchone()
@@ -494,7 +617,10 @@ async def cancel_cheque_main(
                 "amount": float(cheque[5]),  # cheque amount
                 "safe_id": cheque[4]
             })
+            post_entry(db, "safe", cheque[4], -float(cheque[5]), "cheque_cancelled", "cheque", cheque_id,
+                       f"Cheque {cheque[1]} cancelled: {cancellation_reason}", current_user.id)
         
+        refresh_book_counters(db, cheque_ids=[cheque_id])
         db.commit()
         
         return {
@@ -543,165 +669,6 @@ async def get_unassigned_cheques(db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
-@app.get("/safes/{safe_id}/cheques")
-async def get_safe_cheques(
-    safe_id: int,
-    limit: int = Query(10, description="Number of cheques to return (default: 10 for settled, all for active)"),
-    offset: int = Query(0, description="Number of cheques to skip"),
-    cheque_number: Optional[str] = Query(None, description="Filter by cheque number"),
-    start_date: Optional[str] = Query(None, description="Filter by settlement date (start)"),
-    end_date: Optional[str] = Query(None, description="Filter by settlement date (end)"),
-    status_filter: Optional[str] = Query(None, description="Filter by status: settled, active, all"),
-    db: Session = Depends(get_db)
-):
-    """Get cheques assigned to a specific safe with pagination and filtering"""
-    try:
-        # Verify safe exists
-        safe = db.execute(text("SELECT id, name FROM safes WHERE id = :id"), 
-                         {"id": safe_id}).fetchone()
-        if not safe:
-            raise HTTPException(status_code=404, detail="Safe not found")
-        
-        # Build WHERE conditions
-        where_conditions = ["c.safe_id = :safe_id", "c.is_assigned_to_safe = 1"]
-        params = {"safe_id": safe_id}
-        
-        # Add filtering conditions
-        if cheque_number:
-            where_conditions.append("c.cheque_number LIKE :cheque_number")
-            params["cheque_number"] = f"%{cheque_number}%"
-        
-        if start_date:
-            where_conditions.append("DATE(c.settlement_date) >= :start_date")
-            params["start_date"] = start_date
-            
-        if end_date:
-            where_conditions.append("DATE(c.settlement_date) <= :end_date")
-            params["end_date"] = end_date
-            
-        if status_filter == "settled":
-            where_conditions.append("c.is_settled = 1")
-        elif status_filter == "active":
-            where_conditions.append("c.is_settled = 0")
-        # "all" or None means no status filter
-        
-        where_clause = " AND ".join(where_conditions)
-        
-        # Determine ordering - settled cheques by settlement date DESC, active by cheque number
-        if status_filter == "settled":
-            order_clause = "ORDER BY c.settlement_date DESC, c.cheque_number DESC"
-        else:
-            order_clause = "ORDER BY c.cheque_number"
-            
-        # Build pagination - for settled cheques, default to limit 10, for active show all
-        if status_filter == "settled" or (status_filter is None and limit == 10):
-            limit_clause = f"LIMIT {limit} OFFSET {offset}"
-        elif status_filter == "active":
-            limit_clause = ""  # Show all active cheques
-        else:
-            limit_clause = f"LIMIT {limit} OFFSET {offset}"
-        
-        # Get cheques assigned to this safe
-        result = db.execute(text(f"""
-            SELECT c.id, c.cheque_number, c.amount, c.status, 
-                   c.issue_date, c.due_date, c.description, c.issued_to,
-                   ba.account_name, ba.bank_name,
-                   COALESCE(
-                       (SELECT SUM(e.amount) FROM expenses e WHERE e.cheque_id = c.id AND e.status != 'rejected'),
-                       0
-                   ) as total_expenses,
-                   c.amount - COALESCE(
-                       (SELECT SUM(e.amount) FROM expenses e WHERE e.cheque_id = c.id AND e.status != 'rejected'),
-                       0
-                   ) as remaining_amount,
-                   c.is_settled,
-                   c.overspent_amount,
-                   c.settlement_date,
-                   c.safe_id,
-                   c.settled_by_cheque_id,
-                   c.is_printed,
-                   c.printed_at,
-                   c.print_count,
-                   (SELECT GROUP_CONCAT(e.id ORDER BY e.id) FROM expenses e WHERE e.cheque_id = c.id AND e.status != 'rejected') as expense_ids
-            FROM cheques c
-            LEFT JOIN bank_accounts ba ON c.bank_account_id = ba.id
-            WHERE {where_clause}
-            {order_clause}
-            {limit_clause}
-        """), params)
-        
-        cheques = []
-        for row in result:
-            total_expenses = float(row[10]) if row[10] else 0.0  # Updated index (due_date added)
-            cheque_amount = float(row[2]) if row[2] else 0.0
-            remaining_amount = float(row[11]) if row[11] else cheque_amount  # Updated index
-            is_overspent = total_expenses > cheque_amount
-            
-            # Calculate overspent amount
-            overspent_amount = float(row[13]) if row[13] else 0.0  # Updated index
-            if is_overspent and overspent_amount == 0.0:
-                overspent_amount = total_expenses - cheque_amount
-            
-            # Check for settlement attachments if cheque is settled
-            attachments = []
-            if bool(row[12]):  # is_settled (updated index)
-                try:
-                    import glob
-                    attachment_pattern = os.path.join(EARLY_SETTLEMENT_UPLOAD_DIR, f"settlement_{row[0]}_*")
-                    attachment_files = glob.glob(attachment_pattern)
-                    
-                    for file_path in attachment_files:
-                        if os.path.exists(file_path):
-                            file_size = os.path.getsize(file_path)
-                            file_name = os.path.basename(file_path)
-                            # Extract original filename from unique filename
-                            original_name = file_name.split('_', 3)[-1] if '_' in file_name else file_name
-                            attachments.append({
-                                "filename": file_name,
-                                "original_filename": original_name,
-                                "file_size": file_size,
-                                "file_path": file_path
-                            })
-                except Exception as e:
-                    print(f"Error checking attachments for cheque {row[0]}: {e}")
-            
-            # Parse expense IDs from comma-separated string
-            expense_ids_str = row[20] if len(row) > 20 and row[20] else ""  # Updated index
-            expense_ids = [int(id.strip()) for id in expense_ids_str.split(",") if id.strip().isdigit()] if expense_ids_str else []
-            
-            cheques.append({
-                "id": row[0],
-                "cheque_number": row[1],
-                "amount": cheque_amount,
-                "status": row[3] or "assigned",
-                "issue_date": row[4].isoformat() if row[4] else None,
-                "due_date": row[5].isoformat() if row[5] else None,  # Add due_date field
-                "description": row[6] or "",  # Updated index
-                "issued_to": row[7] or "",  # Updated index
-                "bank_account": f"{row[8]} ({row[9]})" if row[8] else "Unknown",  # Updated indices
-                "total_expenses": total_expenses,
-                "remaining_amount": remaining_amount,
-                "is_settled": bool(row[12]),  # Updated index
-                "is_overspent": is_overspent,
-                "overspent_amount": overspent_amount,
-                "settlement_date": row[14].isoformat() if row[14] else None,  # Updated index
-                "safe_id": safe_id,  # Use the safe_id parameter directly
-                "settled_by_cheque_id": row[16] if len(row) > 16 else None,  # Updated index
-                "is_printed": bool(row[17]) if len(row) > 17 else False,  # Print status (updated index)
-                "printed_at": row[18].isoformat() if len(row) > 18 and row[18] else None,  # Print timestamp (updated index)
-                "print_count": row[19] if len(row) > 19 else 0,  # Print count (updated index)
-                "expense_ids": expense_ids,  # Related expense IDs
-                "expense_count": len(expense_ids),  # Count of expenses
-                "attachments": attachments,
-                "has_attachments": len(attachments) > 0
-            })
-        
-        return cheques
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-
 @app.post("/cheques/manual-settlement-simple")
 async def manual_settle_overspent_cheque(
     settlement_data: dict,
@@ -721,10 +688,7 @@ async def manual_settle_overspent_cheque(
         overspent_cheque = db.execute(text("""
             SELECT c.id, c.cheque_number, c.amount, c.status, 
                    c.safe_id, c.is_settled, c.bank_account_id,
-                   COALESCE(
-                       (SELECT SUM(e.amount) FROM expenses e WHERE e.cheque_id = c.id AND e.status != 'rejected'),
-                       0
-                   ) as total_expenses
+                   COALESCE(c.total_expenses, 0) as total_expenses
             FROM cheques c
             WHERE c.id = :cheque_id
         """), {"cheque_id": overspent_cheque_id}).fetchone()
@@ -798,7 +762,10 @@ async def manual_settle_overspent_cheque(
             "amount": actual_settlement_amount,
             "safe_id": overspent_cheque[4]  # Updated index for safe_id
         })
+        post_entry(db, "safe", overspent_cheque[4], actual_settlement_amount, "settlement", "cheque",
+                   overspent_cheque_id, f"Overspent cheque {overspent_cheque[1]} settled with cheque {settlement_cheque[1]}")
         
+        refresh_book_counters(db, cheque_ids=[settlement_cheque_id, overspent_cheque_id])
         db.commit()
         
         return {
@@ -871,8 +838,6 @@ async def create_early_settlement_with_files(
         ]
         max_size = 10 * 1024 * 1024  # 10MB
         
-        uploaded_files = []
-        
         for file in files:
             # Validate file type
             if file.content_type not in allowed_types:
@@ -880,43 +845,9 @@ async def create_early_settlement_with_files(
                     status_code=400, 
                     detail=f"Invalid file type: {file.filename}. Allowed types: JPG, PNG, GIF, WebP, PDF"
                 )
-            
-            # Validate file size
-            if file.size and file.size > max_size:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"File too large: {file.filename}. Maximum size is 10MB"
-                )
-            
-            # Ensure upload directory exists
-            os.makedirs(EARLY_SETTLEMENT_UPLOAD_DIR, exist_ok=True)
-            
-            # Generate unique filename
-            file_extension = os.path.splitext(file.filename)[1] if file.filename else ''
-            unique_filename = f"settlement_{cheque_id}_{uuid.uuid4()}{file_extension}"
-            file_path = os.path.join(EARLY_SETTLEMENT_UPLOAD_DIR, unique_filename)
-            
-            # Save file to disk
-            try:
-                with open(file_path, "wb") as buffer:
-                    content = await file.read()
-                    buffer.write(content)
-                
-                uploaded_files.append({
-                    "original_filename": file.filename,
-                    "saved_filename": unique_filename,
-                    "file_path": file_path,
-                    "file_size": len(content),
-                    "mime_type": file.content_type
-                })
-            except Exception as e:
-                # Clean up any previously saved files on error
-                for prev_file in uploaded_files:
-                    try:
-                        os.remove(prev_file["file_path"])
-                    except:
-                        pass
-                raise HTTPException(status_code=500, detail=f"Failed to save file {file.filename}: {str(e)}")
+        
+        # Stream every file into the upload store (size limit enforced while streaming)
+        uploaded_files = await store_settlement_files(cheque_id, files, max_size)
         
         # All files validated and saved, now create the settlement
         # Mark cheque as settled
@@ -937,8 +868,14 @@ async def create_early_settlement_with_files(
             "amount": float(deposit_amount),
             "safe_id": cheque[3]
         })
+        post_entry(db, "safe", cheque[3], float(deposit_amount), "early_settlement", "cheque", cheque_id,
+                   f"Early settlement of cheque {cheque[1]}, deposit {deposit_number}")
         
+        record_stored_files(db, uploaded_files)
+        record_cheque_attachments(db, cheque_id, uploaded_files)
+        refresh_book_counters(db, cheque_ids=[cheque_id])
         db.commit()
+        schedule_previews(uploaded_files)
         
         return {
             "success": True,
@@ -968,12 +905,8 @@ async def create_early_settlement_with_files(
         raise
     except Exception as e:
         db.rollback()
-        # Clean up any uploaded files on error
-        for uploaded_file in uploaded_files:
-            try:
-                os.remove(uploaded_file["file_path"])
-            except:
-                pass
+        # Stored files are content-addressed and may be shared, so they stay
+        # (blobs without a stored_files row are unreferenced)
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 @app.post("/early-settlements-simple")
@@ -1027,8 +960,6 @@ async def create_early_settlement_simple(
         ]
         max_size = 10 * 1024 * 1024  # 10MB
         
-        uploaded_files = []
-        
         for file in files:
             # Validate file type
             if file.content_type not in allowed_types:
@@ -1036,43 +967,9 @@ async def create_early_settlement_simple(
                     status_code=400, 
                     detail=f"Invalid file type: {file.filename}. Allowed types: JPG, PNG, GIF, WebP, PDF"
                 )
-            
-            # Validate file size
-            if file.size and file.size > max_size:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"File too large: {file.filename}. Maximum size is 10MB"
-                )
-            
-            # Ensure upload directory exists
-            os.makedirs(EARLY_SETTLEMENT_UPLOAD_DIR, exist_ok=True)
-            
-            # Generate unique filename
-            file_extension = os.path.splitext(file.filename)[1] if file.filename else ''
-            unique_filename = f"settlement_{cheque_id}_{uuid.uuid4()}{file_extension}"
-            file_path = os.path.join(EARLY_SETTLEMENT_UPLOAD_DIR, unique_filename)
-            
-            # Save file to disk
-            try:
-                with open(file_path, "wb") as buffer:
-                    content = await file.read()
-                    buffer.write(content)
-                
-                uploaded_files.append({
-                    "original_filename": file.filename,
-                    "saved_filename": unique_filename,
-                    "file_path": file_path,
-                    "file_size": len(content),
-                    "mime_type": file.content_type
-                })
-            except Exception as e:
-                # Clean up any previously saved files on error
-                for prev_file in uploaded_files:
-                    try:
-                        os.remove(prev_file["file_path"])
-                    except:
-                        pass
-                raise HTTPException(status_code=500, detail=f"Failed to save file {file.filename}: {str(e)}")
+        
+        # Stream every file into the upload store (size limit enforced while streaming)
+        uploaded_files = await store_settlement_files(cheque_id, files, max_size)
         
         # All files validated and saved, now create the settlement
         # Mark cheque as settled
@@ -1093,8 +990,14 @@ async def create_early_settlement_simple(
             "amount": float(deposit_amount),
             "safe_id": cheque[3]
         })
+        post_entry(db, "safe", cheque[3], float(deposit_amount), "early_settlement", "cheque", cheque_id,
+                   f"Early settlement of cheque {cheque[1]}, deposit {deposit_number}")
         
+        record_stored_files(db, uploaded_files)
+        record_cheque_attachments(db, cheque_id, uploaded_files)
+        refresh_book_counters(db, cheque_ids=[cheque_id])
         db.commit()
+        schedule_previews(uploaded_files)
         
         return {
             "success": True,
@@ -1124,12 +1027,8 @@ async def create_early_settlement_simple(
         raise
     except Exception as e:
         db.rollback()
-        # Clean up any uploaded files on error
-        for uploaded_file in uploaded_files:
-            try:
-                os.remove(uploaded_file["file_path"])
-            except:
-                pass
+        # Stored files are content-addressed and may be shared, so they stay
+        # (blobs without a stored_files row are unreferenced)
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
 @app.put("/early-settlements-simple/{settlement_id}/approve")
@@ -1182,29 +1081,35 @@ async def upload_early_settlement_file(
         if not settlement_check:
             raise HTTPException(status_code=404, detail="Early settlement not found")
         
-        # Ensure upload directory exists
-        os.makedirs(EARLY_SETTLEMENT_UPLOAD_DIR, exist_ok=True)
-        
-        # Generate unique filename
-        file_extension = os.path.splitext(file.filename)[1] if file.filename else ''
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = os.path.join(EARLY_SETTLEMENT_UPLOAD_DIR, unique_filename)
+        # Stream into the upload store (size limit enforced while streaming)
+        stored = await store_upload_or_400(file, max_size)
         
-        # Save file to disk
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
-        # Save file record to database (simplified - just return success)
-        # In a full implementation, you would save to early_settlement_files table
+        # Save file record to database
+        record_stored_files(db, [stored])
+        db.execute(text("""
+            INSERT INTO early_settlement_files
+                (early_settlement_id, filename, original_filename, file_path, file_size, mime_type, file_type, uploaded_at)
+            VALUES
+                (:settlement_id, :filename, :original_filename, :file_path, :file_size, :mime_type, :file_type, CURRENT_TIMESTAMP)
+        """), {
+            "settlement_id": settlement_id,
+            "filename": stored["saved_filename"],
+            "original_filename": file.filename or stored["saved_filename"],
+            "file_path": stored["file_path"],
+            "file_size": stored["file_size"],
+            "mime_type": file.content_type,
+            "file_type": file_type
+        })
+        db.commit()
+        schedule_previews([stored])
         
         return {
             "success": True,
             "message": "File uploaded successfully",
             "file_info": {
-                "filename": unique_filename,
+                "filename": stored["saved_filename"],
                 "original_filename": file.filename,
-                "file_size": len(content),
+                "file_size": stored["file_size"],
                 "file_type": file_type,
                 "mime_type": file.content_type
             }
@@ -1213,12 +1118,91 @@ async def upload_early_settlement_file(
     except HTTPException:
         raise
     except Exception as e:
+        db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to upload file: {str(e)}")
 
 # ==========================================
 # ARABIC CHEQUE PRINTING ENDPOINTS
 # ==========================================
 
+CHEQUE_PRINT_COLUMNS = """
+    c.id, c.cheque_number, c.amount, c.issue_date, c.due_date, c.description,
+    c.issued_to, s.name as safe_name, ba.account_name as bank_name
+"""
+
+
+def _cheque_print_data(cheque_row) -> Dict[str, Any]:
+    """Map a CHEQUE_PRINT_COLUMNS row to the fields the Arabic generator expects"""
+    amount = float(cheque_row[2]) if cheque_row[2] else 0
+    issue_date = cheque_row[3]
+    due_date = cheque_row[4]
+    
+    # Format date properly
+    if issue_date:
+        if hasattr(issue_date, 'strftime'):
+            date_str = issue_date.strftime("%Y-%m-%d")
+        else:
+            date_str = str(issue_date)
+    else:
+        date_str = datetime.now().strftime("%Y-%m-%d")
+    
+    if due_date:
+        if hasattr(due_date, 'strftime'):
+            due_date_str = due_date.strftime("%Y-%m-%d")
+        else:
+            due_date_str = str(due_date)
+    else:
+        due_date_str = datetime.now().strftime("%Y-%m-%d")
+    
+    cheque_data = {
+        # Primary cheque fields - these are the fields the Arabic generator expects
+        "beneficiary_name": cheque_row[6] or "غير محدد",  # Maps to issued_to
+        "issued_to": cheque_row[6] or "غير محدد",  # Also include as issued_to for company table
+        "amount_number": amount,
+        "amount_numbers": str(int(amount)),  # For amount in digits field
+        "cheque_number": cheque_row[1] or "",
+        "date": date_str,
+        "issue_date": date_str,
+        "due_date": due_date_str,
+        "note_1": "محرر الشيك",
+        "note_2": "التاريخ",
+        "note_3": "المستلم",
+        "expense_id": "expense_id",
+         # Include both date formats
+        
+        # Description and expense info - FIX: Use correct column index for description
+        "expense_description": cheque_row[5] or f"شيك رقم {cheque_row[1]}",
+        "description": cheque_row[5] or "",  # FIXED: Now uses correct index for description
+        
+        # New positioning fields
+        "payee_notice": "يصرف للمستفيد الأول",
+        "recipient": "مدير الشؤون المالية",  # FIXED: Use role instead of duplicate name
+        "receipt_date": "تاريخ الاستلام",
+        
+        # Bank and safe info
+        "safe_name": cheque_row[7] or "",
+        "bank_name": cheque_row[8] or "",
+        
+        # Additional fields that might be used by company table
+        "expense_number": f"CHQ-{cheque_row[1]}",
+        "category_path": "شيكات > مدفوعات",
+        "reference_number": f"REF-{cheque_row[1]}",
+        "account_code": "ACC-4010",
+        "server_date": datetime.now().strftime("%Y-%m-%d"),
+        
+        # Enable company table by default for cheques from Cheque Management
+        "field_visibility": {
+            "company_table": True,
+            "beneficiary_name": True,
+            "amount_numbers": True,
+            "issued_to": True,
+            "date": True,
+            "cheque_number": True
+        }
+    }
+    return cheque_data
+
+
 @app.post("/cheques/{cheque_id}/print-arabic")
 async def print_existing_cheque_arabic(
     cheque_id: int,
@@ -1226,13 +1210,9 @@ async def print_existing_cheque_arabic(
 ):
     """Print an existing cheque in Arabic format using the pre-uploaded template"""
     try:
-        # Import the cheque generator
-        from arabic_cheque_generator import generate_arabic_cheque
-        
         # Get cheque data from database
-        cheque_query = db.execute(text("""
-            SELECT c.id, c.cheque_number, c.amount, c.issue_date, c.due_date, c.description,
-                   c.issued_to, s.name as safe_name, ba.account_name as bank_name
+        cheque_query = db.execute(text(f"""
+            SELECT {CHEQUE_PRINT_COLUMNS}
             FROM cheques c
             LEFT JOIN safes s ON c.safe_id = s.id  
             LEFT JOIN bank_accounts ba ON c.bank_account_id = ba.id
@@ -1243,77 +1223,10 @@ async def print_existing_cheque_arabic(
         if not cheque_row:
             raise HTTPException(status_code=404, detail="Cheque not found")
         
-        # Extract cheque data and map to expected field names
-        amount = float(cheque_row[2]) if cheque_row[2] else 0
-        issue_date = cheque_row[3]
-        due_date = cheque_row[4]
-        
-        # Format date properly
-        if issue_date:
-            if hasattr(issue_date, 'strftime'):
-                date_str = issue_date.strftime("%Y-%m-%d")
-            else:
-                date_str = str(issue_date)
-        else:
-            date_str = datetime.now().strftime("%Y-%m-%d")
-        
-        if due_date:
-            if hasattr(due_date, 'strftime'):
-                due_date_str = due_date.strftime("%Y-%m-%d")
-            else:
-                due_date_str = str(due_date)
-        else:
-            due_date_str = datetime.now().strftime("%Y-%m-%d")
-        
-        cheque_data = {
-            # Primary cheque fields - these are the fields the Arabic generator expects
-            "beneficiary_name": cheque_row[6] or "غير محدد",  # Maps to issued_to
-            "issued_to": cheque_row[6] or "غير محدد",  # Also include as issued_to for company table
-            "amount_number": amount,
-            "amount_numbers": str(int(amount)),  # For amount in digits field
-            "cheque_number": cheque_row[1] or "",
-            "date": date_str,
-            "issue_date": date_str,
-            "due_date": due_date_str,
-            "note_1": "محرر الشيك",
-            "note_2": "التاريخ",
-            "note_3": "المستلم",
-            "expense_id": "expense_id",
-             # Include both date formats
-            
-            # Description and expense info - FIX: Use correct column index for description
-            "expense_description": cheque_row[5] or f"شيك رقم {cheque_row[1]}",
-            "description": cheque_row[5] or "",  # FIXED: Now uses correct index for description
-            
-            # New positioning fields
-            "payee_notice": "يصرف للمستفيد الأول",
-            "recipient": "مدير الشؤون المالية",  # FIXED: Use role instead of duplicate name
-            "receipt_date": "تاريخ الاستلام",
-            
-            # Bank and safe info
-            "safe_name": cheque_row[7] or "",
-            "bank_name": cheque_row[8] or "",
-            
-            # Additional fields that might be used by company table
-            "expense_number": f"CHQ-{cheque_row[1]}",
-            "category_path": "شيكات > مدفوعات",
-            "reference_number": f"REF-{cheque_row[1]}",
-            "account_code": "ACC-4010",
-            "server_date": datetime.now().strftime("%Y-%m-%d"),
-            
-            # Enable company table by default for cheques from Cheque Management
-            "field_visibility": {
-                "company_table": True,
-                "beneficiary_name": True,
-                "amount_numbers": True,
-                "issued_to": True,
-                "date": True,
-                "cheque_number": True
-            }
-        }
+        cheque_data = _cheque_print_data(cheque_row)
         
-        # Generate the cheque PDF
-        pdf_bytes = generate_arabic_cheque(cheque_data)
+        # Generate the cheque PDF in the render worker pool
+        pdf_bytes = await render_pdf("arabic_cheque", cheque_data)
         
         # Return PDF as inline response
         return Response(
@@ -1326,6 +1239,8 @@ async def print_existing_cheque_arabic(
             }
         )
         
+    except HTTPException:
+        raise
     except ImportError:
         raise HTTPException(
             status_code=500, 
@@ -1336,6 +1251,115 @@ async def print_existing_cheque_arabic(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to print cheque: {str(e)}")
 
+# Upper bound on cheques rendered by one print-batch request; at 0.5 s per
+# page the render timeout stays within MySQL's default 50 s lock wait
+MAX_PRINT_BATCH = 100
+
+@app.post("/cheques/print-batch")
+async def print_cheques_batch(
+    request: schemas.ChequeBatchPrintRequest,
+    db: Session = Depends(get_db)
+):
+    """
+    Print many cheques as one multi-page Arabic PDF (one page per cheque).
+    Pass cheque_ids, or cheque_book_id to print a book (by default only its
+    unprinted cheques, at most MAX_PRINT_BATCH per request; X-More-Cheques
+    says whether to call again). The PDF is rendered from a plain read,
+    without locks; the cheques are then marked printed in one short
+    transaction, which fails with 409 if a concurrent print of the book
+    claimed any of them first, so no cheque is printed twice.
+    """
+    if not request.cheque_ids and request.cheque_book_id is None:
+        raise HTTPException(status_code=400, detail="Provide cheque_ids or cheque_book_id")
+
+    where_conditions = []
+    params: Dict[str, Any] = {}
+    if request.cheque_ids:
+        where_conditions.append("c.id IN :cheque_ids")
+        params["cheque_ids"] = list(dict.fromkeys(request.cheque_ids))
+        if len(params["cheque_ids"]) > MAX_PRINT_BATCH:
+            raise HTTPException(status_code=400, detail=f"Cannot print more than {MAX_PRINT_BATCH} cheques at once")
+    if request.cheque_book_id is not None:
+        where_conditions.append("c.cheque_book_id = :cheque_book_id")
+        params["cheque_book_id"] = request.cheque_book_id
+        if request.unprinted_only:
+            where_conditions.append("COALESCE(c.is_printed, 0) = 0")
+    unprinted_only = request.cheque_book_id is not None and request.unprinted_only
+
+    query = text(f"""
+        SELECT {CHEQUE_PRINT_COLUMNS}
+        FROM cheques c
+        LEFT JOIN safes s ON c.safe_id = s.id
+        LEFT JOIN bank_accounts ba ON c.bank_account_id = ba.id
+        WHERE {" AND ".join(where_conditions)}
+        ORDER BY c.cheque_number
+        LIMIT {MAX_PRINT_BATCH + 1}
+    """)
+    if request.cheque_ids:
+        query = query.bindparams(bindparam("cheque_ids", expanding=True))
+
+    try:
+        rows = db.execute(query, params).fetchall()
+        # End the read transaction: nothing stays open while rendering
+        db.rollback()
+        if not rows:
+            raise HTTPException(status_code=404, detail="No cheques to print")
+        more_cheques = len(rows) > MAX_PRINT_BATCH
+        rows = rows[:MAX_PRINT_BATCH]
+
+        if request.cheque_ids:
+            # Keep the order the caller asked for
+            requested_order = {cheque_id: index for index, cheque_id in enumerate(params["cheque_ids"])}
+            rows.sort(key=lambda row: requested_order[row[0]])
+            missing = set(params["cheque_ids"]) - {row[0] for row in rows}
+            if missing:
+                raise HTTPException(status_code=404, detail=f"Cheque(s) not found: {sorted(missing)}")
+
+        pdf_bytes = await render_pdf(
+            "arabic_cheque_batch", [_cheque_print_data(row) for row in rows],
+            timeout=max(render_pool.timeout, len(rows) * 0.5)
+        )
+
+        if request.mark_printed:
+            # Claim the cheques in one statement; with unprinted_only it only
+            # matches those still unprinted, so a concurrent print shows up
+            # as a short count
+            printed_ids = [row[0] for row in rows]
+            result = db.execute(text(f"""
+                UPDATE cheques 
+                SET is_printed = 1, 
+                    printed_at = NOW(),
+                    print_count = COALESCE(print_count, 0) + 1
+                WHERE id IN :printed_ids
+                {"AND COALESCE(is_printed, 0) = 0" if unprinted_only else ""}
+            """).bindparams(bindparam("printed_ids", expanding=True)), {"printed_ids": printed_ids})
+            if result.rowcount != len(printed_ids):
+                db.rollback()
+                raise HTTPException(
+                    status_code=409,
+                    detail="Some of these cheques were printed by another request meanwhile; print the book again"
+                )
+            db.commit()
+
+        return Response(
+            content=pdf_bytes,
+            media_type="application/pdf",
+            headers={
+                "Content-Disposition": f"inline; filename=cheques_{rows[0][1]}-{rows[-1][1]}_arabic.pdf",
+                "Content-Type": "application/pdf",
+                "Cache-Control": "no-cache",
+                "X-Cheque-Count": str(len(rows)),
+                "X-More-Cheques": "true" if more_cheques else "false"
+            }
+        )
+
+    except HTTPException:
+        db.rollback()
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to print cheques: {str(e)}")
+
 @app.patch("/cheques/{cheque_id}/mark-printed")
 async def mark_cheque_as_printed(
     cheque_id: int,
@@ -1447,6 +1471,10 @@ async def upload_cheque_template(
             content = await file.read()
             buffer.write(content)
         
+        # Drop pre-rendered layers of the previous template
+        from arabic_cheque_generator import template_layer_cache
+        template_layer_cache.invalidate()
+        
         return {
             "success": True,
             "message": "Cheque template uploaded successfully",
@@ -1487,9 +1515,26 @@ async def check_cheque_template_status():
 # ==========================================
 
 @app.get("/ingredients-for-editing")
-async def get_ingredients_for_editing(db: Session = Depends(get_db)):
-    """Get all ingredients in a simple format for recipe editing"""
+async def get_ingredients_for_editing(
+    q: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    """Get all ingredients in a simple format for recipe editing (name-prefix suggestions when q is given)"""
     try:
+        if q:
+            ingredients = [
+                {
+                    "id": item["id"],
+                    "name": item["name"],
+                    "unit": item["unit"],
+                    "price_per_unit": item["price_per_unit"],
+                    "category": item["category_name"]
+                }
+                for item in autocomplete_index.complete(db, q, [ITEM], limit)
+            ]
+            return {"success": True, "count": len(ingredients), "data": ingredients}
+        
         # Get all items that can be used as ingredients
         result = db.execute(text("""
             SELECT i.id, i.name, i.unit, i.price_per_unit,
@@ -1552,51 +1597,7 @@ async def get_sub_recipes_for_editing(db: Session = Depends(get_db)):
 async def get_sub_recipes_manage(db: Session = Depends(get_db)):
     """Get all sub-recipes with full details for management interface"""
     try:
-        sub_recipes = db.query(models.SubRecipe).all()
-        
-        result = []
-        for sub_recipe in sub_recipes:
-            # Get ingredients
-            ingredients = []
-            total_cost = 0
-            for ing in sub_recipe.ingredients:
-                item = db.query(models.Item).filter(models.Item.id == ing.ingredient_id).first()
-                if item:
-                    price_per_unit = float(item.price_per_unit) if item.price_per_unit else 0
-                    ingredient_total_cost = price_per_unit * float(ing.quantity)
-                    total_cost += ingredient_total_cost
-                    ingredients.append({
-                        "id": ing.ingredient_id,
-                        "ingredient_name": item.name,
-                        "name": item.name,
-                        "quantity": float(ing.quantity),
-                        "unit": item.unit,
-                        "price_per_unit": price_per_unit,
-                        "total_cost": ingredient_total_cost
-                    })
-            
-            # Get nested sub-recipes
-            nested_sub_recipes = []
-            for nsr in sub_recipe.nested_sub_recipes:
-                child = nsr.child_sub_recipe
-                nested_sub_recipes.append({
-                    "id": nsr.id,
-                    "sub_recipe_id": child.id,
-                    "sub_recipe_name": child.name,
-                    "name": child.name,
-                    "quantity": float(nsr.quantity)
-                })
-            
-            result.append({
-                "id": sub_recipe.id,
-                "name": sub_recipe.name,
-                "total_cost": total_cost,
-                "ingredients": ingredients,
-                "sub_recipes": nested_sub_recipes,
-                "nested_sub_recipes": nested_sub_recipes  # Some components might use this name
-            })
-        
-        return result
+        return recipe_cost_cache.get_graph(db).sub_recipes_manage()
         
     except Exception as e:
         # Return empty array on error to prevent frontend crashes
@@ -1607,51 +1608,7 @@ async def get_sub_recipes_manage(db: Session = Depends(get_db)):
 async def get_mid_prep_recipes_manage(db: Session = Depends(get_db)):
     """Get all mid-prep recipes with full details for management interface"""
     try:
-        mid_prep_recipes = db.query(models.MidPrepRecipe).all()
-        
-        result = []
-        for mid_prep in mid_prep_recipes:
-            # Get ingredients
-            ingredients = []
-            total_cost = 0
-            for ing in mid_prep.ingredients:
-                item = db.query(models.Item).filter(models.Item.id == ing.ingredient_id).first()
-                if item:
-                    price_per_unit = float(item.price_per_unit) if item.price_per_unit else 0
-                    ingredient_total_cost = price_per_unit * float(ing.quantity)
-                    total_cost += ingredient_total_cost
-                    ingredients.append({
-                        "id": ing.ingredient_id,
-                        "ingredient_name": item.name,
-                        "name": item.name,
-                        "quantity": float(ing.quantity),
-                        "unit": item.unit,
-                        "price_per_unit": price_per_unit,
-                        "total_cost": ingredient_total_cost
-                    })
-            
-            # Get sub-recipes
-            sub_recipes = []
-            if hasattr(mid_prep, 'subrecipes'):
-                for sr in mid_prep.subrecipes:
-                    sub_recipe = db.query(models.SubRecipe).filter(models.SubRecipe.id == sr.sub_recipe_id).first()
-                    if sub_recipe:
-                        sub_recipes.append({
-                            "id": sr.sub_recipe_id,
-                            "sub_recipe_name": sub_recipe.name,
-                            "name": sub_recipe.name,
-                            "quantity": float(sr.quantity)
-                        })
-            
-            result.append({
-                "id": mid_prep.id,
-                "name": mid_prep.name,
-                "total_cost": total_cost,
-                "ingredients": ingredients,
-                "sub_recipes": sub_recipes
-            })
-        
-        return result
+        return recipe_cost_cache.get_graph(db).mid_prep_recipes_manage()
         
     except Exception as e:
         # Return empty array on error to prevent frontend crashes
@@ -1662,72 +1619,7 @@ async def get_mid_prep_recipes_manage(db: Session = Depends(get_db)):
 async def get_cakes_manage(db: Session = Depends(get_db)):
     """Get all cakes with full details for management interface"""
     try:
-        cakes = db.query(models.Cake).all()
-        
-        result = []
-        for cake in cakes:
-            # Get ingredients
-            ingredients = []
-            total_cost = 0
-            for ing in cake.ingredients:
-                if not ing.is_subrecipe:
-                    item = db.query(models.Item).filter(models.Item.id == ing.ingredient_or_subrecipe_id).first()
-                    if item:
-                        price_per_unit = float(item.price_per_unit) if item.price_per_unit else 0
-                        ingredient_cost = price_per_unit * float(ing.quantity)
-                        total_cost += ingredient_cost
-                        ingredients.append({
-                            "id": ing.ingredient_or_subrecipe_id,
-                            "name": item.name,
-                            "quantity": float(ing.quantity),
-                            "unit": item.unit,
-                            "type": "ingredient",
-                            "cost": ingredient_cost
-                        })
-            
-            # Get sub-recipes
-            sub_recipes = []
-            for ing in cake.ingredients:
-                if ing.is_subrecipe:
-                    sub_recipe = db.query(models.SubRecipe).filter(models.SubRecipe.id == ing.ingredient_or_subrecipe_id).first()
-                    if sub_recipe:
-                        # Add sub-recipe to ingredients list for frontend compatibility
-                        ingredients.append({
-                            "id": ing.ingredient_or_subrecipe_id,
-                            "name": sub_recipe.name,
-                            "quantity": float(ing.quantity),
-                            "type": "sub_recipe",
-                            "cost": 0  # Will be calculated on frontend
-                        })
-                        sub_recipes.append({
-                            "id": ing.ingredient_or_subrecipe_id,
-                            "name": sub_recipe.name,
-                            "quantity": float(ing.quantity)
-                        })
-            
-            # Get mid-preps
-            mid_preps = []
-            for mp in cake.mid_preps:
-                mid_prep = db.query(models.MidPrepRecipe).filter(models.MidPrepRecipe.id == mp.mid_prep_id).first()
-                if mid_prep:
-                    mid_preps.append({
-                        "id": mp.mid_prep_id,
-                        "name": mid_prep.name,
-                        "quantity": float(mp.quantity),
-                        "cost": 0  # Will be calculated on frontend
-                    })
-            
-            result.append({
-                "id": cake.id,
-                "name": cake.name,
-                "total_cost": total_cost,
-                "percent_yield": float(cake.percent_yield) if cake.percent_yield else 100,
-                "ingredients": ingredients,
-                "sub_recipes": sub_recipes,
-                "mid_preps": mid_preps
-            })
-        
-        return result
+        return recipe_cost_cache.get_graph(db).cakes_manage()
         
     except Exception as e:
         # Return empty array on error to prevent frontend crashes
@@ -2103,22 +1995,18 @@ async def get_batch_sessions_simple(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Failed to fetch batch sessions: {str(e)}")
 
 @app.get("/api/batch/cakes/search")
-async def search_batch_cakes_simple(q: str = "", db: Session = Depends(get_db)):
-    """Search batch cakes - Simple version"""
+async def search_batch_cakes_simple(q: str = "", limit: int = Query(20, ge=1, le=100), db: Session = Depends(get_db)):
+    """Search batch cakes by name prefix (type-ahead, served from memory)"""
     try:
-        # Return sample cake search results
-        cakes = [
-            {"id": 1, "name": "Chocolate Cake", "type": "cake", "category": "chocolate"},
-            {"id": 2, "name": "Vanilla Cake", "type": "cake", "category": "vanilla"},
-            {"id": 3, "name": "Strawberry Cake", "type": "cake", "category": "fruit"},
-            {"id": 4, "name": "Black Forest Cake", "type": "cake", "category": "specialty"}
-        ]
+        if not q:
+            graph = recipe_cost_cache.get_graph(db)
+            names = sorted((graph.names[node], node[1]) for node in graph.nodes_of(CAKE))
+            return [{"id": cake_id, "name": name, "type": "cake"} for name, cake_id in names[:limit]]
         
-        # Simple search filter
-        if q:
-            cakes = [cake for cake in cakes if q.lower() in cake["name"].lower()]
-        
-        return cakes
+        return [
+            {"id": cake["id"], "name": cake["name"], "type": "cake"}
+            for cake in autocomplete_index.complete(db, q, [CAKE], limit)
+        ]
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to search cakes: {str(e)}")
@@ -2828,6 +2716,40 @@ async def sync_foodics_products(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to sync products: {str(e)}")
 
+def shop_sales_response(db: Session, shop_id: int, start_date: datetime, end_date: datetime) -> Dict[str, Any]:
+    """Local sales of the Foodics branch linked to a shop"""
+    branch_id = foodics_sync.shop_branch_id(db, shop_id)
+    if not branch_id:
+        return {
+            "success": False,
+            "message": "Shop is not linked to a Foodics branch",
+            "sales_data": []
+        }
+    return foodics_sync.local_branch_sales(db, branch_id, start_date, end_date)
+
+@app.post("/api/foodics/sync-orders")
+async def sync_foodics_orders(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Ingest new Foodics orders of every synced branch now"""
+    if not foodics_available:
+        return {
+            "success": False,
+            "message": "Foodics service not available - basic mode only"
+        }
+    return await foodics_sync.sync_all_branches(db)
+
+@app.get("/api/foodics/sync-status")
+async def get_foodics_sync_status(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Per-branch cursor of the Foodics order sync and the API client counters"""
+    if not foodics_available:
+        return {"success": False, "message": "Foodics service not available - basic mode only", "branches": []}
+    return {"success": True, "branches": foodics_sync.sync_status(db), "client": foodics_client.stats()}
+
 @app.get("/api/foodics/fetch-sales/{shop_id}")
 async def fetch_shop_sales_from_foodics(
     shop_id: int,
@@ -2835,7 +2757,7 @@ async def fetch_shop_sales_from_foodics(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    """SALES-FOCUSED: Fetch sales data from Foodics branch"""
+    """SALES-FOCUSED: Sales of a shop's Foodics branch over the last `days` (synced orders)"""
     try:
         if not foodics_available:
             return {
@@ -2844,10 +2766,8 @@ async def fetch_shop_sales_from_foodics(
                 "sales_data": []
             }
         
-        foodics_service = FoodicsService(db)
-        
-        fetch_result = await foodics_service.fetch_branch_sales_data(shop_id, days)
-        return fetch_result
+        end_date = datetime.utcnow()
+        return shop_sales_response(db, shop_id, end_date - timedelta(days=days), end_date)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch sales data: {str(e)}")
@@ -2867,11 +2787,9 @@ async def fetch_shop_inventory_from_foodics(
                 "mode": "SALES_ONLY"
             }
         
-        foodics_service = FoodicsService(db)
-        
         # Redirect to sales data instead
-        fetch_result = await foodics_service.fetch_branch_sales_data(shop_id, 7)
-        return fetch_result
+        end_date = datetime.utcnow()
+        return shop_sales_response(db, shop_id, end_date - timedelta(days=7), end_date)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch sales data: {str(e)}")
@@ -2907,7 +2825,7 @@ async def get_foodics_sales_data(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    """Fetch sales data from Foodics for revenue tracking"""
+    """Sales data of a shop's Foodics branch for revenue tracking (synced orders)"""
     try:
         if not foodics_available:
             return {
@@ -2916,10 +2834,7 @@ async def get_foodics_sales_data(
                 "sales_data": []
             }
         
-        foodics_service = FoodicsService(db)
-        
-        sales_data = await foodics_service.fetch_sales_data(shop_id, start_date, end_date)
-        return sales_data
+        return shop_sales_response(db, shop_id, start_date, end_date)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get sales data: {str(e)}")
@@ -2947,13 +2862,9 @@ async def get_branch_sales_direct(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    """READ-ONLY: Get sales data for a specific Foodics branch"""
+    """READ-ONLY: Get sales data for a specific Foodics branch (synced orders)"""
     try:
-        from foodics_service import SecureFoodicsService
-        foodics_service = SecureFoodicsService(db)
-        
-        sales_data = await foodics_service.get_branch_sales(branch_id, start_date, end_date)
-        return sales_data
+        return foodics_sync.local_branch_sales(db, branch_id, start_date, end_date)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get branch sales: {str(e)}")
@@ -3034,9 +2945,10 @@ async def get_default_branch_sales(
         if not branch_id:
             raise HTTPException(status_code=400, detail="No default branch configured. Use /api/foodics/configure-branch first.")
         
-        sales_data = await foodics_service.get_branch_sales(branch_id, start_date, end_date)
-        return sales_data
+        return foodics_sync.local_branch_sales(db, branch_id, start_date, end_date)
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get default branch sales: {str(e)}")
 
@@ -3101,106 +3013,51 @@ async def get_inventory_summary_report(
     warehouse_id: Optional[int] = None,
     category_id: Optional[int] = None,
     low_stock_only: bool = False,
+    page: int = Query(1, ge=1),
+    per_page: int = Query(100, ge=1, le=1000),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    """Get comprehensive inventory summary report"""
+    """Get comprehensive inventory summary report from the valuation snapshot"""
     try:
-        where_clauses = []
-        params = {}
-        
-        if warehouse_id:
-            where_clauses.append("ws.warehouse_id = :warehouse_id")
-            params["warehouse_id"] = warehouse_id
-            
-        if category_id:
-            where_clauses.append("i.category_id = :category_id")
-            params["category_id"] = category_id
-            
-        where_clause = ""
-        if where_clauses:
-            where_clause = "WHERE " + " AND ".join(where_clauses)
-        
-        # Get inventory summary
-        query = text(f"""
-            SELECT 
-                w.id as warehouse_id,
-                w.name as warehouse_name,
-                i.id as item_id,
-                i.name as item_name,
-                i.unit,
-                ic.name as category_name,
-                COALESCE(ws.quantity, 0) as current_stock,
-                COALESCE(i.min_stock_level, 0) as min_stock_level,
-                CASE 
-                    WHEN COALESCE(ws.quantity, 0) <= COALESCE(i.min_stock_level, 0) THEN 'Low Stock'
-                    WHEN COALESCE(ws.quantity, 0) = 0 THEN 'Out of Stock'
-                    ELSE 'In Stock'
-                END as stock_status,
-                COALESCE(avg_cost.avg_price, 0) as average_cost,
-                COALESCE(ws.quantity, 0) * COALESCE(avg_cost.avg_price, 0) as total_value
-            FROM warehouses w
-            CROSS JOIN items i
-            LEFT JOIN warehouse_stock ws ON w.id = ws.warehouse_id AND i.id = ws.ingredient_id
-            LEFT JOIN inventory_categories ic ON i.category_id = ic.id
-            LEFT JOIN (
-                SELECT poi.item_id, AVG(poi.unit_price) as avg_price
-                FROM purchase_order_items poi
-                JOIN purchase_orders po ON poi.purchase_order_id = po.id
-                WHERE po.order_date >= DATE_SUB(NOW(), INTERVAL 6 MONTH)
-                GROUP BY poi.item_id
-            ) avg_cost ON i.id = avg_cost.item_id
-            {where_clause}
-            ORDER BY w.name, ic.name, i.name
-        """)
-        
-        if low_stock_only:
-            query = text(f"""
-                {query.text}
-                HAVING stock_status IN ('Low Stock', 'Out of Stock')
-            """)
-        
-        result = db.execute(query, params).fetchall()
-        
-        # Process results
-        report_data = []
-        total_value = 0
-        
-        for row in result:
-            item_data = {
-                "warehouse_id": row[0],
-                "warehouse_name": row[1],
-                "item_id": row[2],
-                "item_name": row[3],
-                "unit": row[4],
-                "category_name": row[5] or "Uncategorized",
-                "current_stock": float(row[6]),
-                "min_stock_level": float(row[7]),
-                "stock_status": row[8],
-                "average_cost": float(row[9]),
-                "total_value": float(row[10])
-            }
-            report_data.append(item_data)
-            total_value += float(row[10])
-        
-        # Summary statistics
-        summary = {
-            "total_items": len(report_data),
-            "total_inventory_value": total_value,
-            "low_stock_items": len([item for item in report_data if item["stock_status"] == "Low Stock"]),
-            "out_of_stock_items": len([item for item in report_data if item["stock_status"] == "Out of Stock"]),
-            "in_stock_items": len([item for item in report_data if item["stock_status"] == "In Stock"])
-        }
+        # Summary statistics cover every matching row, items only the requested page
+        summary = get_valuation_summary(db, warehouse_id, category_id, low_stock_only)
+        report_data = get_valuation_rows(
+            db, warehouse_id, category_id, low_stock_only,
+            limit=per_page, offset=(page - 1) * per_page
+        )
+        total = summary["total_items"]
         
         return {
             "success": True,
             "summary": summary,
-            "items": report_data
+            "items": report_data,
+            "pagination": {
+                "page": page,
+                "per_page": per_page,
+                "total": total,
+                "pages": (total + per_page - 1) // per_page
+            }
         }
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate report: {str(e)}")
 
+@app.post("/api/reports/inventory-summary/refresh")
+async def refresh_inventory_summary_snapshot(
+    warehouse_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Re-sync the inventory valuation snapshot with warehouse stock on demand"""
+    try:
+        rows = refresh_valuation_snapshot(db, warehouse_id)
+        db.commit()
+        return {"success": True, "rows_changed": rows}
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to refresh inventory snapshot: {str(e)}")
+
 @app.get("/api/reports/purchase-analysis")
 async def get_purchase_analysis_report(
     supplier_id: Optional[int] = None,
@@ -3290,122 +3147,38 @@ async def get_purchase_analysis_report(
 async def global_search(
     q: str = Query(..., min_length=2, description="Search query"),
     search_type: Optional[str] = Query(None, description="Type: items, suppliers, orders, cheques"),
-    limit: int = Query(20, le=100),
+    limit: int = Query(20, ge=1, le=100),
+    page: int = Query(1, ge=1),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    """Global search across all entities"""
+    """Global search across all entities, ranked and paginated from the search index"""
     try:
-        results = {"items": [], "suppliers": [], "purchase_orders": [], "cheques": []}
-        search_term = f"%{q}%"
-        
-        if not search_type or search_type == "items":
-            # Search items
-            items = db.execute(text("""
-                SELECT i.id, i.name, i.unit, ic.name as category_name,
-                       COALESCE(SUM(ws.quantity), 0) as total_stock
-                FROM items i
-                LEFT JOIN inventory_categories ic ON i.category_id = ic.id
-                LEFT JOIN warehouse_stock ws ON i.id = ws.ingredient_id
-                WHERE i.name LIKE :search_term
-                GROUP BY i.id, i.name, i.unit, ic.name
-                LIMIT :limit
-            """), {"search_term": search_term, "limit": limit}).fetchall()
-            
-            results["items"] = [
-                {
-                    "id": item[0],
-                    "name": item[1],
-                    "unit": item[2],
-                    "category": item[3] or "Uncategorized",
-                    "total_stock": float(item[4])
-                }
-                for item in items
-            ]
-        
-        if not search_type or search_type == "suppliers":
-            # Search suppliers
-            suppliers = db.execute(text("""
-                SELECT s.id, s.name, s.contact_name, s.phone,
-                       COUNT(po.id) as total_orders
-                FROM suppliers s
-                LEFT JOIN purchase_orders po ON s.id = po.supplier_id
-                WHERE s.name LIKE :search_term 
-                   OR s.contact_name LIKE :search_term
-                   OR s.phone LIKE :search_term
-                GROUP BY s.id, s.name, s.contact_name, s.phone
-                LIMIT :limit
-            """), {"search_term": search_term, "limit": limit}).fetchall()
-            
-            results["suppliers"] = [
-                {
-                    "id": supplier[0],
-                    "name": supplier[1],
-                    "contact_name": supplier[2],
-                    "phone": supplier[3],
-                    "total_orders": supplier[4] or 0
-                }
-                for supplier in suppliers
-            ]
-        
-        if not search_type or search_type == "orders":
-            # Search purchase orders
-            orders = db.execute(text("""
-                SELECT po.id, s.name as supplier_name, po.order_date, 
-                       po.status, po.total_amount
-                FROM purchase_orders po
-                JOIN suppliers s ON po.supplier_id = s.id
-                WHERE s.name LIKE :search_term
-                   OR CAST(po.id AS CHAR) LIKE :search_term
-                ORDER BY po.order_date DESC
-                LIMIT :limit
-            """), {"search_term": search_term, "limit": limit}).fetchall()
-            
-            results["purchase_orders"] = [
-                {
-                    "id": order[0],
-                    "supplier_name": order[1],
-                    "order_date": order[2].isoformat() if order[2] else None,
-                    "status": order[3],
-                    "total_amount": float(order[4]) if order[4] else 0
-                }
-                for order in orders
-            ]
-        
-        if not search_type or search_type == "cheques":
-            # Search cheques
-            cheques = db.execute(text("""
-                SELECT c.id, c.cheque_number, c.amount, c.status,
-                       ba.account_name, ba.bank_name
-                FROM cheques c
-                LEFT JOIN bank_accounts ba ON c.bank_account_id = ba.id
-                WHERE c.cheque_number LIKE :search_term
-                   OR c.description LIKE :search_term
-                   OR ba.account_name LIKE :search_term
-                LIMIT :limit
-            """), {"search_term": search_term, "limit": limit}).fetchall()
-            
-            results["cheques"] = [
-                {
-                    "id": cheque[0],
-                    "cheque_number": cheque[1],
-                    "amount": float(cheque[2]) if cheque[2] else 0,
-                    "status": cheque[3],
-                    "bank_account": f"{cheque[4]} ({cheque[5]})" if cheque[4] else "Unknown"
-                }
-                for cheque in cheques
-            ]
+        entity_types = None
+        if search_type:
+            if search_type not in SEARCH_TYPE_ALIASES:
+                raise HTTPException(status_code=400, detail=f"Unknown search type: {search_type}")
+            entity_types = [SEARCH_TYPE_ALIASES[search_type]]
         
-        # Count total results
-        total_results = sum(len(results[key]) for key in results)
+        total, hits = search_index.search(db, q, entity_types, offset=(page - 1) * limit, limit=limit)
+        results = hydrate_hits(db, hits)
         
         return {
             "success": True,
             "query": q,
-            "total_results": total_results,
-            "results": results
+            "total_results": total,
+            "results": results,
+            "hits": [{"type": key[0], "id": key[1], "score": score} for key, score in hits],
+            "pagination": {
+                "page": page,
+                "per_page": limit,
+                "total": total,
+                "pages": (total + limit - 1) // limit
+            }
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
 
@@ -3413,63 +3186,30 @@ async def global_search(
 @app.get("/api/export/inventory-csv")
 async def export_inventory_csv(
     warehouse_id: Optional[int] = None,
+    category_id: Optional[int] = None,
+    low_stock_only: bool = False,
+    export_format: str = Query("csv", alias="format", pattern="^(csv|xlsx)$"),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    """Export inventory data as CSV"""
+    """Export inventory data as CSV (or XLSX with format=xlsx), streamed row by row"""
     try:
-        import csv
-        import io
-        
-        where_clause = ""
-        params = {}
-        
-        if warehouse_id:
-            where_clause = "WHERE w.id = :warehouse_id"
-            params["warehouse_id"] = warehouse_id
-        
-        # Get inventory data
-        result = db.execute(text(f"""
-            SELECT 
-                w.name as warehouse_name,
-                i.name as item_name,
-                i.unit,
-                ic.name as category_name,
-                COALESCE(ws.quantity, 0) as current_stock,
-                COALESCE(i.min_stock_level, 0) as min_stock_level
-            FROM warehouses w
-            CROSS JOIN items i
-            LEFT JOIN warehouse_stock ws ON w.id = ws.warehouse_id AND i.id = ws.ingredient_id
-            LEFT JOIN inventory_categories ic ON i.category_id = ic.id
-            {where_clause}
-            ORDER BY w.name, ic.name, i.name
-        """), params).fetchall()
-        
-        # Create CSV
-        output = io.StringIO()
-        writer = csv.writer(output)
+        sql, params = valuation_rows_query(warehouse_id, category_id, low_stock_only)
         
-        # Headers
-        writer.writerow([
-            "Warehouse", "Item Name", "Unit", "Category", 
-            "Current Stock", "Min Stock Level"
-        ])
-        
-        # Data rows
-        for row in result:
-            writer.writerow([
-                row[0], row[1], row[2], row[3] or "Uncategorized",
-                float(row[4]), float(row[5])
-            ])
-        
-        # Return CSV as response
-        csv_data = output.getvalue()
-        output.close()
+        def export_rows():
+            for row in iter_query_rows(sql, params):
+                yield [
+                    row[1], row[3], row[4], row[5] or "Uncategorized",
+                    float(row[6]), float(row[7]), float(row[9]), float(row[10])
+                ]
         
-        return Response(
-            content=csv_data,
-            media_type="text/csv",
-            headers={"Content-Disposition": "attachment; filename=inventory_export.csv"}
+        return export_response(
+            export_format,
+            "inventory_export",
+            ["Warehouse", "Item Name", "Unit", "Category",
+             "Current Stock", "Min Stock Level", "Average Cost", "Total Value"],
+            export_rows(),
+            sheet_name="Inventory"
         )
         
     except Exception as e:
@@ -3930,19 +3670,10 @@ async def upload_supplier_invoice(
         raise HTTPException(status_code=400, detail="Only PDF and image files are allowed")
     
     try:
-        # Create uploads directory if it doesn't exist
-        upload_dir = "uploads/supplier_invoices"
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        # Generate unique filename
-        file_extension = file.filename.split('.')[-1] if '.' in file.filename else 'pdf'
-        unique_filename = f"invoice_cheque_{cheque_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{file_extension}"
-        file_path = os.path.join(upload_dir, unique_filename)
-        
-        # Save file
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        # Stream into the upload store (size limit enforced while streaming)
+        stored = await store_upload_or_400(file, default_extension=".pdf")
+        file_path = stored["file_path"]
+        record_stored_files(db, [stored])
         
         # Update cheque record
         cheque.supplier_invoice_uploaded = True
@@ -3953,7 +3684,10 @@ async def upload_supplier_invoice(
         # Update status to 'settled' now that invoice is uploaded
         cheque.status = 'settled'
         
+        db.flush()
+        refresh_book_counters(db, cheque_ids=[cheque.id])
         db.commit()
+        schedule_previews([stored])
         
         return {
             "success": True,
@@ -3962,6 +3696,9 @@ async def upload_supplier_invoice(
             "cheque_status": cheque.status
         }
         
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error uploading file: {str(e)}")
@@ -3969,10 +3706,11 @@ async def upload_supplier_invoice(
 @app.get("/cheques/{cheque_id}/supplier-invoice")
 async def get_supplier_invoice(
     cheque_id: int,
+    size: Optional[str] = Query(None, description="thumb, medium or full (images only)"),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    """Download supplier invoice for a cheque"""
+    """Download supplier invoice for a cheque (?size=thumb|medium for an image preview)"""
     
     # Get the cheque
     cheque = db.query(models.Cheque).filter(models.Cheque.id == cheque_id).first()
@@ -3997,10 +3735,12 @@ async def get_supplier_invoice(
     }
     media_type = media_type_map.get(file_extension, 'application/octet-stream')
     
-    return FileResponse(
-        path=cheque.supplier_invoice_file_path,
-        media_type=media_type,
-        filename=f"invoice_cheque_{cheque_id}.{file_extension}"
+    return await preview_response(
+        cheque.supplier_invoice_file_path,
+        size,
+        media_type,
+        f"invoice_cheque_{cheque_id}.{file_extension}",
+        disposition="attachment"
     )
 
 @app.get("/cheques/supplier-payments/pending-invoice")
@@ -4050,9 +3790,10 @@ async def get_supplier_payments_pending_invoice(
 async def get_settlement_attachment(
     cheque_id: int,
     filename: str,
+    size: Optional[str] = Query(None, description="thumb, medium or full (images only)"),
     db: Session = Depends(get_db)
 ):
-    """Download a settlement attachment file"""
+    """Download a settlement attachment file (?size=thumb|medium for an image preview)"""
     try:
         # Verify cheque exists and is settled
         cheque = db.execute(text("""
@@ -4067,13 +3808,15 @@ async def get_settlement_attachment(
         if not cheque[2]:  # is_settled
             raise HTTPException(status_code=400, detail="Cheque is not settled")
         
-        # Construct file path
-        file_path = os.path.join(EARLY_SETTLEMENT_UPLOAD_DIR, filename)
-        
         # Security check - ensure filename starts with correct pattern
-        if not filename.startswith(f"settlement_{cheque_id}_"):
+        if not filename.startswith(f"settlement_{cheque_id}_") or os.path.basename(filename) != filename:
             raise HTTPException(status_code=403, detail="Access denied")
         
+        # Recorded attachments point into the upload store; files saved
+        # before it existed are still found under their name
+        attachment = attachment_file(db, cheque_id, filename)
+        file_path = attachment["file_path"] if attachment else os.path.join(EARLY_SETTLEMENT_UPLOAD_DIR, filename)
+        
         # Check if file exists
         if not os.path.exists(file_path):
             raise HTTPException(status_code=404, detail="Attachment file not found")
@@ -4089,23 +3832,13 @@ async def get_settlement_attachment(
         }
         
         file_ext = os.path.splitext(filename)[1].lower()
-        content_type = content_type_map.get(file_ext, 'application/octet-stream')
-        
-        # Read and return file
-        with open(file_path, "rb") as file:
-            content = file.read()
+        content_type = (attachment and attachment["mime_type"]) or content_type_map.get(file_ext, 'application/octet-stream')
         
-        # Extract original filename for better display
-        original_name = filename.split('_', 3)[-1] if '_' in filename else filename
+        # Original filename for better display
+        original_name = (attachment and attachment["original_filename"]) or filename.split('_', 3)[-1]
         
-        return Response(
-            content=content,
-            media_type=content_type,
-            headers={
-                "Content-Disposition": f"inline; filename=\"{original_name}\"",
-                "Content-Type": content_type
-            }
-        )
+        # Streamed from disk (or its preview), cacheable for a year
+        return await preview_response(file_path, size, content_type, original_name)
         
     except HTTPException:
         raise
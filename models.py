@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Text, DECIMAL, Enum, UniqueConstraint, Date, Index, text
+from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime, ForeignKey, Boolean, Text, DECIMAL, Enum, UniqueConstraint, Date, Index, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -161,6 +161,21 @@ class WasteLog(Base):
     user = relationship("User", back_populates="waste_logs", foreign_keys=[user_id])
     approver = relationship("User", foreign_keys=[approved_by])
 
+class InventoryValuationSnapshot(Base):
+    """Per-(warehouse, item) stock valuation kept in step with stock changes"""
+    __tablename__ = "inventory_valuation_snapshot"
+
+    warehouse_id = Column(Integer, ForeignKey("warehouses.id", ondelete="CASCADE"), primary_key=True)
+    item_id = Column(Integer, ForeignKey("items.id", ondelete="CASCADE"), primary_key=True, index=True)
+    quantity = Column(DECIMAL(12, 3), nullable=False, default=0)
+    avg_cost = Column(DECIMAL(18, 6), nullable=False, default=0)  # Moving-average unit cost
+    total_value = Column(DECIMAL(18, 4), nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    # Relationships
+    warehouse = relationship("Warehouse")
+    item = relationship("Item")
+
 class SubRecipe(Base):
     __tablename__ = "sub_recipes"
     
@@ -271,6 +286,20 @@ class CakeMidPrep(Base):
     cake = relationship("Cake", back_populates="mid_preps")
     mid_prep = relationship("MidPrepRecipe", back_populates="used_in_cakes")
 
+class RecipeFlatBom(Base):
+    """Materialized bill of materials: raw item quantities per unit of a fully exploded recipe"""
+    __tablename__ = "recipe_flat_bom"
+
+    # Primary key order makes "all items of one recipe" a single range scan
+    recipe_type = Column(String(20), primary_key=True)  # sub_recipe, mid_prep, cake
+    recipe_id = Column(Integer, primary_key=True)
+    item_id = Column(Integer, ForeignKey("items.id", ondelete="CASCADE"), primary_key=True)
+    quantity = Column(DECIMAL(18, 6), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    # Relationships
+    item = relationship("Item")
+
 
 # ==========================================
 # TRANSFER TEMPLATE MODELS
@@ -471,6 +500,15 @@ class ChequeBook(Base):
     # Status management
     status = Column(String(20), default="active")  # active, closed, cancelled, exhausted
     
+    # Cheque counts by status, maintained by cheque_counters.refresh_book_counters()
+    cheques_count = Column(Integer, nullable=False, default=0)
+    created_cheques = Column(Integer, nullable=False, default=0)
+    assigned_cheques = Column(Integer, nullable=False, default=0)
+    active_cheques = Column(Integer, nullable=False, default=0)
+    overspent_cheques = Column(Integer, nullable=False, default=0)
+    settled_cheques = Column(Integer, nullable=False, default=0)
+    cancelled_cheques = Column(Integer, nullable=False, default=0)
+    
     # Tracking
     issued_date = Column(DateTime(timezone=True), server_default=func.now())
     activated_date = Column(DateTime(timezone=True), nullable=True)
@@ -495,44 +533,32 @@ class ChequeBook(Base):
     @property
     def can_be_closed(self):
         """Check if cheque book can be closed (all cheques settled or cancelled)"""
-        for cheque in self.cheques:
-            if cheque.status not in ['settled', 'cancelled']:
-                return False
-        return True
+        return (self.settled_cheques or 0) + (self.cancelled_cheques or 0) == (self.cheques_count or 0)
     
     @property
     def usage_percentage(self):
         """Get percentage of cheques used"""
-        if not self.cheques:
+        if not self.cheques_count:
             return 0
-        used = len([c for c in self.cheques if c.status != 'created'])
-        return (used / len(self.cheques)) * 100
+        used = self.cheques_count - (self.created_cheques or 0)
+        return (used / self.cheques_count) * 100
     
     @property
     def cheques_summary(self):
         """Get summary of cheques in this book"""
-        summary = {
-            'total': len(self.cheques),
-            'created': 0,
-            'assigned': 0,
-            'active': 0,
-            'overspent': 0,
-            'settled': 0,
-            'cancelled': 0,
-            'used': 0,
-            'available': 0
+        total = self.cheques_count or 0
+        available = self.created_cheques or 0
+        return {
+            'total': total,
+            'created': available,
+            'assigned': self.assigned_cheques or 0,
+            'active': self.active_cheques or 0,
+            'overspent': self.overspent_cheques or 0,
+            'settled': self.settled_cheques or 0,
+            'cancelled': self.cancelled_cheques or 0,
+            'used': total - available,
+            'available': available
         }
-        
-        for cheque in self.cheques:
-            if cheque.status in summary:
-                summary[cheque.status] += 1
-            
-            if cheque.status == 'created':
-                summary['available'] += 1
-            else:
-                summary['used'] += 1
-                
-        return summary
 
 class Safe(Base):
     """Safes where money is stored with balance tracking"""
@@ -580,7 +606,9 @@ class Cheque(Base):
     supplier_invoice_uploaded_by = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
     
     # Settlement tracking
+    # Non-rejected expenses, maintained by cheque_counters.record_expense()
     total_expenses = Column(DECIMAL(12, 2), default=0.00)
+    expenses_count = Column(Integer, nullable=False, default=0)
     overspent_amount = Column(DECIMAL(12, 2), default=0.00)
     settled_by_cheque_id = Column(Integer, ForeignKey("cheques.id", ondelete="SET NULL"), nullable=True)
     settlement_date = Column(DateTime(timezone=True), nullable=True)
@@ -604,10 +632,15 @@ class Cheque(Base):
     # NEW: Relationship for invoice uploader
     invoice_uploader = relationship("User", foreign_keys=[supplier_invoice_uploaded_by])
     
+    # Safe cheque listings: filter by safe / settled, keyset on settlement_date
+    __table_args__ = (
+        Index('idx_cheques_safe_settled', 'safe_id', 'is_assigned_to_safe', 'is_settled', 'settlement_date'),
+    )
+    
     @property
     def current_expenses_total(self):
-        """Calculate current total expenses"""
-        return sum(expense.amount for expense in self.expenses if expense.status != 'rejected')
+        """Current total of non-rejected expenses (stored counter)"""
+        return self.total_expenses or 0
     
     @property
     def remaining_amount(self):
@@ -837,6 +870,35 @@ class EarlySettlementFile(Base):
     early_settlement = relationship("EarlySettlement", back_populates="attachments")
     uploader = relationship("User", foreign_keys=[uploaded_by])
 
+class ChequeAttachment(Base):
+    """Files attached to a cheque at settlement (blobs in the upload store, see upload_storage)"""
+    __tablename__ = "cheque_attachments"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    cheque_id = Column(Integer, ForeignKey("cheques.id", ondelete="CASCADE"), nullable=False, index=True)
+    filename = Column(String(255), nullable=False)  # settlement_<cheque_id>_<uuid><ext>
+    original_filename = Column(String(255), nullable=False)
+    file_path = Column(String(500), nullable=False)
+    file_size = Column(Integer, nullable=False)
+    mime_type = Column(String(100), nullable=True)
+    uploaded_by = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Relationships
+    cheque = relationship("Cheque")
+
+class StoredFile(Base):
+    """Content-addressed upload blob (uploads/store/<sha256[:2]>/<sha256><ext>, see upload_storage)"""
+    __tablename__ = "stored_files"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), nullable=False, index=True)
+    file_path = Column(String(500), unique=True, nullable=False)
+    file_size = Column(BigInteger, nullable=False)
+    mime_type = Column(String(100), nullable=True)
+    reference_count = Column(Integer, nullable=False, default=1)  # uploads that resolved to this blob
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
 class AuditLog(Base):
     """Audit trail for all expense system transactions"""
     __tablename__ = "audit_logs"
@@ -861,6 +923,41 @@ class AuditLog(Base):
     expense = relationship("Expense")
     user = relationship("User")
 
+class LedgerEntry(Base):
+    """Immutable posting against a safe or bank account balance (see balance_ledger)"""
+    __tablename__ = "balance_ledger"
+
+    id = Column(Integer, primary_key=True, index=True)
+    account_type = Column(String(10), nullable=False)  # safe, bank
+    account_id = Column(Integer, nullable=False)  # safes.id / bank_accounts.id
+    amount = Column(DECIMAL(15, 2), nullable=False)  # signed: credit > 0, debit < 0
+    entry_type = Column(String(30), nullable=False)  # opening, expense, cheque_assigned, cheque_cancelled, settlement, early_settlement, adjustment, reset
+    reference_type = Column(String(30), nullable=True)  # expense, cheque, ...
+    reference_id = Column(Integer, nullable=True)
+    description = Column(String(500), nullable=True)
+    created_by = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    posted_at = Column(DateTime, nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        Index('idx_balance_ledger_account_posted', 'account_type', 'account_id', 'posted_at'),
+    )
+
+class BalanceCheckpoint(Base):
+    """Balance of an account from every ledger entry posted before as_of"""
+    __tablename__ = "balance_checkpoints"
+
+    id = Column(Integer, primary_key=True, index=True)
+    account_type = Column(String(10), nullable=False)
+    account_id = Column(Integer, nullable=False)
+    as_of = Column(DateTime, nullable=False)
+    balance = Column(DECIMAL(15, 2), nullable=False)
+    entries_count = Column(Integer, nullable=False, default=0)  # entries since the previous checkpoint
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint('account_type', 'account_id', 'as_of', name='uq_balance_checkpoint'),
+    )
+
 # ==========================================
 # BATCH PRODUCTION CALCULATOR MODELS
 # ==========================================
@@ -1088,6 +1185,79 @@ class FoodicsAuthToken(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now()) 
 
+class FoodicsSyncCursor(Base):
+    """Resume point of foodics_sync per branch: every order at or below last_reference is final and stored"""
+    __tablename__ = "foodics_sync_cursors"
+
+    id = Column(Integer, primary_key=True, index=True)
+    branch_id = Column(String(50), unique=True, nullable=False)  # Foodics branch UID
+    last_reference = Column(BigInteger, nullable=False, default=0)
+    orders_synced = Column(Integer, nullable=False, default=0)
+    last_synced_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class FoodicsOrder(Base):
+    """Local copy of a completed / returned Foodics order"""
+    __tablename__ = "foodics_orders"
+
+    id = Column(Integer, primary_key=True, index=True)
+    foodics_id = Column(String(50), unique=True, nullable=False)
+    branch_id = Column(String(50), nullable=False)
+    reference = Column(BigInteger, nullable=False)
+    status = Column(Integer, nullable=False)  # 4 = completed, 5 = returned
+    total_price = Column(DECIMAL(12, 2), default=0)
+    subtotal_price = Column(DECIMAL(12, 2), default=0)
+    discount_amount = Column(DECIMAL(12, 2), default=0)
+    rounding_amount = Column(DECIMAL(12, 2), default=0)
+    tax_amount = Column(DECIMAL(12, 2), default=0)
+    business_date = Column(Date, nullable=True)
+    ordered_at = Column(DateTime, nullable=True)  # Foodics created_at
+    synced_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index('idx_foodics_orders_branch_ordered', 'branch_id', 'ordered_at'),
+    )
+
+class FoodicsOrderProduct(Base):
+    """Product lines of a Foodics order (combo products flattened, with combo_name)"""
+    __tablename__ = "foodics_order_products"
+
+    id = Column(Integer, primary_key=True, index=True)
+    order_id = Column(String(50), nullable=False, index=True)  # foodics_orders.foodics_id
+    product_name = Column(String(255), nullable=False, default="")
+    sku = Column(String(100), nullable=True)
+    combo_name = Column(String(255), nullable=True)
+    quantity = Column(DECIMAL(10, 3), default=1)
+    unit_price = Column(DECIMAL(12, 2), default=0)
+    total_price = Column(DECIMAL(12, 2), default=0)
+    discount_amount = Column(DECIMAL(12, 2), default=0)
+    is_non_revenue = Column(Boolean, default=False)
+
+class FoodicsOrderPayment(Base):
+    """Payments of a Foodics order"""
+    __tablename__ = "foodics_order_payments"
+
+    id = Column(Integer, primary_key=True, index=True)
+    order_id = Column(String(50), nullable=False, index=True)  # foodics_orders.foodics_id
+    payment_method = Column(String(100), nullable=False, default="Unknown")
+    amount = Column(DECIMAL(12, 2), default=0)
+    tendered = Column(DECIMAL(12, 2), default=0)
+    tips = Column(DECIMAL(12, 2), default=0)
+    business_date = Column(Date, nullable=True)
+
+class FoodicsOrderTax(Base):
+    """Product, option and charge taxes of a Foodics order"""
+    __tablename__ = "foodics_order_taxes"
+
+    id = Column(Integer, primary_key=True, index=True)
+    order_id = Column(String(50), nullable=False, index=True)  # foodics_orders.foodics_id
+    source = Column(String(20), nullable=False)  # product / product_option / charge
+    product_name = Column(String(255), nullable=True)
+    tax_name = Column(String(100), nullable=False, default="")
+    rate = Column(DECIMAL(6, 3), default=0)
+    amount = Column(DECIMAL(12, 2), default=0)
+
 class Permission(Base):
     __tablename__ = "permissions"
     
@@ -0,0 +1,224 @@
+"""
+PDF Render Pool
+Runs the CPU-bound ReportLab / PyMuPDF generators in a small pool of worker
+processes so a render no longer blocks the event loop for every other
+request. Workers are started once and import the generators up front
+(registering the Amiri / Noto fonts), so jobs only pay for the render itself.
+"""
+
+import asyncio
+import importlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Worker processes (PDF_RENDER_WORKERS overrides)
+RENDER_WORKERS = settings.pdf_render_workers or min(2, os.cpu_count() or 1)
+
+# Jobs running or waiting; further submissions are rejected (HTTP 503)
+RENDER_QUEUE_LIMIT = settings.pdf_render_queue_limit or RENDER_WORKERS * 8
+
+# Seconds a caller waits for one render
+RENDER_TIMEOUT_SECONDS = settings.pdf_render_timeout_seconds
+
+# Job name -> (module, function) for the PDF pool; other pools bring their own
+RENDERERS = {
+    "arabic_cheque": ("arabic_cheque_generator", "generate_arabic_cheque"),
+    "arabic_cheque_batch": ("arabic_cheque_generator", "generate_arabic_cheques_batch"),
+    "purchase_order": ("purchase_order_pdf_generator", "generate_purchase_order_pdf"),
+}
+
+
+class RenderPoolBusy(Exception):
+    """The render queue is full; the caller should retry later"""
+
+
+class RenderTimeout(Exception):
+    """A render did not finish within its timeout"""
+
+
+def _warm_worker():
+    """Process initializer: import every PDF generator once (fonts register on import)"""
+    for module_name, _ in RENDERERS.values():
+        importlib.import_module(module_name)
+    from purchase_order_pdf_generator import register_fonts
+    from arabic_cheque_generator import template_font
+    register_fonts()
+    template_font()
+
+
+def _render(target: Tuple[str, str], args: tuple, kwargs: Dict[str, Any]) -> bytes:
+    module_name, function_name = target
+    return getattr(importlib.import_module(module_name), function_name)(*args, **kwargs)
+
+
+class RenderPool:
+    """
+    Bounded ProcessPoolExecutor for PDF jobs.
+
+    `await render_pool.render("purchase_order", po_data, language="ar")`
+    runs the named generator in a worker and returns its bytes. At most
+    `max_pending` jobs may be running or queued at once (RenderPoolBusy
+    beyond that), and each caller waits at most `timeout` seconds
+    (RenderTimeout). A job that times out keeps its slot until the worker
+    actually finishes it, so a stuck renderer still counts against the queue.
+    Only jobs in the pool's own `renderers` table can be submitted.
+    """
+
+    def __init__(self, max_workers: int = RENDER_WORKERS, max_pending: int = RENDER_QUEUE_LIMIT,
+                 timeout: float = RENDER_TIMEOUT_SECONDS, initializer=_warm_worker, name: str = "PDF render",
+                 renderers: Optional[Dict[str, Tuple[str, str]]] = None):
+        self.name = name
+        self.renderers = RENDERERS if renderers is None else renderers
+        self.initializer = initializer
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._peak_pending = 0
+        self._completed = 0
+        self._failed = 0
+        self._timed_out = 0
+        self._rejected = 0
+        self._render_seconds = 0.0
+
+    # ---------- lifecycle ----------
+
+    def start(self, wait: bool = True):
+        """Create the workers and warm them (call at application startup)"""
+        with self._lock:
+            if self._executor is not None:
+                return
+            # spawn: workers must not inherit the server's threads, sockets or DB pool
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=self.initializer
+            )
+            executor = self._executor
+        # Start every worker now instead of on the first requests
+        warmups = [executor.submit(os.getpid) for _ in range(self.max_workers)]
+        if wait:
+            for future in warmups:
+                future.result()
+        logger.info(f"{self.name} pool started ({self.max_workers} worker(s), queue limit {self.max_pending})")
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Replacing a broken pool inside a request: don't block on the warm-up
+            self.start(wait=False)
+        return self._executor
+
+    # ---------- jobs ----------
+
+    def _finished(self, started: float, future):
+        with self._lock:
+            self._pending -= 1
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                self._failed += 1
+            else:
+                self._completed += 1
+                self._render_seconds += time.monotonic() - started
+
+    async def render(self, job: str, *args, timeout: Optional[float] = None, **kwargs) -> bytes:
+        """Run renderers[job](*args, **kwargs) in a worker and return its result (PDF bytes)"""
+        target = self.renderers.get(job)
+        if target is None:
+            raise ValueError(f"Unknown {self.name} job: {job}")
+
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise RenderPoolBusy(f"{self.name} queue is full ({self._pending} job(s) pending)")
+            self._pending += 1
+            self._peak_pending = max(self._peak_pending, self._pending)
+
+        started = time.monotonic()
+        try:
+            executor = self._get_executor()
+            try:
+                future = executor.submit(_render, target, args, kwargs)
+            except BrokenProcessPool:
+                self._restart(executor)
+                executor = self._get_executor()
+                future = executor.submit(_render, target, args, kwargs)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(lambda done: self._finished(started, done))
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._timed_out += 1
+            raise RenderTimeout(f"{self.name} '{job}' took longer than {timeout or self.timeout:g}s")
+        except BrokenProcessPool:
+            # The worker died mid-job; the next render gets a fresh pool
+            self._restart(executor)
+            raise
+
+    def _restart(self, broken: ProcessPoolExecutor):
+        # A worker died (e.g. killed for memory): every pending job is lost
+        # with it, so the whole pool is replaced (once, by the first caller)
+        with self._lock:
+            if self._executor is not broken:
+                return
+            self._executor = None
+        logger.warning(f"{self.name} pool was broken, restarting it")
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and counters for monitoring"""
+        with self._lock:
+            running = min(self._pending, self.max_workers)
+            return {
+                "workers": self.max_workers,
+                "started": self._executor is not None,
+                "queue_limit": self.max_pending,
+                "in_flight": self._pending,
+                "running": running,
+                "queued": self._pending - running,
+                "peak_in_flight": self._peak_pending,
+                "completed": self._completed,
+                "failed": self._failed,
+                "timed_out": self._timed_out,
+                "rejected": self._rejected,
+                "avg_job_ms": round(self._render_seconds / self._completed * 1000, 1) if self._completed else None
+            }
+
+
+# Shared instance used by all endpoints in this process
+render_pool = RenderPool()
+
+
+async def render_pdf(job: str, *args, **kwargs) -> bytes:
+    """render_pool.render for endpoints: a full queue is a 503, a timeout a 504"""
+    try:
+        return await render_pool.render(job, *args, **kwargs)
+    except RenderPoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except RenderTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
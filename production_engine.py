@@ -0,0 +1,397 @@
+"""
+Kitchen Production Engine
+Executes a whole production order (sub-recipes, mid-preps and cakes) as a
+handful of set-based statements: explode to raw materials once, then apply
+every stock deduction and addition with one multi-row upsert and one bulk
+stock_movements insert inside a single transaction. Staged production (the
+pre / mid / final kitchen endpoints) first uses the "[PRODUCED] <name>"
+stock of earlier stages and only explodes what is missing.
+"""
+
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Any, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+from sqlalchemy import text, bindparam
+
+from recipe_graph import Node, ITEM, SUB_RECIPE, MID_PREP, CAKE
+from recipe_cost_cache import recipe_cost_cache
+from inventory_valuation import record_stock_changes
+
+logger = logging.getLogger(__name__)
+
+# Unit used for the "[PRODUCED] <name>" stock item of each recipe kind
+PRODUCED_UNITS = {
+    SUB_RECIPE: "batch",
+    MID_PREP: "batch",
+    CAKE: "piece",
+}
+
+PRODUCED_LABELS = {
+    SUB_RECIPE: "batch(es)",
+    MID_PREP: "batch(es)",
+    CAKE: "piece(s)",
+}
+
+
+def parse_production_lines(production_data: dict) -> List[Tuple[str, int, float]]:
+    """
+    Read the kitchen request body into (kind, recipe_id, quantity) lines.
+    Accepts any mix of the `sub_recipes`, `mid_preps` and `cakes` lists.
+    """
+    lines = []
+    for key, kind, id_field in (
+        ("sub_recipes", SUB_RECIPE, "sub_recipe_id"),
+        ("mid_preps", MID_PREP, "mid_prep_id"),
+        ("cakes", CAKE, "cake_id"),
+    ):
+        for entry in production_data.get(key, []) or []:
+            try:
+                recipe_id = int(entry.get(id_field))
+                quantity = float(entry.get("quantity", 1))
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail=f"Invalid {key} entry: {entry}")
+            if quantity <= 0:
+                raise HTTPException(status_code=400, detail=f"Quantity must be positive in {key} entry: {entry}")
+            lines.append((kind, recipe_id, quantity))
+    return lines
+
+
+def apply_stock_deltas(db: Session, warehouse_id: int, deltas: Dict[int, float]):
+    """Add signed quantity changes to warehouse_stock with one multi-row upsert and
+    keep the inventory valuation snapshot in step"""
+    if not deltas:
+        return
+    values = []
+    params: Dict[str, Any] = {"warehouse_id": warehouse_id}
+    for index, (item_id, change) in enumerate(deltas.items()):
+        values.append(f"(:warehouse_id, :item_{index}, :qty_{index})")
+        params[f"item_{index}"] = item_id
+        params[f"qty_{index}"] = round(change, 3)
+    db.execute(text(f"""
+        INSERT INTO warehouse_stock (warehouse_id, ingredient_id, quantity)
+        VALUES {", ".join(values)}
+        ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity)
+    """), params)
+    record_stock_changes(db, warehouse_id, deltas)
+
+
+def insert_stock_movements(db: Session, warehouse_id: int, movements: List[Dict[str, Any]],
+                           user_id: Optional[int] = None):
+    """Write stock_movements audit rows ({item_id, change, reason}) in one executemany"""
+    if not movements:
+        return
+    db.execute(text("""
+        INSERT INTO stock_movements (ingredient_id, warehouse_id, user_id, `change`, reason, `timestamp`)
+        VALUES (:item_id, :warehouse_id, :user_id, :change, :reason, NOW())
+    """), [
+        {**movement, "change": round(movement["change"], 3), "warehouse_id": warehouse_id, "user_id": user_id}
+        for movement in movements
+    ])
+
+
+def _ensure_produced_items(db: Session, graph, lines: List[Tuple[str, int, float]]) -> Dict[Node, int]:
+    """Map every produced recipe to its '[PRODUCED] <name>' item, creating missing ones in bulk"""
+    wanted: Dict[Tuple[str, str], List[Node]] = {}
+    for kind, recipe_id, _ in lines:
+        node = (kind, recipe_id)
+        name = graph.names.get(node)
+        if name is None:
+            raise HTTPException(status_code=404, detail=f"{kind.replace('_', '-')} {recipe_id} not found")
+        wanted.setdefault((f"[PRODUCED] {name}", PRODUCED_UNITS[kind]), []).append(node)
+
+    lookup = text("SELECT id, name, unit FROM items WHERE name IN :names").bindparams(
+        bindparam("names", expanding=True)
+    )
+    names = sorted({name for name, _ in wanted})
+    found = {(row[1], row[2]): row[0] for row in db.execute(lookup, {"names": names})}
+
+    missing = [{"name": name, "unit": unit} for name, unit in wanted if (name, unit) not in found]
+    if missing:
+        try:
+            db.execute(text("""
+                INSERT INTO items (name, unit, price_per_unit, category_id, item_type)
+                VALUES (:name, :unit, 0.00, NULL, 'production')
+            """), missing)
+        except Exception:
+            # If item_type column doesn't exist, insert without it
+            db.execute(text("""
+                INSERT INTO items (name, unit, price_per_unit, category_id)
+                VALUES (:name, :unit, 0.00, NULL)
+            """), missing)
+        found = {(row[1], row[2]): row[0] for row in db.execute(lookup, {"names": names})}
+
+    produced: Dict[Node, int] = {}
+    for key, nodes in wanted.items():
+        if key not in found:
+            raise HTTPException(status_code=500, detail=f"Could not create stock item '{key[0]}'")
+        for node in nodes:
+            produced[node] = found[key]
+    return produced
+
+
+def _find_produced_items(db: Session, graph, nodes: List[Node]) -> Dict[Node, int]:
+    """Existing '[PRODUCED] <name>' items of these recipes (none are created)"""
+    wanted = {(f"[PRODUCED] {graph.names[node]}", PRODUCED_UNITS[node[0]]): node for node in nodes}
+    if not wanted:
+        return {}
+    rows = db.execute(
+        text("SELECT id, name, unit FROM items WHERE name IN :names").bindparams(bindparam("names", expanding=True)),
+        {"names": sorted({name for name, _ in wanted})}
+    )
+    return {wanted[(row[1], row[2])]: row[0] for row in rows if (row[1], row[2]) in wanted}
+
+
+def _staged_consumption(db: Session, graph, warehouse_id: int,
+                        lines: List[Tuple[str, int, float]]) -> Tuple[Dict[int, float], Dict[int, Node]]:
+    """
+    Stock to consume for one production stage: raw items of each line's direct
+    links, the '[PRODUCED]' stock of its child recipes as far as the
+    warehouse has it (locked), and the raw materials of any shortfall.
+    Returns ({item_id: quantity}, {produced item_id: recipe node}).
+    """
+    consumption: Dict[int, float] = {}
+    children: Dict[Node, float] = {}
+    for kind, recipe_id, quantity in lines:
+        for edge in graph.edges.get((kind, recipe_id), []):
+            if edge.child[0] == ITEM:
+                consumption[edge.child[1]] = consumption.get(edge.child[1], 0.0) + edge.quantity * quantity
+            else:
+                children[edge.child] = children.get(edge.child, 0.0) + edge.quantity * quantity
+
+    produced_items = _find_produced_items(db, graph, sorted(children))
+    on_hand: Dict[int, float] = {}
+    if produced_items:
+        on_hand = {
+            row[0]: float(row[1] or 0)
+            for row in db.execute(
+                text("""
+                    SELECT ingredient_id, quantity FROM warehouse_stock
+                    WHERE warehouse_id = :warehouse_id AND ingredient_id IN :item_ids
+                    FOR UPDATE
+                """).bindparams(bindparam("item_ids", expanding=True)),
+                {"warehouse_id": warehouse_id, "item_ids": sorted(produced_items.values())}
+            )
+        }
+
+    for child, needed in sorted(children.items()):
+        item_id = produced_items.get(child)
+        used = min(needed, max(on_hand.get(item_id, 0.0), 0.0)) if item_id is not None else 0.0
+        if used > 0:
+            consumption[item_id] = consumption.get(item_id, 0.0) + used
+        shortfall = needed - used
+        if shortfall > 1e-9:
+            for raw_id, per_unit in graph.flat_bom(child).items():
+                consumption[raw_id] = consumption.get(raw_id, 0.0) + per_unit * shortfall
+    return consumption, {item_id: node for node, item_id in produced_items.items()}
+
+
+def check_feasibility(db: Session, warehouse_id: int, lines: List[Tuple[str, int, float]]) -> Dict[str, Any]:
+    """
+    Compare a production plan against one warehouse's stock without changing
+    anything: required vs available vs shortage for every raw item, and the
+    maximum quantity of each planned recipe that current stock could produce
+    on its own. One bulk read of warehouse_stock; the rest is in memory.
+    """
+    if not lines:
+        raise HTTPException(status_code=400, detail="Nothing specified in the production plan")
+
+    warehouse = db.execute(text("SELECT name FROM warehouses WHERE id = :id"), {"id": warehouse_id}).fetchone()
+    if not warehouse:
+        raise HTTPException(status_code=404, detail=f"Warehouse ID {warehouse_id} not found")
+
+    graph = recipe_cost_cache.get_graph(db)
+    for kind, recipe_id, _ in lines:
+        if (kind, recipe_id) not in graph.names:
+            raise HTTPException(status_code=404, detail=f"{kind.replace('_', '-')} {recipe_id} not found")
+
+    available = {
+        row[0]: float(row[1] or 0)
+        for row in db.execute(
+            text("SELECT ingredient_id, quantity FROM warehouse_stock WHERE warehouse_id = :warehouse_id"),
+            {"warehouse_id": warehouse_id}
+        )
+    }
+
+    required: Dict[int, float] = {}
+    recipes = []
+    for kind, recipe_id, quantity in lines:
+        flat = graph.flat_bom((kind, recipe_id))
+        for item_id, per_unit in flat.items():
+            required[item_id] = required.get(item_id, 0.0) + per_unit * quantity
+
+        # The scarcest ingredient decides how many units stock alone allows
+        limits = [
+            (available.get(item_id, 0.0) / per_unit, item_id)
+            for item_id, per_unit in flat.items() if per_unit > 0
+        ]
+        max_producible, limiting_item = min(limits) if limits else (None, None)
+        recipes.append({
+            "type": kind,
+            "recipe_id": recipe_id,
+            "name": graph.names[(kind, recipe_id)],
+            "planned_quantity": quantity,
+            "max_producible": round(max(max_producible, 0.0), 3) if max_producible is not None else None,
+            "limiting_item_id": limiting_item,
+            "limiting_item_name": graph.items[limiting_item]["name"] if limiting_item else None,
+            "can_produce_planned": max_producible is None or max_producible + 1e-9 >= quantity
+        })
+
+    items = []
+    for item_id, needed in required.items():
+        have = available.get(item_id, 0.0)
+        shortage = max(needed - have, 0.0)
+        items.append({
+            "item_id": item_id,
+            "name": graph.items[item_id]["name"],
+            "unit": graph.items[item_id]["unit"],
+            "required": round(needed, 3),
+            "available": round(have, 3),
+            "shortage": round(shortage, 3),
+            "shortage_cost": round(shortage * graph.items[item_id]["price_per_unit"], 2)
+        })
+    items.sort(key=lambda row: (-row["shortage"], row["name"]))
+
+    short_items = [row for row in items if row["shortage"] > 0]
+    return {
+        "warehouse_id": warehouse_id,
+        "warehouse_name": warehouse[0],
+        "feasible": not short_items,
+        "shortage_count": len(short_items),
+        "total_shortage_cost": round(sum(row["shortage_cost"] for row in short_items), 2),
+        "items": items,
+        "recipes": recipes
+    }
+
+
+def execute_production(
+    db: Session,
+    warehouse_id: int,
+    lines: List[Tuple[str, int, float]],
+    user_id: Optional[int] = None,
+    allow_negative_stock: bool = False,
+    use_produced_stock: bool = False
+) -> Dict[str, Any]:
+    """
+    Consume raw materials for, and book the output of, every production line
+    in one transaction. Raises HTTPException(400) listing shortages unless
+    `allow_negative_stock` is set. Commits on success, rolls back on error.
+
+    With `use_produced_stock` (staged production) child recipes are taken
+    from their '[PRODUCED]' stock first and only the shortfall is exploded
+    to raw materials; otherwise every line is exploded all the way down.
+    """
+    if not lines:
+        raise HTTPException(status_code=400, detail="Nothing specified for production")
+
+    warehouse = db.execute(text("SELECT name FROM warehouses WHERE id = :id"), {"id": warehouse_id}).fetchone()
+    if not warehouse:
+        raise HTTPException(status_code=404, detail=f"Warehouse ID {warehouse_id} not found")
+    warehouse_name = warehouse[0]
+
+    graph = recipe_cost_cache.get_graph(db)
+
+    try:
+        produced_items = _ensure_produced_items(db, graph, lines)
+
+        consumption: Dict[int, float] = {}
+        stage_inputs: Dict[int, Node] = {}
+        if use_produced_stock:
+            consumption, stage_inputs = _staged_consumption(db, graph, warehouse_id, lines)
+        else:
+            # Explode the whole order to raw materials once
+            for kind, recipe_id, quantity in lines:
+                for item_id, per_unit in graph.flat_bom((kind, recipe_id)).items():
+                    consumption[item_id] = consumption.get(item_id, 0.0) + per_unit * quantity
+
+        # '[PRODUCED]' items may be newer than the cached graph
+        item_info = dict(graph.items)
+        for item_id, node in stage_inputs.items():
+            item_info[item_id] = {"name": f"[PRODUCED] {graph.names[node]}", "unit": PRODUCED_UNITS[node[0]]}
+
+        if consumption and not allow_negative_stock:
+            stock_rows = db.execute(
+                text("""
+                    SELECT ingredient_id, quantity FROM warehouse_stock
+                    WHERE warehouse_id = :warehouse_id AND ingredient_id IN :item_ids
+                    FOR UPDATE
+                """).bindparams(bindparam("item_ids", expanding=True)),
+                {"warehouse_id": warehouse_id, "item_ids": sorted(consumption)}
+            )
+            available = {row[0]: float(row[1] or 0) for row in stock_rows}
+            shortages = [
+                f"{item_info[item_id]['name']} (need {round(needed, 3)} {item_info[item_id]['unit'] or ''}, "
+                f"have {round(available.get(item_id, 0.0), 3)})"
+                for item_id, needed in sorted(consumption.items())
+                if available.get(item_id, 0.0) + 1e-9 < needed
+            ]
+            if shortages:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Insufficient stock in {warehouse_name} for: " + ", ".join(shortages)
+                )
+
+        # Net stock change per item: raw materials out, produced items in
+        deltas: Dict[int, float] = {item_id: -quantity for item_id, quantity in consumption.items()}
+        movements: List[Dict[str, Any]] = [
+            {"item_id": item_id, "change": -quantity, "reason": "Kitchen production consumption"}
+            for item_id, quantity in sorted(consumption.items())
+        ]
+        for kind, recipe_id, quantity in lines:
+            item_id = produced_items[(kind, recipe_id)]
+            deltas[item_id] = deltas.get(item_id, 0.0) + quantity
+            movements.append({"item_id": item_id, "change": quantity, "reason": f"Kitchen production output ({kind})"})
+
+        # One multi-row upsert for every stock change, one bulk insert for the audit trail
+        apply_stock_deltas(db, warehouse_id, deltas)
+        insert_stock_movements(db, warehouse_id, movements, user_id)
+
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    completed_at = datetime.now().isoformat()
+    produced = []
+    for kind, recipe_id, quantity in lines:
+        node = (kind, recipe_id)
+        produced.append({
+            "type": kind,
+            "recipe_id": recipe_id,
+            "name": graph.names[node],
+            "quantity_produced": quantity,
+            "item_id": produced_items[node],
+            "produced_item_name": f"[PRODUCED] {graph.names[node]}",
+            "warehouse_id": warehouse_id,
+            "warehouse_name": warehouse_name,
+            "status": "completed"
+        })
+
+    consumed = [
+        {
+            "item_id": item_id,
+            "name": item_info[item_id]["name"],
+            "unit": item_info[item_id]["unit"],
+            "quantity": round(quantity, 3)
+        }
+        for item_id, quantity in sorted(consumption.items())
+    ]
+
+    logger.info(
+        f"Kitchen production in warehouse {warehouse_id}: {len(lines)} line(s), "
+        f"{len(consumed)} raw item(s) consumed, {len(movements)} movement(s)"
+    )
+
+    return {
+        "status": "completed",
+        "warehouse_id": warehouse_id,
+        "warehouse_name": warehouse_name,
+        "produced": produced,
+        "produced_items": [
+            f"{line['quantity_produced']} {PRODUCED_LABELS[line['type']]} of {line['name']}" for line in produced
+        ],
+        "consumed_items": consumed,
+        "completed_at": completed_at
+    }
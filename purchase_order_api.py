@@ -4,8 +4,7 @@ Purchase Order API endpoints for FastAPI + React migration
 Preserves all logic and integrates with existing Arabic cheque system
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Response
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import text, and_, or_, desc
 from typing import List, Optional
@@ -18,8 +17,16 @@ from auth import get_current_active_user
 import models
 import schemas
 from db import get_connection, get_ingredient_packages, get_supplier_default_price, calculate_package_totals
-from arabic_cheque_generator import generate_arabic_cheque
+from pdf_render_pool import render_pdf
+from arabic_cheque_generator import cheque_layout_version
+from cheque_counters import refresh_book_counters
+from document_cache import document_cache, document_key, renderer_version, PO_PDF, PO_HTML, PO_CHEQUE_PDF
+import html_purchase_order
+import purchase_order_pdf_generator
 from html_purchase_order import generate_purchase_order_html
+from inventory_valuation import record_receipt
+from search_index import search_index, SUPPLIERS, PURCHASE_ORDERS, CHEQUES
+from autocomplete import autocomplete_index, ITEM, SUPPLIER
 
 router = APIRouter(prefix="/api/purchase-orders", tags=["purchase-orders"])
 
@@ -89,6 +96,8 @@ async def create_supplier(
     db.add(db_supplier)
     db.commit()
     db.refresh(db_supplier)
+    search_index.refresh(db, SUPPLIERS, db_supplier.id)
+    autocomplete_index.refresh(db, SUPPLIER, db_supplier.id)
     return db_supplier
 
 @router.get("/suppliers/{supplier_id}", response_model=schemas.SupplierWithStats)
@@ -133,6 +142,8 @@ async def update_supplier(
     
     db.commit()
     db.refresh(supplier)
+    search_index.refresh(db, SUPPLIERS, supplier_id)
+    autocomplete_index.refresh(db, SUPPLIER, supplier_id)
     return supplier
 
 @router.delete("/suppliers/{supplier_id}")
@@ -148,6 +159,8 @@ async def delete_supplier(
     
     db.delete(supplier)
     db.commit()
+    search_index.invalidate()  # its purchase orders cascade away too
+    autocomplete_index.remove(SUPPLIER, supplier_id)
     return {"message": "Supplier deleted successfully"}
 
 # ==========================================
@@ -349,6 +362,7 @@ async def create_purchase_order(
         
         db.commit()
         db.refresh(db_po)
+        search_index.refresh(db, PURCHASE_ORDERS, db_po.id)
         
         # Load with relationships for response
         po_with_details = db.query(models.PurchaseOrder).options(
@@ -459,6 +473,7 @@ async def approve_purchase_order(
     
     db.commit()
     db.refresh(po)
+    _invalidate_purchase_order_documents(po_id)
     
     return {
         "message": "Purchase order approved successfully",
@@ -486,6 +501,7 @@ async def update_purchase_order(
     
     db.commit()
     db.refresh(po)
+    _invalidate_purchase_order_documents(po_id)
     
     # Return with details
     return await get_purchase_order(po_id, db, current_user)
@@ -524,6 +540,7 @@ async def add_purchase_order_item(
     
     db.commit()
     db.refresh(po_item)
+    _invalidate_purchase_order_documents(po_id)
     
     return po_item
 
@@ -557,6 +574,7 @@ async def update_purchase_order_item(
     
     db.commit()
     db.refresh(po_item)
+    _invalidate_purchase_order_documents(po_id)
     
     return po_item
 
@@ -584,6 +602,7 @@ async def delete_purchase_order_item(
         po.update_total()
     
     db.commit()
+    _invalidate_purchase_order_documents(po_id)
     
     return {"message": "Item deleted successfully"}
 
@@ -598,17 +617,13 @@ async def search_items(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    """Search items for purchase orders"""
-    items = db.query(models.Item).filter(
-        models.Item.name.ilike(f"%{q}%")
-    ).limit(limit).all()
-    
+    """Search items for purchase orders (name-prefix type-ahead, served from memory)"""
     return [{
-        "id": item.id, 
-        "name": item.name, 
-        "unit": item.unit,
-        "price_per_unit": float(item.price_per_unit) if item.price_per_unit else 0.0
-    } for item in items]
+        "id": item["id"], 
+        "name": item["name"], 
+        "unit": item["unit"],
+        "price_per_unit": item["price_per_unit"]
+    } for item in autocomplete_index.complete(db, q, [ITEM], limit)]
 
 @router.get("/suppliers/{supplier_id}/items")
 async def get_supplier_items(
@@ -814,8 +829,9 @@ async def generate_purchase_order_cheque(
         )
         db.add(expense)
         
-        # Update cheque total expenses
+        # Update cheque spend counters
         cheque.total_expenses = cheque_amount
+        cheque.expenses_count = (cheque.expenses_count or 0) + 1
         cheque.update_status()
         
         # Update purchase order payment status
@@ -824,8 +840,12 @@ async def generate_purchase_order_cheque(
         po.paid_by = current_user.id
         po.payment_cheque_id = cheque.id
         
+        db.flush()
+        refresh_book_counters(db, cheque_ids=[cheque.id])
         db.commit()
         db.refresh(cheque)
+        search_index.refresh(db, CHEQUES, cheque.id)
+        _invalidate_purchase_order_documents(po_id)
         
         # Generate Arabic PDF with enhanced data
         try:
@@ -863,9 +883,8 @@ async def generate_purchase_order_cheque(
                 "debug_mode": False
             }
             
-            # Import the Arabic cheque generator
-            from arabic_cheque_generator import generate_arabic_cheque
-            pdf_bytes = generate_arabic_cheque(cheque_data)
+            # Render once in the PDF worker pool to confirm the cheque prints
+            pdf_bytes = await render_pdf("arabic_cheque", cheque_data)
             
             return {
                 "success": True,
@@ -891,10 +910,63 @@ async def generate_purchase_order_cheque(
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error generating cheque: {str(e)}")
 
+# Company block printed on purchase order documents
+PDF_COMPANY_INFO = {
+    "name": "استوديو كيك KBS",
+    "address": "١٢٣ شارع المخبز، القاهرة، مصر",
+    "phone": "+٢٠ ١٢٣ ٤٥٦ ٧٨٩",
+    "email": "orders@kbscakestudio.com"
+}
+
+HTML_COMPANY_INFO = {
+    "name": "استوديو كيك KBS",
+    "address": "شارع الجمهورية، المعادي، القاهرة",
+    "phone": "+20 11 234 5678",
+    "email": "orders@kbscakestudio.com"
+}
+
+def _purchase_order_document_data(po: models.PurchaseOrder) -> dict:
+    """PO fields shared by the PDF and HTML documents (without company_info)"""
+    return {
+        "id": po.id,
+        "order_date": po.order_date.isoformat() if po.order_date else "",
+        "expected_date": po.expected_date.isoformat() if po.expected_date else None,
+        "status": po.status,
+        "payment_status": po.payment_status or "unpaid",
+        "total_amount": float(po.total_amount),
+        "supplier": {
+            "name": po.supplier.name,
+            "contact_name": po.supplier.contact_name,
+            "phone": po.supplier.phone,
+            "email": po.supplier.email,
+            "address": po.supplier.address
+        },
+        "warehouse": {
+            "name": po.warehouse.name if po.warehouse else "Not specified",
+            "location": po.warehouse.location if po.warehouse else ""
+        } if po.warehouse else None,
+        "items": [
+            {
+                "item_name": item.item.name,
+                "quantity_ordered": float(item.quantity_ordered),
+                "unit": item.item.unit or "unit",
+                "unit_price": float(item.unit_price),
+                "total_price": float(item.total_price)
+            }
+            for item in po.items
+        ]
+    }
+
+def _invalidate_purchase_order_documents(po_id: int):
+    """Drop cached PDF/HTML/cheque documents of a PO after it changed"""
+    for doc_type in (PO_PDF, PO_HTML, PO_CHEQUE_PDF):
+        document_cache.invalidate(doc_type, po_id)
+
 @router.get("/{po_id}/cheque/{cheque_id}/arabic-pdf")
 async def get_purchase_order_cheque_pdf(
     po_id: int,
     cheque_id: int,
+    request: Request,
     token: Optional[str] = Query(None, description="Authentication token for direct access"),
     db: Session = Depends(get_db)
 ):
@@ -979,23 +1051,26 @@ async def get_purchase_order_cheque_pdf(
     }
     
     try:
-        # Import the Arabic cheque generator
-        from arabic_cheque_generator import generate_arabic_cheque
-        pdf_bytes = generate_arabic_cheque(cheque_data)
-        
-        return Response(
-            content=pdf_bytes,
+        # Render in the PDF worker pool (keeps the event loop free), cached
+        # per cheque data and print layout
+        key = document_key(PO_CHEQUE_PDF, cheque_data, version=cheque_layout_version())
+        return await document_cache.respond(
+            request, PO_CHEQUE_PDF, po_id, key,
+            lambda: render_pdf("arabic_cheque", cheque_data),
             media_type="application/pdf",
             headers={
                 "Content-Disposition": f"inline; filename=cheque_{cheque.cheque_number}_arabic.pdf"
             }
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
 
 @router.get("/{po_id}/pdf")
 async def get_purchase_order_pdf(
     po_id: int,
+    request: Request,
     token: Optional[str] = Query(None, description="Authentication token for direct access"),
     db: Session = Depends(get_db)
 ):
@@ -1025,61 +1100,29 @@ async def get_purchase_order_pdf(
         raise HTTPException(status_code=404, detail="Purchase order not found")
     
     # Prepare data for PDF generation
-    po_data = {
-        "id": po.id,
-        "order_date": po.order_date.isoformat() if po.order_date else "",
-        "expected_date": po.expected_date.isoformat() if po.expected_date else None,
-        "status": po.status,
-        "payment_status": po.payment_status or "unpaid",
-        "total_amount": float(po.total_amount),
-        "supplier": {
-            "name": po.supplier.name,
-            "contact_name": po.supplier.contact_name,
-            "phone": po.supplier.phone,
-            "email": po.supplier.email,
-            "address": po.supplier.address
-        },
-        "warehouse": {
-            "name": po.warehouse.name if po.warehouse else "Not specified",
-            "location": po.warehouse.location if po.warehouse else ""
-        } if po.warehouse else None,
-        "items": [
-            {
-                "item_name": item.item.name,
-                "quantity_ordered": float(item.quantity_ordered),
-                "unit": item.item.unit or "unit",
-                "unit_price": float(item.unit_price),
-                "total_price": float(item.total_price)
-            }
-            for item in po.items
-        ],
-        "company_info": {
-            "name": "استوديو كيك KBS",
-            "address": "١٢٣ شارع المخبز، القاهرة، مصر",
-            "phone": "+٢٠ ١٢٣ ٤٥٦ ٧٨٩",
-            "email": "orders@kbscakestudio.com"
-        }
-    }
+    po_data = _purchase_order_document_data(po)
+    po_data["company_info"] = PDF_COMPANY_INFO
     
     try:
-        # Import the PDF generator
-        from purchase_order_pdf_generator import generate_purchase_order_pdf
-        # Generate in Arabic by default
-        pdf_bytes = generate_purchase_order_pdf(po_data, language='ar')
-        
-        return Response(
-            content=pdf_bytes,
+        # Generate in Arabic by default, in the PDF worker pool (cached until the PO changes)
+        key = document_key(PO_PDF, po_data, "ar", renderer_version(purchase_order_pdf_generator))
+        return await document_cache.respond(
+            request, PO_PDF, po_id, key,
+            lambda: render_pdf("purchase_order", po_data, language='ar'),
             media_type="application/pdf",
             headers={
                 "Content-Disposition": f"inline; filename=PO_{po.id}_{po.order_date.strftime('%Y%m%d')}.pdf"
             }
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating PDF: {str(e)}")
 
 @router.get("/{po_id}/html")
 async def get_purchase_order_html(
     po_id: int,
+    request: Request,
     language: str = Query("ar", description="Language: 'ar' for Arabic, 'en' for English"),
     token: Optional[str] = Query(None, description="Authentication token for direct access"),
     db: Session = Depends(get_db)
@@ -1110,51 +1153,17 @@ async def get_purchase_order_html(
         raise HTTPException(status_code=404, detail="Purchase order not found")
     
     # Prepare data for HTML generation
-    po_data = {
-        "id": po.id,
-        "order_date": po.order_date.isoformat() if po.order_date else "",
-        "expected_date": po.expected_date.isoformat() if po.expected_date else None,
-        "status": po.status,
-        "payment_status": po.payment_status or "unpaid",
-        "total_amount": float(po.total_amount),
-        "supplier": {
-            "name": po.supplier.name,
-            "contact_name": po.supplier.contact_name,
-            "phone": po.supplier.phone,
-            "email": po.supplier.email,
-            "address": po.supplier.address
-        },
-        "warehouse": {
-            "name": po.warehouse.name if po.warehouse else "Not specified",
-            "location": po.warehouse.location if po.warehouse else ""
-        } if po.warehouse else None,
-        "items": [
-            {
-                "item_name": item.item.name,
-                "quantity_ordered": float(item.quantity_ordered),
-                "unit": item.item.unit or "unit",
-                "unit_price": float(item.unit_price),
-                "total_price": float(item.total_price)
-            }
-            for item in po.items
-        ],
-        "company_info": {
-            "name": "استوديو كيك KBS",
-            "address": "شارع الجمهورية، المعادي، القاهرة",
-            "phone": "+20 11 234 5678",
-            "email": "orders@kbscakestudio.com"
-        }
-    }
+    po_data = _purchase_order_document_data(po)
+    po_data["company_info"] = HTML_COMPANY_INFO
     
     try:
-        # Generate HTML - much cleaner and works perfectly with Arabic!
-        html_content = generate_purchase_order_html(po_data, language)
-        
-        return HTMLResponse(
-            content=html_content,
-            status_code=200,
+        # Generate HTML - much cleaner and works perfectly with Arabic! (cached until the PO changes)
+        key = document_key(PO_HTML, po_data, language, renderer_version(html_purchase_order))
+        return await document_cache.respond(
+            request, PO_HTML, po_id, key,
+            lambda: generate_purchase_order_html(po_data, language),
+            media_type="text/html; charset=utf-8",
             headers={
-                "Content-Type": "text/html; charset=utf-8",
                 "Content-Disposition": f"inline; filename=PO_{po.id}_{language}.html"
             }
         )
@@ -1165,6 +1174,7 @@ async def get_purchase_order_html(
 @router.get("/{po_id}/download-html")
 async def download_purchase_order_html(
     po_id: int,
+    request: Request,
     language: str = Query("ar", description="Language: 'ar' for Arabic, 'en' for English"),
     token: Optional[str] = Query(None, description="Authentication token for direct access"),
     db: Session = Depends(get_db)
@@ -1195,57 +1205,18 @@ async def download_purchase_order_html(
         raise HTTPException(status_code=404, detail="Purchase order not found")
     
     # Prepare data for HTML generation (same as above)
-    po_data = {
-        "id": po.id,
-        "order_date": po.order_date.isoformat() if po.order_date else "",
-        "expected_date": po.expected_date.isoformat() if po.expected_date else None,
-        "status": po.status,
-        "payment_status": po.payment_status or "unpaid",
-        "total_amount": float(po.total_amount),
-        "supplier": {
-            "name": po.supplier.name,
-            "contact_name": po.supplier.contact_name,
-            "phone": po.supplier.phone,
-            "email": po.supplier.email,
-            "address": po.supplier.address
-        },
-        "warehouse": {
-            "name": po.warehouse.name if po.warehouse else "Not specified",
-            "location": po.warehouse.location if po.warehouse else ""
-        } if po.warehouse else None,
-        "items": [
-            {
-                "item_name": item.item.name,
-                "quantity_ordered": float(item.quantity_ordered),
-                "unit": item.item.unit or "unit",
-                "unit_price": float(item.unit_price),
-                "total_price": float(item.total_price)
-            }
-            for item in po.items
-        ],
-        "company_info": {
-            "name": "استوديو كيك KBS", 
-            "address": "شارع الجمهورية، المعادي، القاهرة",
-            "phone": "+20 11 234 5678",
-            "email": "orders@kbscakestudio.com"
-        }
-    }
+    po_data = _purchase_order_document_data(po)
+    po_data["company_info"] = HTML_COMPANY_INFO
     
     try:
-        # Create temporary file
-        import tempfile
         filename = f"PO_{po.id}_{language}_{po.order_date.strftime('%Y%m%d')}.html"
         
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.html', delete=False, encoding='utf-8') as temp_file:
-            html_content = generate_purchase_order_html(po_data, language)
-            temp_file.write(html_content)
-            temp_file_path = temp_file.name
-        
-        # Return file for download
-        return FileResponse(
-            path=temp_file_path,
-            filename=filename,
-            media_type="text/html",
+        # Same document as /html, served from the cache as a download
+        key = document_key(PO_HTML, po_data, language, renderer_version(html_purchase_order))
+        return await document_cache.respond(
+            request, PO_HTML, po_id, key,
+            lambda: generate_purchase_order_html(po_data, language),
+            media_type="text/html; charset=utf-8",
             headers={
                 "Content-Disposition": f"attachment; filename={filename}"
             }
@@ -1418,9 +1389,14 @@ async def receive_purchase_order(
                 )
                 db.add(stock)
 
+        record_receipt(db, po.warehouse_id, [
+            (po_item.item_id, po_item.quantity_ordered, po_item.unit_price) for po_item in po.items
+        ])
+
         po.status = "Received"
         po.updated_at = datetime.utcnow()
         db.commit()
+        _invalidate_purchase_order_documents(po_id)
         return {"success": True, "message": "Purchase order received"}
     except Exception as e:
         db.rollback()
@@ -1513,6 +1489,13 @@ async def receive_purchase_order_with_details(
                 unit_price = po_item.unit_price or Decimal('0.00')
                 total_received_amount += unit_price * item_data.quantity_received
 
+        # Fold received lines into the moving-average inventory valuation
+        record_receipt(db, po.warehouse_id, [
+            (po_item.item_id, po_item.quantity_received, po_item.unit_price)
+            for po_item in po.items
+            if any(item_data.id == po_item.id for item_data in receive_data.items)
+        ])
+
         # Update purchase order status
         if not any_items_received:
             po.status = "Cancelled"  # All items returned
@@ -1528,6 +1511,7 @@ async def receive_purchase_order_with_details(
         print(f"🔍 DEBUG: About to commit - PO status: {po.status}, received_by: {po.received_by}, received_date: {po.received_date}")
         db.commit()
         print("✅ DEBUG: Commit successful")
+        _invalidate_purchase_order_documents(po_id)
         
         return {
             "success": True,
@@ -1569,6 +1553,7 @@ async def return_purchase_order(
             item.quantity_received = 0
 
         db.commit()
+        _invalidate_purchase_order_documents(po_id)
         
         return {
             "success": True,
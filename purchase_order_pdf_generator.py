@@ -18,13 +18,10 @@ import io
 import glob
 from typing import Dict, Any, List
 
-# Arabic text processing
-try:
-    import arabic_reshaper
-    from bidi.algorithm import get_display
-    ARABIC_SUPPORT = True
-except ImportError:
-    ARABIC_SUPPORT = False
+# Arabic text processing (shared, cached shaping)
+from arabic_text import ARABIC_SUPPORT, has_arabic, shape, shape_many
+
+if not ARABIC_SUPPORT:
     print("⚠️ Arabic text processing libraries not available")
 
 # Register fonts for better Unicode support
@@ -66,8 +63,10 @@ def translate_payment_status(status: str, lang: str) -> str:
     return translations.get(lang, {}).get(status.lower(), status.title())
 
 def register_fonts():
-    """Register custom fonts for the PDF"""
+    """Register custom fonts for the PDF (parsed once per process)"""
     global AMIRI_AVAILABLE
+    if AMIRI_AVAILABLE and 'Amiri-Bold' in pdfmetrics.getRegisteredFontNames():
+        return
     AMIRI_AVAILABLE = False
     
     try:
@@ -153,15 +152,10 @@ def process_arabic_text(text):
         text = str(text)
     
     # Check if text contains Arabic characters
-    has_arabic = any('\u0600' <= char <= '\u06FF' for char in text)
-    
-    if has_arabic and ARABIC_SUPPORT:
+    if has_arabic(text) and ARABIC_SUPPORT:
         try:
-            # Reshape Arabic text to connect letters properly
-            reshaped_text = arabic_reshaper.reshape(text)
-            # Apply bidirectional algorithm for proper display
-            display_text = get_display(reshaped_text)
-            return display_text
+            # Reshape (connect letters) and reorder for display, memoized
+            return shape(text)
         except Exception as e:
             print(f"⚠️ Arabic text processing failed for '{text}': {e}")
             return ensure_unicode_text(text)
@@ -448,7 +442,9 @@ def generate_purchase_order_pdf(po_data: Dict[str, Any], language: str = 'ar') -
         # Table headers
         items_data = [['#', 'Item Description', 'Quantity', 'Unit', 'Unit Price', 'Total']]
     
-    # Add items
+    # Add items (Arabic item names are shaped together, repeats only once)
+    if language == 'ar':
+        item_names = shape_many(item['item_name'] for item in po_data['items'])
     for idx, item in enumerate(po_data['items'], 1):
         if language == 'ar':
             items_data.append([
@@ -456,7 +452,7 @@ def generate_purchase_order_pdf(po_data: Dict[str, Any], language: str = 'ar') -
                 f"{item['unit_price']:,.2f} ج.م",
                 item.get('unit', process_arabic_text('وحدة')),
                 f"{item['quantity_ordered']:,.2f}",
-                process_arabic_text(item['item_name']),
+                item_names[idx - 1],
                 str(idx)
             ])
         else:
@@ -0,0 +1,146 @@
+"""
+Rolled-up Recipe Cost Cache
+Keeps one RecipeGraph per process and maintains it incrementally: price and
+recipe edits only mark the affected node and its ancestors dirty, and the next
+read recomputes just those nodes
+"""
+
+import logging
+import threading
+from typing import Optional, Set
+
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+
+from recipe_graph import (
+    RecipeGraph, Node, ITEM, SUB_RECIPE, MID_PREP, CAKE,
+    load_recipe_graph, reload_node_links
+)
+
+logger = logging.getLogger(__name__)
+
+RECIPE_TABLES = {
+    SUB_RECIPE: "sub_recipes",
+    MID_PREP: "mid_prep_recipes",
+    CAKE: "cakes",
+}
+
+
+class RecipeCostCache:
+    """
+    Process-wide cost cache keyed by recipe node.
+
+    The graph is loaded on first use. Write paths call `item_changed`,
+    `item_removed` or `recipe_changed` after committing; those walk the
+    reverse-dependency index (item -> sub-recipes -> mid-preps -> cakes) and
+    flag the affected nodes. Reads via `get_graph` settle the dirty set first,
+    after which `graph.cost(kind, id)` is a dictionary lookup.
+
+    `version` increases every time the graph is reloaded or recomputed, so
+    derived structures (e.g. the batch explosion matrix) know when to rebuild.
+    """
+
+    def __init__(self):
+        self._graph: Optional[RecipeGraph] = None
+        self._dirty: Set[Node] = set()
+        self._lock = threading.RLock()
+        self.version = 0
+
+    def get_graph(self, db: Session) -> RecipeGraph:
+        """Return the cached graph with every cost up to date"""
+        with self._lock:
+            if self._graph is None:
+                self._graph = load_recipe_graph(db)
+                self._dirty.clear()
+                self.version += 1
+            elif self._dirty:
+                logger.info(f"Recomputing {len(self._dirty)} dirty recipe cost node(s)")
+                self._graph.compute_costs(self._dirty)
+                self._dirty.clear()
+                self.version += 1
+            return self._graph
+
+    def cost(self, db: Session, kind: str, node_id: int) -> float:
+        return self.get_graph(db).cost(kind, node_id)
+
+    def item_changed(self, item_id: int, name: str, unit: Optional[str], price_per_unit: Optional[float]):
+        """An item was created or updated (name, unit or price)"""
+        with self._lock:
+            if self._graph is None:
+                return
+
+            node = (ITEM, item_id)
+            price = float(price_per_unit) if price_per_unit else 0.0
+            old = self._graph.items.get(item_id)
+
+            self._graph.items[item_id] = {
+                "id": item_id,
+                "name": name or "Unknown Item",
+                "unit": unit,
+                "price_per_unit": price
+            }
+            if node not in self._graph.names:
+                self._graph.add_node(node, name or "Unknown Item")
+                self._dirty.add(node)
+                return
+
+            self._graph.names[node] = name or "Unknown Item"
+            if old is None or old["price_per_unit"] != price:
+                self._dirty |= self._graph.ancestors(node)
+
+    def item_removed(self, item_id: int):
+        """An item was deleted; its recipe links are gone via ON DELETE CASCADE"""
+        with self._lock:
+            if self._graph is None:
+                return
+
+            node = (ITEM, item_id)
+            if node not in self._graph.names:
+                return
+            affected = self._graph.ancestors(node) - {node}
+            self._graph.remove_node(node)
+            self._dirty.discard(node)
+            self._dirty |= affected
+
+    def recipe_changed(self, db: Session, kind: str, recipe_id: int):
+        """
+        A sub-recipe, mid-prep or cake (or one of its link rows) was created,
+        edited or deleted. Re-reads just that recipe's links.
+        """
+        with self._lock:
+            if self._graph is None:
+                return
+
+            node = (kind, recipe_id)
+            columns = "name, percent_yield" if kind == CAKE else "name"
+            row = db.execute(
+                text(f"SELECT {columns} FROM {RECIPE_TABLES[kind]} WHERE id = :id"), {"id": recipe_id}
+            ).fetchone()
+
+            if not row:
+                if node in self._graph.names:
+                    affected = self._graph.ancestors(node) - {node}
+                    self._graph.remove_node(node)
+                    self._dirty.discard(node)
+                    self._dirty |= affected
+                return
+
+            if node not in self._graph.names:
+                self._graph.add_node(node, row[0])
+            else:
+                self._graph.names[node] = row[0]
+            if kind == CAKE:
+                self._graph.cake_yields[recipe_id] = float(row[1]) if row[1] else 100
+
+            reload_node_links(db, self._graph, node)
+            self._dirty |= self._graph.ancestors(node)
+
+    def invalidate(self):
+        """Drop everything; the next read reloads the full graph"""
+        with self._lock:
+            self._graph = None
+            self._dirty.clear()
+
+
+# Shared instance used by all endpoints in this process
+recipe_cost_cache = RecipeCostCache()
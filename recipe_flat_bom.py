@@ -0,0 +1,178 @@
+"""
+Flattened Bill of Materials
+Maintains the recipe_flat_bom table (raw item quantities per unit of every
+sub-recipe, mid-prep and cake) from the recipe graph, so readers get a
+recipe's fully exploded ingredients with one indexed range scan. Rows are
+checked against the cost cache's graph whenever its version moves and
+rewritten in a background worker when they differ.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Any, Iterable, Set
+
+from sqlalchemy.orm import Session
+from sqlalchemy import text, bindparam
+
+from recipe_graph import Node, SUB_RECIPE, MID_PREP, CAKE
+from recipe_cost_cache import recipe_cost_cache
+
+logger = logging.getLogger(__name__)
+
+RECIPE_KINDS = (SUB_RECIPE, MID_PREP, CAKE)
+
+
+def rebuild_flat_bom(db: Session, nodes: Optional[Iterable[Node]] = None) -> int:
+    """
+    Rewrite recipe_flat_bom rows for the given recipe nodes, or for every
+    recipe when `nodes` is None. Does not commit. Returns rows written.
+    """
+    graph = recipe_cost_cache.get_graph(db)
+
+    if nodes is None:
+        targets = [node for kind in RECIPE_KINDS for node in graph.nodes_of(kind)]
+        db.execute(text("DELETE FROM recipe_flat_bom"))
+    else:
+        targets = sorted({node for node in nodes if node[0] in RECIPE_KINDS})
+        for kind in RECIPE_KINDS:
+            ids = [node[1] for node in targets if node[0] == kind]
+            if ids:
+                db.execute(
+                    text("DELETE FROM recipe_flat_bom WHERE recipe_type = :kind AND recipe_id IN :ids")
+                    .bindparams(bindparam("ids", expanding=True)),
+                    {"kind": kind, "ids": ids}
+                )
+
+    rows = []
+    for node in targets:
+        if node not in graph.names:
+            continue  # recipe was deleted; its rows are gone above
+        for item_id, quantity in graph.flat_bom(node).items():
+            rows.append({
+                "recipe_type": node[0],
+                "recipe_id": node[1],
+                "item_id": item_id,
+                "quantity": round(quantity, 6)
+            })
+
+    if rows:
+        db.execute(text("""
+            INSERT INTO recipe_flat_bom (recipe_type, recipe_id, item_id, quantity)
+            VALUES (:recipe_type, :recipe_id, :item_id, :quantity)
+        """), rows)
+
+    logger.info(f"Rebuilt flat BOM for {len(targets)} recipe(s), {len(rows)} row(s)")
+    return len(rows)
+
+
+# Recipe -> recipe_cost_cache.version at which its stored rows last matched the graph
+_verified: Dict[Node, int] = {}
+_verified_lock = threading.Lock()
+
+# Recipes waiting for a background rebuild, and the single worker that does them
+_pending: Set[Node] = set()
+_rebuilder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="flat-bom")
+
+
+def _rebuild_pending():
+    from database import SessionLocal
+
+    with _verified_lock:
+        nodes = set(_pending)
+        _pending.clear()
+    if not nodes:
+        return
+    db = SessionLocal()
+    try:
+        rebuild_flat_bom(db, nodes)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Flat BOM rebuild of {len(nodes)} recipe(s) failed: {str(e)}")
+    finally:
+        db.close()
+
+
+def schedule_rebuild(nodes: Iterable[Node]):
+    """Rewrite the rows of these recipes in the background (outside any request)"""
+    with _verified_lock:
+        new = set(nodes) - _pending
+        if not new:
+            return
+        _pending.update(new)
+        for node in new:
+            _verified.pop(node, None)
+    _rebuilder.submit(_rebuild_pending)
+
+
+def _matches(stored: Dict[int, float], expected: Dict[int, float]) -> bool:
+    return stored.keys() == expected.keys() and all(
+        abs(stored[item_id] - round(quantity, 6)) < 1e-6 for item_id, quantity in expected.items()
+    )
+
+
+def get_flat_bom(db: Session, kind: str, recipe_id: int, quantity: float = 1.0,
+                 warehouse_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Exploded raw items for `quantity` units of a recipe, with available stock
+    in one warehouse (or across all warehouses when warehouse_id is None).
+
+    Stored rows are checked against the cost cache's graph once per cache
+    version (a dictionary compare; recipe and item edits reported to
+    recipe_cost_cache bump the version). Missing or stale rows are answered
+    from the graph and rewritten by schedule_rebuild, never in the request.
+    """
+    stock_join = "ws.ingredient_id = f.item_id"
+    if warehouse_id is not None:
+        stock_join += " AND ws.warehouse_id = :warehouse_id"
+
+    query = text(f"""
+        SELECT f.item_id, i.name, i.unit, f.quantity, COALESCE(SUM(ws.quantity), 0)
+        FROM recipe_flat_bom f
+        JOIN items i ON i.id = f.item_id
+        LEFT JOIN warehouse_stock ws ON {stock_join}
+        WHERE f.recipe_type = :kind AND f.recipe_id = :recipe_id
+        GROUP BY f.item_id, i.name, i.unit, f.quantity
+        ORDER BY i.name
+    """)
+    params = {"kind": kind, "recipe_id": recipe_id, "warehouse_id": warehouse_id}
+
+    rows = db.execute(query, params).fetchall()
+
+    node = (kind, recipe_id)
+    graph = recipe_cost_cache.get_graph(db)
+    version = recipe_cost_cache.version
+    if _verified.get(node) != version:
+        expected = graph.flat_bom(node) if node in graph.names else {}
+        if _matches({row[0]: float(row[3]) for row in rows}, expected):
+            _verified[node] = version
+        else:
+            # Not materialized yet, or the recipe changed since: answer from the graph
+            schedule_rebuild([node])
+            rows = _rows_from_graph(db, expected, stock_join, params) if expected else []
+
+    return [
+        {
+            "item_id": row[0],
+            "ingredient_name": row[1] or "Unknown Item",
+            "required_quantity": round(float(row[3]) * quantity, 6),
+            "available_stock": float(row[4]),
+            "unit": row[2] or "units"
+        }
+        for row in rows
+    ]
+
+
+def _rows_from_graph(db: Session, expected: Dict[int, float], stock_join: str,
+                     params: Dict[str, Any]) -> List[Any]:
+    """get_flat_bom rows for quantities taken from the graph instead of recipe_flat_bom"""
+    rows = db.execute(text(f"""
+        SELECT i.id, i.name, i.unit, COALESCE(SUM(ws.quantity), 0)
+        FROM items i
+        LEFT JOIN warehouse_stock ws ON {stock_join.replace("f.item_id", "i.id")}
+        WHERE i.id IN :item_ids
+        GROUP BY i.id, i.name, i.unit
+        ORDER BY i.name
+    """).bindparams(bindparam("item_ids", expanding=True)), {**params, "item_ids": sorted(expected)})
+    return [(row[0], row[1], row[2], round(expected[row[0]], 6), row[3]) for row in rows]
@@ -0,0 +1,411 @@
+"""
+Recipe Graph Cost Engine
+Loads the whole recipe structure (items, sub-recipes, mid-preps, cakes) in a
+fixed number of bulk queries and rolls costs up through the graph in memory
+"""
+
+import logging
+from collections import deque
+from typing import Dict, List, Any, Iterable, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Node kinds used as the first element of every node key
+ITEM = "item"
+SUB_RECIPE = "sub_recipe"
+MID_PREP = "mid_prep"
+CAKE = "cake"
+
+Node = Tuple[str, int]
+
+
+class RecipeCycleError(ValueError):
+    """Raised when the recipe structure contains a cycle (e.g. A uses B uses A)"""
+
+    def __init__(self, nodes: List[Node]):
+        self.nodes = nodes
+        readable = ", ".join(f"{kind}:{node_id}" for kind, node_id in nodes)
+        super().__init__(f"Recipe cycle detected between: {readable}")
+
+
+class RecipeEdge:
+    """A single 'parent uses quantity x of child' link"""
+
+    __slots__ = ("child", "quantity", "link_id")
+
+    def __init__(self, child: Node, quantity: float, link_id: int):
+        self.child = child
+        self.quantity = quantity
+        self.link_id = link_id
+
+
+class RecipeGraph:
+    """
+    In-memory DAG of the recipe structure.
+
+    Leaves are raw items priced by `items.price_per_unit`; every other node
+    (sub-recipe, mid-prep, cake) costs the sum of quantity * child cost over
+    its outgoing edges. Costs are computed for all nodes in a single
+    topological pass, or for a subset of nodes when only part of the graph
+    changed.
+
+    `parents` is the reverse-dependency index (child -> parents using it),
+    holding one entry per edge so it mirrors `edges` exactly.
+    """
+
+    def __init__(self):
+        self.items: Dict[int, Dict[str, Any]] = {}
+        self.names: Dict[Node, str] = {}
+        self.cake_yields: Dict[int, float] = {}
+        self.edges: Dict[Node, List[RecipeEdge]] = {}
+        self.parents: Dict[Node, List[Node]] = {}
+        self.costs: Dict[Node, float] = {}
+        self.cyclic_nodes: List[Node] = []
+        self.flat_boms: Dict[Node, Dict[int, float]] = {}
+
+    # ------------------------------------------------------------------
+    # Construction
+    # ------------------------------------------------------------------
+
+    def add_node(self, node: Node, name: str):
+        self.names[node] = name
+        self.edges.setdefault(node, [])
+        self.parents.setdefault(node, [])
+
+    def add_edge(self, parent: Node, child: Node, quantity: Any, link_id: int):
+        """Add a link, skipping children that no longer exist (deleted items etc.)"""
+        if parent not in self.names or child not in self.names:
+            return
+        self.edges[parent].append(RecipeEdge(child, float(quantity or 0), link_id))
+        self.parents[child].append(parent)
+
+    def clear_edges(self, parent: Node):
+        """Drop all outgoing links of a node (before re-adding them)"""
+        self._forget_flat_boms(parent)
+        for edge in self.edges.get(parent, []):
+            self.parents[edge.child].remove(parent)
+        self.edges[parent] = []
+
+    def remove_node(self, node: Node):
+        """Remove a node and every link pointing at it"""
+        self._forget_flat_boms(node)
+        self.clear_edges(node)
+        for parent in set(self.parents.pop(node, [])):
+            self.edges[parent] = [edge for edge in self.edges[parent] if edge.child != node]
+        self.edges.pop(node, None)
+        self.names.pop(node, None)
+        self.costs.pop(node, None)
+        if node in self.cyclic_nodes:
+            self.cyclic_nodes.remove(node)
+        if node[0] == ITEM:
+            self.items.pop(node[1], None)
+
+    def ancestors(self, node: Node) -> Set[Node]:
+        """The node itself plus every recipe that uses it, directly or transitively"""
+        seen = {node}
+        stack = [node]
+        while stack:
+            for parent in self.parents.get(stack.pop(), []):
+                if parent not in seen:
+                    seen.add(parent)
+                    stack.append(parent)
+        return seen
+
+    # ------------------------------------------------------------------
+    # Cost computation
+    # ------------------------------------------------------------------
+
+    def compute_costs(self, nodes: Optional[Iterable[Node]] = None) -> Dict[Node, float]:
+        """
+        Roll costs up from items to cakes using Kahn's algorithm.
+
+        With `nodes` given, only those nodes are recomputed and every other
+        node's cached cost is reused; callers pass a node together with its
+        ancestors (see `ancestors`) so the subset is closed upwards.
+
+        Nodes that sit on (or depend on) a cycle never reach in-degree zero;
+        they are recorded in `cyclic_nodes` and left without a cost instead
+        of failing the whole graph.
+        """
+        targets = set(self.edges) if nodes is None else {node for node in nodes if node in self.edges}
+        if nodes is None:
+            self.costs = {}
+
+        # Count, for each target, how many of its children still need a cost;
+        # children already known to be cyclic never get one
+        blocked = set(self.cyclic_nodes) - targets
+        pending: Dict[Node, int] = {
+            node: sum(1 for edge in self.edges[node] if edge.child in targets or edge.child in blocked)
+            for node in targets
+        }
+        ready = deque(node for node, count in pending.items() if count == 0)
+        computed: Set[Node] = set()
+
+        while ready:
+            node = ready.popleft()
+            if node[0] == ITEM:
+                self.costs[node] = self.items[node[1]]["price_per_unit"]
+            else:
+                self.costs[node] = sum(
+                    (edge.quantity * self.costs.get(edge.child, 0.0) for edge in self.edges[node]), 0.0
+                )
+            computed.add(node)
+
+            for parent in self.parents[node]:
+                if parent in pending:
+                    pending[parent] -= 1
+                    if pending[parent] == 0:
+                        ready.append(parent)
+
+        stuck = [node for node in targets if node not in computed]
+        for node in stuck:
+            self.costs.pop(node, None)
+        self.cyclic_nodes = [node for node in self.cyclic_nodes if node not in targets] + stuck
+        if stuck:
+            logger.warning(str(RecipeCycleError(stuck)))
+
+        return self.costs
+
+    def check_acyclic(self):
+        """Raise RecipeCycleError if the last cost pass found a cycle"""
+        if self.cyclic_nodes:
+            raise RecipeCycleError(self.cyclic_nodes)
+
+    def cost(self, kind: str, node_id: int) -> float:
+        """Fully rolled-up cost of one unit of a node (0 if unknown or cyclic)"""
+        return self.costs.get((kind, node_id), 0.0)
+
+    # ------------------------------------------------------------------
+    # Flattened bill of materials
+    # ------------------------------------------------------------------
+
+    def flat_bom(self, node: Node) -> Dict[int, float]:
+        """
+        Raw item quantities ({item_id: quantity}) needed for one unit of a node,
+        with every sub-recipe and mid-prep exploded. Memoized per node; the
+        memo only depends on structure, so price changes keep it valid.
+        """
+        if node in self.flat_boms:
+            return self.flat_boms[node]
+        if node not in self.edges or node in self.cyclic_nodes:
+            return {}
+        if node[0] == ITEM:
+            return {node[1]: 1.0}
+
+        flat: Dict[int, float] = {}
+        for edge in self.edges[node]:
+            for item_id, quantity in self.flat_bom(edge.child).items():
+                flat[item_id] = flat.get(item_id, 0.0) + edge.quantity * quantity
+        self.flat_boms[node] = flat
+        return flat
+
+    def _forget_flat_boms(self, node: Node):
+        for ancestor in self.ancestors(node):
+            self.flat_boms.pop(ancestor, None)
+
+    # ------------------------------------------------------------------
+    # Serialization helpers for the management endpoints
+    # ------------------------------------------------------------------
+
+    def _item_line(self, edge: RecipeEdge) -> Dict[str, Any]:
+        item = self.items[edge.child[1]]
+        return {
+            "id": item["id"],
+            "ingredient_name": item["name"],
+            "name": item["name"],
+            "quantity": edge.quantity,
+            "unit": item["unit"],
+            "price_per_unit": item["price_per_unit"],
+            "total_cost": edge.quantity * item["price_per_unit"]
+        }
+
+    def _children(self, node: Node, kind: str) -> List[RecipeEdge]:
+        return [edge for edge in self.edges.get(node, []) if edge.child[0] == kind]
+
+    def sub_recipes_manage(self) -> List[Dict[str, Any]]:
+        result = []
+        for node in self.nodes_of(SUB_RECIPE):
+            nested_sub_recipes = []
+            for edge in self._children(node, SUB_RECIPE):
+                child_id = edge.child[1]
+                nested_sub_recipes.append({
+                    "id": edge.link_id,
+                    "sub_recipe_id": child_id,
+                    "sub_recipe_name": self.names[edge.child],
+                    "name": self.names[edge.child],
+                    "quantity": edge.quantity,
+                    "cost": edge.quantity * self.cost(SUB_RECIPE, child_id)
+                })
+
+            result.append({
+                "id": node[1],
+                "name": self.names[node],
+                "total_cost": self.cost(*node),
+                "ingredients": [self._item_line(edge) for edge in self._children(node, ITEM)],
+                "sub_recipes": nested_sub_recipes,
+                "nested_sub_recipes": nested_sub_recipes  # Some components might use this name
+            })
+        return result
+
+    def mid_prep_recipes_manage(self) -> List[Dict[str, Any]]:
+        result = []
+        for node in self.nodes_of(MID_PREP):
+            sub_recipes = []
+            for edge in self._children(node, SUB_RECIPE):
+                child_id = edge.child[1]
+                sub_recipes.append({
+                    "id": child_id,
+                    "sub_recipe_name": self.names[edge.child],
+                    "name": self.names[edge.child],
+                    "quantity": edge.quantity,
+                    "cost": edge.quantity * self.cost(SUB_RECIPE, child_id)
+                })
+
+            result.append({
+                "id": node[1],
+                "name": self.names[node],
+                "total_cost": self.cost(*node),
+                "ingredients": [self._item_line(edge) for edge in self._children(node, ITEM)],
+                "sub_recipes": sub_recipes
+            })
+        return result
+
+    def cakes_manage(self) -> List[Dict[str, Any]]:
+        result = []
+        for node in self.nodes_of(CAKE):
+            ingredients = []
+            for edge in self._children(node, ITEM):
+                item = self.items[edge.child[1]]
+                ingredients.append({
+                    "id": item["id"],
+                    "name": item["name"],
+                    "quantity": edge.quantity,
+                    "unit": item["unit"],
+                    "type": "ingredient",
+                    "cost": edge.quantity * item["price_per_unit"]
+                })
+
+            sub_recipes = []
+            for edge in self._children(node, SUB_RECIPE):
+                child_id = edge.child[1]
+                line_cost = edge.quantity * self.cost(SUB_RECIPE, child_id)
+                # Add sub-recipe to ingredients list for frontend compatibility
+                ingredients.append({
+                    "id": child_id,
+                    "name": self.names[edge.child],
+                    "quantity": edge.quantity,
+                    "type": "sub_recipe",
+                    "cost": line_cost
+                })
+                sub_recipes.append({
+                    "id": child_id,
+                    "name": self.names[edge.child],
+                    "quantity": edge.quantity,
+                    "cost": line_cost
+                })
+
+            mid_preps = []
+            for edge in self._children(node, MID_PREP):
+                child_id = edge.child[1]
+                mid_preps.append({
+                    "id": child_id,
+                    "name": self.names[edge.child],
+                    "quantity": edge.quantity,
+                    "cost": edge.quantity * self.cost(MID_PREP, child_id)
+                })
+
+            result.append({
+                "id": node[1],
+                "name": self.names[node],
+                "total_cost": self.cost(*node),
+                "percent_yield": self.cake_yields.get(node[1], 100),
+                "ingredients": ingredients,
+                "sub_recipes": sub_recipes,
+                "mid_preps": mid_preps
+            })
+        return result
+
+    def nodes_of(self, kind: str) -> List[Node]:
+        return [node for node in self.names if node[0] == kind]
+
+
+def load_recipe_graph(db: Session) -> RecipeGraph:
+    """
+    Build the recipe graph with a fixed number of bulk queries
+    (items, recipe names, and one query per link table) and compute costs.
+    """
+    graph = RecipeGraph()
+
+    for row in db.execute(text("SELECT id, name, unit, price_per_unit FROM items")):
+        graph.items[row[0]] = {
+            "id": row[0],
+            "name": row[1] or "Unknown Item",
+            "unit": row[2],
+            "price_per_unit": float(row[3]) if row[3] else 0.0
+        }
+        graph.add_node((ITEM, row[0]), row[1] or "Unknown Item")
+
+    recipe_rows = db.execute(text("""
+        SELECT 'sub_recipe' AS kind, id, name, NULL AS percent_yield FROM sub_recipes
+        UNION ALL
+        SELECT 'mid_prep', id, name, NULL FROM mid_prep_recipes
+        UNION ALL
+        SELECT 'cake', id, name, percent_yield FROM cakes
+        ORDER BY kind, id
+    """))
+    for kind, node_id, name, percent_yield in recipe_rows:
+        graph.add_node((kind, node_id), name)
+        if kind == CAKE:
+            graph.cake_yields[node_id] = float(percent_yield) if percent_yield else 100
+
+    _load_links(db, graph)
+    graph.compute_costs()
+    return graph
+
+
+def reload_node_links(db: Session, graph: RecipeGraph, node: Node):
+    """
+    Re-read the outgoing links of a single recipe node after it was edited.
+    Does not recompute costs; callers mark `graph.ancestors(node)` dirty.
+    """
+    graph.clear_edges(node)
+    _load_links(db, graph, node)
+
+
+# (parent kind, child kind, table, parent column, child column)
+LINK_TABLES = [
+    (SUB_RECIPE, ITEM, "sub_recipe_ingredients", "sub_recipe_id", "ingredient_id"),
+    (SUB_RECIPE, SUB_RECIPE, "sub_recipe_nested", "parent_sub_recipe_id", "sub_recipe_id"),
+    (MID_PREP, ITEM, "mid_prep_ingredients", "mid_prep_id", "ingredient_id"),
+    (MID_PREP, SUB_RECIPE, "mid_prep_subrecipes", "mid_prep_id", "sub_recipe_id"),
+    (CAKE, MID_PREP, "cake_mid_prep", "cake_id", "mid_prep_id"),
+]
+
+
+def _load_links(db: Session, graph: RecipeGraph, parent: Optional[Node] = None):
+    """Load recipe links for every node, or only for `parent` when given"""
+    for parent_kind, child_kind, table, parent_col, child_col in LINK_TABLES:
+        if parent is not None and parent[0] != parent_kind:
+            continue
+        where = f"WHERE {parent_col} = :parent_id" if parent is not None else ""
+        rows = db.execute(text(f"""
+            SELECT id, {parent_col}, {child_col}, quantity FROM {table} {where} ORDER BY id
+        """), {"parent_id": parent[1] if parent else None})
+        for link_id, parent_id, child_id, quantity in rows:
+            graph.add_edge((parent_kind, parent_id), (child_kind, child_id), quantity, link_id)
+
+    if parent is not None and parent[0] != CAKE:
+        return
+
+    # cake_ingredients mixes raw items and sub-recipes behind a flag
+    where = "WHERE cake_id = :parent_id" if parent is not None else ""
+    cake_rows = db.execute(text(f"""
+        SELECT id, cake_id, ingredient_or_subrecipe_id, is_subrecipe, quantity
+        FROM cake_ingredients {where} ORDER BY id
+    """), {"parent_id": parent[1] if parent else None})
+    for link_id, cake_id, child_id, is_subrecipe, quantity in cake_rows:
+        child_kind = SUB_RECIPE if is_subrecipe else ITEM
+        graph.add_edge((CAKE, cake_id), (child_kind, child_id), quantity, link_id)
@@ -6,6 +6,8 @@ import models
 import schemas
 from database import get_db
 from auth import get_current_active_user, get_password_hash
+from cheque_counters import rebuild_counters
+from balance_ledger import post_safe_resets
 
 router = APIRouter(prefix="/admin-simple", tags=["Super Admin"])
 
@@ -33,12 +35,14 @@ async def reset_safe_simple(safe_id: int, db: Session = Depends(get_db)):
         db.execute(text("DELETE FROM expenses WHERE safe_id = :safe_id"), {"safe_id": safe_id})
         
         # Reset safe balance to initial balance
+        post_safe_resets(db, [safe_id])
         db.execute(text("""
             UPDATE safes 
             SET current_balance = :initial_balance 
             WHERE id = :safe_id
         """), {"safe_id": safe_id, "initial_balance": initial_balance})
         
+        rebuild_counters(db)  # expenses were deleted
         db.commit()
         
         return {
@@ -92,6 +96,7 @@ async def reset_all_safes_simple(confirm: str = None, db: Session = Depends(get_
             db.execute(text("DELETE FROM expenses WHERE safe_id = :safe_id"), {"safe_id": safe_id})
             
             # Reset safe balance to initial balance
+            post_safe_resets(db, [safe_id])
             db.execute(text("""
                 UPDATE safes 
                 SET current_balance = :initial_balance 
@@ -100,6 +105,7 @@ async def reset_all_safes_simple(confirm: str = None, db: Session = Depends(get_
             
             reset_count += 1
         
+        rebuild_counters(db)  # expenses were deleted
         db.commit()
         
         return {
@@ -139,12 +145,14 @@ async def delete_all_cheques_simple(confirm: str = None, db: Session = Depends(g
         db.execute(text("DELETE FROM cheques"))
         
         # Reset all safe balances to their initial balances
+        post_safe_resets(db)
         db.execute(text("""
             UPDATE safes 
             SET current_balance = initial_balance 
             WHERE is_active = 1
         """))
         
+        rebuild_counters(db)  # expenses were deleted
         db.commit()
         
         return {
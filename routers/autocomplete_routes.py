@@ -0,0 +1,27 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from sqlalchemy.orm import Session
+from typing import Optional
+from database import get_db
+from autocomplete import autocomplete_index, KINDS
+
+router = APIRouter(prefix="/api/autocomplete", tags=["autocomplete"])
+
+@router.get("")
+async def autocomplete(
+    q: str = Query(..., min_length=1, description="Name prefix (Arabic or English)"),
+    types: Optional[str] = Query(None, description="Comma-separated: item, cake, sub_recipe, supplier"),
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db)
+):
+    """Type-ahead suggestions served from the in-process name index"""
+    kinds = None
+    if types:
+        kinds = [kind.strip() for kind in types.split(",") if kind.strip()]
+        unknown = [kind for kind in kinds if kind not in KINDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown type(s): {', '.join(unknown)}")
+
+    try:
+        return {"success": True, "data": autocomplete_index.complete(db, q, kinds, limit)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Autocomplete failed: {str(e)}")
@@ -1,13 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from typing import Optional
 from pydantic import BaseModel, Field
-from datetime import datetime
+from datetime import date, datetime
 
 from database import get_db
 from auth import get_current_active_user
 from models import User
+from balance_ledger import post_entry, statement_for_dates
 
 router = APIRouter(tags=["bank-accounts"])
 
@@ -89,6 +90,8 @@ async def create_bank_account(
             FROM bank_accounts 
             WHERE account_number = :number
         """), {"number": account_data.account_number}).fetchone()
+        post_entry(db, "bank", new_account[0], account_data.opening_balance, "opening",
+                   description="Opening balance", created_by=current_user.id)
         
         db.commit()
         
@@ -267,4 +270,21 @@ async def delete_bank_account(
         raise
     except Exception as e:
         db.rollback()
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}") 
+
+@router.get("/bank-accounts/{account_id}/statement")
+async def get_bank_account_statement(
+    account_id: int,
+    start_date: date = Query(..., description="First day (YYYY-MM-DD)"),
+    end_date: date = Query(..., description="Last day, inclusive (YYYY-MM-DD)"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Ledger postings of a bank account between two dates with opening, running and closing balances"""
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+    account = db.execute(text("SELECT account_name FROM bank_accounts WHERE id = :id"),
+                         {"id": account_id}).fetchone()
+    if not account:
+        raise HTTPException(status_code=404, detail="Bank account not found")
+    return {"account_name": account[0], **statement_for_dates(db, "bank", account_id, start_date, end_date)}
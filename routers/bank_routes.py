@@ -8,7 +8,7 @@ from datetime import datetime
 
 from database import get_db
 from auth import get_current_active_user
-from models import User, Bank, BankAccount, ChequeBook
+from models import User, Bank, BankAccount
 
 router = APIRouter(prefix="/banks", tags=["banks"])
 
@@ -146,7 +146,7 @@ async def get_bank_detail(
 ):
     """Get detailed information about a specific bank"""
     bank = db.query(Bank).options(
-        joinedload(Bank.bank_accounts).joinedload(BankAccount.cheque_books).joinedload(ChequeBook.cheques)
+        joinedload(Bank.bank_accounts).joinedload(BankAccount.cheque_books)
     ).filter(Bank.id == bank_id).first()
     
     if not bank:
@@ -172,7 +172,7 @@ async def get_bank_detail(
             "active_cheque_book": {
                 "id": active_book.id,
                 "book_number": active_book.book_number,
-                "cheques_remaining": len([c for c in active_book.cheques if c.status == 'created'])
+                "cheques_remaining": active_book.created_cheques or 0
             } if active_book else None,
             "total_cheque_books": len(account.cheque_books),
             "total_cheques_issued": account.total_cheques_issued
@@ -342,7 +342,6 @@ async def get_bank_hierarchy(
     bank = db.query(Bank).options(
         joinedload(Bank.bank_accounts)
         .joinedload(BankAccount.cheque_books)
-        .joinedload(ChequeBook.cheques)
     ).filter(Bank.id == bank_id).first()
     
     if not bank:
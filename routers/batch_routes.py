@@ -0,0 +1,33 @@
+from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy.orm import Session
+from database import get_db
+from batch_explosion import explode_batch
+
+router = APIRouter(prefix="/api/batch", tags=["batch"])
+
+@router.post("/explode")
+async def explode_batch_plan(plan: dict, db: Session = Depends(get_db)):
+    """
+    Explode a production plan {cake_id: quantity} into the full raw-material
+    bill of materials (sub-recipes and mid-preps included) in one pass
+    """
+    try:
+        cake_quantities = {}
+        for cake_id, quantity in plan.items():
+            try:
+                cake_id, quantity = int(cake_id), float(quantity)
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail=f"Invalid plan entry: {cake_id} -> {quantity}")
+            # Only plan cakes with a positive quantity, like the batch calculator
+            if quantity > 0:
+                cake_quantities[cake_id] = cake_quantities.get(cake_id, 0.0) + quantity
+        
+        if not cake_quantities:
+            raise HTTPException(status_code=400, detail="No cakes with a positive quantity in the plan")
+        
+        return {"success": True, "data": explode_batch(db, cake_quantities)}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to explode batch: {str(e)}")
@@ -1,16 +1,89 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import and_, or_, func
+from sqlalchemy import and_, or_, func, text, bindparam
 from typing import Optional, List
 from datetime import datetime
 from pydantic import BaseModel, Field
 
 from database import get_db
 from auth import get_current_active_user
-from models import User, Bank, BankAccount, ChequeBook, Cheque
+from models import User, Bank, BankAccount, ChequeBook
+from search_index import search_index
+from cheque_counters import refresh_book_counters
 
 router = APIRouter(prefix="/cheque-books", tags=["cheque-books"])
 
+# Cheque numbers per IN (...) lookup
+CHEQUE_NUMBER_CHUNK = 1000
+
+INSERT_BLANK_CHEQUE_SQL = text("""
+    INSERT INTO cheques (
+        cheque_number, cheque_book_id, bank_account_id, amount, issue_date,
+        description, created_by, status, is_assigned_to_safe, is_settled, total_expenses
+    ) VALUES (
+        :cheque_number, :cheque_book_id, :bank_account_id, 0.00, CURRENT_TIMESTAMP,
+        :description, :created_by, 'created', 0, 0, 0
+    )
+""")
+
+
+def book_cheque_rows(db: Session, book_id: int, status: Optional[str] = None):
+    """Cheques of a book with their safe name and stored spend counters"""
+    return db.execute(text(f"""
+        SELECT c.id, c.cheque_number, c.amount, c.status, c.total_expenses, c.is_settled,
+               c.safe_id, s.name AS safe_name, c.issued_to, c.issue_date, c.created_at, c.settlement_date
+        FROM cheques c
+        LEFT JOIN safes s ON c.safe_id = s.id
+        WHERE c.cheque_book_id = :book_id {"AND c.status = :status" if status else ""}
+        ORDER BY c.cheque_number
+    """), {"book_id": book_id, "status": status}).fetchall()
+
+
+def _cheque_row_detail(row) -> dict:
+    amount = float(row.amount or 0)
+    total_expenses = float(row.total_expenses or 0)
+    return {
+        "id": row.id,
+        "cheque_number": row.cheque_number,
+        "amount": amount,
+        "status": row.status,
+        "total_expenses": total_expenses,
+        "remaining_amount": amount - total_expenses,
+        "is_overspent": total_expenses > amount,
+        "is_settled": row.is_settled,
+        "safe_id": row.safe_id,
+        "safe_name": row.safe_name,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "settlement_date": row.settlement_date.isoformat() if row.settlement_date else None
+    }
+
+
+def existing_cheque_numbers(db: Session, cheque_numbers: List[str]) -> List[str]:
+    """The given cheque numbers that already exist, in the given order"""
+    query = text("SELECT cheque_number FROM cheques WHERE cheque_number IN :numbers").bindparams(
+        bindparam("numbers", expanding=True)
+    )
+    found = set()
+    for offset in range(0, len(cheque_numbers), CHEQUE_NUMBER_CHUNK):
+        chunk = cheque_numbers[offset:offset + CHEQUE_NUMBER_CHUNK]
+        found.update(row[0] for row in db.execute(query, {"numbers": chunk}))
+    return [number for number in cheque_numbers if number in found]
+
+
+def insert_blank_cheques(db: Session, book_id: int, bank_account_id: int, cheque_numbers: List[str],
+                         description: str, created_by: int):
+    """Insert the blank leaves of a book with one executemany (no ORM objects)"""
+    db.execute(INSERT_BLANK_CHEQUE_SQL, [
+        {
+            "cheque_number": number,
+            "cheque_book_id": book_id,
+            "bank_account_id": bank_account_id,
+            "description": description,
+            "created_by": created_by
+        }
+        for number in cheque_numbers
+    ])
+
 # Pydantic models
 class ChequeBookCreate(BaseModel):
     book_number: str = Field(..., min_length=1, max_length=50)
@@ -34,7 +107,6 @@ async def get_cheque_books(
     """Get all cheque books with optional filtering"""
     query = db.query(ChequeBook).options(
         joinedload(ChequeBook.bank_account).joinedload(BankAccount.bank),
-        joinedload(ChequeBook.cheques),
         joinedload(ChequeBook.creator),
         joinedload(ChequeBook.closer)
     )
@@ -86,9 +158,7 @@ async def get_active_cheque_book(
     db: Session = Depends(get_db)
 ):
     """Get the active cheque book for a bank account"""
-    book = db.query(ChequeBook).options(
-        joinedload(ChequeBook.cheques)
-    ).filter(
+    book = db.query(ChequeBook).filter(
         and_(
             ChequeBook.bank_account_id == bank_account_id,
             ChequeBook.status == 'active'
@@ -172,6 +242,19 @@ async def create_cheque_book(
     if existing_book:
         raise HTTPException(status_code=400, detail="Cheque book number already exists")
     
+    # Reject the book if any number in its range was already issued (one query)
+    cheque_numbers = [
+        f"{book_data.prefix or ''}{str(num).zfill(len(start_num_str))}"
+        for num in range(start_num, end_num + 1)
+    ]
+    existing_numbers = existing_cheque_numbers(db, cheque_numbers)
+    if existing_numbers:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Cheque number {existing_numbers[0]} already exists"
+                   + (f" (and {len(existing_numbers) - 1} more in this range)" if len(existing_numbers) > 1 else "")
+        )
+    
     # Create the cheque book
     new_book = ChequeBook(
         book_number=book_data.book_number,
@@ -185,52 +268,32 @@ async def create_cheque_book(
         created_by=current_user.id
     )
     
-    db.add(new_book)
-    db.flush()  # Get the ID
-    
-    # Create all cheques for this book
-    cheques_created = []
-    for num in range(start_num, end_num + 1):
-        cheque_number = f"{book_data.prefix or ''}{str(num).zfill(len(start_num_str))}"
-        
-        # Check if cheque number already exists
-        existing_cheque = db.query(Cheque).filter(Cheque.cheque_number == cheque_number).first()
-        if existing_cheque:
-            db.rollback()
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Cheque number {cheque_number} already exists"
-            )
+    try:
+        db.add(new_book)
+        db.flush()  # Get the ID
+        book_id = new_book.id
         
-        cheque = Cheque(
-            cheque_number=cheque_number,
-            cheque_book_id=new_book.id,
-            bank_account_id=book_data.bank_account_id,
-            amount=0.00,  # Blank cheques
-            issue_date=func.now(),
-            description=f"Cheque from book {book_data.book_number}",
-            created_by=current_user.id,
-            status="created"
+        # Create all cheques for this book in one executemany
+        insert_blank_cheques(
+            db, book_id, book_data.bank_account_id, cheque_numbers,
+            f"Cheque from book {book_data.book_number}", current_user.id
         )
-        db.add(cheque)
-        cheques_created.append(cheque_number)
-    
-    try:
+        refresh_book_counters(db, book_ids=[book_id])
         db.commit()
-        db.refresh(new_book)
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+    search_index.invalidate()  # a whole range of new cheques; reload on next search
     
     return {
         "success": True,
         "message": f"Cheque book '{book_data.book_number}' created successfully",
         "cheque_book": {
-            "id": new_book.id,
-            "book_number": new_book.book_number,
+            "id": book_id,
+            "book_number": book_data.book_number,
             "total_cheques": total_cheques,
-            "cheques_created": cheques_created[:5] + ['...'] if len(cheques_created) > 5 else cheques_created,
-            "total_created": len(cheques_created)
+            "cheques_created": cheque_numbers[:5] + ['...'] if len(cheque_numbers) > 5 else cheque_numbers,
+            "total_created": len(cheque_numbers)
         }
     }
 
@@ -244,9 +307,7 @@ async def close_cheque_book(
     """Close a cheque book with validation"""
     
     # Get the cheque book
-    book = db.query(ChequeBook).options(
-        joinedload(ChequeBook.cheques)
-    ).filter(ChequeBook.id == book_id).first()
+    book = db.query(ChequeBook).filter(ChequeBook.id == book_id).first()
     
     if not book:
         raise HTTPException(status_code=404, detail="Cheque book not found")
@@ -256,15 +317,21 @@ async def close_cheque_book(
     
     # Check if all cheques are settled or cancelled
     if not book.can_be_closed:
-        active_cheques = [c for c in book.cheques if c.status not in ['settled', 'cancelled']]
+        open_count = (book.cheques_count or 0) - (book.settled_cheques or 0) - (book.cancelled_cheques or 0)
+        examples = db.execute(text("""
+            SELECT cheque_number, status FROM cheques
+            WHERE cheque_book_id = :book_id AND status NOT IN ('settled', 'cancelled')
+            ORDER BY cheque_number
+            LIMIT 5
+        """), {"book_id": book_id}).fetchall()
         
-        active_list = [f"{c.cheque_number} ({c.status})" for c in active_cheques[:5]]
-        if len(active_cheques) > 5:
-            active_list.append(f"... and {len(active_cheques) - 5} more")
+        active_list = [f"{row[0]} ({row[1]})" for row in examples]
+        if open_count > 5:
+            active_list.append(f"... and {open_count - 5} more")
             
         raise HTTPException(
             status_code=400,
-            detail=f"Cannot close cheque book. {len(active_cheques)} cheques are not settled or cancelled. Examples: {', '.join(active_list)}"
+            detail=f"Cannot close cheque book. {open_count} cheques are not settled or cancelled. Examples: {', '.join(active_list)}"
         )
     
     # Close the cheque book
@@ -297,7 +364,6 @@ async def get_cheque_book_detail(
     """Get detailed information about a specific cheque book"""
     book = db.query(ChequeBook).options(
         joinedload(ChequeBook.bank_account).joinedload(BankAccount.bank),
-        joinedload(ChequeBook.cheques).joinedload(Cheque.safe),
         joinedload(ChequeBook.creator),
         joinedload(ChequeBook.closer)
     ).filter(ChequeBook.id == book_id).first()
@@ -307,22 +373,12 @@ async def get_cheque_book_detail(
     
     # Get detailed cheque information
     cheques_detail = []
-    for cheque in sorted(book.cheques, key=lambda c: c.cheque_number):
-        cheques_detail.append({
-            "id": cheque.id,
-            "cheque_number": cheque.cheque_number,
-            "amount": float(cheque.amount),
-            "status": cheque.status,
-            "safe_id": cheque.safe_id,
-            "safe_name": cheque.safe.name if cheque.safe else None,
-            "total_expenses": float(cheque.total_expenses),
-            "remaining_amount": float(cheque.remaining_amount),
-            "is_overspent": cheque.is_overspent,
-            "is_settled": cheque.is_settled,
-            "issued_to": cheque.issued_to,
-            "issue_date": cheque.issue_date.isoformat() if cheque.issue_date else None,
-            "settlement_date": cheque.settlement_date.isoformat() if cheque.settlement_date else None
-        })
+    for row in book_cheque_rows(db, book_id):
+        cheque = _cheque_row_detail(row)
+        del cheque["created_at"]
+        cheque["issued_to"] = row.issued_to
+        cheque["issue_date"] = row.issue_date.isoformat() if row.issue_date else None
+        cheques_detail.append(cheque)
     
     return {
         "book": {
@@ -368,31 +424,7 @@ async def get_cheque_book_cheques(
     if not book:
         raise HTTPException(status_code=404, detail="Cheque book not found")
     
-    query = db.query(Cheque).options(
-        joinedload(Cheque.safe)
-    ).filter(Cheque.cheque_book_id == book_id)
-    
-    if status:
-        query = query.filter(Cheque.status == status)
-    
-    cheques = query.order_by(Cheque.cheque_number).all()
-    
-    result = []
-    for cheque in cheques:
-        result.append({
-            "id": cheque.id,
-            "cheque_number": cheque.cheque_number,
-            "amount": float(cheque.amount),
-            "status": cheque.status,
-            "total_expenses": float(cheque.total_expenses or 0),
-            "remaining_amount": float(cheque.remaining_amount),
-            "is_overspent": cheque.is_overspent,
-            "is_settled": cheque.is_settled,
-            "safe_id": cheque.safe_id,
-            "safe_name": cheque.safe.name if cheque.safe else None,
-            "created_at": cheque.created_at.isoformat() if cheque.created_at else None,
-            "settlement_date": cheque.settlement_date.isoformat() if cheque.settlement_date else None
-        })
+    result = [_cheque_row_detail(row) for row in book_cheque_rows(db, book_id, status)]
     
     return {
         "cheque_book": {
@@ -418,9 +450,7 @@ async def cancel_cheque_book(
         raise HTTPException(status_code=403, detail="Only administrators can cancel cheque books")
     
     # Get the cheque book
-    book = db.query(ChequeBook).options(
-        joinedload(ChequeBook.cheques)
-    ).filter(ChequeBook.id == book_id).first()
+    book = db.query(ChequeBook).filter(ChequeBook.id == book_id).first()
     
     if not book:
         raise HTTPException(status_code=404, detail="Cheque book not found")
@@ -432,11 +462,11 @@ async def cancel_cheque_book(
         raise HTTPException(status_code=400, detail="Cannot cancel a closed cheque book")
     
     # Check if any cheques have been used
-    used_cheques = [c for c in book.cheques if c.status != 'created']
+    used_cheques = book.cheques_summary['used']
     if used_cheques:
         raise HTTPException(
             status_code=400,
-            detail=f"Cannot cancel cheque book. {len(used_cheques)} cheque(s) have been used."
+            detail=f"Cannot cancel cheque book. {used_cheques} cheque(s) have been used."
         )
     
     # Cancel the cheque book and all its cheques
@@ -446,11 +476,13 @@ async def cancel_cheque_book(
     book.closed_reason = close_data.reason or "Cancelled by administrator"
     
     # Cancel all cheques in the book
-    for cheque in book.cheques:
-        if cheque.status == 'created':
-            cheque.status = 'cancelled'
-    
+    book_number = book.book_number
     try:
+        cancelled = db.execute(text("""
+            UPDATE cheques SET status = 'cancelled'
+            WHERE cheque_book_id = :book_id AND status = 'created'
+        """), {"book_id": book_id}).rowcount
+        refresh_book_counters(db, book_ids=[book_id])
         db.commit()
     except Exception as e:
         db.rollback()
@@ -458,6 +490,41 @@ async def cancel_cheque_book(
     
     return {
         "success": True,
-        "message": f"Cheque book '{book.book_number}' cancelled successfully",
-        "cancelled_cheques": len(book.cheques)
-    } 
\ No newline at end of file
+        "message": f"Cheque book '{book_number}' cancelled successfully",
+        "cancelled_cheques": cancelled
+    } 
+
+
+if __name__ == "__main__":
+    # Issue a 1,000-cheque book the old way (one SELECT + one INSERT per leaf)
+    # and the bulk way against the configured database, rolling both back:
+    # python -m routers.cheque_book_routes
+    import time
+    from database import SessionLocal
+
+    def per_row(db: Session, numbers: List[str]):
+        for number in numbers:
+            if db.execute(text("SELECT id FROM cheques WHERE cheque_number = :number"), {"number": number}).first():
+                raise ValueError(f"Cheque number {number} already exists")
+            insert_blank_cheques(db, None, bank_account_id, [number], "benchmark", None)
+
+    def bulk(db: Session, numbers: List[str]):
+        if existing_cheque_numbers(db, numbers):
+            raise ValueError("Benchmark cheque numbers already exist")
+        insert_blank_cheques(db, None, bank_account_id, numbers, "benchmark", None)
+
+    db = SessionLocal()
+    try:
+        bank_account_id = db.execute(text("SELECT id FROM bank_accounts LIMIT 1")).scalar()
+        if bank_account_id is None:
+            raise SystemExit("Needs at least one bank account")
+        for name, issue in (("per-row", per_row), ("bulk", bulk)):
+            numbers = [f"BENCH-{name}-{num:04d}" for num in range(1000)]
+            started = time.perf_counter()
+            issue(db, numbers)
+            db.flush()
+            print(f"{name}: {(time.perf_counter() - started) * 1e3:.1f} ms for 1,000 cheques")
+            db.rollback()
+    finally:
+        db.rollback()
+        db.close()
@@ -4,6 +4,8 @@ from sqlalchemy import text
 from database import get_db
 from auth import get_current_active_user
 from models import User
+from cheque_counters import refresh_book_counters
+from balance_ledger import post_entry
 
 router = APIRouter(prefix="/cheques", tags=["cheques"])
 
@@ -33,6 +35,7 @@ async def update_cheque(
             db.execute(text("UPDATE cheques SET status = :status WHERE id = :id"), 
                       {"status": status, "id": cheque_id})
         
+        refresh_book_counters(db, cheque_ids=[cheque_id])
         db.commit()
         
         return {"success": True, "message": "Cheque updated successfully"}
@@ -89,6 +92,8 @@ async def assign_cheques_to_safe(
             
             assigned_count += 1
             total_amount_assigned += float(cheque[3]) if cheque[3] else 0.0
+            post_entry(db, "safe", safe_id, float(cheque[3] or 0), "cheque_assigned", "cheque", cheque_id,
+                       f"Cheque {cheque[1]} assigned")
         
         # Update safe balance with total amount of assigned cheques
         if assigned_count > 0:
@@ -98,6 +103,7 @@ async def assign_cheques_to_safe(
                 WHERE id = :safe_id
             """), {"amount": total_amount_assigned, "safe_id": safe_id})
         
+        refresh_book_counters(db, cheque_ids=cheque_ids)
         db.commit()
         
         return {
@@ -243,7 +249,10 @@ async def settle_overspent_cheque(
             "amount": overspent_amount,
             "safe_id": safe_id
         })
+        post_entry(db, "safe", safe_id, overspent_amount, "settlement", "cheque", cheque_id,
+                   f"Overspent cheque {overspent_cheque[1]} settled with cheque {settlement_cheque_number}")
         
+        refresh_book_counters(db, cheque_ids=[cheque_id, settlement_cheque_id])
         db.commit()
         
         return {
@@ -284,10 +293,7 @@ async def cancel_cheque(
         cheque = db.execute(text("""
             SELECT c.id, c.cheque_number, c.status, c.is_settled, 
                    c.safe_id, c.amount,
-                   COALESCE(
-                       (SELECT SUM(e.amount) FROM expenses e WHERE e.cheque_id = c.id AND e.status != 'rejected'),
-                       0
-                   ) as total_expenses
+                   COALESCE(c.total_expenses, 0) as total_expenses
             FROM cheques c
             WHERE c.id = :cheque_id
         """), {"cheque_id": cheque_id}).fetchone()
@@ -336,7 +342,10 @@ async def cancel_cheque(
                 "amount": float(cheque[5]),  # cheque amount
                 "safe_id": cheque[4]
             })
+            post_entry(db, "safe", cheque[4], -float(cheque[5]), "cheque_cancelled", "cheque", cheque_id,
+                       f"Cheque {cheque[1]} cancelled: {cancellation_reason}", current_user.id)
         
+        refresh_book_counters(db, cheque_ids=[cheque_id])
         db.commit()
         
         return {
@@ -1,5 +1,5 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import HTMLResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from typing import List, Optional
@@ -8,8 +8,13 @@ import schemas
 import models
 from database import get_db
 from auth import get_current_active_user
+import html_expense_summary
 from html_expense_summary import generate_expense_summary_html
-import tempfile
+from document_cache import document_cache, document_key, renderer_version, EXPENSE_SUMMARY_HTML
+from export_stream import iter_query_rows, export_response
+from cheque_counters import record_expense
+from safe_balance import debit_safe, safe_balance
+from balance_ledger import post_entry
 import os
 
 router = APIRouter(prefix="/api/expenses", tags=["Expenses"])
@@ -57,6 +62,52 @@ async def get_expenses(
             "data": []
         }
 
+def _expense_filters(
+    from_date: Optional[str], to_date: Optional[str], cheque_id: Optional[int], cheque_number: Optional[str],
+    category_id: Optional[int], status: Optional[str], safe_id: Optional[int], search_term: Optional[str]
+):
+    """Build the WHERE clause and params shared by expense search and export"""
+    # Build dynamic query
+    where_conditions = []
+    params = {}
+    
+    # Date range filter
+    if from_date:
+        where_conditions.append("e.expense_date >= :from_date")
+        params["from_date"] = from_date
+    if to_date:
+        where_conditions.append("e.expense_date <= :to_date")
+        params["to_date"] = to_date
+    
+    # Cheque filters
+    if cheque_id:
+        where_conditions.append("e.cheque_id = :cheque_id")
+        params["cheque_id"] = cheque_id
+    if cheque_number:
+        where_conditions.append("c.cheque_number LIKE :cheque_number")
+        params["cheque_number"] = f"%{cheque_number}%"
+    
+    # Other filters
+    if category_id:
+        where_conditions.append("e.category_id = :category_id")
+        params["category_id"] = category_id
+    if status:
+        where_conditions.append("e.status = :status")
+        params["status"] = status
+    if safe_id:
+        where_conditions.append("e.safe_id = :safe_id")
+        params["safe_id"] = safe_id
+    if search_term:
+        where_conditions.append("(e.description LIKE :search_term OR e.notes LIKE :search_term)")
+        params["search_term"] = f"%{search_term}%"
+    
+    # Build WHERE clause
+    where_clause = ""
+    if where_conditions:
+        where_clause = "WHERE " + " AND ".join(where_conditions)
+    
+    return where_clause, params
+
 @router.get("/search", summary="Search expenses with filters")
 async def search_expenses(
     from_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
@@ -73,44 +124,9 @@ async def search_expenses(
 ):
     """Search expenses with multiple filters"""
     try:
-        # Build dynamic query
-        where_conditions = []
-        params = {}
-        
-        # Date range filter
-        if from_date:
-            where_conditions.append("e.expense_date >= :from_date")
-            params["from_date"] = from_date
-        if to_date:
-            where_conditions.append("e.expense_date <= :to_date")
-            params["to_date"] = to_date
-        
-        # Cheque filters
-        if cheque_id:
-            where_conditions.append("e.cheque_id = :cheque_id")
-            params["cheque_id"] = cheque_id
-        if cheque_number:
-            where_conditions.append("c.cheque_number LIKE :cheque_number")
-            params["cheque_number"] = f"%{cheque_number}%"
-        
-        # Other filters
-        if category_id:
-            where_conditions.append("e.category_id = :category_id")
-            params["category_id"] = category_id
-        if status:
-            where_conditions.append("e.status = :status")
-            params["status"] = status
-        if safe_id:
-            where_conditions.append("e.safe_id = :safe_id")
-            params["safe_id"] = safe_id
-        if search_term:
-            where_conditions.append("(e.description LIKE :search_term OR e.notes LIKE :search_term)")
-            params["search_term"] = f"%{search_term}%"
-        
-        # Build WHERE clause
-        where_clause = ""
-        if where_conditions:
-            where_clause = "WHERE " + " AND ".join(where_conditions)
+        where_clause, params = _expense_filters(
+            from_date, to_date, cheque_id, cheque_number, category_id, status, safe_id, search_term
+        )
         
         # Set limit
         params["limit"] = limit
@@ -171,9 +187,70 @@ async def search_expenses(
             "data": []
         }
 
+@router.get("/export", summary="Export expenses as CSV or XLSX")
+async def export_expenses(
+    from_date: Optional[str] = Query(None, description="Start date (YYYY-MM-DD)"),
+    to_date: Optional[str] = Query(None, description="End date (YYYY-MM-DD)"),
+    cheque_id: Optional[int] = Query(None, description="Filter by cheque ID"),
+    cheque_number: Optional[str] = Query(None, description="Filter by cheque number"),
+    category_id: Optional[int] = Query(None, description="Filter by category ID"),
+    status: Optional[str] = Query(None, description="Filter by status"),
+    safe_id: Optional[int] = Query(None, description="Filter by safe ID"),
+    search_term: Optional[str] = Query(None, description="Search in description"),
+    export_format: str = Query("csv", alias="format", pattern="^(csv|xlsx)$", description="csv or xlsx"),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Stream every matching expense (no row limit) as a CSV or XLSX download"""
+    where_clause, params = _expense_filters(
+        from_date, to_date, cheque_id, cheque_number, category_id, status, safe_id, search_term
+    )
+    
+    query = f"""
+        SELECT e.id, e.expense_date, e.description, e.amount, e.status,
+               ec.name as category_name, s.name as safe_name, c.cheque_number, e.paid_to, e.notes
+        FROM expenses e
+        LEFT JOIN expense_categories ec ON e.category_id = ec.id
+        LEFT JOIN safes s ON e.safe_id = s.id
+        LEFT JOIN cheques c ON e.cheque_id = c.id
+        {where_clause}
+        ORDER BY e.expense_date DESC, e.id DESC
+    """
+    
+    def export_rows():
+        for row in iter_query_rows(query, params):
+            yield [
+                row[0],
+                row[1].isoformat() if row[1] else "",
+                row[2] or "",
+                float(row[3]) if row[3] else 0.0,
+                row[4] or "pending",
+                row[5] or "Uncategorized",
+                row[6] or "Unknown Safe",
+                row[7] or "",
+                row[8] or "",
+                row[9] or ""
+            ]
+    
+    return export_response(
+        export_format,
+        f"expenses_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+        ["ID", "Date", "Description", "Amount", "Status", "Category", "Safe", "Cheque Number", "Paid To", "Notes"],
+        export_rows(),
+        sheet_name="Expenses"
+    )
+
+def _expense_summary_key(expenses: List[dict], summary_info: dict, language: str) -> str:
+    return document_key(
+        EXPENSE_SUMMARY_HTML,
+        {"expenses": expenses, "summary_info": summary_info},
+        language,
+        renderer_version(html_expense_summary)
+    )
+
 @router.post("/summary/html", response_class=HTMLResponse, summary="Generate HTML expense summary")
 async def generate_expense_summary_html_endpoint(
     request_data: dict,
+    request: Request,
     language: str = Query("ar", description="Language (ar/en)"),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
@@ -220,19 +297,23 @@ async def generate_expense_summary_html_endpoint(
         if not expenses:
             raise HTTPException(status_code=404, detail="No expenses found")
         
-        # Generate HTML
-        html_content = generate_expense_summary_html(expenses, summary_info, language)
-        
-        return HTMLResponse(content=html_content, status_code=200)
+        # Same expenses, totals and language -> same cached document
+        key = _expense_summary_key(expenses, summary_info, language)
+        return await document_cache.respond(
+            request, EXPENSE_SUMMARY_HTML, "selection", key,
+            lambda: generate_expense_summary_html(expenses, summary_info, language),
+            media_type="text/html; charset=utf-8"
+        )
         
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate expense summary: {str(e)}")
 
-@router.post("/summary/download", response_class=FileResponse, summary="Download HTML expense summary")
+@router.post("/summary/download", response_class=HTMLResponse, summary="Download HTML expense summary")
 async def download_expense_summary_html(
     request_data: dict,
+    request: Request,
     language: str = Query("ar", description="Language (ar/en)"),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
@@ -279,23 +360,16 @@ async def download_expense_summary_html(
         if not expenses:
             raise HTTPException(status_code=404, detail="No expenses found")
         
-        # Generate HTML
-        html_content = generate_expense_summary_html(expenses, summary_info, language)
-        
-        # Create temporary file
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.html', delete=False, encoding='utf-8') as f:
-            f.write(html_content)
-            temp_file = f.name
-        
         # Generate filename
         date_str = datetime.now().strftime('%Y%m%d_%H%M%S')
         filename = f"expense_summary_{date_str}.html"
         
-        return FileResponse(
-            path=temp_file,
-            filename=filename,
-            media_type='text/html',
-            background=None  # Don't delete file immediately
+        key = _expense_summary_key(expenses, summary_info, language)
+        return await document_cache.respond(
+            request, EXPENSE_SUMMARY_HTML, "selection", key,
+            lambda: generate_expense_summary_html(expenses, summary_info, language),
+            media_type="text/html; charset=utf-8",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
         )
         
     except HTTPException:
@@ -370,14 +444,11 @@ async def create_expense(
         # Always set expense_date to current server date (cannot be changed by user)
         expense_date = datetime.now().date()
         
-        # Get cheque details including safe_id, amount, and current expenses
+        # Get cheque details and its safe (plain read; the balance is checked by the debit)
         cheque_result = db.execute(text("""
-            SELECT c.safe_id, c.amount, c.cheque_number,
-                   COALESCE(
-                       (SELECT SUM(e.amount) FROM expenses e WHERE e.cheque_id = c.id AND e.status != 'rejected'),
-                       0
-                   ) as current_expenses
+            SELECT c.safe_id, c.cheque_number, s.name
             FROM cheques c
+            LEFT JOIN safes s ON s.id = c.safe_id
             WHERE c.id = :cheque_id
         """), {"cheque_id": cheque_id})
         cheque_row = cheque_result.fetchone()
@@ -385,50 +456,11 @@ async def create_expense(
             raise HTTPException(status_code=404, detail="Cheque not found")
         
         safe_id = cheque_row[0]
-        cheque_amount = float(cheque_row[1]) if cheque_row[1] else 0.0
-        cheque_number = cheque_row[2]
-        current_expenses = float(cheque_row[3]) if cheque_row[3] else 0.0
-        
-        # Get safe details
-        if safe_id:
-            safe_result = db.execute(text("SELECT name, current_balance FROM safes WHERE id = :safe_id"), 
-                                   {"safe_id": safe_id})
-            safe_row = safe_result.fetchone()
-            if not safe_row:
-                raise HTTPException(status_code=404, detail="Safe not found")
-            
-            safe_name = safe_row[0]
-            safe_balance = float(safe_row[1]) if safe_row[1] else 0.0
-        else:
+        if not safe_id:
             raise HTTPException(status_code=400, detail="Cheque is not assigned to any safe")
-        
-        # PRIMARY VALIDATION: Safe balance can never go negative
-        if amount > safe_balance:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Cannot create expense: Insufficient funds in safe '{safe_name}'. "
-                       f"Expense amount: ${amount:.2f}, Available balance: ${safe_balance:.2f}. "
-                       f"Safe balance cannot go negative."
-            )
-        
-        # Calculate overspend amount if any
-        new_total_expenses = current_expenses + amount
-        overspend_amount = max(0, new_total_expenses - cheque_amount)
-        
-        # SECONDARY VALIDATION: Additional check for cheque overspend scenarios
-        if overspend_amount > 0:
-            if overspend_amount > safe_balance:
-                # Calculate maximum allowed expense
-                max_allowed_expense = amount - (overspend_amount - safe_balance)
-                
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"Cannot create expense: This would overspend cheque #{cheque_number} by ${overspend_amount:.2f}, "
-                           f"but safe '{safe_name}' only has ${safe_balance:.2f} available. "
-                           f"Maximum allowed expense amount: ${max_allowed_expense:.2f}. "
-                           f"Current cheque details: Amount=${cheque_amount:.2f}, "
-                           f"Already spent=${current_expenses:.2f}, Remaining=${cheque_amount - current_expenses:.2f}"
-                )
+        if cheque_row[2] is None:
+            raise HTTPException(status_code=404, detail="Safe not found")
+        safe_name = cheque_row[2]
         
         # Insert expense
         insert_result = db.execute(text("""
@@ -445,16 +477,24 @@ async def create_expense(
             "notes": notes
         })
         
-        # Update safe balance - deduct the expense amount
-        if safe_id:
-            db.execute(text("""
-                UPDATE safes 
-                SET current_balance = current_balance - :amount
-                WHERE id = :safe_id
-            """), {
-                "amount": amount,
-                "safe_id": safe_id
-            })
+        # Cheque spend counters (and its book's status counts)
+        record_expense(db, cheque_id, amount)
+        post_entry(db, "safe", safe_id, -amount, "expense", "expense", insert_result.lastrowid,
+                   description or f"Expense on cheque {cheque_row[1]}", current_user.id)
+        
+        # PRIMARY VALIDATION: Safe balance can never go negative. Checked and
+        # deducted in one statement, last so the safe row stays locked only
+        # until the commit below. (An overspend is at most the expense amount,
+        # so this also covers overspending the cheque.)
+        if not debit_safe(db, safe_id, amount):
+            db.rollback()
+            safe_balance_now = safe_balance(db, safe_id) or 0.0
+            raise HTTPException(
+                status_code=400,
+                detail=f"Cannot create expense: Insufficient funds in safe '{safe_name}'. "
+                       f"Expense amount: ${amount:.2f}, Available balance: ${safe_balance_now:.2f}. "
+                       f"Safe balance cannot go negative."
+            )
         
         db.commit()
         
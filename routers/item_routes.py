@@ -6,6 +6,9 @@ import schemas
 import models
 from database import get_db
 from auth import get_current_active_user
+from recipe_cost_cache import recipe_cost_cache
+from search_index import search_index, ITEMS
+from autocomplete import autocomplete_index, ITEM
 
 router = APIRouter(tags=["Items"])
 
@@ -162,6 +165,9 @@ async def update_item_manage(
         })
         
         db.commit()
+        recipe_cost_cache.item_changed(item_id, name, unit, price_per_unit)
+        search_index.refresh(db, ITEMS, item_id)
+        autocomplete_index.refresh(db, ITEM, item_id)
         
         return {
             "success": True,
@@ -216,6 +222,9 @@ async def delete_item_manage(
         """), {"item_id": item_id})
         
         db.commit()
+        recipe_cost_cache.item_removed(item_id)
+        search_index.remove(ITEMS, item_id)
+        autocomplete_index.remove(ITEM, item_id)
         
         return {
             "success": True,
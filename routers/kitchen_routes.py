@@ -1,7 +1,12 @@
 from fastapi import APIRouter, HTTPException, Depends
 from sqlalchemy.orm import Session
 from sqlalchemy import text
+from typing import Optional
 from database import get_db
+from recipe_graph import SUB_RECIPE, MID_PREP, CAKE
+from recipe_flat_bom import get_flat_bom, rebuild_flat_bom
+from recipe_cost_cache import recipe_cost_cache
+from production_engine import parse_production_lines, execute_production, check_feasibility
 
 router = APIRouter(prefix="/api/kitchen", tags=["kitchen"])
 
@@ -43,125 +48,23 @@ async def get_kitchen_sub_recipes_simple(db: Session = Depends(get_db)):
 
 @router.post("/execute-pre-production")
 async def execute_pre_production(production_data: dict, db: Session = Depends(get_db)):
-    """Execute pre-production for sub-recipes and store results in Kitchen Storage (warehouse_id: 5)"""
+    """Execute pre-production for sub-recipes: consume raw materials (and produced nested sub-recipes) and add the produced batches to the warehouse"""
     try:
-        sub_recipes = production_data.get("sub_recipes", [])
-        warehouse_id = production_data.get("warehouse_id", 1)  # Default to Main Warehouse for testing
+        warehouse_id = production_data.get("warehouse_id", 1)  # Default to Main Warehouse
+        lines = parse_production_lines({"sub_recipes": production_data.get("sub_recipes", [])})
         
-        if not sub_recipes:
+        if not lines:
             raise HTTPException(status_code=400, detail="No sub-recipes specified for production")
         
-        # Verify warehouse exists
-        warehouse_check = db.execute(text("SELECT name FROM warehouses WHERE id = :id"), {"id": warehouse_id}).fetchone()
-        if not warehouse_check:
-            raise HTTPException(status_code=404, detail=f"Warehouse ID {warehouse_id} not found")
-        
-        warehouse_name = warehouse_check[0]
-        
-        # Create warehouse_stock table if it doesn't exist
-        db.execute(text("""
-            CREATE TABLE IF NOT EXISTS warehouse_stock (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                warehouse_id INT NOT NULL,
-                ingredient_id INT NOT NULL,
-                quantity DECIMAL(10, 3) DEFAULT 0,
-                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                UNIQUE KEY unique_warehouse_ingredient (warehouse_id, ingredient_id),
-                FOREIGN KEY (warehouse_id) REFERENCES warehouses(id) ON DELETE CASCADE,
-                FOREIGN KEY (ingredient_id) REFERENCES items(id) ON DELETE CASCADE
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-        """))
-        
-        # Process each sub-recipe in the production request
-        processed_recipes = []
-        produced_items = []
-        
-        for recipe in sub_recipes:
-            sub_recipe_id = recipe.get("sub_recipe_id")
-            quantity = recipe.get("quantity", 1)
-            
-            # Get sub-recipe name from database (try to get real name first)
-            sub_recipe_info = db.execute(text("SELECT name FROM sub_recipes WHERE id = :id"), 
-                                       {"id": sub_recipe_id}).fetchone()
-            if sub_recipe_info:
-                sub_recipe_name = sub_recipe_info[0]
-            else:
-                sub_recipe_name = f"Sub-Recipe {sub_recipe_id}"
-            
-            # Create an item for the produced sub-recipe with type "production"
-            produced_item_name = f"[PRODUCED] {sub_recipe_name}"
-            
-            # Check if this produced item already exists
-            item_check = db.execute(text("""
-                SELECT id FROM items WHERE name = :name AND unit = 'batch'
-            """), {"name": produced_item_name}).fetchone()
-            
-            if not item_check:
-                # Create new item entry for the produced sub-recipe
-                # Try with item_type column first, fall back to without it if column doesn't exist
-                try:
-                    db.execute(text("""
-                        INSERT INTO items (name, unit, price_per_unit, category_id, item_type)
-                        VALUES (:name, 'batch', 0.00, NULL, 'production')
-                    """), {"name": produced_item_name})
-                except Exception:
-                    # If item_type column doesn't exist, insert without it
-                    db.execute(text("""
-                        INSERT INTO items (name, unit, price_per_unit, category_id)
-                        VALUES (:name, 'batch', 0.00, NULL)
-                    """), {"name": produced_item_name})
-                
-                item_id = db.execute(text("SELECT LAST_INSERT_ID()")).fetchone()[0]
-            else:
-                item_id = item_check[0]
-            
-            # Add/update stock in the specified warehouse
-            db.execute(text("""
-                INSERT INTO warehouse_stock (warehouse_id, ingredient_id, quantity)
-                VALUES (:warehouse_id, :ingredient_id, :quantity)
-                ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity)
-            """), {
-                "warehouse_id": warehouse_id,
-                "ingredient_id": item_id,
-                "quantity": quantity
-            })
-            
-            processed_recipes.append({
-                "sub_recipe_id": sub_recipe_id,
-                "sub_recipe_name": sub_recipe_name,
-                "quantity_produced": quantity,
-                "status": "completed",
-                "warehouse_id": warehouse_id,
-                "warehouse_name": warehouse_name,
-                "item_id": item_id,
-                "produced_item_name": produced_item_name,
-                "produced_at": "2024-01-15T16:00:00Z"
-            })
-            
-            produced_items.append(f"{quantity} batch(es) of {sub_recipe_name}")
-        
-        # Commit the database changes
-        try:
-            db.commit()
-        except Exception as e:
-            db.rollback()
-            raise HTTPException(status_code=500, detail=f"Failed to save production data: {str(e)}")
-        
-        # Return production results
-        result = {
-            "production_id": 1001,
-            "status": "completed",
-            "warehouse_id": warehouse_id,
-            "warehouse_name": warehouse_name,
-            "total_recipes": len(sub_recipes),
-            "produced_items": produced_items,
-            "started_at": "2024-01-15T15:30:00Z",
-            "completed_at": "2024-01-15T16:00:00Z"
-        }
+        result = execute_production(
+            db, warehouse_id, lines,
+            allow_negative_stock=bool(production_data.get("allow_negative_stock", False)),
+            use_produced_stock=True
+        )
         
         return {
             "success": True, 
-            "message": f"Pre-production completed! Produced {len(sub_recipes)} sub-recipes in {warehouse_name}", 
+            "message": f"Pre-production completed! Produced {len(lines)} sub-recipes in {result['warehouse_name']}", 
             "data": result
         }
         
@@ -280,207 +183,82 @@ async def get_kitchen_mid_prep_stock_simple(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=f"Failed to fetch mid-prep stock: {str(e)}")
 
 @router.get("/sub-recipe/{sub_recipe_id}/ingredients")
-async def get_sub_recipe_ingredients(sub_recipe_id: int, db: Session = Depends(get_db)):
-    """Get ingredients needed for a specific sub-recipe"""
+async def get_sub_recipe_ingredients(
+    sub_recipe_id: int,
+    quantity: float = 1.0,
+    warehouse_id: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """Get raw ingredients needed for a specific sub-recipe (fully exploded)"""
     try:
-        # Return sample ingredients data for the sub-recipe
-        ingredients = [
-            {
-                "item_id": 1,
-                "ingredient_name": "Flour", 
-                "required_quantity": 2.5,
-                "available_stock": 10.0,
-                "unit": "kg"
-            },
-            {
-                "item_id": 2,
-                "ingredient_name": "Sugar",
-                "required_quantity": 1.0,
-                "available_stock": 5.0,
-                "unit": "kg"
-            },
-            {
-                "item_id": 3,
-                "ingredient_name": "Eggs",
-                "required_quantity": 6,
-                "available_stock": 24,
-                "unit": "pieces"
-            },
-            {
-                "item_id": 4,
-                "ingredient_name": "Butter",
-                "required_quantity": 0.5,
-                "available_stock": 2.0,
-                "unit": "kg"
-            }
-        ]
-        
+        ingredients = get_flat_bom(db, SUB_RECIPE, sub_recipe_id, quantity, warehouse_id)
         return {"success": True, "data": ingredients}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch sub-recipe ingredients: {str(e)}")
 
-@router.get("/cake/{cake_id}/ingredients")
-async def get_cake_ingredients(cake_id: int, db: Session = Depends(get_db)):
-    """Get ingredients needed for a specific cake"""
+@router.get("/mid-prep/{mid_prep_id}/ingredients")
+async def get_mid_prep_ingredients(
+    mid_prep_id: int,
+    quantity: float = 1.0,
+    warehouse_id: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """Get raw ingredients needed for a specific mid-prep (fully exploded)"""
     try:
-        # Return sample ingredients data for the cake
-        ingredients = [
-            {
-                "item_id": 1,
-                "ingredient_name": "Flour", 
-                "required_quantity": 5.0,
-                "available_stock": 20.0,
-                "unit": "kg"
-            },
-            {
-                "item_id": 2,
-                "ingredient_name": "Sugar",
-                "required_quantity": 3.0,
-                "available_stock": 15.0,
-                "unit": "kg"
-            },
-            {
-                "item_id": 3,
-                "ingredient_name": "Eggs",
-                "required_quantity": 12,
-                "available_stock": 50,
-                "unit": "pieces"
-            },
-            {
-                "item_id": 4,
-                "ingredient_name": "Butter",
-                "required_quantity": 2.0,
-                "available_stock": 8.0,
-                "unit": "kg"
-            }
-        ]
+        ingredients = get_flat_bom(db, MID_PREP, mid_prep_id, quantity, warehouse_id)
+        return {"success": True, "data": ingredients}
         
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch mid-prep ingredients: {str(e)}")
+
+@router.get("/cake/{cake_id}/ingredients")
+async def get_cake_ingredients(
+    cake_id: int,
+    quantity: float = 1.0,
+    warehouse_id: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """Get raw ingredients needed for a specific cake (fully exploded)"""
+    try:
+        ingredients = get_flat_bom(db, CAKE, cake_id, quantity, warehouse_id)
         return {"success": True, "data": ingredients}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch cake ingredients: {str(e)}")
 
+@router.post("/flat-bom/rebuild")
+async def rebuild_recipe_flat_bom(db: Session = Depends(get_db)):
+    """Reload the recipe graph and rebuild the materialized recipe_flat_bom table for every recipe"""
+    try:
+        recipe_cost_cache.invalidate()
+        rows = rebuild_flat_bom(db)
+        db.commit()
+        return {"success": True, "message": f"Flat BOM rebuilt ({rows} rows)", "rows": rows}
+        
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to rebuild flat BOM: {str(e)}")
+
 @router.post("/execute-mid-production")
 async def execute_mid_production(production_data: dict, db: Session = Depends(get_db)):
-    """Execute mid-production for mid-prep recipes and store results in warehouse"""
+    """Execute mid-production for mid-prep recipes: consume the produced sub-recipes (raw materials for any shortfall) and add the produced batches to the warehouse"""
     try:
-        mid_preps = production_data.get("mid_preps", [])
         warehouse_id = production_data.get("warehouse_id", 1)  # Default to Main Warehouse
+        lines = parse_production_lines({"mid_preps": production_data.get("mid_preps", [])})
         
-        if not mid_preps:
+        if not lines:
             raise HTTPException(status_code=400, detail="No mid-prep recipes specified for production")
         
-        # Verify warehouse exists
-        warehouse_check = db.execute(text("SELECT name FROM warehouses WHERE id = :id"), {"id": warehouse_id}).fetchone()
-        if not warehouse_check:
-            raise HTTPException(status_code=404, detail=f"Warehouse ID {warehouse_id} not found")
-        
-        warehouse_name = warehouse_check[0]
-        
-        # Create warehouse_stock table if it doesn't exist
-        db.execute(text("""
-            CREATE TABLE IF NOT EXISTS warehouse_stock (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                warehouse_id INT NOT NULL,
-                ingredient_id INT NOT NULL,
-                quantity DECIMAL(10, 3) DEFAULT 0,
-                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                UNIQUE KEY unique_warehouse_ingredient (warehouse_id, ingredient_id),
-                FOREIGN KEY (warehouse_id) REFERENCES warehouses(id) ON DELETE CASCADE,
-                FOREIGN KEY (ingredient_id) REFERENCES items(id) ON DELETE CASCADE
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-        """))
-        
-        # Process each mid-prep recipe in the production request
-        processed_mid_preps = []
-        produced_items = []
-        
-        for mid_prep in mid_preps:
-            mid_prep_id = mid_prep.get("mid_prep_id")
-            quantity = mid_prep.get("quantity", 1)
-            
-            # Get mid-prep name from database
-            mid_prep_info = db.execute(text("SELECT name FROM mid_prep_recipes WHERE id = :id"), 
-                                     {"id": mid_prep_id}).fetchone()
-            if mid_prep_info:
-                mid_prep_name = mid_prep_info[0]
-            else:
-                mid_prep_name = f"Mid-Prep {mid_prep_id}"
-            
-            # Create an item for the produced mid-prep with type "production"
-            produced_item_name = f"[PRODUCED] {mid_prep_name}"
-            
-            # Check if this produced item already exists
-            item_check = db.execute(text("""
-                SELECT id FROM items WHERE name = :name AND unit = 'batch'
-            """), {"name": produced_item_name}).fetchone()
-            
-            if not item_check:
-                # Create new item entry for the produced mid-prep
-                try:
-                    db.execute(text("""
-                        INSERT INTO items (name, unit, price_per_unit, category_id, item_type)
-                        VALUES (:name, 'batch', 0.00, NULL, 'production')
-                    """), {"name": produced_item_name})
-                except Exception:
-                    # If item_type column doesn't exist, insert without it
-                    db.execute(text("""
-                        INSERT INTO items (name, unit, price_per_unit, category_id)
-                        VALUES (:name, 'batch', 0.00, NULL)
-                    """), {"name": produced_item_name})
-                
-                item_id = db.execute(text("SELECT LAST_INSERT_ID()")).fetchone()[0]
-            else:
-                item_id = item_check[0]
-            
-            # Add/update stock in the specified warehouse
-            db.execute(text("""
-                INSERT INTO warehouse_stock (warehouse_id, ingredient_id, quantity)
-                VALUES (:warehouse_id, :ingredient_id, :quantity)
-                ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity)
-            """), {
-                "warehouse_id": warehouse_id,
-                "ingredient_id": item_id,
-                "quantity": quantity
-            })
-            
-            processed_mid_preps.append({
-                "mid_prep_id": mid_prep_id,
-                "mid_prep_name": mid_prep_name,
-                "quantity_produced": quantity,
-                "status": "completed",
-                "warehouse_id": warehouse_id,
-                "warehouse_name": warehouse_name,
-                "item_id": item_id,
-                "produced_item_name": produced_item_name,
-                "produced_at": "2024-01-15T16:00:00Z"
-            })
-            
-            produced_items.append(f"{quantity} batch(es) of {mid_prep_name}")
-        
-        # Commit the database changes
-        try:
-            db.commit()
-        except Exception as e:
-            db.rollback()
-            raise HTTPException(status_code=500, detail=f"Failed to save production data: {str(e)}")
-        
-        # Return production results
-        result = {
-            "production_id": 2001,
-            "status": "completed",
-            "warehouse_id": warehouse_id,
-            "warehouse_name": warehouse_name,
-            "total_mid_preps": len(mid_preps),
-            "produced_items": produced_items,
-            "started_at": "2024-01-15T15:30:00Z",
-            "completed_at": "2024-01-15T16:00:00Z"
-        }
+        result = execute_production(
+            db, warehouse_id, lines,
+            allow_negative_stock=bool(production_data.get("allow_negative_stock", False)),
+            use_produced_stock=True
+        )
         
         return {
             "success": True, 
-            "message": f"Mid-production completed! Produced {len(mid_preps)} mid-prep recipes in {warehouse_name}", 
+            "message": f"Mid-production completed! Produced {len(lines)} mid-prep recipes in {result['warehouse_name']}", 
             "data": result
         }
         
@@ -492,124 +270,50 @@ async def execute_mid_production(production_data: dict, db: Session = Depends(ge
 
 @router.post("/execute-final-production")
 async def execute_final_production(production_data: dict, db: Session = Depends(get_db)):
-    """Execute final production for cakes and store results in warehouse"""
+    """Execute final production for cakes: consume the produced mid-preps and sub-recipes (raw materials for any shortfall) and add the finished cakes to the warehouse"""
     try:
-        cakes = production_data.get("cakes", [])
         warehouse_id = production_data.get("warehouse_id", 1)  # Default to Main Warehouse
+        lines = parse_production_lines({"cakes": production_data.get("cakes", [])})
         
-        if not cakes:
+        if not lines:
             raise HTTPException(status_code=400, detail="No cakes specified for production")
         
-        # Verify warehouse exists
-        warehouse_check = db.execute(text("SELECT name FROM warehouses WHERE id = :id"), {"id": warehouse_id}).fetchone()
-        if not warehouse_check:
-            raise HTTPException(status_code=404, detail=f"Warehouse ID {warehouse_id} not found")
-        
-        warehouse_name = warehouse_check[0]
-        
-        # Create warehouse_stock table if it doesn't exist
-        db.execute(text("""
-            CREATE TABLE IF NOT EXISTS warehouse_stock (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                warehouse_id INT NOT NULL,
-                ingredient_id INT NOT NULL,
-                quantity DECIMAL(10, 3) DEFAULT 0,
-                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                UNIQUE KEY unique_warehouse_ingredient (warehouse_id, ingredient_id),
-                FOREIGN KEY (warehouse_id) REFERENCES warehouses(id) ON DELETE CASCADE,
-                FOREIGN KEY (ingredient_id) REFERENCES items(id) ON DELETE CASCADE
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-        """))
-        
-        # Process each cake in the production request
-        processed_cakes = []
-        produced_items = []
-        
-        for cake in cakes:
-            cake_id = cake.get("cake_id")
-            quantity = cake.get("quantity", 1)
-            
-            # Get cake name from database
-            cake_info = db.execute(text("SELECT name FROM cakes WHERE id = :id"), 
-                                 {"id": cake_id}).fetchone()
-            if cake_info:
-                cake_name = cake_info[0]
-            else:
-                cake_name = f"Cake {cake_id}"
-            
-            # Create an item for the produced cake with type "production"
-            produced_item_name = f"[PRODUCED] {cake_name}"
-            
-            # Check if this produced item already exists
-            item_check = db.execute(text("""
-                SELECT id FROM items WHERE name = :name AND unit = 'piece'
-            """), {"name": produced_item_name}).fetchone()
-            
-            if not item_check:
-                # Create new item entry for the produced cake
-                try:
-                    db.execute(text("""
-                        INSERT INTO items (name, unit, price_per_unit, category_id, item_type)
-                        VALUES (:name, 'piece', 0.00, NULL, 'production')
-                    """), {"name": produced_item_name})
-                except Exception:
-                    # If item_type column doesn't exist, insert without it
-                    db.execute(text("""
-                        INSERT INTO items (name, unit, price_per_unit, category_id)
-                        VALUES (:name, 'piece', 0.00, NULL)
-                    """), {"name": produced_item_name})
-                
-                item_id = db.execute(text("SELECT LAST_INSERT_ID()")).fetchone()[0]
-            else:
-                item_id = item_check[0]
-            
-            # Add/update stock in the specified warehouse
-            db.execute(text("""
-                INSERT INTO warehouse_stock (warehouse_id, ingredient_id, quantity)
-                VALUES (:warehouse_id, :ingredient_id, :quantity)
-                ON DUPLICATE KEY UPDATE quantity = quantity + VALUES(quantity)
-            """), {
-                "warehouse_id": warehouse_id,
-                "ingredient_id": item_id,
-                "quantity": quantity
-            })
-            
-            processed_cakes.append({
-                "cake_id": cake_id,
-                "cake_name": cake_name,
-                "quantity_produced": quantity,
-                "status": "completed",
-                "warehouse_id": warehouse_id,
-                "warehouse_name": warehouse_name,
-                "item_id": item_id,
-                "produced_item_name": produced_item_name,
-                "produced_at": "2024-01-15T16:00:00Z"
-            })
-            
-            produced_items.append(f"{quantity} piece(s) of {cake_name}")
+        result = execute_production(
+            db, warehouse_id, lines,
+            allow_negative_stock=bool(production_data.get("allow_negative_stock", False)),
+            use_produced_stock=True
+        )
         
-        # Commit the database changes
-        try:
-            db.commit()
-        except Exception as e:
-            db.rollback()
-            raise HTTPException(status_code=500, detail=f"Failed to save production data: {str(e)}")
-        
-        # Return production results
-        result = {
-            "production_id": 3001,
-            "status": "completed",
-            "warehouse_id": warehouse_id,
-            "warehouse_name": warehouse_name,
-            "total_cakes": len(cakes),
-            "produced_items": produced_items,
-            "started_at": "2024-01-15T15:30:00Z",
-            "completed_at": "2024-01-15T16:00:00Z"
+        return {
+            "success": True, 
+            "message": f"Final production completed! Produced {len(lines)} cakes in {result['warehouse_name']}", 
+            "data": result
         }
         
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to execute final production: {str(e)}")
+
+@router.post("/execute-production")
+async def execute_production_order(production_data: dict, db: Session = Depends(get_db)):
+    """
+    Execute a whole production order (any mix of sub_recipes, mid_preps and
+    cakes) in one transaction
+    """
+    try:
+        warehouse_id = production_data.get("warehouse_id", 1)  # Default to Main Warehouse
+        lines = parse_production_lines(production_data)
+        
+        result = execute_production(
+            db, warehouse_id, lines,
+            allow_negative_stock=bool(production_data.get("allow_negative_stock", False))
+        )
+        
         return {
-            "success": True, 
-            "message": f"Final production completed! Produced {len(cakes)} cakes in {warehouse_name}", 
+            "success": True,
+            "message": f"Production completed! Produced {len(lines)} recipe line(s) in {result['warehouse_name']}",
             "data": result
         }
         
@@ -617,4 +321,24 @@ async def execute_final_production(production_data: dict, db: Session = Depends(
         raise
     except Exception as e:
         db.rollback()
-        raise HTTPException(status_code=500, detail=f"Failed to execute final production: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to execute production: {str(e)}")
+
+@router.post("/production-feasibility")
+async def get_production_feasibility(production_data: dict, db: Session = Depends(get_db)):
+    """
+    Check a production plan (sub_recipes, mid_preps and/or cakes) against the
+    stock of one warehouse: required vs available vs shortage per raw item and
+    the maximum producible quantity of each planned recipe
+    """
+    try:
+        warehouse_id = production_data.get("warehouse_id")
+        if warehouse_id is None:
+            raise HTTPException(status_code=400, detail="warehouse_id is required")
+        
+        lines = parse_production_lines(production_data)
+        return {"success": True, "data": check_feasibility(db, int(warehouse_id), lines)}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to check production feasibility: {str(e)}")
@@ -1,11 +1,16 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Query, Response, status
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from typing import List, Optional
+from typing import List, Optional, Tuple
+from datetime import date, datetime, timedelta
+import base64
+import json
 import schemas
 import models
 from database import get_db
 from auth import get_current_active_user
+from cheque_attachments import attachments_by_cheque
+from balance_ledger import post_entry, post_balance_set, balance_at, statement_for_dates
 
 router = APIRouter(prefix="/safes", tags=["Safes"])
 
@@ -31,6 +36,9 @@ async def create_safe(
     try:
         db_safe = models.Safe(**safe.dict(), current_balance=safe.initial_balance)
         db.add(db_safe)
+        db.flush()
+        post_entry(db, "safe", db_safe.id, float(safe.initial_balance or 0), "opening",
+                   description="Initial balance", created_by=current_user.id)
         db.commit()
         db.refresh(db_safe)
         return db_safe
@@ -50,6 +58,8 @@ async def update_safe_balance(
         if not db_safe:
             raise HTTPException(status_code=404, detail="Safe not found")
         
+        post_balance_set(db, "safe", safe_id, balance_update.amount,
+                         description=balance_update.reason or "Manual balance update", created_by=current_user.id)
         db_safe.current_balance = balance_update.amount
         db.commit()
         db.refresh(db_safe)
@@ -57,6 +67,40 @@ async def update_safe_balance(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating safe balance: {str(e)}")
 
+@router.get("/{safe_id}/balance-at")
+async def get_safe_balance_at(
+    safe_id: int,
+    at: datetime = Query(..., description="Point in time (YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS)"),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Safe balance from every ledger posting before `at`"""
+    safe = db.execute(text("SELECT id, name FROM safes WHERE id = :id"), {"id": safe_id}).fetchone()
+    if not safe:
+        raise HTTPException(status_code=404, detail="Safe not found")
+    return {
+        "safe_id": safe_id,
+        "safe_name": safe[1],
+        "at": at.isoformat(),
+        "balance": balance_at(db, "safe", safe_id, at)
+    }
+
+@router.get("/{safe_id}/statement")
+async def get_safe_statement(
+    safe_id: int,
+    start_date: date = Query(..., description="First day (YYYY-MM-DD)"),
+    end_date: date = Query(..., description="Last day, inclusive (YYYY-MM-DD)"),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Ledger postings of a safe between two dates with opening, running and closing balances"""
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="end_date must not be before start_date")
+    safe = db.execute(text("SELECT id, name FROM safes WHERE id = :id"), {"id": safe_id}).fetchone()
+    if not safe:
+        raise HTTPException(status_code=404, detail="Safe not found")
+    return {"safe_name": safe[1], **statement_for_dates(db, "safe", safe_id, start_date, end_date)}
+
 # Simple endpoint for frontend compatibility  
 @router.get("/simple", summary="Simple safes endpoint")
 async def get_safes_simple(db: Session = Depends(get_db)):
@@ -91,150 +135,210 @@ async def get_safes_simple(db: Session = Depends(get_db)):
             "safes": []
         }
 
-@router.get("/{safe_id}/cheques")
-async def get_safe_cheques(
+# Page size bounds for /safes/{safe_id}/cheques
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 500
+
+
+def _encode_cursor(key, cheque_id: int) -> str:
+    payload = json.dumps([key.isoformat() if isinstance(key, datetime) else key, cheque_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str):
+    try:
+        key, cheque_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if key is not None and not isinstance(key, str):
+            raise ValueError(key)
+        return key, int(cheque_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _parse_cursor_datetime(value: Optional[str]) -> datetime:
+    try:
+        return datetime.fromisoformat(value)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _parse_date(value: str, name: str) -> date:
+    try:
+        return date.fromisoformat(value[:10])
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name}, expected YYYY-MM-DD")
+
+
+def list_safe_cheques(
+    db: Session,
     safe_id: int,
-    limit: int = 10,
+    limit: Optional[int] = None,
     offset: int = 0,
+    cursor: Optional[str] = None,
     cheque_number: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    status_filter: Optional[str] = None,
+    status_filter: Optional[str] = None
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    One page of a safe's cheques and the cursor of the next page (None on
+    the last page).
+
+    Settled cheques are ordered newest settlement first and paged on
+    (settlement_date, id); everything else is ordered and paged on
+    cheque_number. Both walk idx_cheques_safe_settled / the unique
+    cheque_number index instead of counting past OFFSET rows. `offset` is
+    still honoured when no cursor is given, for older clients.
+
+    status_filter="active" without limit or cursor returns every open cheque
+    in one response, as it always has (the print manager relies on it).
+    """
+    settled_order = status_filter == "settled"
+    unbounded = status_filter == "active" and limit is None and not cursor
+    if limit is None:
+        limit = DEFAULT_PAGE_SIZE
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    where_conditions = ["c.safe_id = :safe_id", "c.is_assigned_to_safe = 1"]
+    params = {"safe_id": safe_id, "limit": limit + 1}
+
+    if cheque_number:
+        where_conditions.append("c.cheque_number LIKE :cheque_number")
+        params["cheque_number"] = f"%{cheque_number}%"
+
+    # Half-open datetime range instead of DATE(settlement_date), so the index applies
+    if start_date:
+        where_conditions.append("c.settlement_date >= :start_date")
+        params["start_date"] = _parse_date(start_date, "start_date")
+
+    if end_date:
+        where_conditions.append("c.settlement_date < :end_date")
+        params["end_date"] = _parse_date(end_date, "end_date") + timedelta(days=1)
+
+    if status_filter == "settled":
+        where_conditions.append("c.is_settled = 1")
+    elif status_filter == "active":
+        where_conditions.append("c.is_settled = 0")
+    # "all" or None means no status filter
+
+    if cursor:
+        key, cheque_id = _decode_cursor(cursor)
+        params.update({"cursor_key": key, "cursor_id": cheque_id})
+        if settled_order:
+            # Every settlement path sets settlement_date along with is_settled
+            params["cursor_key"] = _parse_cursor_datetime(key)
+            where_conditions.append(
+                "(c.settlement_date < :cursor_key OR (c.settlement_date = :cursor_key AND c.id < :cursor_id))"
+            )
+        else:
+            where_conditions.append("c.cheque_number > :cursor_key")
+        offset = 0
+
+    if settled_order:
+        order_clause = "ORDER BY c.settlement_date DESC, c.id DESC"
+    else:
+        order_clause = "ORDER BY c.cheque_number"
+    params["offset"] = max(offset, 0)
+
+    rows = db.execute(text(f"""
+        SELECT c.id, c.cheque_number, c.amount, c.status,
+               c.issue_date, c.due_date, c.description, c.issued_to,
+               ba.account_name, ba.bank_name,
+               COALESCE(c.total_expenses, 0) as total_expenses,
+               c.is_settled,
+               c.overspent_amount,
+               c.settlement_date,
+               c.settled_by_cheque_id,
+               c.expenses_count,
+               c.is_printed,
+               c.printed_at,
+               c.print_count
+        FROM cheques c
+        LEFT JOIN bank_accounts ba ON c.bank_account_id = ba.id
+        WHERE {" AND ".join(where_conditions)}
+        {order_clause}
+        {"" if unbounded else "LIMIT :limit OFFSET :offset"}
+    """), params).fetchall()
+
+    next_cursor = None
+    if not unbounded and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = _encode_cursor(last.settlement_date if settled_order else last.cheque_number, last.id)
+
+    attachments = attachments_by_cheque(db, [row.id for row in rows if row.is_settled])
+
+    cheques = []
+    for row in rows:
+        total_expenses = float(row.total_expenses)
+        cheque_amount = float(row.amount) if row.amount else 0.0
+        is_overspent = total_expenses > cheque_amount
+
+        # Calculate overspent amount
+        overspent_amount = float(row.overspent_amount) if row.overspent_amount else 0.0
+        if is_overspent and overspent_amount == 0.0:
+            overspent_amount = total_expenses - cheque_amount
+
+        cheque_attachments = attachments.get(row.id, [])
+        cheques.append({
+            "id": row.id,
+            "cheque_number": row.cheque_number,
+            "amount": cheque_amount,
+            "status": row.status or "assigned",
+            "issue_date": row.issue_date.isoformat() if row.issue_date else None,
+            "due_date": row.due_date.isoformat() if row.due_date else None,
+            "description": row.description or "",
+            "issued_to": row.issued_to or "",
+            "bank_account": f"{row.account_name} ({row.bank_name})" if row.account_name else "Unknown",
+            "total_expenses": total_expenses,
+            "remaining_amount": cheque_amount - total_expenses,
+            "is_settled": bool(row.is_settled),
+            "is_overspent": is_overspent,
+            "overspent_amount": overspent_amount,
+            "settlement_date": row.settlement_date.isoformat() if row.settlement_date else None,
+            "safe_id": safe_id,
+            "settled_by_cheque_id": row.settled_by_cheque_id,
+            "expense_count": row.expenses_count or 0,
+            "is_printed": bool(row.is_printed),
+            "printed_at": row.printed_at.isoformat() if row.printed_at else None,
+            "print_count": row.print_count or 0,
+            "attachments": cheque_attachments,
+            "has_attachments": len(cheque_attachments) > 0
+        })
+
+    return cheques, next_cursor
+
+
+@router.get("/{safe_id}/cheques")
+async def get_safe_cheques(
+    safe_id: int,
+    response: Response,
+    limit: Optional[int] = Query(None, description=f"Page size (default {DEFAULT_PAGE_SIZE}, max {MAX_PAGE_SIZE}; active without limit returns all)"),
+    offset: int = Query(0, description="Rows to skip when no cursor is given (prefer cursor)"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor header of the previous page"),
+    cheque_number: Optional[str] = None,
+    start_date: Optional[str] = Query(None, description="Settlement date from (YYYY-MM-DD)"),
+    end_date: Optional[str] = Query(None, description="Settlement date to, inclusive (YYYY-MM-DD)"),
+    status_filter: Optional[str] = Query(None, description="settled, active or all"),
     db: Session = Depends(get_db)
 ):
-    """Get cheques assigned to a specific safe with filtering and pagination"""
+    """
+    Get cheques assigned to a specific safe with filtering and keyset
+    pagination. The body is the page; the X-Next-Cursor response header,
+    when present, is passed back as `cursor` for the next page.
+    """
     try:
-        import os
-        import glob
-        
         # Verify safe exists
         safe = db.execute(text("SELECT id, name FROM safes WHERE id = :id"), 
                          {"id": safe_id}).fetchone()
         if not safe:
             raise HTTPException(status_code=404, detail="Safe not found")
         
-        # Build dynamic WHERE conditions
-        where_conditions = ["c.safe_id = :safe_id", "c.is_assigned_to_safe = 1"]
-        params = {"safe_id": safe_id}
-        
-        # Add filtering conditions
-        if cheque_number:
-            where_conditions.append("c.cheque_number LIKE :cheque_number")
-            params["cheque_number"] = f"%{cheque_number}%"
-        
-        if start_date:
-            where_conditions.append("DATE(c.settlement_date) >= :start_date")
-            params["start_date"] = start_date
-            
-        if end_date:
-            where_conditions.append("DATE(c.settlement_date) <= :end_date")
-            params["end_date"] = end_date
-            
-        if status_filter == "settled":
-            where_conditions.append("c.is_settled = 1")
-        elif status_filter == "active":
-            where_conditions.append("c.is_settled = 0")
-        # "all" or None means no status filter
-        
-        where_clause = " AND ".join(where_conditions)
-        
-        # Determine ordering - settled cheques by settlement date DESC, active by cheque number
-        if status_filter == "settled":
-            order_clause = "ORDER BY c.settlement_date DESC, c.cheque_number DESC"
-        else:
-            order_clause = "ORDER BY c.cheque_number"
-            
-        # Build pagination - for settled cheques, default to limit 10, for active show all
-        if status_filter == "settled" or (status_filter is None and limit == 10):
-            limit_clause = f"LIMIT {limit} OFFSET {offset}"
-        elif status_filter == "active":
-            limit_clause = ""  # Show all active cheques
-        else:
-            limit_clause = f"LIMIT {limit} OFFSET {offset}"
-
-        # Get cheques assigned to this safe
-        result = db.execute(text(f"""
-            SELECT c.id, c.cheque_number, c.amount, c.status, 
-                   c.issue_date, c.due_date, c.description, c.issued_to,
-                   ba.account_name, ba.bank_name,
-                   COALESCE(
-                       (SELECT SUM(e.amount) FROM expenses e WHERE e.cheque_id = c.id AND e.status != 'rejected'),
-                       0
-                   ) as total_expenses,
-                   c.amount - COALESCE(
-                       (SELECT SUM(e.amount) FROM expenses e WHERE e.cheque_id = c.id AND e.status != 'rejected'),
-                       0
-                   ) as remaining_amount,
-                   c.is_settled,
-                   c.overspent_amount,
-                   c.settlement_date,
-                   c.safe_id,
-                   c.settled_by_cheque_id
-            FROM cheques c
-            LEFT JOIN bank_accounts ba ON c.bank_account_id = ba.id
-            WHERE {where_clause}
-            {order_clause}
-            {limit_clause}
-        """), params)
-        
-        cheques = []
-        for row in result:
-            total_expenses = float(row[10]) if row[10] else 0.0  # Updated index (due_date added)
-            cheque_amount = float(row[2]) if row[2] else 0.0
-            remaining_amount = float(row[11]) if row[11] else cheque_amount  # Updated index
-            is_overspent = total_expenses > cheque_amount
-            
-            # Calculate overspent amount
-            overspent_amount = float(row[13]) if row[13] else 0.0  # Updated index
-            if is_overspent and overspent_amount == 0.0:
-                overspent_amount = total_expenses - cheque_amount
-            
-            # Check for settlement attachments if cheque is settled
-            attachments = []
-            if bool(row[12]):  # is_settled (updated index)
-                try:
-                    EARLY_SETTLEMENT_UPLOAD_DIR = "uploads/early_settlement_files"
-                    attachment_pattern = os.path.join(EARLY_SETTLEMENT_UPLOAD_DIR, f"settlement_{row[0]}_*")
-                    attachment_files = glob.glob(attachment_pattern)
-                    
-                    for file_path in attachment_files:
-                        if os.path.exists(file_path):
-                            file_size = os.path.getsize(file_path)
-                            file_name = os.path.basename(file_path)
-                            # Extract original filename from unique filename
-                            original_name = file_name.split('_', 3)[-1] if '_' in file_name else file_name
-                            attachments.append({
-                                "filename": file_name,
-                                "original_filename": original_name,
-                                "file_size": file_size,
-                                "file_path": file_path
-                            })
-                except Exception as e:
-                    print(f"Error checking attachments for cheque {row[0]}: {e}")
-            
-            cheques.append({
-                "id": row[0],
-                "cheque_number": row[1],
-                "amount": cheque_amount,
-                "status": row[3] or "assigned",
-                "issue_date": row[4].isoformat() if row[4] else None,
-                "due_date": row[5].isoformat() if row[5] else None,  # Added due_date field
-                "description": row[6] or "",  # Updated index
-                "issued_to": row[7] or "",  # Updated index
-                "bank_account": f"{row[8]} ({row[9]})" if row[8] else "Unknown",  # Updated indices
-                "total_expenses": total_expenses,
-                "remaining_amount": remaining_amount,
-                "is_settled": bool(row[12]),  # Updated index
-                "is_overspent": is_overspent,
-                "overspent_amount": overspent_amount,
-                "settlement_date": row[14].isoformat() if row[14] else None,  # Updated index
-                "safe_id": safe_id,  # Use the safe_id parameter directly
-                "settled_by_cheque_id": row[16] if len(row) > 16 else None,  # Updated index
-                "expense_count": 0,
-                "attachments": attachments,
-                "has_attachments": len(attachments) > 0
-            })
-        
+        cheques, next_cursor = list_safe_cheques(
+            db, safe_id, limit, offset, cursor, cheque_number, start_date, end_date, status_filter
+        )
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
         return cheques
     except HTTPException:
         raise
@@ -0,0 +1,118 @@
+"""
+Safe Balance Debits
+A debit is one conditional UPDATE: the balance check and the write happen in
+the same statement, so concurrent postings against one safe can never
+overdraw it, and nothing has to be read and locked up front. Callers run
+the debit as the last write before commit, which keeps the safe's row lock
+(held until commit) as short as possible.
+"""
+
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+_DEBIT = text("""
+    UPDATE safes
+    SET current_balance = current_balance - :amount
+    WHERE id = :safe_id AND current_balance >= :amount
+""")
+
+
+def debit_safe(db: Session, safe_id: int, amount: float) -> bool:
+    """Take `amount` out of a safe; False (nothing changed) when the balance is short"""
+    return db.execute(_DEBIT, {"safe_id": safe_id, "amount": amount}).rowcount == 1
+
+
+def safe_balance(db: Session, safe_id: int) -> Optional[float]:
+    row = db.execute(text("SELECT current_balance FROM safes WHERE id = :safe_id"), {"safe_id": safe_id}).fetchone()
+    return float(row[0] or 0) if row else None
+
+
+if __name__ == "__main__":
+    # Concurrency stress test: many cashiers posting against one scratch safe.
+    #   python safe_balance.py [--workers 16] [--posts 100] [--url mysql+mysqlconnector://...]
+    # "read-check-write" is the old pattern (SELECT, validate in Python, UPDATE);
+    # "conditional" is debit_safe. Expected: only the conditional run never overdraws.
+    import argparse
+    import threading
+    import time
+    import uuid
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="database URL (default: the application database)")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--posts", type=int, default=100, help="postings per worker")
+    parser.add_argument("--amount", type=float, default=10.0)
+    parser.add_argument("--balance", type=float, default=5000.0)
+    parser.add_argument("--work-ms", type=float, default=2.0, help="other writes of a posting (expense insert, ...)")
+    args = parser.parse_args()
+
+    if args.url:
+        engine = create_engine(args.url, pool_size=args.workers, max_overflow=0)
+    else:
+        from database import engine
+    Session_ = sessionmaker(bind=engine)
+
+    def read_check_write(db: Session, safe_id: int) -> bool:
+        if safe_balance(db, safe_id) < args.amount:
+            return False
+        time.sleep(args.work_ms / 1000)
+        db.execute(text("UPDATE safes SET current_balance = current_balance - :amount WHERE id = :safe_id"),
+                   {"amount": args.amount, "safe_id": safe_id})
+        return True
+
+    def conditional(db: Session, safe_id: int) -> bool:
+        time.sleep(args.work_ms / 1000)
+        return debit_safe(db, safe_id, args.amount)
+
+    def run(name: str, post) -> None:
+        setup = Session_()
+        safe_name = f"stress-test-{uuid.uuid4().hex[:8]}"
+        safe_id = setup.execute(text("""
+            INSERT INTO safes (name, initial_balance, current_balance, is_active)
+            VALUES (:name, :balance, :balance, TRUE)
+        """), {"name": safe_name, "balance": args.balance}).lastrowid
+        setup.commit()
+
+        accepted = [0] * args.workers
+        errors = [0] * args.workers
+
+        def cashier(index: int):
+            db = Session_()
+            try:
+                for _ in range(args.posts):
+                    try:
+                        if post(db, safe_id):
+                            accepted[index] += 1
+                        db.commit()
+                    except Exception:
+                        db.rollback()
+                        errors[index] += 1
+            finally:
+                db.close()
+
+        threads = [threading.Thread(target=cashier, args=(index,)) for index in range(args.workers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        final = safe_balance(setup, safe_id)
+        expected = args.balance - sum(accepted) * args.amount
+        setup.execute(text("DELETE FROM safes WHERE id = :safe_id"), {"safe_id": safe_id})
+        setup.commit()
+        setup.close()
+
+        total = args.workers * args.posts
+        mark = "✅" if final >= 0 and abs(final - expected) < 0.005 else "❌"
+        print(f"{mark} {name}: {total / elapsed:.0f} postings/s, {sum(accepted)} accepted, "
+              f"{sum(errors)} error(s), final balance {final:.2f} (expected {expected:.2f})")
+
+    run("read-check-write", read_check_write)
+    run("conditional", conditional)
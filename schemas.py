@@ -415,6 +415,12 @@ class ChequeAssignToSafe(BaseModel):
     safe_id: int
     cheque_ids: List[int]
 
+class ChequeBatchPrintRequest(BaseModel):
+    cheque_ids: Optional[List[int]] = None  # Explicit cheques, printed in this order
+    cheque_book_id: Optional[int] = None  # ...or every cheque in a book
+    unprinted_only: bool = True  # With cheque_book_id: skip cheques already printed
+    mark_printed: bool = True
+
 class ChequeBase(BaseModel):
     cheque_number: str
     bank_account_id: Optional[int] = None
@@ -0,0 +1,382 @@
+"""
+Global Search Index
+In-process inverted index over items, suppliers, purchase orders and cheques
+with Arabic-aware normalization. A query is ranked and paginated across every
+entity type from the index alone; MySQL is only hit to hydrate the returned
+page by primary key
+"""
+
+import bisect
+import logging
+import re
+import threading
+import time
+import unicodedata
+from typing import Dict, List, Optional, Any, Iterable, Tuple
+
+from sqlalchemy.orm import Session
+from sqlalchemy import text, bindparam
+
+logger = logging.getLogger(__name__)
+
+ITEMS = "items"
+SUPPLIERS = "suppliers"
+PURCHASE_ORDERS = "purchase_orders"
+CHEQUES = "cheques"
+
+ENTITY_TYPES = (ITEMS, SUPPLIERS, PURCHASE_ORDERS, CHEQUES)
+
+# ?search_type= values accepted by /api/search/global
+SEARCH_TYPE_ALIASES = {
+    "items": ITEMS,
+    "suppliers": SUPPLIERS,
+    "orders": PURCHASE_ORDERS,
+    "purchase_orders": PURCHASE_ORDERS,
+    "cheques": CHEQUES,
+}
+
+# Full reload interval, catches writes made outside the hooked endpoints
+REFRESH_SECONDS = 600
+
+# Score for a query token matching a whole indexed token vs. only its prefix
+EXACT_MATCH = 3
+PREFIX_MATCH = 1
+
+Key = Tuple[str, int]
+
+# ==========================================
+# NORMALIZATION
+# ==========================================
+
+_ARABIC_DIACRITICS = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")  # tashkeel, Quranic marks, tatweel
+
+_ARABIC_FOLDING = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي", "ئ": "ي", "ؤ": "و",
+    "ة": "ه",
+    "٠": "0", "١": "1", "٢": "2", "٣": "3", "٤": "4",
+    "٥": "5", "٦": "6", "٧": "7", "٨": "8", "٩": "9",
+    "۰": "0", "۱": "1", "۲": "2", "۳": "3", "۴": "4",
+    "۵": "5", "۶": "6", "۷": "7", "۸": "8", "۹": "9",
+})
+
+_TOKEN_SPLIT = re.compile(r"[^\w]+", re.UNICODE)
+
+_ARABIC_ARTICLES = ("وال", "بال", "فال", "كال", "ال")
+
+
+def normalize_text(value: Any) -> str:
+    """Lower-case, strip tashkeel/tatweel, fold alef/ya/ta-marbuta variants and Arabic digits"""
+    if value is None:
+        return ""
+    normalized = unicodedata.normalize("NFKC", str(value)).lower()
+    normalized = _ARABIC_DIACRITICS.sub("", normalized)
+    return normalized.translate(_ARABIC_FOLDING)
+
+
+def _strip_article(token: str) -> str:
+    for article in _ARABIC_ARTICLES:
+        if token.startswith(article) and len(token) - len(article) >= 2:
+            return token[len(article):]
+    return token
+
+
+def tokenize(value: Any) -> List[str]:
+    """Normalized search tokens; 'الشوكولاتة' and 'شوكولاته' both yield 'شوكولاته'"""
+    tokens = []
+    for token in _TOKEN_SPLIT.split(normalize_text(value)):
+        token = token.strip("_")
+        if not token:
+            continue
+        tokens.append(_strip_article(token))
+    return tokens
+
+
+def _index_tokens(value: Any) -> List[str]:
+    """Tokens stored for a field: query tokens plus article-bearing and zero-stripped number forms"""
+    tokens = []
+    for token in _TOKEN_SPLIT.split(normalize_text(value)):
+        token = token.strip("_")
+        if not token:
+            continue
+        tokens.append(token)
+        stripped = _strip_article(token)
+        if stripped != token:
+            tokens.append(stripped)
+        if token.isdigit() and token.lstrip("0") and token.lstrip("0") != token:
+            tokens.append(token.lstrip("0"))  # cheque "000123" is found by "123"
+    return tokens
+
+
+# ==========================================
+# ENTITY SOURCES
+# ==========================================
+
+# Columns after the id are (value, weight); title fields weigh more
+ENTITY_SOURCES = {
+    ITEMS: ("""
+        SELECT i.id, i.name, ic.name
+        FROM items i
+        LEFT JOIN inventory_categories ic ON i.category_id = ic.id
+        {where}
+    """, (2, 1), "i.id"),
+    SUPPLIERS: ("""
+        SELECT s.id, s.name, s.contact_name, s.phone
+        FROM suppliers s
+        {where}
+    """, (2, 1, 1), "s.id"),
+    PURCHASE_ORDERS: ("""
+        SELECT po.id, po.id, s.name
+        FROM purchase_orders po
+        JOIN suppliers s ON po.supplier_id = s.id
+        {where}
+    """, (2, 1), "po.id"),
+    CHEQUES: ("""
+        SELECT c.id, c.cheque_number, c.description, ba.account_name, ba.bank_name
+        FROM cheques c
+        LEFT JOIN bank_accounts ba ON c.bank_account_id = ba.id
+        {where}
+    """, (2, 1, 1, 1), "c.id"),
+}
+
+
+def _load_documents(db: Session, entity_type: str, where: str = "",
+                    params: Optional[Dict[str, Any]] = None) -> Iterable[Tuple[int, Dict[str, int]]]:
+    sql, weights, _ = ENTITY_SOURCES[entity_type]
+    for row in db.execute(text(sql.format(where=where)), params or {}):
+        tokens: Dict[str, int] = {}
+        for value, weight in zip(row[1:], weights):
+            for token in _index_tokens(value):
+                if tokens.get(token, 0) < weight:
+                    tokens[token] = weight
+        yield row[0], tokens
+
+
+class SearchIndex:
+    """
+    Token -> {(entity_type, id): weight} postings plus a sorted vocabulary
+    for prefix lookups.
+
+    Loaded on first search and fully reloaded every REFRESH_SECONDS. Write
+    paths call `refresh(db, entity_type, id)` or `remove(entity_type, id)`
+    after committing so their changes are searchable immediately.
+    """
+
+    def __init__(self):
+        self._documents: Dict[Key, Dict[str, int]] = {}
+        self._postings: Dict[str, Dict[Key, int]] = {}
+        self._vocabulary: List[str] = []
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.RLock()
+
+    # ---------- maintenance ----------
+
+    def _add(self, key: Key, tokens: Dict[str, int]):
+        self._drop(key)
+        self._documents[key] = tokens
+        for token, weight in tokens.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                bisect.insort(self._vocabulary, token)
+            postings[key] = weight
+
+    def _drop(self, key: Key):
+        tokens = self._documents.pop(key, None)
+        if not tokens:
+            return
+        for token in tokens:
+            postings = self._postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(key, None)
+            if not postings:
+                del self._postings[token]
+                position = bisect.bisect_left(self._vocabulary, token)
+                if position < len(self._vocabulary) and self._vocabulary[position] == token:
+                    del self._vocabulary[position]
+
+    def _load(self, db: Session):
+        documents: Dict[Key, Dict[str, int]] = {}
+        postings: Dict[str, Dict[Key, int]] = {}
+        for entity_type in ENTITY_TYPES:
+            for entity_id, tokens in _load_documents(db, entity_type):
+                key = (entity_type, entity_id)
+                documents[key] = tokens
+                for token, weight in tokens.items():
+                    postings.setdefault(token, {})[key] = weight
+
+        self._documents = documents
+        self._postings = postings
+        self._vocabulary = sorted(postings)
+        self._loaded_at = time.monotonic()
+        logger.info(f"Loaded search index: {len(documents)} document(s), {len(postings)} token(s)")
+
+    def ensure_loaded(self, db: Session):
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at > REFRESH_SECONDS:
+                self._load(db)
+
+    def refresh(self, db: Session, entity_type: str, entity_id: int):
+        """Re-read one entity (or drop it if deleted). Supplier renames re-index their POs too."""
+        with self._lock:
+            if self._loaded_at is None:
+                return
+
+            key_column = ENTITY_SOURCES[entity_type][2]
+            found = False
+            for doc_id, tokens in _load_documents(db, entity_type, f"WHERE {key_column} = :id", {"id": entity_id}):
+                self._add((entity_type, doc_id), tokens)
+                found = True
+            if not found:
+                self._drop((entity_type, entity_id))
+
+            if entity_type == SUPPLIERS:
+                for doc_id, tokens in _load_documents(db, PURCHASE_ORDERS, "WHERE po.supplier_id = :id", {"id": entity_id}):
+                    self._add((PURCHASE_ORDERS, doc_id), tokens)
+
+    def remove(self, entity_type: str, entity_id: int):
+        with self._lock:
+            self._drop((entity_type, entity_id))
+
+    def invalidate(self):
+        """Drop everything; the next search reloads the full index"""
+        with self._lock:
+            self._loaded_at = None
+
+    # ---------- querying ----------
+
+    def _matches(self, token: str) -> Dict[Key, int]:
+        """Best score per document for one query token (whole-token or prefix match)"""
+        scores: Dict[Key, int] = {
+            key: weight * EXACT_MATCH for key, weight in self._postings.get(token, {}).items()
+        }
+        position = bisect.bisect_right(self._vocabulary, token)
+        while position < len(self._vocabulary) and self._vocabulary[position].startswith(token):
+            for key, weight in self._postings[self._vocabulary[position]].items():
+                score = weight * PREFIX_MATCH
+                if scores.get(key, 0) < score:
+                    scores[key] = score
+            position += 1
+        return scores
+
+    def search(self, db: Session, query: str, entity_types: Optional[Iterable[str]] = None,
+               offset: int = 0, limit: int = 20) -> Tuple[int, List[Tuple[Key, int]]]:
+        """
+        Return (total matches, [((entity_type, id), score), ...] for one page).
+        Every query token must match; documents are ranked by summed score.
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return 0, []
+        allowed = set(entity_types or ENTITY_TYPES)
+
+        with self._lock:
+            self.ensure_loaded(db)
+
+            # Rarest token first keeps the candidate set small
+            per_token = sorted((self._matches(token) for token in tokens), key=len)
+            candidates = {key: score for key, score in per_token[0].items() if key[0] in allowed}
+            for scores in per_token[1:]:
+                if not candidates:
+                    break
+                candidates = {key: total + scores[key] for key, total in candidates.items() if key in scores}
+
+        order = {entity_type: position for position, entity_type in enumerate(ENTITY_TYPES)}
+        ranked = sorted(candidates.items(), key=lambda hit: (-hit[1], order[hit[0][0]], hit[0][1]))
+        return len(ranked), ranked[offset:offset + limit]
+
+
+# Shared instance used by all endpoints in this process
+search_index = SearchIndex()
+
+
+# ==========================================
+# HYDRATION
+# ==========================================
+
+def _fetch_by_ids(db: Session, sql: str, ids: List[int]):
+    return db.execute(text(sql).bindparams(bindparam("ids", expanding=True)), {"ids": ids}).fetchall()
+
+
+def hydrate_hits(db: Session, hits: List[Tuple[Key, int]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Current rows for a page of hits, grouped by entity type in rank order"""
+    ids_by_type: Dict[str, List[int]] = {entity_type: [] for entity_type in ENTITY_TYPES}
+    scores: Dict[Key, int] = {}
+    for key, score in hits:
+        ids_by_type[key[0]].append(key[1])
+        scores[key] = score
+
+    rows_by_key: Dict[Key, Dict[str, Any]] = {}
+
+    if ids_by_type[ITEMS]:
+        for item in _fetch_by_ids(db, """
+            SELECT i.id, i.name, i.unit, ic.name as category_name,
+                   COALESCE(SUM(ws.quantity), 0) as total_stock
+            FROM items i
+            LEFT JOIN inventory_categories ic ON i.category_id = ic.id
+            LEFT JOIN warehouse_stock ws ON i.id = ws.ingredient_id
+            WHERE i.id IN :ids
+            GROUP BY i.id, i.name, i.unit, ic.name
+        """, ids_by_type[ITEMS]):
+            rows_by_key[(ITEMS, item[0])] = {
+                "id": item[0],
+                "name": item[1],
+                "unit": item[2],
+                "category": item[3] or "Uncategorized",
+                "total_stock": float(item[4])
+            }
+
+    if ids_by_type[SUPPLIERS]:
+        for supplier in _fetch_by_ids(db, """
+            SELECT s.id, s.name, s.contact_name, s.phone,
+                   (SELECT COUNT(*) FROM purchase_orders po WHERE po.supplier_id = s.id) as total_orders
+            FROM suppliers s
+            WHERE s.id IN :ids
+        """, ids_by_type[SUPPLIERS]):
+            rows_by_key[(SUPPLIERS, supplier[0])] = {
+                "id": supplier[0],
+                "name": supplier[1],
+                "contact_name": supplier[2],
+                "phone": supplier[3],
+                "total_orders": supplier[4] or 0
+            }
+
+    if ids_by_type[PURCHASE_ORDERS]:
+        for order in _fetch_by_ids(db, """
+            SELECT po.id, s.name as supplier_name, po.order_date,
+                   po.status, po.total_amount
+            FROM purchase_orders po
+            JOIN suppliers s ON po.supplier_id = s.id
+            WHERE po.id IN :ids
+        """, ids_by_type[PURCHASE_ORDERS]):
+            rows_by_key[(PURCHASE_ORDERS, order[0])] = {
+                "id": order[0],
+                "supplier_name": order[1],
+                "order_date": order[2].isoformat() if order[2] else None,
+                "status": order[3],
+                "total_amount": float(order[4]) if order[4] else 0
+            }
+
+    if ids_by_type[CHEQUES]:
+        for cheque in _fetch_by_ids(db, """
+            SELECT c.id, c.cheque_number, c.amount, c.status,
+                   ba.account_name, ba.bank_name
+            FROM cheques c
+            LEFT JOIN bank_accounts ba ON c.bank_account_id = ba.id
+            WHERE c.id IN :ids
+        """, ids_by_type[CHEQUES]):
+            rows_by_key[(CHEQUES, cheque[0])] = {
+                "id": cheque[0],
+                "cheque_number": cheque[1],
+                "amount": float(cheque[2]) if cheque[2] else 0,
+                "status": cheque[3],
+                "bank_account": f"{cheque[4]} ({cheque[5]})" if cheque[4] else "Unknown"
+            }
+
+    results: Dict[str, List[Dict[str, Any]]] = {entity_type: [] for entity_type in ENTITY_TYPES}
+    for key, score in hits:
+        row = rows_by_key.get(key)
+        if row is not None:  # deleted since it was indexed
+            results[key[0]].append({**row, "score": score})
+    return results
@@ -0,0 +1,265 @@
+"""
+Stock Count Import
+Applies a full-warehouse stock count (the Excel stock template) as a set:
+the sheet is validated column-wise in pandas, the warehouse's current
+quantities are read in one locked query, and the differences go to the
+database as one multi-row warehouse_stock upsert plus one bulk
+stock_movements insert (production_engine.apply_stock_deltas /
+insert_stock_movements), in a single short transaction. Rows that fail
+validation are reported per row and skipped; the rest are applied.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from fastapi import HTTPException
+from sqlalchemy import text, bindparam
+from sqlalchemy.orm import Session
+
+from production_engine import apply_stock_deltas, insert_stock_movements
+
+REQUIRED_COLUMNS = {"ingredient_id", "quantity", "ingredient_name"}
+
+# Smaller differences between the count and the stored quantity are ignored
+CHANGE_TOLERANCE = 0.001
+
+MOVEMENT_REASON = "Excel Upload"
+
+
+def _cell_text(column: pd.Series) -> pd.Series:
+    """Cells as stripped text, empty for blanks"""
+    return column.astype(object).where(column.notna(), "").astype(str).str.strip()
+
+
+def validate_stock_count(df: pd.DataFrame, known_item_ids: Iterable[int]) -> Tuple[pd.DataFrame, List[str]]:
+    """
+    Split a stock count sheet into valid rows (columns ingredient_id,
+    quantity, row) and "Row N: ..." errors, first failing check per row.
+    Rows are numbered from 1 after the header; when an ingredient appears
+    more than once the last row counts and the earlier ones are reported.
+    """
+    row_numbers = pd.Series(np.arange(1, len(df) + 1), index=df.index)
+    raw_ids = _cell_text(df["ingredient_id"])
+    raw_quantities = _cell_text(df["quantity"])
+    ids = pd.to_numeric(df["ingredient_id"], errors="coerce")
+    quantities = pd.to_numeric(df["quantity"], errors="coerce")
+    names = _cell_text(df["ingredient_name"])
+
+    missing_id = raw_ids == ""
+    bad_id = ids.isna() | (ids % 1 != 0)
+    whole_ids = ids.where(~bad_id).astype("Int64")
+    unknown = ~bad_id & ~whole_ids.isin(set(known_item_ids))
+    bad_quantity = quantities.isna() | np.isinf(quantities)
+    negative = ~bad_quantity & (quantities < 0)
+    later_row = whole_ids.where(~bad_id).duplicated(keep="last") & ~bad_id
+
+    # Checks in priority order; each row reports the first that fails
+    checks = [
+        (missing_id, "Missing ingredient ID"),
+        (bad_id, "Invalid ingredient ID " + raw_ids),
+        (names == "", "Missing ingredient name"),
+        (unknown, "Ingredient " + whole_ids.astype(str) + " not found"),
+        (raw_quantities == "", "Missing quantity"),
+        (bad_quantity, "Invalid quantity " + raw_quantities),
+        (negative, "Quantity cannot be negative (" + raw_quantities + ")"),
+        (later_row, "Ingredient " + whole_ids.astype(str) + " is counted again further down; the last row is used"),
+    ]
+    error = pd.Series("", index=df.index, dtype=object)
+    for failed, message in checks:
+        error = error.mask((error == "") & failed.fillna(False).astype(bool), message)
+
+    invalid = error != ""
+    errors = ("Row " + row_numbers[invalid].astype(str) + ": " + error[invalid]).tolist()
+    valid = pd.DataFrame({
+        "ingredient_id": whole_ids[~invalid].astype("int64"),
+        "quantity": quantities[~invalid].astype(float).round(3),
+        "row": row_numbers[~invalid]
+    })
+    return valid, errors
+
+
+def stock_count_deltas(valid: pd.DataFrame, current: Dict[int, float]) -> pd.Series:
+    """Counted minus stored quantity per ingredient id, only where they differ"""
+    stored = valid["ingredient_id"].map(current).fillna(0.0).astype(float)
+    deltas = (valid["quantity"] - stored).round(3)
+    deltas.index = valid["ingredient_id"]
+    return deltas[deltas.abs() > CHANGE_TOLERANCE]
+
+
+def import_stock_count(db: Session, warehouse_id: int, df: pd.DataFrame,
+                       user_id: Optional[int] = None) -> Dict[str, Any]:
+    """Apply a stock count sheet to a warehouse (commits) and report the result"""
+    missing = REQUIRED_COLUMNS - set(df.columns)
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Excel must include columns: {', '.join(sorted(missing))}")
+
+    if not db.execute(text("SELECT id FROM warehouses WHERE id = :id"), {"id": warehouse_id}).fetchone():
+        raise HTTPException(status_code=404, detail=f"Warehouse ID {warehouse_id} not found")
+
+    sheet_ids = pd.to_numeric(df["ingredient_id"], errors="coerce").dropna()
+    sheet_ids = sorted({int(item_id) for item_id in sheet_ids if float(item_id).is_integer()})
+    known_item_ids = set()
+    if sheet_ids:
+        known_item_ids = {
+            row[0] for row in db.execute(
+                text("SELECT id FROM items WHERE id IN :item_ids").bindparams(bindparam("item_ids", expanding=True)),
+                {"item_ids": sheet_ids}
+            )
+        }
+    valid, errors = validate_stock_count(df, known_item_ids)
+
+    try:
+        # Locks the warehouse's stock rows until commit, so nothing moves between read and write
+        current = {
+            row[0]: float(row[1] or 0) for row in db.execute(text("""
+                SELECT ingredient_id, quantity FROM warehouse_stock
+                WHERE warehouse_id = :warehouse_id
+                FOR UPDATE
+            """), {"warehouse_id": warehouse_id})
+        }
+        deltas = stock_count_deltas(valid, current)
+        changes = {int(item_id): float(change) for item_id, change in deltas.items()}
+
+        apply_stock_deltas(db, warehouse_id, changes)
+        insert_stock_movements(db, warehouse_id, [
+            {"item_id": item_id, "change": change, "reason": MOVEMENT_REASON}
+            for item_id, change in changes.items()
+        ], user_id)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    updates_count = len(valid)
+    result = {
+        "success": True,
+        "updates_count": updates_count,
+        "changed_count": len(changes),
+        "message": f"Updated {updates_count} items successfully"
+    }
+    if errors:
+        result["errors"] = errors
+        result["message"] += f", {len(errors)} errors occurred"
+    return result
+
+
+if __name__ == "__main__":
+    # 10k-row stock count benchmark: python stock_count_import.py [--rows 10000] [--url mysql+mysqlconnector://...]
+    # Both runs work on scratch items / a scratch warehouse and are rolled back.
+    import argparse
+    import time
+    import uuid
+    from io import BytesIO
+
+    from sqlalchemy import create_engine
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--url", help="database URL (default: the application database)")
+    parser.add_argument("--sheet-only", action="store_true", help="only time parsing and validation")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    sheet = pd.DataFrame({
+        "ingredient_id": np.arange(1, args.rows + 1),
+        "ingredient_name": [f"Item {index}" for index in range(1, args.rows + 1)],
+        "quantity": rng.uniform(0, 500, args.rows).round(3)
+    })
+    # A few broken rows, as hand-edited sheets have
+    sheet = sheet.astype({"ingredient_id": object, "quantity": object})
+    sheet.loc[10, "quantity"] = "twelve"
+    sheet.loc[20, "ingredient_name"] = ""
+    sheet.loc[30, "ingredient_id"] = "abc"
+    buffer = BytesIO()
+    sheet.to_excel(buffer, index=False)
+    content = buffer.getvalue()
+
+    started = time.perf_counter()
+    df = pd.read_excel(BytesIO(content))
+    print(f"read_excel: {args.rows} rows in {time.perf_counter() - started:.2f}s")
+
+    started = time.perf_counter()
+    valid, errors = validate_stock_count(df, range(1, args.rows + 1))
+    stock_count_deltas(valid, {item_id: 100.0 for item_id in range(1, args.rows + 1, 2)})
+    print(f"vectorized validation + deltas: {(time.perf_counter() - started) * 1000:.0f} ms, "
+          f"{len(valid)} valid, {len(errors)} error(s): {errors}")
+
+    started = time.perf_counter()
+    for index, row in df.iterrows():
+        try:
+            int(row["ingredient_id"]), float(row["quantity"]), str(row.get("ingredient_name", "")).strip()
+        except Exception:
+            pass
+    print(f"iterrows (parsing only, no queries): {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    if not args.sheet_only:
+        if args.url:
+            engine = create_engine(args.url)
+        else:
+            from database import engine
+
+        def scratch(db: Session) -> Tuple[int, pd.DataFrame]:
+            """Scratch warehouse stocking half of `rows` scratch items, and a count sheet of all of them"""
+            tag = uuid.uuid4().hex[:8]
+            warehouse_id = db.execute(text("INSERT INTO warehouses (name) VALUES (:name)"),
+                                      {"name": f"count-bench-{tag}"}).lastrowid
+            names = [f"count-bench-{tag}-{index}" for index in range(args.rows)]
+            db.execute(text("INSERT INTO items (name, unit, price_per_unit) VALUES (:name, 'kg', 1.00)"),
+                       [{"name": name} for name in names])
+            item_ids = [row[0] for row in db.execute(text("SELECT id FROM items WHERE name LIKE :prefix ORDER BY id"),
+                                                     {"prefix": f"count-bench-{tag}-%"})]
+            db.execute(text("INSERT INTO warehouse_stock (warehouse_id, ingredient_id, quantity) VALUES (:w, :i, 100)"),
+                       [{"w": warehouse_id, "i": item_id} for item_id in item_ids[::2]])
+            counted = pd.DataFrame({
+                "ingredient_id": item_ids,
+                "ingredient_name": names,
+                "quantity": rng.uniform(0, 500, len(item_ids)).round(3)
+            })
+            return warehouse_id, counted
+
+        def row_by_row(db: Session, warehouse_id: int, counted: pd.DataFrame):
+            # The previous upload_stock_template loop: 2-3 statements per row
+            for index, row in counted.iterrows():
+                ingredient_id = int(row["ingredient_id"])
+                new_qty = float(row["quantity"])
+                current = db.execute(text("""
+                    SELECT COALESCE(quantity, 0) FROM warehouse_stock
+                    WHERE warehouse_id = :warehouse_id AND ingredient_id = :ingredient_id
+                """), {"warehouse_id": warehouse_id, "ingredient_id": ingredient_id}).fetchone()
+                change = new_qty - (float(current[0]) if current else 0)
+                db.execute(text("""
+                    INSERT INTO warehouse_stock (warehouse_id, ingredient_id, quantity)
+                    VALUES (:warehouse_id, :ingredient_id, :quantity)
+                    ON DUPLICATE KEY UPDATE quantity = VALUES(quantity)
+                """), {"warehouse_id": warehouse_id, "ingredient_id": ingredient_id, "quantity": new_qty})
+                if abs(change) > CHANGE_TOLERANCE:
+                    insert_stock_movements(db, warehouse_id, [
+                        {"item_id": ingredient_id, "change": change, "reason": MOVEMENT_REASON}
+                    ])
+
+        def import_all(db: Session, warehouse_id: int, counted: pd.DataFrame):
+            import_stock_count(db, warehouse_id, counted)
+
+        for name, run in (("row by row", row_by_row), ("import_stock_count", import_all)):
+            # Everything runs inside an outer transaction that is rolled back;
+            # the session's commits only release savepoints
+            connection = engine.connect()
+            outer = connection.begin()
+            db = Session(bind=connection, join_transaction_mode="create_savepoint")
+            try:
+                warehouse_id, counted = scratch(db)
+                expected = float(counted["quantity"].sum())
+                started = time.perf_counter()
+                run(db, warehouse_id, counted)
+                elapsed = time.perf_counter() - started
+                total = float(db.execute(text("SELECT COALESCE(SUM(quantity), 0) FROM warehouse_stock WHERE warehouse_id = :w"),
+                                         {"w": warehouse_id}).scalar())
+                mark = "✅" if abs(total - expected) < 0.01 else "❌"
+                print(f"{mark} {name}: {len(counted)} rows in {elapsed:.2f}s (warehouse total {total:.3f}, expected {expected:.3f})")
+            except Exception as e:
+                print(f"❌ {name}: {str(e)}")
+            finally:
+                db.close()
+                outer.rollback()
+                connection.close()
@@ -0,0 +1,199 @@
+"""
+Upload Storage
+Streams uploaded files to disk in fixed-size chunks (writes and hashing run
+in a worker thread, so the event loop never blocks on disk I/O and a file is
+never held in memory whole), enforces the size limit while streaming, and
+moves the finished file atomically into a content-addressed store:
+
+    uploads/store/<sha256[:2]>/<sha256><ext>
+
+Identical content is stored once. Every stored blob is recorded in
+stored_files; the feature tables (cheque_attachments, early_settlement_files,
+cheques.supplier_invoice_file_path) point at its path.
+"""
+
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+from fastapi import HTTPException, UploadFile
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from config import settings
+
+STORE_DIR = Path("uploads/store")
+TEMP_DIR = Path("uploads/tmp")
+
+# Bytes read from the request and written per step
+CHUNK_SIZE = 1024 * 1024
+
+# Default per-file limit (MAX_UPLOAD_SIZE_MB)
+MAX_UPLOAD_BYTES = settings.max_upload_size_mb * 1024 * 1024
+
+_EXTENSION = re.compile(r"^\.[a-z0-9]{1,10}$")
+
+
+class UploadTooLarge(Exception):
+    """The upload passed its size limit while streaming"""
+
+
+def _extension(filename: Optional[str], default: str = "") -> str:
+    extension = os.path.splitext(filename or "")[1].lower()
+    return extension if _EXTENSION.match(extension) else default
+
+
+def content_path(sha256: str, extension: str = "") -> Path:
+    return STORE_DIR / sha256[:2] / f"{sha256}{extension}"
+
+
+def _write_chunk(handle, hasher, chunk: bytes):
+    # hashlib releases the GIL for large buffers, so both steps run off the loop
+    hasher.update(chunk)
+    handle.write(chunk)
+
+
+def _finish(handle, temp_path: str, target: Path) -> bool:
+    """fsync + atomic rename into the store; True when the content was already there"""
+    handle.flush()
+    os.fsync(handle.fileno())
+    handle.close()
+    if target.exists():
+        os.remove(temp_path)
+        return True
+    target.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(temp_path, target)
+    return False
+
+
+def _discard(handle, temp_path: str):
+    try:
+        handle.close()
+    finally:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+
+async def store_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES,
+                       default_extension: str = "") -> Dict[str, Any]:
+    """
+    Stream an UploadFile into the store and return its metadata
+    ({original_filename, saved_filename, file_path, file_size, mime_type,
+    sha256, deduplicated}). Raises UploadTooLarge past `max_bytes`.
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLarge(f"{file.filename} is larger than {max_bytes // (1024 * 1024)}MB")
+
+    await asyncio.to_thread(TEMP_DIR.mkdir, parents=True, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=TEMP_DIR, suffix=".part")
+    handle = os.fdopen(fd, "wb")
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        while True:
+            chunk = await file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadTooLarge(f"{file.filename} is larger than {max_bytes // (1024 * 1024)}MB")
+            await asyncio.to_thread(_write_chunk, handle, hasher, chunk)
+
+        sha256 = hasher.hexdigest()
+        extension = _extension(file.filename, default_extension)
+        target = content_path(sha256, extension)
+        deduplicated = await asyncio.to_thread(_finish, handle, temp_path, target)
+    except BaseException:
+        await asyncio.to_thread(_discard, handle, temp_path)
+        raise
+
+    return {
+        "original_filename": file.filename,
+        "saved_filename": target.name,
+        "file_path": target.as_posix(),
+        "file_size": size,
+        "mime_type": file.content_type,
+        "sha256": sha256,
+        "deduplicated": deduplicated
+    }
+
+
+async def store_upload_or_400(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES,
+                              default_extension: str = "") -> Dict[str, Any]:
+    """store_upload for endpoints: an oversized file is a 400 naming the limit"""
+    try:
+        return await store_upload(file, max_bytes, default_extension)
+    except UploadTooLarge:
+        raise HTTPException(
+            status_code=400,
+            detail=f"File too large: {file.filename}. Maximum size is {max_bytes // (1024 * 1024)}MB"
+        )
+
+
+def record_stored_files(db: Session, stored: Iterable[Dict[str, Any]]):
+    """Upsert stored_files rows for store_upload results (caller commits)"""
+    rows = [
+        {
+            "sha256": item["sha256"],
+            "file_path": item["file_path"],
+            "file_size": item["file_size"],
+            "mime_type": item["mime_type"]
+        }
+        for item in stored
+    ]
+    if not rows:
+        return
+    db.execute(text("""
+        INSERT INTO stored_files (sha256, file_path, file_size, mime_type, reference_count, created_at)
+        VALUES (:sha256, :file_path, :file_size, :mime_type, 1, CURRENT_TIMESTAMP)
+        ON DUPLICATE KEY UPDATE reference_count = reference_count + 1
+    """), rows)
+
+
+if __name__ == "__main__":
+    # Streaming vs read-everything benchmark: python upload_storage.py
+    import shutil
+    import time
+    import tracemalloc
+
+    from starlette.datastructures import Headers
+
+    STORE_DIR = Path(tempfile.mkdtemp()) / "store"
+    TEMP_DIR = STORE_DIR.parent / "tmp"
+    payload = os.urandom(8 * 1024 * 1024)
+
+    def upload() -> UploadFile:
+        # As Starlette spools a multipart file: in memory up to 1MB, then on disk
+        spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        spooled.write(payload)
+        spooled.seek(0)
+        return UploadFile(spooled, size=len(payload), filename="statement.pdf",
+                          headers=Headers({"content-type": "application/pdf"}))
+
+    async def read_all(file: UploadFile):
+        with open(STORE_DIR.parent / "whole.pdf", "wb") as buffer:
+            content = await file.read()
+            buffer.write(content)
+
+    async def streamed(file: UploadFile):
+        await store_upload(file, max_bytes=64 * 1024 * 1024)
+
+    for name, run in (("read + write", read_all), ("store_upload", streamed)):
+        file = upload()
+        tracemalloc.start()
+        started = time.perf_counter()
+        asyncio.run(run(file))
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"{name}: {elapsed * 1000:.1f} ms, peak {peak / 1024 / 1024:.1f} MB allocated")
+
+    result = asyncio.run(store_upload(upload(), max_bytes=64 * 1024 * 1024))
+    print(f"second upload of the same content deduplicated: {result['deduplicated']}")
+    shutil.rmtree(STORE_DIR.parent)
@@ -5,12 +5,16 @@ from typing import List, Optional
 import pandas as pd
 from datetime import datetime
 from io import BytesIO
+import asyncio
 import json
 
 from database import get_db
 from auth import get_current_active_user
 import models
 import schemas
+from inventory_valuation import record_stock_changes
+from export_stream import iter_query_rows, xlsx_response
+from stock_count_import import import_stock_count
 
 router = APIRouter(prefix="/api/warehouse", tags=["warehouse"])
 
@@ -508,6 +512,10 @@ async def receive_transfer_order(
                     "quantity": returned
                 })
             
+            # Keep the inventory valuation snapshot in step
+            record_stock_changes(db, source_warehouse_id, {ingredient_id: returned - sent_qty})
+            record_stock_changes(db, target_warehouse_id, {ingredient_id: accepted})
+            
             # Handle wasted items
             if wasted > 0 and receive_data.waste_reason:
                 # Create waste log
@@ -597,6 +605,8 @@ async def update_stock(
             "quantity": update_data.new_quantity
         })
         
+        record_stock_changes(db, update_data.warehouse_id, {update_data.ingredient_id: change})
+        
         # Log stock movement if there's a change
         if abs(change) > 0.001:  # Avoid logging tiny changes due to floating point precision
             # Create stock_movements table if it doesn't exist
@@ -647,6 +657,72 @@ async def update_stock(
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error updating stock: {str(e)}")
 
+@router.post("/stock/upload-template/{warehouse_id}")
+async def upload_stock_template(
+    warehouse_id: int,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """
+    Upload Excel template to update stock quantities. The whole count is
+    applied at once (stock_count_import); invalid rows are listed in `errors`.
+    """
+    
+    if not file.filename.endswith(('.xlsx', '.xls')):
+        raise HTTPException(status_code=400, detail="File must be Excel format (.xlsx or .xls)")
+    
+    try:
+        # Read Excel file
+        content = await file.read()
+        df = await asyncio.to_thread(pd.read_excel, BytesIO(content))
+        return import_stock_count(db, warehouse_id, df, current_user.id)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error processing Excel file: {str(e)}")
+
+@router.get("/stock/template/{warehouse_id}")
+async def download_stock_template(
+    warehouse_id: int,
+    db: Session = Depends(get_db)
+):
+    """Download Excel template for stock updates (streamed .xlsx)"""
+    
+    try:
+        # Get warehouse name
+        warehouse = db.execute(text("SELECT name FROM warehouses WHERE id = :id"), 
+                               {"id": warehouse_id}).fetchone()
+        if not warehouse:
+            raise HTTPException(status_code=404, detail="Warehouse not found")
+        
+        # Current stock data, streamed straight into the workbook
+        stock_query = """
+            SELECT i.id AS ingredient_id, i.name AS ingredient_name, 
+                   COALESCE(ws.quantity, 0) AS quantity
+            FROM items i
+            LEFT JOIN warehouse_stock ws ON i.id = ws.ingredient_id AND ws.warehouse_id = :warehouse_id
+            ORDER BY i.name
+        """
+        
+        def template_rows():
+            for s in iter_query_rows(stock_query, {"warehouse_id": warehouse_id}):
+                yield [s[0], s[1], float(s[2])]
+        
+        return xlsx_response(
+            f"{warehouse[0]}_stock_template.xlsx",
+            ["ingredient_id", "ingredient_name", "quantity"],
+            template_rows(),
+            sheet_name="Sheet1"
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating template: {str(e)}")
+
 @router.get("/categories")
 async def get_categories(db: Session = Depends(get_db)):
     """Get all inventory categories"""
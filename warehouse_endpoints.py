@@ -496,155 +496,6 @@ async def update_stock(
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Error updating stock: {str(e)}")
 
-@router.post("/stock/upload-template/{warehouse_id}")
-async def upload_stock_template(
-    warehouse_id: int,
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_active_user)
-):
-    """Upload Excel template to update stock quantities"""
-    
-    if not file.filename.endswith(('.xlsx', '.xls')):
-        raise HTTPException(status_code=400, detail="File must be Excel format (.xlsx or .xls)")
-    
-    try:
-        # Read Excel file
-        content = await file.read()
-        df = pd.read_excel(BytesIO(content))
-        
-        # Validate required columns
-        required_cols = {"ingredient_id", "quantity", "ingredient_name"}
-        if not required_cols.issubset(df.columns):
-            missing = required_cols - set(df.columns)
-            raise HTTPException(
-                status_code=400,
-                detail=f"Excel must include columns: {', '.join(missing)}"
-            )
-        
-        updates_count = 0
-        errors = []
-        
-        for index, row in df.iterrows():
-            try:
-                ingredient_id = int(row["ingredient_id"])
-                new_qty = float(row["quantity"])
-                ingredient_name = str(row.get("ingredient_name", "")).strip()
-                
-                if not ingredient_name:
-                    errors.append(f"Row {index + 1}: Missing ingredient name")
-                    continue
-                
-                # Get current quantity
-                current_query = text("""
-                    SELECT COALESCE(quantity, 0) 
-                    FROM warehouse_stock 
-                    WHERE warehouse_id = :warehouse_id AND ingredient_id = :ingredient_id
-                """)
-                current_result = db.execute(current_query, {
-                    "warehouse_id": warehouse_id,
-                    "ingredient_id": ingredient_id
-                }).fetchone()
-                
-                current_qty = float(current_result[0]) if current_result else 0
-                change = new_qty - current_qty
-                
-                # Update stock
-                db.execute(text("""
-                    INSERT INTO warehouse_stock (warehouse_id, ingredient_id, quantity)
-                    VALUES (:warehouse_id, :ingredient_id, :quantity)
-                    ON DUPLICATE KEY UPDATE quantity = VALUES(quantity)
-                """), {
-                    "warehouse_id": warehouse_id,
-                    "ingredient_id": ingredient_id,
-                    "quantity": new_qty
-                })
-                
-                # Log movement if significant change
-                if abs(change) > 0.001:
-                    db.execute(text("""
-                        INSERT INTO stock_movements (ingredient_id, warehouse_id, change_qty, reason, timestamp, created_by)
-                        VALUES (:ingredient_id, :warehouse_id, :change_qty, :reason, NOW(), :created_by)
-                    """), {
-                        "ingredient_id": ingredient_id,
-                        "warehouse_id": warehouse_id,
-                        "change_qty": change,
-                        "reason": "Excel Upload",
-                        "created_by": current_user.username
-                    })
-                
-                updates_count += 1
-                
-            except Exception as e:
-                errors.append(f"Row {index + 1}: {str(e)}")
-        
-        db.commit()
-        
-        result = {
-            "success": True,
-            "updates_count": updates_count,
-            "message": f"Updated {updates_count} items successfully"
-        }
-        
-        if errors:
-            result["errors"] = errors
-            result["message"] += f", {len(errors)} errors occurred"
-        
-        return result
-        
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"Error processing Excel file: {str(e)}")
-
-@router.get("/stock/template/{warehouse_id}")
-async def download_stock_template(
-    warehouse_id: int,
-    db: Session = Depends(get_db)
-):
-    """Download Excel template for stock updates"""
-    
-    try:
-        # Get current stock data
-        stock_query = text("""
-            SELECT i.id AS ingredient_id, i.name AS ingredient_name, 
-                   COALESCE(ws.quantity, 0) AS quantity
-            FROM items i
-            LEFT JOIN warehouse_stock ws ON i.id = ws.ingredient_id AND ws.warehouse_id = :warehouse_id
-            ORDER BY i.name
-        """)
-        
-        stock_data = db.execute(stock_query, {"warehouse_id": warehouse_id}).fetchall()
-        
-        # Create DataFrame
-        df = pd.DataFrame([
-            {
-                "ingredient_id": s[0],
-                "ingredient_name": s[1],
-                "quantity": float(s[2])
-            }
-            for s in stock_data
-        ])
-        
-        # Convert to Excel
-        excel_buffer = BytesIO()
-        df.to_excel(excel_buffer, index=False)
-        excel_buffer.seek(0)
-        
-        # Get warehouse name
-        warehouse_name = db.execute(text("SELECT name FROM warehouses WHERE id = :id"), 
-                                  {"id": warehouse_id}).fetchone()[0]
-        
-        filename = f"{warehouse_name}_stock_template.xlsx"
-        
-        return {
-            "success": True,
-            "filename": filename,
-            "data": excel_buffer.getvalue().hex()  # Send as hex string
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error generating template: {str(e)}")
-
 # ==========================================
 # CATEGORY MANAGEMENT ENDPOINTS
 # ==========================================